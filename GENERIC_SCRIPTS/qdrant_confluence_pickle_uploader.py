@@ -22,7 +22,7 @@ import sys
 from pathlib import Path
 from typing import List, Dict, Any, Tuple
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, FilterSelector, MatchValue
 import ollama
 from tqdm import tqdm
 from datetime import datetime
@@ -32,11 +32,15 @@ import html2text
 # Add parent directory to path to import utils
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
-    from utils.html_cleaner import clean_confluence_html
+    from utils.html_cleaner import HTML_CLEANERS, clean_confluence_html, set_default_cleaner
+    from utils.batch_cleaner import BatchCleaner
+    from utils.text_cache import TextCache
     USE_CONFLUENCE_CLEANER = True
 except ImportError:
     print("Warning: Could not import clean_confluence_html from utils, using fallback")
     USE_CONFLUENCE_CLEANER = False
+    HTML_CLEANERS = ('bs4', 'lxml')
+from utils.change_ledger import ProcessedLedger, page_body_hash
 
 # Detect if we're in WSL
 is_wsl = os.path.exists('/proc/version') and 'microsoft' in open('/proc/version').read().lower()
@@ -48,6 +52,9 @@ KNOWLEDGE_COLLECTION = "open-webui_knowledge"
 # Batch size for knowledge.data updates
 KNOWLEDGE_UPDATE_BATCH = 100  # Update knowledge.data every 100 files
 
+# Name of this uploader in the processed-pages ledger (--ledger)
+LEDGER_CONSUMER = "qdrant_pickle_uploader"
+
 def load_config():
     """Load configuration from settings.ini"""
     config = configparser.ConfigParser()
@@ -436,8 +443,12 @@ def insert_chunks_to_qdrant(client: QdrantClient, chunks: List[str],
 
 def process_confluence_page(page_data: Dict, space_key: str, space_name: str,
                           config: Dict, pg_conn, qdrant_client, ollama_client,
-                          base_confluence_url: str, all_pages_lookup: Dict = None) -> Tuple[bool, Dict]:
-    """Process a single Confluence page and upload to OpenWebUI"""
+                          base_confluence_url: str, all_pages_lookup: Dict = None,
+                          page_content: str = None) -> Tuple[bool, Dict]:
+    """Process a single Confluence page and upload to OpenWebUI
+
+    page_content is the page's markdown if it was already converted (see --clean-workers).
+    """
     
     page_id = page_data.get('id', '')
     page_title = page_data.get('title', 'Untitled')
@@ -483,7 +494,9 @@ def process_confluence_page(page_data: Dict, space_key: str, space_name: str,
     # Process HTML content
     if config.get('html_to_markdown', True):
         # First try the Confluence-specific cleaner if available
-        if USE_CONFLUENCE_CLEANER:
+        if USE_CONFLUENCE_CLEANER and page_content:
+            print("    Using Confluence HTML cleaner (converted by a clean worker)")
+        elif USE_CONFLUENCE_CLEANER:
             print(f"    Using Confluence HTML cleaner")
             cleaned_html = clean_confluence_html(page_body)
             if cleaned_html:
@@ -610,6 +623,79 @@ def process_confluence_page(page_data: Dict, space_key: str, space_name: str,
     
     return True, file_info
 
+def page_ancestors(page: Dict, all_pages_lookup: Dict, max_depth: int = 10) -> Dict:
+    """The part of all_pages_lookup process_confluence_page needs for the page's hierarchy path"""
+    ancestors = {}
+    parent_id = page.get('parent_id')
+    while parent_id and parent_id in all_pages_lookup and len(ancestors) < max_depth:
+        ancestors[parent_id] = all_pages_lookup[parent_id]
+        parent_id = all_pages_lookup[parent_id].get('parent_id')
+    return ancestors
+
+def attach_duplicate_pages(client: QdrantClient, canonical: Tuple[str, str],
+                           duplicates: List[Tuple[str, str, str]], base_confluence_url: str):
+    """List the pages skipped as duplicates of a canonical page in the payload of its points,
+    so a search hit on the canonical page also leads to every copy"""
+    space_key, page_id = canonical
+    payload = {
+        "duplicate_pages": [
+            {
+                "space_key": dup_space_key,
+                "page_id": dup_page_id,
+                "page_title": dup_title,
+                "confluence_url": f"{base_confluence_url}/pages/viewpage.action?pageId={dup_page_id}"
+            }
+            for dup_space_key, dup_page_id, dup_title in duplicates
+        ]
+    }
+    selector = Filter(must=[
+        FieldCondition(key="metadata.space_key", match=MatchValue(value=space_key)),
+        FieldCondition(key="metadata.page_id", match=MatchValue(value=page_id))
+    ])
+    for collection_name in (FILES_COLLECTION, KNOWLEDGE_COLLECTION):
+        client.set_payload(collection_name=collection_name, payload=payload, points=selector)
+
+def get_knowledge_files(conn, knowledge_id: str) -> List[Dict]:
+    """The file references currently listed in knowledge.data"""
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT data FROM knowledge WHERE id = %s", (knowledge_id,))
+        result = cur.fetchone()
+    except Exception as e:
+        print(f"Warning: Could not read knowledge.data: {e}")
+        conn.rollback()
+        return []
+    data = result[0] if result and result[0] else {}
+    if isinstance(data, str):
+        data = json.loads(data)
+    return list(data.get('files', []))
+
+def delete_page_upload(conn, client: QdrantClient, space_key: str, page_id: str) -> List[str]:
+    """Delete an earlier upload of a page: its points in both collections and its file record.
+    Returns the ids of the deleted files"""
+    selector = FilterSelector(filter=Filter(must=[
+        FieldCondition(key="metadata.space_key", match=MatchValue(value=space_key)),
+        FieldCondition(key="metadata.page_id", match=MatchValue(value=page_id))
+    ]))
+    try:
+        for collection_name in (FILES_COLLECTION, KNOWLEDGE_COLLECTION):
+            client.delete(collection_name=collection_name, points_selector=selector)
+    except Exception as e:
+        print(f"    Warning: Could not delete the points of page {page_id}: {e}")
+    if not conn:
+        return []
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM file WHERE meta->>'space_key' = %s AND meta->>'page_id' = %s RETURNING id",
+                    (space_key, page_id))
+        file_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        return file_ids
+    except Exception as e:
+        print(f"    Warning: Could not delete the file record of page {page_id}: {e}")
+        conn.rollback()
+        return []
+
 def get_pickle_files(pickle_dir: str, space_keys: List[str] = None) -> List[Path]:
     """Get list of pickle files to process"""
     pickle_path = Path(pickle_dir)
@@ -664,8 +750,25 @@ def main():
                        help="Clear checkpoint and start fresh")
     parser.add_argument("--base-url", default="https://confluence.example.com",
                        help="Base URL of Confluence instance for generating links")
+    parser.add_argument("--dedup-db",
+                       help="Dedup map from dedup_bodies.py; pages whose body duplicates another page's are not uploaded "
+                            "once that page is, and are listed in its points' payload instead")
+    parser.add_argument("--dedup-near", action="store_true",
+                       help="With --dedup-db, also skip near-duplicate (template) pages, not just identical ones")
+    parser.add_argument("--html-cleaner", choices=HTML_CLEANERS, default="bs4",
+                       help="Text extraction: bs4 (reference) or lxml (same output, several times faster on large pages)")
+    parser.add_argument("--clean-workers", type=int, default=1,
+                       help="Processes converting page bodies to markdown ahead of upload (default: 1, one page at a time)")
+    parser.add_argument("--text-cache", metavar="PATH",
+                       help="SQLite cache of converted page markdown by body hash (see warm_text_cache.py); "
+                            "pages whose body is cached are not converted again")
+    parser.add_argument("--ledger", metavar="PATH",
+                       help="SQLite ledger of uploaded pages by body hash (utils/change_ledger.py); pages unchanged "
+                            "since their last upload are skipped, changed and deleted pages replace or drop it")
     
     args = parser.parse_args()
+    if USE_CONFLUENCE_CLEANER:
+        set_default_cleaner(args.html_cleaner)
     
     # Override config with command line args
     if args.no_markdown:
@@ -752,9 +855,102 @@ def main():
         print("No pickle files found!")
         return
     
+    # Pages duplicating another page's body are skipped once that canonical page is uploaded
+    # with the body the map recorded; until then (or if it never is) they wait in deferred
+    skipper = None
+    deferred = []
+    if args.dedup_db:
+        from utils.body_dedup import DedupMap, DuplicateSkipper
+        with DedupMap(args.dedup_db) as dedup_map:
+            duplicate_hashes = dedup_map.duplicate_hashes(near=args.dedup_near)
+        # Body hashes of the pages an interrupted earlier run uploaded
+        uploaded_hashes = {(space_key, page_id): digest for space_key, space_info in processed_spaces.items()
+                           for page_id, digest in space_info.get('hashes', {}).items()}
+        skipper = DuplicateSkipper(duplicate_hashes, uploaded_hashes)
+        for canonical_space_key, canonical_page_id, dup_space_key, dup_page_id, dup_title in checkpoint.get('duplicate_pages', []):
+            skipper.skipped[(canonical_space_key, canonical_page_id)].append((dup_space_key, dup_page_id, dup_title))
+        print(f"Dedup map: {len(skipper)} duplicate pages, skipped once their canonical page is uploaded")
+    
+    # With a ledger, pages whose body has not changed since their last upload are skipped, so
+    # knowledge.data has to keep listing them: the run starts from the files already there
+    ledger = ProcessedLedger(args.ledger, LEDGER_CONSUMER) if args.ledger else None
+    recorded = {}
+    if ledger is not None and pg_conn and not uploaded_files:
+        uploaded_files = get_knowledge_files(pg_conn, args.knowledge_id)
+    
     total_pages_processed = 0
     total_spaces_processed = 0
     failed_pages = 0
+    skipped_duplicates = 0
+    skipped_unchanged = 0
+    
+    def record_page(space_key: str, page: Dict):
+        """Checkpoint a page as done (uploaded or skipped as a duplicate)"""
+        space_info = processed_spaces.setdefault(space_key, {'pages': [], 'completed': False})
+        space_info['pages'].append(page.get('id', ''))
+        if skipper:
+            space_info.setdefault('hashes', {})[str(page.get('id', ''))] = page_body_hash(page)
+            checkpoint['duplicate_pages'] = [[*canonical, *duplicate] for canonical, duplicates in skipper.skipped.items()
+                                             for duplicate in duplicates]
+        checkpoint['processed_spaces'] = processed_spaces
+        checkpoint['uploaded_files'] = uploaded_files
+        save_checkpoint(checkpoint, config['checkpoint_file'])
+    
+    def skip_duplicate(space_key: str, page: Dict) -> bool:
+        """Skip a page whose canonical page's upload covers it, and list it in that page's payload"""
+        nonlocal skipped_duplicates
+        if not skipper.skip(space_key, page):
+            return False
+        canonical = skipper.canonical(space_key, page)
+        try:
+            attach_duplicate_pages(qdrant_client, canonical, skipper.skipped[canonical], args.base_url)
+        except Exception as e:
+            print(f"    Warning: Could not list duplicate page {page.get('id', '')} on {canonical[0]}/{canonical[1]}: {e}")
+        record_page(space_key, page)
+        skipped_duplicates += 1
+        return True
+    
+    def remove_upload(space_key: str, page_id: str):
+        """Delete the earlier upload of a page that changed or is gone, and its knowledge.data entry"""
+        deleted = set(delete_page_upload(pg_conn, qdrant_client, space_key, page_id))
+        uploaded_files[:] = [f for f in uploaded_files if f.get('id') not in deleted]
+    
+    def upload_page(space_key: str, space_name: str, page: Dict, all_pages_lookup: Dict, page_content: str = None) -> bool:
+        """Upload one page and checkpoint it"""
+        nonlocal total_pages_processed, failed_pages
+        if str(page.get('id', '')) in recorded.get(space_key, {}):
+            remove_upload(space_key, str(page.get('id', '')))
+        success, file_info = process_confluence_page(
+            page, space_key, space_name, config, pg_conn, 
+            qdrant_client, ollama_client, args.base_url, all_pages_lookup,
+            page_content
+        )
+        
+        if not (success and file_info):
+            failed_pages += 1
+            return False
+        
+        uploaded_files.append(file_info)
+        if skipper:
+            skipper.mark_uploaded(space_key, page)
+        record_page(space_key, page)
+        if ledger is not None:
+            ledger.mark([(page.get('id', ''), page_body_hash(page))], space_key)
+        total_pages_processed += 1
+        
+        # Update knowledge.data periodically
+        if total_pages_processed % KNOWLEDGE_UPDATE_BATCH == 0 and pg_conn:
+            print(f"\n[Progress] Updating knowledge.data with {len(uploaded_files)} files...")
+            update_knowledge_data(pg_conn, args.knowledge_id, uploaded_files)
+        return True
+    
+    # With several clean workers, each space's pending pages are converted on a process pool up front;
+    # with a text cache, pages converted in an earlier run are read from it
+    batch_cleaner = None
+    text_cache = None
+    if (args.clean_workers > 1 or args.text_cache) and USE_CONFLUENCE_CLEANER and config.get('html_to_markdown', True):
+        text_cache = TextCache(args.text_cache) if args.text_cache else None
+        batch_cleaner = BatchCleaner('markdown', workers=args.clean_workers, cache=text_cache)
     
     # Process each pickle file
     for pickle_file in pickle_files:
@@ -787,9 +983,28 @@ def main():
             # Create a lookup dictionary for all pages (for building hierarchy paths)
             all_pages_lookup = {p.get('id'): p for p in pages if p.get('id')}
             
+            # Pages uploaded before with the same body
+            unchanged = set()
+            if ledger is not None:
+                recorded[space_key] = ledger.hashes(space_key)
+                unchanged = {p.get('id', '') for p in pages
+                             if recorded[space_key].get(str(p.get('id', ''))) == page_body_hash(p)}
+            
+            converted = {}
+            if batch_cleaner:
+                pending = [p for p in pages if p.get('body') and p.get('id', '') not in processed_page_ids
+                           and p.get('id', '') not in unchanged
+                           and not (skipper and skipper.canonical(space_key, p))]
+                if pending:
+                    print(f"  Converting {len(pending)} pages on {args.clean_workers} processes...")
+                    contents = batch_cleaner.clean(p['body'] for p in pending)
+                    converted = {p.get('id', ''): content for p, content in zip(pending, contents)}
+            
             # Process each page
             space_page_count = 0
             space_failed_count = 0
+            space_deferred_count = 0
+            space_unchanged_count = 0
             
             for idx, page in enumerate(pages):
                 page_id = page.get('id', '')
@@ -798,45 +1013,46 @@ def main():
                 if page_id in processed_page_ids:
                     continue
                 
-                # Process page
-                success, file_info = process_confluence_page(
-                    page, space_key, space_name, config, pg_conn, 
-                    qdrant_client, ollama_client, args.base_url, all_pages_lookup
-                )
+                if page_id in unchanged:
+                    space_unchanged_count += 1
+                    continue
                 
-                if success and file_info:
-                    uploaded_files.append(file_info)
-                    
-                    # Update checkpoint
-                    if space_key not in processed_spaces:
-                        processed_spaces[space_key] = {'pages': [], 'completed': False}
-                    processed_spaces[space_key]['pages'].append(page_id)
-                    
-                    checkpoint['processed_spaces'] = processed_spaces
-                    checkpoint['uploaded_files'] = uploaded_files
-                    save_checkpoint(checkpoint, config['checkpoint_file'])
-                    
+                # Duplicates wait for their canonical page, which may come later in the run
+                if skipper and skipper.canonical(space_key, page):
+                    if not skip_duplicate(space_key, page):
+                        deferred.append((space_key, space_name, page, page_ancestors(page, all_pages_lookup)))
+                        space_deferred_count += 1
+                    continue
+                
+                # Process page
+                if upload_page(space_key, space_name, page, all_pages_lookup, converted.get(page_id)):
                     space_page_count += 1
-                    total_pages_processed += 1
-                    
-                    # Update knowledge.data periodically
-                    if total_pages_processed % KNOWLEDGE_UPDATE_BATCH == 0 and pg_conn:
-                        print(f"\n[Progress] Updating knowledge.data with {len(uploaded_files)} files...")
-                        update_knowledge_data(pg_conn, args.knowledge_id, uploaded_files)
                 else:
                     space_failed_count += 1
-                    failed_pages += 1
                 
                 # Progress indicator
                 if (idx + 1) % 10 == 0 or (idx + 1) == len(pages):
                     print(f"    Progress: {idx + 1}/{len(pages)} pages processed")
             
-            # Mark space as completed
-            processed_spaces[space_key]['completed'] = True
+            # Pages uploaded before that are no longer in the space
+            if ledger is not None:
+                removed = ledger.removed(all_pages_lookup, space_key)
+                for page_id in removed:
+                    remove_upload(space_key, page_id)
+                ledger.forget(removed)
+                if removed:
+                    print(f"  Removed {len(removed)} pages that are no longer in the space")
+            skipped_unchanged += space_unchanged_count
+            
+            # Mark space as completed; a space with deferred duplicates is completed at the end
+            processed_spaces.setdefault(space_key, {'pages': [], 'completed': False})
+            processed_spaces[space_key]['completed'] = not space_deferred_count
             checkpoint['processed_spaces'] = processed_spaces
             save_checkpoint(checkpoint, config['checkpoint_file'])
             
-            print(f"  Space complete: {space_page_count} pages uploaded, {space_failed_count} failed")
+            print(f"  Space complete: {space_page_count} pages uploaded, {space_failed_count} failed"
+                  + (f", {space_unchanged_count} unchanged" if ledger is not None else "")
+                  + (f", {space_deferred_count} duplicates waiting for their canonical page" if space_deferred_count else ""))
             total_spaces_processed += 1
             
             # Small delay between spaces
@@ -847,6 +1063,27 @@ def main():
             print(f"  ERROR processing space {space_key}: {e}")
             continue
     
+    # Duplicates whose canonical page was not uploaded when they came up: skipped if it has
+    # been since, uploaded on their own otherwise (canonical page in a space left out, changed
+    # since the dedup map was built, or failed to upload)
+    if deferred:
+        print(f"\nResolving {len(deferred)} duplicate pages that waited for their canonical page...")
+        for space_key, space_name, page, ancestors in deferred:
+            if not skip_duplicate(space_key, page):
+                upload_page(space_key, space_name, page, ancestors)
+        for space_key in {space_key for space_key, _, _, _ in deferred}:
+            processed_spaces.setdefault(space_key, {'pages': [], 'completed': False})['completed'] = True
+        checkpoint['processed_spaces'] = processed_spaces
+        save_checkpoint(checkpoint, config['checkpoint_file'])
+    
+    if batch_cleaner:
+        batch_cleaner.close()
+    if text_cache is not None:
+        print(text_cache.summary())
+        text_cache.close()
+    if ledger is not None:
+        ledger.close()
+    
     # Final knowledge.data update
     if pg_conn and uploaded_files:
         print(f"\n[Final Update] Updating knowledge.data with all {len(uploaded_files)} files...")
@@ -858,6 +1095,10 @@ def main():
     print(f"Total spaces processed: {total_spaces_processed}")
     print(f"Total pages uploaded: {total_pages_processed}")
     print(f"Failed pages: {failed_pages}")
+    if skipper:
+        print(f"Duplicate pages skipped: {skipped_duplicates} (listed in their canonical page's payload)")
+    if ledger is not None:
+        print(f"Unchanged pages skipped: {skipped_unchanged}")
     
     # Show collection statistics
     try:
@@ -34,11 +34,14 @@ import html2text
 # Add parent directory to path to import utils
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
-    from utils.html_cleaner import clean_confluence_html
+    from utils.html_cleaner import HTML_CLEANERS, clean_confluence_html, set_default_cleaner
+    from utils.batch_cleaner import BatchCleaner
+    from utils.text_cache import TextCache
     USE_CONFLUENCE_CLEANER = True
 except ImportError:
     print("Warning: Could not import clean_confluence_html from utils, using fallback")
     USE_CONFLUENCE_CLEANER = False
+    HTML_CLEANERS = ('bs4', 'lxml')
 
 # Detect if we're in WSL
 is_wsl = os.path.exists('/proc/version') and 'microsoft' in open('/proc/version').read().lower()
@@ -479,13 +482,25 @@ def load_pickle_files(pickle_dir: str, process_all_spaces: bool = False,
     
     return pages_by_space
 
+def page_html(page: Dict) -> str:
+    """Storage (or view) HTML of a page body"""
+    body = page.get('body', {})
+    storage = body.get('storage', body.get('view', {}))
+    return storage.get('value', '')
+
 def process_confluence_pages(pages_by_space: Dict[str, List], config: Dict, 
                             model: SentenceTransformer, qdrant_client: QdrantClient, 
-                            pg_conn, checkpoint: Dict) -> int:
+                            pg_conn, checkpoint: Dict, clean_workers: int = 1, text_cache=None) -> int:
     """Process Confluence pages and upload to Qdrant/PostgreSQL"""
     total_processed = 0
     uploaded_files = checkpoint.get('uploaded_files', [])
     
+    # With several clean workers, each space's pending pages are converted on a process pool up front;
+    # with a text cache (a TextCache), pages converted in an earlier run are read from it
+    batch_cleaner = None
+    if (clean_workers > 1 or text_cache is not None) and USE_CONFLUENCE_CLEANER and config.get('html_to_markdown', True):
+        batch_cleaner = BatchCleaner('markdown', workers=clean_workers, cache=text_cache)
+    
     for space_key, pages in pages_by_space.items():
         # Check if space already processed
         if space_key in checkpoint['processed_spaces'] and checkpoint['processed_spaces'][space_key].get('completed'):
@@ -498,6 +513,14 @@ def process_confluence_pages(pages_by_space: Dict[str, List], config: Dict,
         print(f"\nProcessing space: {space_key}")
         print(f"  Already processed: {len(processed_pages)} pages")
         
+        converted = {}
+        if batch_cleaner:
+            pending = [page for page in pages if page.get('id', '') not in processed_pages and page_html(page)]
+            if pending:
+                print(f"  Converting {len(pending)} pages on {clean_workers} processes...")
+                contents = batch_cleaner.clean(page_html(page) for page in pending)
+                converted = {page.get('id', ''): content for page, content in zip(pending, contents)}
+        
         space_pages = 0
         for page in tqdm(pages, desc=f"Space {space_key}"):
             page_id = page.get('id', '')
@@ -512,9 +535,7 @@ def process_confluence_pages(pages_by_space: Dict[str, List], config: Dict,
                 last_updated = page.get('history', {}).get('lastUpdated', {}).get('when', '')
                 
                 # Get page body
-                body = page.get('body', {})
-                storage = body.get('storage', body.get('view', {}))
-                html_content = storage.get('value', '')
+                html_content = page_html(page)
                 
                 if not html_content:
                     print(f"  Skipping empty page: {page_title}")
@@ -523,7 +544,9 @@ def process_confluence_pages(pages_by_space: Dict[str, List], config: Dict,
                 
                 # Convert HTML to markdown if configured
                 if config.get('html_to_markdown', True):
-                    content = html_to_markdown_text(html_content)
+                    content = converted.get(page_id)
+                    if content is None:
+                        content = html_to_markdown_text(html_content)
                 else:
                     content = html_content
                 
@@ -633,6 +656,8 @@ def process_confluence_pages(pages_by_space: Dict[str, List], config: Dict,
         print(f"\n[Final Update] Updating knowledge.data with {len(uploaded_files)} remaining files...")
         update_knowledge_data(pg_conn, config['knowledge_id'], uploaded_files)
     
+    if batch_cleaner:
+        batch_cleaner.close()
     return total_processed
 
 def main():
@@ -647,8 +672,17 @@ def main():
                        help="Process only first 10 pages for testing")
     parser.add_argument("--space", type=str, 
                        help="Process only this specific space key")
+    parser.add_argument("--html-cleaner", choices=HTML_CLEANERS, default="bs4",
+                       help="Text extraction: bs4 (reference) or lxml (same output, several times faster on large pages)")
+    parser.add_argument("--clean-workers", type=int, default=1,
+                       help="Processes converting page bodies to markdown ahead of upload (default: 1, one page at a time)")
+    parser.add_argument("--text-cache", metavar="PATH",
+                       help="SQLite cache of converted page markdown by body hash (see warm_text_cache.py); "
+                            "pages whose body is cached are not converted again")
     
     args = parser.parse_args()
+    if USE_CONFLUENCE_CLEANER:
+        set_default_cleaner(args.html_cleaner)
     
     
     if args.clear_checkpoint:
@@ -724,9 +758,13 @@ def main():
         pages_by_space = limited_pages
     
     # Process pages
+    text_cache = TextCache(args.text_cache) if args.text_cache and USE_CONFLUENCE_CLEANER else None
     total_processed = process_confluence_pages(
-        pages_by_space, config, model, qdrant_client, pg_conn, checkpoint
+        pages_by_space, config, model, qdrant_client, pg_conn, checkpoint, args.clean_workers, text_cache
     )
+    if text_cache is not None:
+        print(text_cache.summary())
+        text_cache.close()
     
     # Final report
     elapsed_time = time.time() - start_time
@@ -33,11 +33,14 @@ from sentence_transformers import SentenceTransformer
 # Add parent directory to path to import utils
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
-    from utils.html_cleaner import clean_confluence_html
+    from utils.html_cleaner import HTML_CLEANERS, clean_confluence_html, set_default_cleaner
+    from utils.batch_cleaner import BatchCleaner
+    from utils.text_cache import TextCache
     USE_CONFLUENCE_CLEANER = True
 except ImportError:
     print("Warning: Could not import clean_confluence_html from utils, using fallback")
     USE_CONFLUENCE_CLEANER = False
+    HTML_CLEANERS = ('bs4', 'lxml')
 
 # Detect if we're in WSL
 is_wsl = os.path.exists('/proc/version') and 'microsoft' in open('/proc/version').read().lower()
@@ -441,8 +444,12 @@ def insert_chunks_to_qdrant(client: QdrantClient, chunks: List[str],
 
 def process_confluence_page(page_data: Dict, space_key: str, space_name: str,
                           config: Dict, pg_conn, qdrant_client, embed_model,
-                          base_confluence_url: str, all_pages_lookup: Dict = None) -> Tuple[bool, Dict]:
-    """Process a single Confluence page and upload to OpenWebUI"""
+                          base_confluence_url: str, all_pages_lookup: Dict = None,
+                          page_content: str = None) -> Tuple[bool, Dict]:
+    """Process a single Confluence page and upload to OpenWebUI
+
+    page_content is the page's markdown if it was already converted (see --clean-workers).
+    """
     
     page_id = page_data.get('id', '')
     page_title = page_data.get('title', 'Untitled')
@@ -488,7 +495,9 @@ def process_confluence_page(page_data: Dict, space_key: str, space_name: str,
     # Process HTML content
     if config.get('html_to_markdown', True):
         # First try the Confluence-specific cleaner if available
-        if USE_CONFLUENCE_CLEANER:
+        if USE_CONFLUENCE_CLEANER and page_content:
+            print("    Using Confluence HTML cleaner (converted by a clean worker)")
+        elif USE_CONFLUENCE_CLEANER:
             print(f"    Using Confluence HTML cleaner")
             cleaned_html = clean_confluence_html(page_body)
             if cleaned_html:
@@ -658,8 +667,17 @@ def main():
                        help="Base URL of Confluence instance for generating links")
     parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu",
                        help="Device to use for embeddings (cuda/cpu)")
+    parser.add_argument("--html-cleaner", choices=HTML_CLEANERS, default="bs4",
+                       help="Text extraction: bs4 (reference) or lxml (same output, several times faster on large pages)")
+    parser.add_argument("--clean-workers", type=int, default=1,
+                       help="Processes converting page bodies to markdown ahead of upload (default: 1, one page at a time)")
+    parser.add_argument("--text-cache", metavar="PATH",
+                       help="SQLite cache of converted page markdown by body hash (see warm_text_cache.py); "
+                            "pages whose body is cached are not converted again")
     
     args = parser.parse_args()
+    if USE_CONFLUENCE_CLEANER:
+        set_default_cleaner(args.html_cleaner)
     
     # Override config with command line args
     if args.no_markdown:
@@ -746,6 +764,14 @@ def main():
     total_spaces_processed = 0
     failed_pages = 0
     
+    # With several clean workers, each space's pending pages are converted on a process pool up front;
+    # with a text cache, pages converted in an earlier run are read from it
+    batch_cleaner = None
+    text_cache = None
+    if (args.clean_workers > 1 or args.text_cache) and USE_CONFLUENCE_CLEANER and config.get('html_to_markdown', True):
+        text_cache = TextCache(args.text_cache) if args.text_cache else None
+        batch_cleaner = BatchCleaner('markdown', workers=args.clean_workers, cache=text_cache)
+    
     # Process each pickle file
     for pickle_file in pickle_files:
         space_key = pickle_file.stem
@@ -777,6 +803,14 @@ def main():
             # Create a lookup dictionary for all pages (for building hierarchy paths)
             all_pages_lookup = {p.get('id'): p for p in pages if p.get('id')}
             
+            converted = {}
+            if batch_cleaner:
+                pending = [p for p in pages if p.get('body') and p.get('id', '') not in processed_page_ids]
+                if pending:
+                    print(f"  Converting {len(pending)} pages on {args.clean_workers} processes...")
+                    contents = batch_cleaner.clean(p['body'] for p in pending)
+                    converted = {p.get('id', ''): content for p, content in zip(pending, contents)}
+            
             # Process each page
             space_page_count = 0
             space_failed_count = 0
@@ -791,7 +825,8 @@ def main():
                 # Process page
                 success, file_info = process_confluence_page(
                     page, space_key, space_name, config, pg_conn, 
-                    qdrant_client, embed_model, args.base_url, all_pages_lookup
+                    qdrant_client, embed_model, args.base_url, all_pages_lookup,
+                    converted.get(page_id)
                 )
                 
                 if success and file_info:
@@ -837,6 +872,12 @@ def main():
             print(f"  ERROR processing space {space_key}: {e}")
             continue
     
+    if batch_cleaner:
+        batch_cleaner.close()
+    if text_cache is not None:
+        print(text_cache.summary())
+        text_cache.close()
+    
     # Final knowledge.data update
     if pg_conn and uploaded_files:
         print(f"\n[Final Update] Updating knowledge.data with all {len(uploaded_files)} files...")
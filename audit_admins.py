@@ -3,13 +3,12 @@
 
 import csv
 import json
-import random
 import requests
 import urllib3  # For disabling SSL warnings
 import sys
-import time
 import warnings
 from config_loader import load_confluence_settings
+from utils.confluence_client import get_client
 
 # --- Suppress InsecureRequestWarning ---
 warnings.filterwarnings('ignore', 'Unverified HTTPS request is being made to',
@@ -39,57 +38,34 @@ except Exception as e:
     print("Please ensure settings.ini exists and is correctly formatted.", file=sys.stderr)
     sys.exit(1)  # Exit if settings can't be loaded
 
+# Retry messages go to the log (stderr) only, so stdout stays clean for the CSV/JSON report
+CONFLUENCE_CLIENT = get_client(CONFLUENCE_BASE_URL, USERNAME, PASSWORD, VERIFY_SSL, verbose=False)
+
 def make_api_request(url, params=None, max_retries=5):
     """
-    Makes an API request, handling authentication, 429 rate limiting, and SSL verification.
-    Copied from space_explorer.py which works successfully.
+    Makes an API request through the shared pooled Confluence client, which handles
+    authentication, SSL verification, 429 rate limiting and transient errors.
     """
-    retries = 0
-    while retries < max_retries:
-        query_params = '&'.join([f"{k}={v}" for k, v in (params or {}).items()])
-        request_url = f"{url}?{query_params}" if query_params else url
-        print(f"REST Request: GET {request_url}", file=sys.stderr)
+    query_params = '&'.join([f"{k}={v}" for k, v in (params or {}).items()])
+    request_url = f"{url}?{query_params}" if query_params else url
+    print(f"REST Request: GET {request_url}", file=sys.stderr)
+
+    response = CONFLUENCE_CLIENT.get(url, params=params, max_retries=max_retries)
+    if response is None:
+        print(f"Failed to fetch data from {url} after {max_retries} retries.", file=sys.stderr)
+        return None
+    print(f"Response Status: {response.status_code}", file=sys.stderr)
 
+    if response.status_code == 200:
         try:
-            auth = None
-            if USERNAME and PASSWORD:
-                auth = (USERNAME, PASSWORD)
-
-            response = requests.get(url, params=params, verify=VERIFY_SSL, auth=auth)
-            print(f"Response Status: {response.status_code}", file=sys.stderr)
-
-            if response.status_code == 200:
-                try:
-                    return response.json()
-                except requests.exceptions.JSONDecodeError:
-                    print("Error: Response was not valid JSON.", file=sys.stderr)
-                    print(f"Response text: {response.text[:500]}...", file=sys.stderr)
-                    return None
-
-            elif response.status_code == 429:
-                retry_after = response.headers.get('Retry-After')
-                wait_time = int(retry_after) if retry_after else (2 ** retries) * 5
-                jitter = random.uniform(0, 1) * 2
-                wait_time += jitter
-                print(f"Rate limited (429). Server requested Retry-After: {retry_after or 'Not specified'}", file=sys.stderr)
-                print(f"Waiting for {wait_time:.2f} seconds before retry {retries + 1}/{max_retries}", file=sys.stderr)
-                time.sleep(wait_time)
-                retries += 1
-                continue
+            return response.json()
+        except requests.exceptions.JSONDecodeError:
+            print("Error: Response was not valid JSON.", file=sys.stderr)
+            print(f"Response text: {response.text[:500]}...", file=sys.stderr)
+            return None
 
-            else:
-                print(f"Error: Received status code {response.status_code} for {url}", file=sys.stderr)
-                print(f"Response body: {response.text}", file=sys.stderr)
-                return None
-
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}", file=sys.stderr)
-            wait_time = (2 ** retries) * 2
-            print(f"Network error. Waiting {wait_time} seconds before retry {retries + 1}/{max_retries}", file=sys.stderr)
-            time.sleep(wait_time)
-            retries += 1
-
-    print(f"Failed to fetch data from {url} after {max_retries} retries.", file=sys.stderr)
+    print(f"Error: Received status code {response.status_code} for {url}", file=sys.stderr)
+    print(f"Response body: {response.text}", file=sys.stderr)
     return None
 
 def get_all_space_keys():
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Benchmark the fetch modes of sample_and_pickle_spaces.py against mock_confluence_server.py.
+
+Each mode runs the real script in a subprocess, in a scratch directory whose settings.ini
+points at an in-process mock server, so no Confluence instance is needed. For every mode
+the harness reports pages/s, requests per page (from the server's counters), injected 429s
+and errors, and the peak RSS of the fetcher process (wall time includes interpreter start-up).
+
+Modes:
+    per-page     --pickle-all-spaces-full (page listing, then one GET per body)
+    single-pass  --pickle-all-spaces-full --single-pass (bodies in the listing calls)
+    workers      single-pass with --workers N space-parallel processes
+    attachments  single-pass with --download-attachments
+    delta-sync   --delta-sync after a share of pages changed (--delta-fraction)
+
+Results can be saved with --json and compared with a previous run with --baseline; a mode
+whose pages/s fell, or whose requests/page or peak RSS grew, by more than --tolerance is a
+regression and makes the script exit with status 1.
+
+Usage:
+    python benchmark_fetchers.py
+    python benchmark_fetchers.py --spaces 5 --pages 1000 --latency 30 --json bench.json
+    python benchmark_fetchers.py --modes single-pass,delta-sync --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from mock_confluence_server import MockConfluenceServer, add_content_arguments, mock_from_args
+from utils.streaming_pickle import load_space
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_and_pickle_spaces.py')
+MODES = ('per-page', 'single-pass', 'workers', 'attachments', 'delta-sync')
+DEFAULT_MODES = ('per-page', 'single-pass', 'delta-sync')
+DEFAULT_TOLERANCE = 0.2
+RUN_TIMEOUT = 1800
+# POSIX reports a finished child's peak RSS through os.wait4
+HAVE_WAIT4 = hasattr(os, 'wait4')
+# How often the peak RSS is sampled where os.wait4 is not available (needs psutil)
+RSS_POLL_SECONDS = 0.05
+
+
+def mode_arguments(mode, workers):
+    """Command line of sample_and_pickle_spaces.py for a full-pickle mode."""
+    args = ['--pickle-all-spaces-full']
+    if mode != 'per-page':
+        args.append('--single-pass')
+    if mode == 'workers':
+        args += ['--workers', str(workers)]
+    if mode == 'attachments':
+        args.append('--download-attachments')
+    return args
+
+
+def write_settings(workdir, base_url):
+    with open(os.path.join(workdir, 'settings.ini'), 'w') as f:
+        f.write(f"[confluence]\nbase_url = {base_url}\nusername = bench\npassword = bench\nverify_ssl = False\n\n"
+                f"[data]\npickle_dir = {os.path.join(workdir, 'temp')}\n"
+                f"attachment_store_dir = {os.path.join(workdir, 'attachment_store')}\n")
+
+
+def _wait_polling(process, timeout):
+    """Wait for process, sampling its RSS with psutil if available; returns the peak in bytes or None."""
+    peak = None
+    handle = None
+    if psutil is not None:
+        try:
+            handle = psutil.Process(process.pid)
+        except psutil.Error:
+            handle = None
+    deadline = time.monotonic() + timeout
+    while process.poll() is None:
+        if time.monotonic() > deadline:
+            process.kill()
+            process.wait()
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        if handle is not None:
+            try:
+                peak = max(peak or 0, handle.memory_info().rss)
+            except psutil.Error:
+                pass
+        time.sleep(RSS_POLL_SECONDS)
+    return peak
+
+
+def run_fetcher(workdir, args, timeout=RUN_TIMEOUT):
+    """Run sample_and_pickle_spaces.py in workdir; returns (seconds, peak RSS bytes or None, exit code, log path)."""
+    log_path = os.path.join(workdir, f"run-{int(time.time() * 1000)}.log")
+    env = dict(os.environ, PYTHONUNBUFFERED='1', NO_PROXY='127.0.0.1,localhost', no_proxy='127.0.0.1,localhost')
+    started = time.perf_counter()
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, SCRIPT] + args, cwd=workdir, env=env,
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        if HAVE_WAIT4:
+            # wait4 has no timeout; a watchdog kills runs that hang
+            timer = threading.Timer(timeout, process.kill)
+            timer.start()
+            try:
+                _, status, usage = os.wait4(process.pid, 0)
+            finally:
+                timer.cancel()
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        else:
+            peak = _wait_polling(process, timeout)
+    return time.perf_counter() - started, peak, process.returncode, log_path
+
+
+def count_pages(directory):
+    """Pages, and pages with a body, in the space pickles of directory."""
+    pages = with_body = 0
+    if not os.path.isdir(directory):
+        return 0, 0
+    for name in os.listdir(directory):
+        if name.endswith('.pkl'):
+            data = load_space(os.path.join(directory, name))
+            if isinstance(data, dict):
+                for page in data.get('sampled_pages') or []:
+                    pages += 1
+                    with_body += bool(page.get('body'))
+    return pages, with_body
+
+
+def tail(path, lines=20):
+    with open(path, errors='replace') as f:
+        return ''.join(f.readlines()[-lines:])
+
+
+def run_mode(server, mode, workers=2, delta_fraction=0.05, extra_args=(), keep=False, timeout=RUN_TIMEOUT):
+    """Benchmark one mode against a running MockConfluenceServer; returns a result dict."""
+    workdir = tempfile.mkdtemp(prefix=f"bench-{mode}-")
+    try:
+        write_settings(workdir, server.base_url)
+        full_dir = os.path.join(workdir, 'temp', 'full_pickles')
+        expected = None
+        if mode == 'delta-sync':
+            # Start from a complete set of pickles, then change some pages on the server
+            seconds, _, code, log_path = run_fetcher(workdir, mode_arguments('single-pass', workers), timeout)
+            if code != 0:
+                raise RuntimeError(f"Preparing delta-sync failed (exit code {code}):\n{tail(log_path)}")
+            expected = len(server.mock.touch(delta_fraction, seed=f"{server.mock.seed}:bench"))
+            args = ['--delta-sync', full_dir]
+        else:
+            args = mode_arguments(mode, workers)
+
+        server.mock.reset_stats()
+        seconds, peak, code, log_path = run_fetcher(workdir, args + list(extra_args), timeout)
+        stats = server.mock.stats_snapshot()
+        pages, with_body = count_pages(full_dir)
+        if expected is not None:
+            pages = expected
+        result = {
+            'mode': mode,
+            'exit_code': code,
+            'pages': pages,
+            'pages_with_body': with_body,
+            'seconds': round(seconds, 3),
+            'pages_per_sec': round(pages / seconds, 2) if seconds else 0.0,
+            'requests': stats['total_requests'],
+            'requests_per_page': round(stats['total_requests'] / pages, 3) if pages else None,
+            'requests_by_endpoint': stats['requests'],
+            'throttled': stats['throttled'],
+            'errors_injected': stats['errors'],
+            'bytes_served': stats['bytes'],
+            'peak_rss_mb': round(peak / (1024 * 1024), 1) if peak else None,
+        }
+        if code != 0:
+            result['log_tail'] = tail(log_path)
+        return result
+    finally:
+        if keep:
+            print(f"  Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regression messages for results against a previous run's results (same JSON format)."""
+    previous = {r['mode']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = previous.get(result['mode'])
+        if not base:
+            continue
+        if base.get('pages_per_sec') and result['pages_per_sec'] < base['pages_per_sec'] * (1 - tolerance):
+            regressions.append(f"{result['mode']}: {result['pages_per_sec']} pages/s, was {base['pages_per_sec']}")
+        for key, label in (('requests_per_page', 'requests/page'), ('peak_rss_mb', 'MB peak RSS')):
+            if base.get(key) and result.get(key) and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{result['mode']}: {result[key]} {label}, was {base[key]}")
+    return regressions
+
+
+def print_table(results):
+    print(f"\n{'Mode':<13} {'Pages':>7} {'Seconds':>8} {'Pages/s':>8} {'Req':>7} {'Req/page':>9} {'429s':>6} {'Errors':>7} {'Peak RSS':>9}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f} MB" if r['peak_rss_mb'] else 'n/a'
+        per_page = f"{r['requests_per_page']:.2f}" if r['requests_per_page'] is not None else 'n/a'
+        status = '' if r['exit_code'] == 0 else f"  (exit code {r['exit_code']})"
+        print(f"{r['mode']:<13} {r['pages']:>7} {r['seconds']:>8.1f} {r['pages_per_sec']:>8.1f} {r['requests']:>7} "
+              f"{per_page:>9} {r['throttled']:>6} {r['errors_injected']:>7} {rss:>9}{status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the fetch modes of sample_and_pickle_spaces.py offline.')
+    parser.add_argument('--modes', default=','.join(DEFAULT_MODES),
+                        help=f"Comma-separated modes to run: {', '.join(MODES)} or 'all' (default: {','.join(DEFAULT_MODES)})")
+    parser.add_argument('--workers', type=int, default=2, help='Processes for the workers mode (default: 2)')
+    parser.add_argument('--delta-fraction', type=float, default=0.05, help='Share of pages changed before delta-sync (default: 0.05)')
+    parser.add_argument('--fetcher-args', default='', help='Extra arguments for sample_and_pickle_spaces.py, e.g. "--body-workers 16"')
+    parser.add_argument('--json', metavar='FILE', help='Write the results to FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare with the results of an earlier --json run')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Allowed relative slowdown before a regression is reported (default: {DEFAULT_TOLERANCE})')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directories (pickles and fetcher logs)')
+    parser.add_argument('--timeout', type=int, default=RUN_TIMEOUT, help=f'Seconds before a run is killed (default: {RUN_TIMEOUT})')
+    add_content_arguments(parser)
+    args = parser.parse_args()
+
+    modes = MODES if args.modes == 'all' else [m.strip() for m in args.modes.split(',') if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown mode(s): {', '.join(unknown)}")
+    if not HAVE_WAIT4 and psutil is None:
+        print("Peak RSS is not measured on this platform without psutil (pip install psutil).")
+
+    mock = mock_from_args(args)
+    print(f"Mock Confluence: {len(mock.spaces)} spaces, {len(mock.pages)} pages, {len(mock.attachments)} attachments")
+    results = []
+    with MockConfluenceServer(mock) as server:
+        for mode in modes:
+            print(f"Running {mode}...")
+            result = run_mode(server, mode, workers=args.workers, delta_fraction=args.delta_fraction,
+                              extra_args=args.fetcher_args.split(), keep=args.keep, timeout=args.timeout)
+            if result['exit_code'] != 0:
+                print(f"  {mode} failed with exit code {result['exit_code']}:\n{result['log_tail']}")
+            results.append(result)
+    print_table(results)
+
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key not in ('json', 'baseline', 'keep')}
+        with open(args.json, 'w') as f:
+            json.dump({'created_at': datetime.now().isoformat(), 'settings': settings, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    failed = any(r['exit_code'] != 0 for r in results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nRegressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for message in regressions:
+                print(f"  {message}")
+            failed = True
+        else:
+            print(f"\nNo regressions against {args.baseline}.")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
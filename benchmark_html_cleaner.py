@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark the BeautifulSoup and lxml implementations of clean_confluence_html.
+
+Bodies come from a directory of pickled spaces (--pickle-dir) or, by default, from the
+synthetic content of mock_confluence_server.py. Each cleaner cleans every body --repeat
+times and the best run is reported as MB/s (of storage-format input) and pages/s. Unless
+--no-verify is given the two outputs are compared page by page, and bodies the lxml path
+had to hand to BeautifulSoup are counted (their speed is that of the bs4 cleaner).
+
+Usage:
+    python benchmark_html_cleaner.py
+    python benchmark_html_cleaner.py --pages 500 --body-bytes 200000
+    python benchmark_html_cleaner.py --pickle-dir temp --spaces DEV OPS --max-pages 2000 --json clean.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+from mock_confluence_server import MockConfluence
+from utils.change_ledger import body_storage_value
+from utils.corpus_loader import CorpusLoader, is_space
+from utils.html_cleaner import HTML_CLEANERS, clean_confluence_html, clean_confluence_html_lxml, etree
+
+
+def synthetic_bodies(pages, body_bytes, seed):
+    mock = MockConfluence(spaces=1, pages=pages, body_bytes=body_bytes, seed=seed)
+    return [mock.body(page) for page in mock.pages.values()]
+
+
+def pickled_bodies(pickle_dir, space_keys=None, max_pages=None):
+    bodies = []
+    for corpus_file, space in CorpusLoader(pickle_dir, space_keys=space_keys).load_files():
+        if not is_space(space):
+            continue
+        for page in space.get('sampled_pages', []):
+            body = body_storage_value(page.get('body'))
+            if body:
+                bodies.append(body)
+                if max_pages and len(bodies) >= max_pages:
+                    return bodies
+    return bodies
+
+
+def time_cleaner(cleaner, bodies, repeat):
+    """(best seconds, outputs of the last run) of cleaning every body with one implementation."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        outputs = [clean_confluence_html(body, cleaner=cleaner) for body in bodies]
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return best, outputs
+
+
+def run_benchmark(bodies, repeat=3, verify=True):
+    """Results per cleaner plus fallback and mismatch counts of the lxml path."""
+    total_bytes = sum(len(body.encode('utf-8')) for body in bodies)
+    results = {'pages': len(bodies), 'bytes': total_bytes, 'cleaners': {}}
+    outputs = {}
+    for cleaner in HTML_CLEANERS:
+        seconds, outputs[cleaner] = time_cleaner(cleaner, bodies, repeat)
+        results['cleaners'][cleaner] = {
+            'seconds': round(seconds, 4),
+            'mb_per_s': round(total_bytes / 1e6 / seconds, 2) if seconds else None,
+            'pages_per_s': round(len(bodies) / seconds, 1) if seconds else None,
+        }
+    results['fallbacks'] = sum(1 for body in bodies if clean_confluence_html_lxml(body, fallback=False) is None)
+    if verify:
+        results['mismatches'] = sum(1 for a, b in zip(outputs['bs4'], outputs['lxml']) if a != b)
+    bs4_seconds = results['cleaners']['bs4']['seconds']
+    lxml_seconds = results['cleaners']['lxml']['seconds']
+    results['speedup'] = round(bs4_seconds / lxml_seconds, 2) if lxml_seconds else None
+    return results
+
+
+def print_results(results):
+    print(f"{results['pages']} pages, {results['bytes'] / 1e6:.1f} MB of storage format")
+    print(f"{'cleaner':8s} {'seconds':>9s} {'MB/s':>8s} {'pages/s':>9s}")
+    for cleaner, stats in results['cleaners'].items():
+        print(f"{cleaner:8s} {stats['seconds']:9.3f} {stats['mb_per_s']:8.2f} {stats['pages_per_s']:9.1f}")
+    print(f"Speedup: {results['speedup']}x")
+    print(f"Bodies the lxml path handed to BeautifulSoup: {results['fallbacks']}")
+    if 'mismatches' in results:
+        print(f"Pages with different output: {results['mismatches']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the bs4 and lxml implementations of clean_confluence_html.')
+    parser.add_argument('--pickle-dir', help='Clean the bodies of the pickled spaces in this directory instead of synthetic ones')
+    parser.add_argument('--spaces', nargs='+', metavar='KEY', help='Only these spaces of --pickle-dir')
+    parser.add_argument('--max-pages', type=int, help='Stop after this many bodies of --pickle-dir')
+    parser.add_argument('--pages', type=int, default=300, help='Synthetic pages (default: 300)')
+    parser.add_argument('--body-bytes', type=int, default=20000, help='Median synthetic body size in bytes (default: 20000)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the synthetic content (default: 1)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per cleaner; the best is reported (default: 3)')
+    parser.add_argument('--no-verify', action='store_true', help='Do not compare the outputs of the two cleaners')
+    parser.add_argument('--json', metavar='FILE', help='Write the results to FILE')
+    args = parser.parse_args()
+
+    if etree is None:
+        print("lxml is not installed (pip install lxml); the lxml cleaner would only measure the bs4 fallback.")
+        return 1
+    if args.pickle_dir:
+        bodies = pickled_bodies(args.pickle_dir, args.spaces, args.max_pages)
+    else:
+        bodies = synthetic_bodies(args.pages, args.body_bytes, args.seed)
+    if not bodies:
+        print("No page bodies to clean.")
+        return 1
+
+    results = run_benchmark(bodies, repeat=args.repeat, verify=not args.no_verify)
+    print_results(results)
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key != 'json'}
+        with open(args.json, 'w') as f:
+            json.dump({'created_at': datetime.now().isoformat(), 'settings': settings, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    return 1 if results.get('mismatches') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Report how well page bodies compress with zstd, with and without a trained dictionary,
+and how fast they decode. Reads legacy space pickles and split-format spaces (.meta).
+
+Every body is compressed on its own, as the split format stores them, so the numbers
+reflect random-access storage rather than one big compressed stream.
+"""
+
+import os
+import sys
+import time
+
+from utils.split_space import (META_SUFFIX, ZSTD_DICT_SAMPLE_BYTES, ZSTD_DICT_SIZE, ZSTD_LEVEL, SplitSpace,
+                               encode_body, train_body_dictionary, zstandard)
+from utils.streaming_pickle import load_space
+
+
+def collect_inputs(paths):
+    """Expand directories into the space pickles and split spaces they contain."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith('.pkl') or name.endswith(META_SUFFIX))
+        else:
+            files.append(path)
+    return files
+
+
+def load_bodies(path):
+    """(space_key, encoded uncompressed bodies, bytes the bodies take on disk or None)."""
+    if path.endswith(META_SUFFIX):
+        with SplitSpace(path) as space:
+            bodies = [space.body_bytes(i)[1] for i in range(len(space))]
+            stored = os.path.getsize(space.bodies_path)
+            return space.space_key, [body for body in bodies if body], stored
+    data = load_space(path)
+    if not isinstance(data, dict) or 'sampled_pages' not in data:
+        raise ValueError("not a space pickle")
+    bodies = [encode_body(page.get('body'))[1] for page in data.get('sampled_pages') or []]
+    return data.get('space_key'), [body for body in bodies if body], None
+
+
+def measure(bodies, level, dict_size):
+    """Compressed sizes and timings for one space's bodies."""
+    plain = zstandard.ZstdCompressor(level=level)
+    start = time.perf_counter()
+    plain_bytes = sum(len(plain.compress(body)) for body in bodies)
+    plain_time = time.perf_counter() - start
+
+    samples = []
+    sample_bytes = 0
+    for body in bodies:
+        if sample_bytes >= ZSTD_DICT_SAMPLE_BYTES:
+            break
+        samples.append(body)
+        sample_bytes += len(body)
+    start = time.perf_counter()
+    dictionary = train_body_dictionary(samples, dict_size)
+    train_time = time.perf_counter() - start
+
+    compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+    start = time.perf_counter()
+    # Bodies that do not shrink are stored raw by the split format, so count them that way
+    compressed = [compressor.compress(body) for body in bodies]
+    compress_time = time.perf_counter() - start
+    dict_bytes = sum(min(len(c), len(b)) for c, b in zip(compressed, bodies))
+    dict_overhead = len(dictionary.as_bytes()) if dictionary is not None else 0
+
+    decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+    start = time.perf_counter()
+    for frame in compressed:
+        decompressor.decompress(frame)
+    decode_time = time.perf_counter() - start
+
+    return {
+        'plain_bytes': plain_bytes,
+        'plain_time': plain_time,
+        'dict_bytes': dict_bytes + dict_overhead,
+        'train_time': train_time,
+        'compress_time': compress_time,
+        'decode_time': decode_time,
+    }
+
+
+def ratio(raw, compressed):
+    return raw / compressed if compressed else 0
+
+
+def throughput(raw, seconds):
+    return raw / (1024 * 1024) / seconds if seconds else 0
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Report zstd compression ratio and decode throughput for page bodies')
+    parser.add_argument('paths', nargs='*', default=['temp'],
+                       help='Space pickles, split .meta files or directories of them (default: temp)')
+    parser.add_argument('--level', type=int, default=ZSTD_LEVEL,
+                       help=f'zstd compression level (default: {ZSTD_LEVEL})')
+    parser.add_argument('--dict-size', type=int, default=ZSTD_DICT_SIZE,
+                       help=f'Dictionary size in bytes (default: {ZSTD_DICT_SIZE})')
+
+    args = parser.parse_args()
+
+    if zstandard is None:
+        print("This report needs the zstandard package: pip install zstandard")
+        return 1
+    inputs = collect_inputs(args.paths)
+    if not inputs:
+        print(f"No .pkl or {META_SUFFIX} files found in {', '.join(args.paths)}")
+        return 1
+
+    print(f"{'Space':<20} {'Bodies':>8} {'Raw MB':>10} {'zstd':>7} {'zstd+dict':>10} {'On disk':>8} {'Decode MB/s':>12}")
+    print("-" * 80)
+    totals = {'bodies': 0, 'raw': 0, 'plain_bytes': 0, 'dict_bytes': 0, 'plain_time': 0.0, 'train_time': 0.0,
+              'compress_time': 0.0, 'decode_time': 0.0}
+    for path in inputs:
+        try:
+            space_key, bodies, stored = load_bodies(path)
+        except Exception as e:
+            print(f"Error reading {path}: {e}")
+            continue
+        if not bodies:
+            continue
+        raw = sum(len(body) for body in bodies)
+        result = measure(bodies, args.level, args.dict_size)
+        on_disk = f"{ratio(raw, stored):.2f}x" if stored is not None else '-'
+        print(f"{str(space_key)[:20]:<20} {len(bodies):>8} {raw / (1024 * 1024):>10.2f} "
+              f"{ratio(raw, result['plain_bytes']):>6.2f}x {ratio(raw, result['dict_bytes']):>9.2f}x "
+              f"{on_disk:>8} {throughput(raw, result['decode_time']):>12.0f}")
+        totals['bodies'] += len(bodies)
+        totals['raw'] += raw
+        for key in ('plain_bytes', 'dict_bytes', 'plain_time', 'train_time', 'compress_time', 'decode_time'):
+            totals[key] += result[key]
+
+    if not totals['raw']:
+        print("No page bodies found")
+        return 1
+    print("-" * 80)
+    print(f"Bodies:               {totals['bodies']} ({totals['raw'] / (1024 * 1024):.1f} MB uncompressed)")
+    print(f"zstd level {args.level}:         {ratio(totals['raw'], totals['plain_bytes']):.2f}x "
+          f"({totals['plain_bytes'] / (1024 * 1024):.1f} MB, {throughput(totals['raw'], totals['plain_time']):.0f} MB/s)")
+    print(f"zstd + dictionary:    {ratio(totals['raw'], totals['dict_bytes']):.2f}x "
+          f"({totals['dict_bytes'] / (1024 * 1024):.1f} MB incl. dictionaries, "
+          f"{throughput(totals['raw'], totals['compress_time']):.0f} MB/s, training {totals['train_time']:.1f}s)")
+    print(f"Decode (dictionary):  {throughput(totals['raw'], totals['decode_time']):.0f} MB/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
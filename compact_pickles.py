@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Validate, repair and compact a directory of space pickles.
+
+Every space is streamed through a validator in worker processes, one space per task:
+
+- abandoned 'processing' placeholders are removed (fresh ones mean a pickling run is still
+  busy with the space, which is then left alone);
+- SPACE.pkl and SPACE_full.pkl are merged page by page, keeping the newest version of each
+  page (version number, then update time), instead of picking a whole file by size;
+- pages without an id and repeated page ids are dropped;
+- bodies are normalized to the plain storage-format string sample_and_pickle_spaces.py
+  writes, whatever shape they had ({'storage': {'value': ...}}, bytes, ...), and get a
+  body_hash (utils/change_ledger.py);
+- the result is written as SPACE.pkl with the highest pickle protocol, which loads faster,
+  and recorded in the pickle catalog. Spaces whose bodies were out of band (a buffers file
+  next to the pickle, see utils/streaming_pickle.py) keep them out of band.
+
+Spaces that are already compact are not rewritten. Unreadable pickles are reported and left
+in place unless a readable file for the same space replaces them. Split-format spaces
+(.meta) are not touched; convert them again with convert_space_format.py.
+
+Usage:
+    python compact_pickles.py temp              # dry run: report what would change
+    python compact_pickles.py temp --execute
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.atomic_io import atomic_pickle_dump
+from utils.change_ledger import body_hash, body_storage_value
+from utils.corpus_loader import DEFAULT_LOAD_PROCESSES, space_key_from_filename
+from utils.pickle_catalog import page_timestamp, record_pickle
+from utils.streaming_pickle import OUT_OF_BAND_MIN_BYTES, BodyBuffer, buffers_path, dump_space, load_space
+
+# A placeholder this old was left behind by a crashed run (sample_and_pickle_spaces.py gives
+# other runs the same time before it reclaims a space)
+PLACEHOLDER_MAX_AGE_HOURS = 6
+
+
+def pickle_protocol(path):
+    """Protocol a pickle file was written with (0-1 have no PROTO opcode)."""
+    with open(path, 'rb') as f:
+        head = f.read(2)
+    return head[1] if len(head) == 2 and head[0] == 0x80 else 0
+
+
+def pickle_bytes(path):
+    """Size of a pickle plus its out-of-band buffers file, if any."""
+    buffers = buffers_path(path)
+    return os.path.getsize(path) + (os.path.getsize(buffers) if buffers and os.path.exists(buffers) else 0)
+
+
+def page_version(page):
+    """Sort key for versions of the same page: version number, update time, then having a body."""
+    number = page.get('update_count') or (page.get('version') or {}).get('number') or 0
+    return number, page_timestamp(page) or 0, bool(page.get('body'))
+
+
+def normalize_page(page):
+    """(page with a plain-string body and body_hash, whether anything changed)."""
+    if 'body' not in page:
+        return page, False
+    body = page['body']
+    value = body_storage_value(body)
+    if value == '' and body not in ('', None) and not isinstance(body, dict):
+        # Not a body shape we know; leave it for a person to look at
+        return page, False
+    digest = body_hash(value)
+    # An out-of-band body is already a plain storage string, only not decoded yet
+    keep = isinstance(body, BodyBuffer)
+    if (body is value or keep) and page.get('body_hash') == digest:
+        return page, False
+    page = dict(page, body=body if keep else value, body_hash=digest)
+    return page, True
+
+
+def read_source(path, placeholder_max_age):
+    """(status, data) of one pickle: 'space', 'placeholder', 'stale placeholder', 'corrupt' or 'other'."""
+    try:
+        data = load_space(path)
+    except Exception as e:
+        return 'corrupt', str(e)
+    if isinstance(data, dict) and data.get('status') == 'processing':
+        age = time.time() - os.path.getmtime(path)
+        return ('stale placeholder' if age >= placeholder_max_age else 'placeholder'), None
+    if not isinstance(data, dict) or not isinstance(data.get('sampled_pages'), list):
+        return 'other', None
+    return 'space', data
+
+
+def merge_spaces(spaces):
+    """Merge loaded versions of one space; the one with the most pages sets the header and page order.
+
+    Returns (merged space dict, counts of what was dropped, normalized and replaced).
+    """
+    spaces = sorted(spaces, key=lambda data: -len(data['sampled_pages']))
+    counts = {'invalid': 0, 'duplicates': 0, 'newer': 0, 'normalized': 0}
+    pages = {}
+    for data in spaces:
+        for page in data['sampled_pages']:
+            if not isinstance(page, dict) or page.get('id') in (None, ''):
+                counts['invalid'] += 1
+                continue
+            page_id = str(page['id'])
+            current = pages.get(page_id)
+            if current is None:
+                pages[page_id] = page
+                continue
+            counts['duplicates'] += 1
+            if page_version(page) > page_version(current):
+                pages[page_id] = page
+                counts['newer'] += 1
+
+    header = {}
+    for data in reversed(spaces):
+        header.update((key, value) for key, value in data.items() if key != 'sampled_pages')
+    if 'total_pages_in_space' in header:
+        header['total_pages_in_space'] = max(data.get('total_pages_in_space') or 0 for data in spaces)
+    normalized = []
+    for page in pages.values():
+        page, changed = normalize_page(page)
+        counts['normalized'] += changed
+        normalized.append(page)
+
+    # Same key order as the main version: header keys, the page list, then any trailing keys
+    keys = list(spaces[0])
+    merged = {key: header[key] for key in keys[:keys.index('sampled_pages')]}
+    merged['sampled_pages'] = normalized
+    merged.update((key, value) for key, value in header.items() if key not in merged)
+    return merged, counts
+
+
+def compact_space(space_key, paths, output_path, execute=False, placeholder_max_age=PLACEHOLDER_MAX_AGE_HOURS * 3600):
+    """
+    Validate and compact the pickles of one space (runs in a worker process).
+
+    Returns a report dict: space_key, sources [(file name, status, page count)], action,
+    pages_in, pages_out, the counts of merge_spaces(), bytes_before, bytes_after and removed files.
+    """
+    report = {'space_key': space_key, 'sources': [], 'action': 'unchanged', 'pages_in': 0, 'pages_out': 0,
+              'invalid': 0, 'duplicates': 0, 'newer': 0, 'normalized': 0, 'removed': [],
+              'bytes_before': sum(pickle_bytes(path) for path in paths), 'bytes_after': None}
+    spaces = []
+    space_paths = []
+    stale = []
+    for path in paths:
+        status, data = read_source(path, placeholder_max_age)
+        report['sources'].append((os.path.basename(path), status,
+                                  len(data['sampled_pages']) if status == 'space' else None))
+        if status == 'placeholder':
+            report['action'] = 'skipped: being pickled'
+            return report
+        if status == 'other':
+            report['action'] = 'skipped: not a space pickle'
+            return report
+        if status == 'space':
+            spaces.append(data)
+            space_paths.append(path)
+            report['pages_in'] += len(data['sampled_pages'])
+        elif status == 'stale placeholder':
+            stale.append(path)
+
+    if not spaces:
+        if stale:
+            report['action'] = 'remove abandoned placeholder'
+            report['removed'] = [os.path.basename(path) for path in stale]
+            if execute:
+                for path in stale:
+                    os.remove(path)
+        else:
+            report['action'] = 'unreadable'
+        return report
+
+    merged, counts = merge_spaces(spaces)
+    report.update(counts)
+    report['pages_out'] = len(merged['sampled_pages'])
+    in_place = os.path.dirname(os.path.abspath(output_path)) == os.path.dirname(os.path.abspath(paths[0]))
+    # Everything else in the group is superseded by the output file
+    superseded = [path for path in paths if os.path.abspath(path) != os.path.abspath(output_path)] if in_place else []
+    superseded = [path for path in superseded if path in space_paths or path in stale]
+    up_to_date = (len(paths) == 1 and len(spaces) == 1 and in_place and os.path.abspath(space_paths[0]) == os.path.abspath(output_path)
+                  and not any(counts.values()) and pickle_protocol(output_path) >= pickle.HIGHEST_PROTOCOL)
+    if up_to_date:
+        report['bytes_after'] = report['bytes_before']
+        return report
+
+    report['action'] = 'rewrite'
+    report['removed'] = [os.path.basename(path) for path in superseded]
+    if execute:
+        if 'body_buffers' in merged:
+            dump_space(merged, output_path, out_of_band_min_bytes=OUT_OF_BAND_MIN_BYTES)
+        else:
+            atomic_pickle_dump(merged, output_path, protocol=pickle.HIGHEST_PROTOCOL)
+            record_pickle(output_path, merged)
+        for path in superseded:
+            buffers = buffers_path(path)
+            os.remove(path)
+            if buffers and os.path.exists(buffers):
+                os.remove(buffers)
+        report['bytes_after'] = pickle_bytes(output_path)
+    return report
+
+
+def group_pickles(directory):
+    """{space_key: [paths]} of the .pkl files in directory, SPACE.pkl before SPACE_full.pkl."""
+    groups = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.pkl'):
+            groups.setdefault(space_key_from_filename(name), []).append(os.path.join(directory, name))
+    return groups
+
+
+def format_sources(sources):
+    return ', '.join(f"{name} ({status}{f', {count} pages' if count is not None else ''})"
+                     for name, status, count in sources)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate, merge, normalize and compact space pickles')
+    parser.add_argument('directory', nargs='?', default='temp',
+                        help='Directory containing the space pickles (default: temp)')
+    parser.add_argument('--execute', action='store_true',
+                        help='Actually rewrite and remove files (default is dry run)')
+    parser.add_argument('--output-dir',
+                        help='Write compacted pickles here instead, leaving the originals untouched')
+    parser.add_argument('--spaces', nargs='+', metavar='SPACE_KEY', help='Only these spaces')
+    parser.add_argument('--placeholder-age', type=float, default=PLACEHOLDER_MAX_AGE_HOURS,
+                        help=f'Hours after which a processing placeholder counts as abandoned '
+                             f'(default: {PLACEHOLDER_MAX_AGE_HOURS})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: number of CPU cores)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: Directory {args.directory} does not exist")
+        return 1
+    output_dir = args.output_dir or args.directory
+    if args.execute:
+        os.makedirs(output_dir, exist_ok=True)
+
+    groups = group_pickles(args.directory)
+    if args.spaces:
+        groups = {key: paths for key, paths in groups.items() if key in set(args.spaces)}
+    if not groups:
+        print(f"No space pickles found in {args.directory}")
+        return 1
+
+    print(f"Scanning {len(groups)} spaces in {args.directory}")
+    print(f"Mode: {'ACTUAL RUN' if args.execute else 'DRY RUN'}")
+    print("=" * 80)
+
+    workers = max(1, min(args.workers or DEFAULT_LOAD_PROCESSES, len(groups)))
+    tasks = [(key, paths, os.path.join(output_dir, f'{key}.pkl')) for key, paths in sorted(groups.items())]
+    totals = {'rewrite': 0, 'unchanged': 0, 'other': 0, 'pages_in': 0, 'pages_out': 0, 'removed': 0,
+              'bytes_before': 0, 'bytes_after': 0}
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(compact_space, key, paths, output_path, args.execute, args.placeholder_age * 3600)
+                   for key, paths, output_path in tasks]
+        for (key, paths, _), future in zip(tasks, futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                print(f"\n[ERROR] {key}: {e}")
+                totals['other'] += 1
+                continue
+            action = report['action']
+            totals['rewrite' if action == 'rewrite' else 'unchanged' if action == 'unchanged' else 'other'] += 1
+            totals['pages_in'] += report['pages_in']
+            totals['pages_out'] += report['pages_out']
+            totals['removed'] += len(report['removed'])
+            if action == 'unchanged':
+                continue
+            print(f"\n[{action.upper()}] {key}: {format_sources(report['sources'])}")
+            if action == 'rewrite':
+                totals['bytes_before'] += report['bytes_before']
+                details = [f"{report['pages_in']} -> {report['pages_out']} pages"]
+                for field, label in (('newer', 'newer versions taken'), ('duplicates', 'duplicate ids'),
+                                     ('invalid', 'invalid pages dropped'), ('normalized', 'bodies normalized')):
+                    if report[field]:
+                        details.append(f"{report[field]} {label}")
+                print(f"  {', '.join(details)}")
+                if report['bytes_after'] is not None:
+                    totals['bytes_after'] += report['bytes_after']
+                    print(f"  {report['bytes_before']:,} -> {report['bytes_after']:,} bytes")
+            if report['removed']:
+                verb = 'Removed' if args.execute else 'Would remove'
+                print(f"  {verb} {', '.join(report['removed'])}")
+
+    print("\n" + "=" * 80)
+    print(f"Spaces: {totals['rewrite']} {'rewritten' if args.execute else 'to rewrite'}, "
+          f"{totals['unchanged']} already compact, {totals['other']} skipped or unreadable")
+    print(f"Pages: {totals['pages_in']:,} read, {totals['pages_out']:,} kept; "
+          f"files {'removed' if args.execute else 'to remove'}: {totals['removed']}")
+    if args.execute and totals['bytes_before']:
+        print(f"Rewritten spaces: {totals['bytes_before'] / (1024 * 1024):.1f} MB -> "
+              f"{totals['bytes_after'] / (1024 * 1024):.1f} MB")
+    print(f"Finished in {time.monotonic() - start:.1f}s with {workers} worker processes")
+    if not args.execute and totals['rewrite'] + totals['removed']:
+        print("\nThis was a dry run. Use --execute to apply the changes.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
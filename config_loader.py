@@ -24,7 +24,9 @@ def load_data_settings(config_path='settings.ini'):
     # Set default values for data section
     config['data'] = {
         'pickle_dir': 'temp',  # Default pickle directory
-        'remote_full_pickle_dir': ''  # Default to empty string, meaning not set
+        'remote_full_pickle_dir': '',  # Default to empty string, meaning not set
+        'attachments_dir': 'attachments',
+        'attachment_store_dir': 'attachment_store'  # Shared content-addressed attachment store
     }
     
     # Override with values from config file if it exists
@@ -38,7 +40,9 @@ def load_data_settings(config_path='settings.ini'):
     # Return as dictionary
     return {
         'pickle_dir': config['data'].get('pickle_dir'),
-        'remote_full_pickle_dir': config['data'].get('remote_full_pickle_dir') if config['data'].get('remote_full_pickle_dir') else None
+        'remote_full_pickle_dir': config['data'].get('remote_full_pickle_dir') if config['data'].get('remote_full_pickle_dir') else None,
+        'attachments_dir': config['data'].get('attachments_dir'),
+        'attachment_store_dir': config['data'].get('attachment_store_dir')
     }
 
 def load_visualization_settings(config_path='settings.ini'):
@@ -4,16 +4,20 @@
 Usage:
     python build_index.py              # Rebuild entire index from all pickles
     python build_index.py --space XYZ  # Re-index just one space (delete + re-add)
+    python build_index.py --incremental  # Re-index only pages whose body or title changed
 """
 
 import sys
 import os
 import argparse
+import hashlib
 import logging
 
 from config import get_config
+from converters import use_html_cleaner
 from pickle_loader import PickleLoader
 from indexer import ConfluenceIndexer
+from utils.change_ledger import LEDGER_FILENAME, ProcessedLedger, page_body_hash
 
 # Setup logging
 logging.basicConfig(
@@ -22,17 +26,50 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+LEDGER_CONSUMER = 'whoosh'
 
-def rebuild_all(config):
+
+def open_ledger(config) -> ProcessedLedger:
+    """The ledger of pages in the index, kept next to the index itself."""
+    os.makedirs(config.index_dir, exist_ok=True)
+    return ProcessedLedger(os.path.join(config.index_dir, LEDGER_FILENAME), LEDGER_CONSUMER)
+
+
+def page_digests(pickle_loader, entries):
+    """(page_id, digest) of every page: its body hash plus the title and parent that are indexed too.
+
+    Bodies are only read for pages pickled before body hashes were stored.
+    """
+    digests = []
+    for space_key, page in entries:
+        if 'body_hash' not in page:
+            page = pickle_loader.with_body(space_key, page)
+        ancestors = page.get('ancestors') or [{}]
+        parent = ancestors[-1].get('id', '') if isinstance(ancestors[-1], dict) else ''
+        key = f"{page_body_hash(page)}\0{page.get('title', '')}\0{page.get('parent_id') or parent}"
+        digests.append((str(page.get('id')), hashlib.sha256(key.encode('utf-8')).hexdigest()))
+    return digests
+
+
+def record_indexed(ledger, pickle_loader, entries):
+    """Mark entries as indexed, grouped by space so a space can be forgotten later."""
+    by_space = {}
+    for space_key, page in entries:
+        by_space.setdefault(space_key, []).append((space_key, page))
+    for space_key, space_entries in by_space.items():
+        ledger.mark(page_digests(pickle_loader, space_entries), space_key)
+
+
+def rebuild_all(config, clean_workers: int = 1):
     """Full rebuild of the WHOOSH index."""
     logger.info("Loading pickle files...")
-    pickle_loader = PickleLoader(config.pickle_dir)
+    pickle_loader = PickleLoader(config.pickle_dir, config.body_store_dir or None, config.compress_bodies)
     pickle_loader.load_all_pickles()
 
     spaces = pickle_loader.get_all_spaces()
     logger.info(f"Loaded {len(spaces)} spaces")
 
-    indexer = ConfluenceIndexer(config.index_dir)
+    indexer = ConfluenceIndexer(config.index_dir, clean_workers, config.body_time_budget, config.text_cache)
 
     logger.info("Building search index (this may take 10-30 seconds)...")
     all_pages = pickle_loader.get_all_pages()
@@ -42,10 +79,48 @@ def rebuild_all(config):
     stats = indexer.get_stats()
     logger.info(f"Index statistics: {stats}")
 
+    with open_ledger(config) as ledger:
+        ledger.clear()
+        record_indexed(ledger, pickle_loader, pickle_loader.get_page_entries())
+
 
-def reindex_space(config, space_key: str):
+def update_changed(config, clean_workers: int = 1):
+    """Re-index pages whose digest differs from the ledger and delete pages that are gone."""
+    pickle_loader = PickleLoader(config.pickle_dir, config.body_store_dir or None, config.compress_bodies)
+    pickle_loader.load_all_pickles()
+    indexer = ConfluenceIndexer(config.index_dir, clean_workers, config.body_time_budget, config.text_cache)
+
+    ledger = open_ledger(config)
+    if not len(ledger) and indexer.get_stats()['total_docs']:
+        logger.info("No ledger for the existing index yet; rebuilding it once to start one")
+        ledger.close()
+        rebuild_all(config, clean_workers)
+        return 0
+
+    with ledger:
+        entries = pickle_loader.get_page_entries()
+        digests = page_digests(pickle_loader, entries)
+        changed = {page_id for page_id, _ in ledger.changed(digests)}
+        removed = ledger.removed(page_id for page_id, _ in digests)
+        logger.info(f"{len(changed)} new or changed pages, {len(removed)} removed, "
+                    f"{len(digests) - len(changed)} unchanged")
+
+        if removed:
+            indexer.delete_pages(removed)
+            ledger.forget(removed)
+
+        changed_entries = [(space_key, page) for space_key, page in entries if str(page.get('id')) in changed]
+        if changed_entries:
+            pages = [(space_key, pickle_loader.with_body(space_key, page)) for space_key, page in changed_entries]
+            indexed_count = indexer.index_all_pages(pages, clear_first=False)
+            logger.info(f"Re-indexed {indexed_count} pages")
+            record_indexed(ledger, pickle_loader, changed_entries)
+    return 0
+
+
+def reindex_space(config, space_key: str, clean_workers: int = 1):
     """Re-index a single space: delete old entries, add current ones."""
-    pickle_loader = PickleLoader(config.pickle_dir)
+    pickle_loader = PickleLoader(config.pickle_dir, config.body_store_dir or None, config.compress_bodies)
     pickle_loader.load_all_pickles()
 
     space = pickle_loader.get_space(space_key)
@@ -55,7 +130,7 @@ def reindex_space(config, space_key: str):
         logger.info(f"Available spaces: {', '.join(sorted(available)[:20])}{'...' if len(available) > 20 else ''}")
         return 1
 
-    indexer = ConfluenceIndexer(config.index_dir)
+    indexer = ConfluenceIndexer(config.index_dir, clean_workers, config.body_time_budget, config.text_cache)
 
     # Get stats before
     stats_before = indexer.get_stats()
@@ -73,6 +148,10 @@ def reindex_space(config, space_key: str):
     stats_after = indexer.get_stats()
     logger.info(f"Re-indexed {indexed_count} pages for space {space_key}")
     logger.info(f"Index after: {stats_after['total_docs']} docs")
+
+    with open_ledger(config) as ledger:
+        ledger.forget_space(space_key)
+        record_indexed(ledger, pickle_loader, pickle_loader.get_page_entries(space_key))
     return 0
 
 
@@ -81,18 +160,31 @@ def main():
     parser = argparse.ArgumentParser(description="Build WHOOSH search index from pickled Confluence data.")
     parser.add_argument('--space', type=str, metavar='SPACE_KEY',
                         help='Re-index just one space (deletes old entries, adds current ones)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Re-index only pages whose body or title changed since the last build, '
+                             'and remove pages that are gone')
+    parser.add_argument('--html-cleaner', choices=('bs4', 'lxml'),
+                        help='Text extraction for the index (default: html_cleaner in settings.ini, else bs4)')
+    parser.add_argument('--clean-workers', type=int, metavar='N',
+                        help='Processes extracting page text (default: clean_workers in settings.ini, else 1; '
+                             '0 uses one per core)')
     args = parser.parse_args()
 
     config = get_config()
+    use_html_cleaner(args.html_cleaner or config.html_cleaner)
+    clean_workers = config.clean_workers if args.clean_workers is None else args.clean_workers or os.cpu_count() or 1
     logger.info(f"Pickle directory: {config.pickle_dir}")
     logger.info(f"Index directory: {config.index_dir}")
 
     if args.space:
         logger.info(f"Re-indexing single space: {args.space}")
-        return reindex_space(config, args.space)
+        return reindex_space(config, args.space, clean_workers)
+    elif args.incremental:
+        logger.info("Incremental index update...")
+        return update_changed(config, clean_workers)
     else:
         logger.info("Full index rebuild...")
-        rebuild_all(config)
+        rebuild_all(config, clean_workers)
         return 0
 
 
@@ -63,6 +63,38 @@ class Config:
         return self._get('data', 'index_dir',
                         os.path.join(Path(__file__).parent, 'whoosh_index'))
 
+    @property
+    def body_store_dir(self) -> str:
+        """Get directory for memory-mapped page bodies (empty keeps bodies in memory)."""
+        return self._get('data', 'body_store_dir', '')
+
+    @property
+    def compress_bodies(self) -> bool:
+        """Whether the body store keeps bodies zstd-compressed."""
+        return self._get('data', 'compress_bodies', 'false').strip().lower() in ('1', 'true', 'yes', 'on')
+
+    @property
+    def html_cleaner(self) -> str:
+        """Implementation of clean_confluence_html used for page text: 'bs4' or 'lxml'."""
+        return self._get('data', 'html_cleaner', 'bs4').strip().lower()
+
+    @property
+    def clean_workers(self) -> int:
+        """Processes extracting page text while building the index (0: one per core)."""
+        workers = int(self._get('data', 'clean_workers', '1').strip() or 1)
+        return workers if workers > 0 else (os.cpu_count() or 1)
+
+    @property
+    def body_time_budget(self) -> Optional[float]:
+        """Seconds spent extracting the text of one mega-page while indexing (None: no limit)."""
+        budget = float(self._get('data', 'body_time_budget', '60').strip() or 0)
+        return budget if budget > 0 else None
+
+    @property
+    def text_cache(self) -> str:
+        """SQLite cache of page texts by body hash used while indexing ('' for none)."""
+        return self._get('data', 'text_cache', '').strip()
+
     @property
     def confluence_url(self) -> str:
         """Get Confluence base URL for fallback."""
@@ -18,7 +18,7 @@ except ImportError:
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 try:
-    from utils.html_cleaner import clean_confluence_html
+    from utils.html_cleaner import clean_confluence_html, set_default_cleaner
     HTML_CLEANER_AVAILABLE = True
 except ImportError:
     HTML_CLEANER_AVAILABLE = False
@@ -27,6 +27,12 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+def use_html_cleaner(name: str) -> None:
+    """Select the clean_confluence_html implementation html_to_text uses ('bs4' or 'lxml')."""
+    if HTML_CLEANER_AVAILABLE:
+        set_default_cleaner(name)
+
+
 def html_to_text(html_content: str) -> str:
     """Convert HTML to plain text.
 
@@ -1,6 +1,7 @@
 """WHOOSH-based indexing for fast full-text search."""
 
 import os
+import sys
 import glob
 import shutil
 import logging
@@ -19,10 +20,20 @@ except (ImportError, AttributeError) as e:
 
 from converters import html_to_text
 
-# Maximum HTML body size to parse (bytes). Pages larger than this are
-# truncated before being fed to BeautifulSoup to avoid stalling on
-# multi-MB meeting-notes / auto-generated pages.
-MAX_BODY_HTML_BYTES = 500_000  # 500 KB
+# Add parent directory to path to import the shared body helpers from confluence-viz
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.batch_cleaner import BatchCleaner
+from utils.change_ledger import body_storage_value, page_body_hash
+from utils.stream_cleaner import stream_text
+from utils.text_cache import TextCache
+
+# HTML bodies larger than this (bytes) are not parsed whole: multi-MB meeting-notes /
+# auto-generated pages would stall BeautifulSoup, so their text is extracted piece by
+# piece (utils/stream_cleaner.py) within a per-page time budget.
+STREAM_BODY_HTML_BYTES = 500_000  # 500 KB
+# Seconds spent on one streamed page before the rest of its body is skipped
+DEFAULT_BODY_TIME_BUDGET = 60.0
 
 logger = logging.getLogger(__name__)
 
@@ -45,11 +56,18 @@ if WHOOSH_AVAILABLE:
 class ConfluenceIndexer:
     """Manages WHOOSH index for Confluence pages."""
 
-    def __init__(self, index_dir: str):
+    def __init__(self, index_dir: str, clean_workers: int = 1,
+                 body_time_budget: Optional[float] = DEFAULT_BODY_TIME_BUDGET, text_cache: str = ''):
         """Initialize indexer.
 
         Args:
             index_dir: Directory to store WHOOSH index
+            clean_workers: Processes that extract page text while indexing; 1 extracts
+                it in this process, one page at a time
+            body_time_budget: Seconds spent extracting the text of one page larger than
+                STREAM_BODY_HTML_BYTES; None for no limit
+            text_cache: Path of a TextCache (utils/text_cache.py) that page texts are read
+                from and stored in, so unchanged bodies are not parsed again; '' for none
         """
         if not WHOOSH_AVAILABLE:
             raise ImportError(
@@ -57,6 +75,11 @@ class ConfluenceIndexer:
                 "On Python 3.10+, install whoosh3: pip install whoosh3"
             )
         self.index_dir = index_dir
+        self.clean_workers = clean_workers
+        self.body_time_budget = body_time_budget
+        self.text_cache = TextCache(text_cache) if text_cache else None
+        # Streamed pages: count, body bytes, bytes their text was extracted from, pages cut short
+        self.stream_stats = {'pages': 0, 'bytes': 0, 'processed_bytes': 0, 'incomplete': 0}
         self.ix = None
 
         # Ensure index directory exists
@@ -123,6 +146,31 @@ class ConfluenceIndexer:
             writer.cancel()
             raise
 
+    def delete_pages(self, page_ids: List[str]) -> int:
+        """Delete pages from the index by page ID.
+
+        Args:
+            page_ids: IDs of the pages to delete
+
+        Returns:
+            Number of documents deleted
+        """
+        from whoosh.query import Term
+        if not page_ids:
+            return 0
+        writer = AsyncWriter(self.ix)
+        try:
+            count = 0
+            for page_id in page_ids:
+                count += writer.delete_by_query(Term('page_id', str(page_id)))
+            writer.commit()
+            logger.info(f"Deleted {count} documents for {len(page_ids)} removed pages")
+            return count
+        except Exception as e:
+            logger.error(f"Error deleting pages: {e}")
+            writer.cancel()
+            raise
+
     def index_all_pages(self, pages: List[tuple], clear_first: bool = False) -> int:
         """Index all pages from pickle data.
 
@@ -145,75 +193,132 @@ class ConfluenceIndexer:
 
         # Use AsyncWriter for better performance
         writer = AsyncWriter(self.ix)
+        # Text of each batch is extracted on a process pool (or read from the text cache)
+        # before its pages are added
+        cleaner = None
+        if self.clean_workers > 1 or self.text_cache is not None:
+            cleaner = BatchCleaner('text', workers=self.clean_workers, cache=self.text_cache)
 
         try:
-            for space_key, page in pages:
-                try:
-                    self._index_page(writer, space_key, page)
-                    indexed_count += 1
-
-                    # Progress reporting
-                    if indexed_count % 50 == 0:
-                        logger.info(f"Progress: {indexed_count}/{total_pages} pages indexed ({100*indexed_count//total_pages}%)")
-
-                    # Batch commit for large datasets
-                    if indexed_count % batch_size == 0:
-                        logger.info(f"Committing batch of {batch_size} pages to disk...")
-                        writer.commit()
-                        logger.info(f"Batch committed. Continuing indexing...")
-                        writer = AsyncWriter(self.ix)  # New writer for next batch
-
-                except Exception as e:
-                    logger.error(f"Error indexing page {page.get('id')}: {e}")
+            for start in range(0, total_pages, batch_size):
+                batch = pages[start:start + batch_size]
+                texts = self._clean_batch(cleaner, batch) if cleaner else [None] * len(batch)
+                for (space_key, page), body_text in zip(batch, texts):
+                    try:
+                        self._index_page(writer, space_key, page, body_text)
+                        indexed_count += 1
+
+                        # Progress reporting
+                        if indexed_count % 50 == 0:
+                            logger.info(f"Progress: {indexed_count}/{total_pages} pages indexed ({100*indexed_count//total_pages}%)")
+
+                        # Batch commit for large datasets
+                        if indexed_count % batch_size == 0:
+                            logger.info(f"Committing batch of {batch_size} pages to disk...")
+                            writer.commit()
+                            logger.info(f"Batch committed. Continuing indexing...")
+                            writer = AsyncWriter(self.ix)  # New writer for next batch
+
+                    except Exception as e:
+                        logger.error(f"Error indexing page {page.get('id')}: {e}")
 
             # Final commit
             logger.info("Committing final batch to disk...")
             writer.commit()
             logger.info(f"Successfully indexed {indexed_count}/{total_pages} pages")
+            if self.stream_stats['pages']:
+                logger.info(self.stream_summary())
+            if self.text_cache is not None:
+                self.text_cache.record_stats()
+                logger.info(self.text_cache.summary())
 
         except Exception as e:
             logger.error(f"Error during indexing: {e}")
             writer.cancel()
             raise
+        finally:
+            if cleaner:
+                cleaner.close()
 
         return indexed_count
 
-    def _index_page(self, writer, space_key: str, page: Dict[str, Any]) -> None:
+    def _clean_batch(self, cleaner: BatchCleaner, batch: List[tuple]) -> List[Optional[str]]:
+        """Extract the text of pages without pre-extracted text; None for the others.
+
+        None is also returned for pages whose extraction failed, so _index_page retries
+        them with html_to_text and its fallback, and for mega-pages, which _index_page
+        streams under the time budget.
+        """
+        texts: List[Optional[str]] = [None] * len(batch)
+        bodies = [body_storage_value(page.get('body')) if not page.get('body_text') else '' for _, page in batch]
+        positions = [i for i, body in enumerate(bodies) if body and len(body) <= STREAM_BODY_HTML_BYTES]
+        try:
+            cleaned = cleaner.clean([bodies[i] for i in positions], [page_body_hash(batch[i][1]) for i in positions])
+        except Exception as e:
+            logger.warning(f"Parallel text extraction failed, extracting this batch in-process: {e}")
+            return texts
+        for i, text in zip(positions, cleaned):
+            texts[i] = text
+        return texts
+
+    def _stream_body_text(self, page: Dict[str, Any], body_html: str) -> str:
+        """Text of a mega-page body, extracted piece by piece within body_time_budget."""
+        digest = None
+        if self.text_cache is not None:
+            digest = page_body_hash(page)
+            text = self.text_cache.get(digest)
+            if text is not None:
+                return text
+        result = stream_text(body_html, self.body_time_budget)
+        self.stream_stats['pages'] += 1
+        self.stream_stats['bytes'] += result.total_chars
+        self.stream_stats['processed_bytes'] += result.processed_chars
+        message = (
+            f"Streamed page {page.get('id', '')} ({page.get('title', '')!r}): "
+            f"{result.processed_chars:,} of {result.total_chars:,} bytes ({100 * result.coverage:.1f}%) "
+            f"in {result.pieces} pieces, {result.elapsed:.1f}s"
+        )
+        if result.complete:
+            logger.info(message)
+            if digest:
+                self.text_cache.put(digest, result.text)
+        else:
+            self.stream_stats['incomplete'] += 1
+            logger.warning(f"{message}; time budget of {self.body_time_budget}s reached")
+        return result.text
+
+    def stream_summary(self) -> str:
+        """How much of the streamed mega-pages made it into the index."""
+        stats = self.stream_stats
+        coverage = 100.0 * stats['processed_bytes'] / stats['bytes'] if stats['bytes'] else 100.0
+        return (f"Mega-pages streamed: {stats['pages']:,}, {stats['processed_bytes']:,} of "
+                f"{stats['bytes']:,} bytes indexed ({coverage:.1f}%), "
+                f"{stats['incomplete']:,} cut short by the time budget")
+
+    def _index_page(self, writer, space_key: str, page: Dict[str, Any],
+                    body_text: Optional[str] = None) -> None:
         """Index a single page.
 
         Args:
             writer: WHOOSH writer
             space_key: Space key
             page: Page data dictionary
+            body_text: Text already extracted from the page body, if any
         """
         page_id = str(page.get('id', ''))
         title = page.get('title', '')
 
-        # Use pre-extracted plain text if available (from pickle-time extraction)
-        body_text = page.get('body_text', '')
-
-        if not body_text:
-            # Fall back to extracting from HTML storage
-            body_html = ''
-            body_data = page.get('body', {})
-            if isinstance(body_data, dict):
-                storage = body_data.get('storage', {})
-                if isinstance(storage, dict):
-                    body_html = storage.get('value', '')
-                elif isinstance(storage, str):
-                    body_html = storage
-            elif isinstance(body_data, str):
-                body_html = body_data
-
-            # Truncate mega-bodies to avoid stalling on multi-MB pages
-            if len(body_html) > MAX_BODY_HTML_BYTES:
-                logger.warning(
-                    f"Truncating page {page_id} ({title!r}) body from "
-                    f"{len(body_html):,} to {MAX_BODY_HTML_BYTES:,} bytes"
-                )
-                body_html = body_html[:MAX_BODY_HTML_BYTES]
-
-            body_text = html_to_text(body_html) if body_html else ''
+        if body_text is None:
+            # Use pre-extracted plain text if available (from pickle-time extraction)
+            body_text = page.get('body_text', '')
+
+            if not body_text:
+                # Fall back to extracting from HTML storage
+                body_html = body_storage_value(page.get('body'))
+                if len(body_html) > STREAM_BODY_HTML_BYTES:
+                    body_text = self._stream_body_text(page, body_html)
+                else:
+                    body_text = html_to_text(body_html) if body_html else ''
 
         # Parse version/history for updated date
         updated = None
@@ -1,31 +1,35 @@
 """Load and manage pickled Confluence data."""
 
 import os
-import pickle
 import logging
 import re
-from typing import Dict, List, Optional, Any
+import sys
+from collections.abc import Sequence
+from typing import Callable, Dict, List, Optional, Any
 from pathlib import Path
 
+# Add parent directory to path to import the split space format from confluence-viz
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.atomic_io import FileLock
+from utils.change_ledger import body_storage_value
+from utils.corpus_loader import CorpusLoader
+from utils.split_space import META_SUFFIX, SplitSpace, find_split_spaces, write_split_space
+from utils.streaming_pickle import load_space
+
 logger = logging.getLogger(__name__)
 
+# Converting a very large pickle into the body store can take a while; other server
+# processes wait this long for it rather than converting the same space twice
+BODY_STORE_LOCK_TIMEOUT = 3600
+
 
 def _extract_body_text(page: Dict[str, Any]) -> str:
     """Extract plain text from page body for in-memory search.
 
     Uses BeautifulSoup for basic HTML stripping. Falls back gracefully.
     """
-    body_data = page.get('body', {})
-    body_html = ''
-    if isinstance(body_data, dict):
-        storage = body_data.get('storage', {})
-        if isinstance(storage, dict):
-            body_html = storage.get('value', '')
-        elif isinstance(storage, str):
-            body_html = storage
-    elif isinstance(body_data, str):
-        body_html = body_data
-
+    body_html = body_storage_value(page.get('body'))
     if not body_html:
         return ''
 
@@ -42,17 +46,44 @@ def _extract_body_text(page: Dict[str, Any]) -> str:
         return re.sub(r'<[^>]+>', ' ', body_html)
 
 
+class _LazyPages(Sequence):
+    """Read-only page sequence that attaches bodies only as items are accessed.
+
+    Used for split-format spaces, whose bodies stay on disk until a caller looks at them.
+    """
+
+    def __init__(self, items: List[Any], hydrate: Callable[[Any], Any]):
+        self._items = items
+        self._hydrate = hydrate
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._hydrate(item) for item in self._items[index]]
+        return self._hydrate(self._items[index])
+
+
 class PickleLoader:
     """Manages loading and caching of pickled Confluence data."""
 
-    def __init__(self, pickle_dir: str):
+    def __init__(self, pickle_dir: str, body_store_dir: Optional[str] = None,
+                 compress_bodies: bool = False):
         """Initialize pickle loader.
 
         Args:
-            pickle_dir: Directory containing .pkl files
+            pickle_dir: Directory containing .pkl files and/or split-format .meta files
+            body_store_dir: If set, legacy pickles are converted once into split-format
+                spaces in this directory and their bodies served from memory-mapped files
+                instead of being kept in memory
+            compress_bodies: zstd-compress bodies in the body store (needs zstandard)
         """
         self.pickle_dir = pickle_dir
+        self.body_store_dir = body_store_dir
+        self.compression = 'zstd' if compress_bodies else None
         self._cache: Dict[str, Dict[str, Any]] = {}
+        self._split_spaces: Dict[str, SplitSpace] = {}  # space_key -> open split space (bodies on disk)
         self._pages_by_id: Dict[str, tuple] = {}  # page_id -> (space_key, page_data)
         self._pages_by_title: Dict[tuple, tuple] = {}  # (title, space_key) -> (space_key, page_data)
         self._children_by_parent: Dict[str, List[tuple]] = {}  # parent_id -> [(space_key, page_data), ...]
@@ -70,14 +101,33 @@ class PickleLoader:
             logger.error(f"Pickle directory not found: {self.pickle_dir}")
             return
 
-        pickle_files = list(Path(self.pickle_dir).glob('*.pkl'))
-        logger.info(f"Found {len(pickle_files)} pickle files in {self.pickle_dir}")
-
-        for pickle_file in pickle_files:
+        # Split-format spaces load metadata only; a legacy pickle of the same space is skipped
+        split_files = find_split_spaces(self.pickle_dir)
+        split_stems = {Path(path).stem for path in split_files}
+        for meta_file in split_files:
             try:
-                self._load_pickle(str(pickle_file))
+                self._load_split_space(meta_file)
             except Exception as e:
-                logger.error(f"Error loading {pickle_file}: {e}")
+                logger.error(f"Error loading {meta_file}: {e}")
+
+        pickle_files = [path for path in Path(self.pickle_dir).glob('*.pkl') if path.stem not in split_stems]
+        logger.info(f"Found {len(pickle_files)} pickle files and {len(split_files)} split spaces in {self.pickle_dir}")
+
+        if self.body_store_dir:
+            os.makedirs(self.body_store_dir, exist_ok=True)
+            for pickle_file in pickle_files:
+                try:
+                    self._load_pickle_into_store(str(pickle_file))
+                except Exception as e:
+                    logger.error(f"Error loading {pickle_file}: {e}")
+        elif pickle_files:
+            # Read the pickles on a thread pool, indexing each space as it arrives
+            loader = CorpusLoader(self.pickle_dir, validate=lambda data: isinstance(data, dict),
+                                  on_error=lambda path, e: logger.error(f"Error loading {path}: {e}"))
+            files = [corpus_file for corpus_file in loader.select() if corpus_file.kind == 'pickle']
+            for corpus_file, data in loader.load_files(files):
+                self._add_space(data, corpus_file.path)
+            logger.info(loader.stats.summary())
 
         self._loaded = True
         logger.info(f"Loaded {len(self._cache)} spaces with {len(self._pages_by_id)} total pages")
@@ -89,48 +139,121 @@ class PickleLoader:
             filepath: Path to the pickle file
         """
         try:
-            with open(filepath, 'rb') as f:
-                data = pickle.load(f)
-
-            # Expected format: {'space_key': str, 'name': str, 'sampled_pages': list, ...}
-            space_key = data.get('space_key')
-            if not space_key:
-                logger.warning(f"No space_key in {filepath}")
-                return
-
-            self._cache[space_key] = data
-
-            # Index pages by ID and title
-            pages = data.get('sampled_pages', [])
-            for page in pages:
-                page_id = page.get('id')
-                page_title = page.get('title')
-
-                if page_id:
-                    self._pages_by_id[str(page_id)] = (space_key, page)
-
-                if page_title:
-                    # Index by (title, space_key) for lookups
-                    self._pages_by_title[(page_title, space_key)] = (space_key, page)
-
-                # Index parent-child relationships
-                parent_id = page.get('parent_id')
-                if not parent_id:
-                    ancestors = page.get('ancestors', [])
-                    if ancestors and isinstance(ancestors[-1], dict):
-                        parent_id = str(ancestors[-1].get('id', ''))
-                if parent_id:
-                    parent_id = str(parent_id)
-                    if parent_id not in self._children_by_parent:
-                        self._children_by_parent[parent_id] = []
-                    self._children_by_parent[parent_id].append((space_key, page))
-
-            logger.debug(f"Loaded space {space_key} from {filepath} with {len(pages)} pages")
+            self._add_space(load_space(filepath), filepath)
 
         except Exception as e:
             logger.error(f"Failed to load pickle {filepath}: {e}")
             raise
 
+    def _add_space(self, data: Dict[str, Any], filepath: str) -> None:
+        """Cache and index a space loaded from filepath."""
+        # Expected format: {'space_key': str, 'name': str, 'sampled_pages': list, ...}
+        space_key = data.get('space_key')
+        if not space_key:
+            logger.warning(f"No space_key in {filepath}")
+            return
+
+        self._cache[space_key] = data
+        pages = data.get('sampled_pages', [])
+        self._index_pages(space_key, pages)
+        logger.debug(f"Loaded space {space_key} from {filepath} with {len(pages)} pages")
+
+    def _load_pickle_into_store(self, filepath: str) -> None:
+        """Serve a legacy pickle from the body store, (re)building its entry if the pickle changed.
+
+        Args:
+            filepath: Path to the pickle file
+        """
+        stat = os.stat(filepath)
+        source = {'file': os.path.abspath(filepath), 'mtime': stat.st_mtime, 'size': stat.st_size,
+                  'compression': self.compression}
+        meta_path = os.path.join(self.body_store_dir, Path(filepath).stem + META_SUFFIX)
+
+        with FileLock(meta_path + '.lock', timeout=BODY_STORE_LOCK_TIMEOUT, stale_after=BODY_STORE_LOCK_TIMEOUT):
+            space = None
+            if os.path.exists(meta_path):
+                try:
+                    space = SplitSpace(meta_path, use_mmap=True)
+                except Exception as e:
+                    logger.warning(f"Rebuilding unreadable body store entry {meta_path}: {e}")
+                if space is not None and space.source != source:
+                    space.close()
+                    space = None
+            if space is None:
+                data = load_space(filepath)
+                if not isinstance(data, dict) or not data.get('space_key'):
+                    logger.warning(f"No space_key in {filepath}")
+                    return
+                write_split_space(data, meta_path, source=source, compression=self.compression)
+                # Only the metadata is kept; the bodies are read back through the map
+                del data
+                space = SplitSpace(meta_path, use_mmap=True)
+                logger.info(f"Added {filepath} to the body store")
+
+        self._load_split_space(meta_path, space)
+
+    def _load_split_space(self, meta_path: str, space: Optional[SplitSpace] = None) -> None:
+        """Load the metadata of a split-format space; bodies are read when pages are handed out.
+
+        Args:
+            meta_path: Path to the space's .meta file
+            space: The space, if it is already open
+        """
+        if space is None:
+            space = SplitSpace(meta_path, use_mmap=True)
+        space_key = space.space_key
+        if not space_key:
+            space.close()
+            logger.warning(f"No space_key in {meta_path}")
+            return
+
+        data = dict(space.header)
+        data['sampled_pages'] = space.pages
+        self._cache[space_key] = data
+        self._split_spaces[space_key] = space
+        self._index_pages(space_key, space.pages)
+        logger.debug(f"Loaded split space {space_key} from {meta_path} with {len(space)} pages")
+
+    def _index_pages(self, space_key: str, pages: List[Dict[str, Any]]) -> None:
+        """Index pages by ID, title and parent."""
+        for page in pages:
+            page_id = page.get('id')
+            page_title = page.get('title')
+
+            if page_id:
+                self._pages_by_id[str(page_id)] = (space_key, page)
+
+            if page_title:
+                # Index by (title, space_key) for lookups
+                self._pages_by_title[(page_title, space_key)] = (space_key, page)
+
+            # Index parent-child relationships
+            parent_id = page.get('parent_id')
+            if not parent_id:
+                ancestors = page.get('ancestors', [])
+                if ancestors and isinstance(ancestors[-1], dict):
+                    parent_id = str(ancestors[-1].get('id', ''))
+            if parent_id:
+                parent_id = str(parent_id)
+                if parent_id not in self._children_by_parent:
+                    self._children_by_parent[parent_id] = []
+                self._children_by_parent[parent_id].append((space_key, page))
+
+    def with_body(self, space_key: str, page: Dict[str, Any]) -> Dict[str, Any]:
+        """Return page with its body, reading it from disk for split-format spaces."""
+        space = self._split_spaces.get(space_key)
+        if space is None or 'body' in page:
+            return page
+        index = space.index_of(page.get('id'))
+        if index is None:
+            return page
+        return space.page(index)
+
+    def close(self) -> None:
+        """Unmap the bodies files of split-format spaces."""
+        for space in self._split_spaces.values():
+            space.close()
+
     def get_all_spaces(self) -> List[Dict[str, Any]]:
         """Get all loaded spaces.
 
@@ -158,7 +281,12 @@ class PickleLoader:
             Space data dictionary or None
         """
         self.load_all_pickles()
-        return self._cache.get(space_key)
+        data = self._cache.get(space_key)
+        if data is None or space_key not in self._split_spaces:
+            return data
+        space = dict(data)
+        space['sampled_pages'] = _LazyPages(data['sampled_pages'], lambda page: self.with_body(space_key, page))
+        return space
 
     def get_page_by_id(self, page_id: str) -> Optional[Dict[str, Any]]:
         """Get a page by its ID.
@@ -172,7 +300,7 @@ class PickleLoader:
         self.load_all_pickles()
         result = self._pages_by_id.get(str(page_id))
         if result:
-            return {'space_key': result[0], 'page': result[1]}
+            return {'space_key': result[0], 'page': self.with_body(*result)}
         return None
 
     def get_page_by_title(self, title: str, space_key: str) -> Optional[Dict[str, Any]]:
@@ -188,7 +316,7 @@ class PickleLoader:
         self.load_all_pickles()
         result = self._pages_by_title.get((title, space_key))
         if result:
-            return {'space_key': result[0], 'page': result[1]}
+            return {'space_key': result[0], 'page': self.with_body(*result)}
         return None
 
     def get_pages_in_space(self, space_key: str, limit: int = 25, start: int = 0) -> List[Dict[str, Any]]:
@@ -210,14 +338,33 @@ class PickleLoader:
         pages = space.get('sampled_pages', [])
         return pages[start:start + limit]
 
-    def get_all_pages(self) -> List[tuple]:
+    def get_all_pages(self) -> Sequence:
         """Get all pages from all spaces.
 
+        Bodies of split-format spaces are read one page at a time as the result is iterated.
+
+        Returns:
+            Sequence of (space_key, page_data) tuples
+        """
+        self.load_all_pickles()
+        items = self.get_page_entries()
+        if not self._split_spaces:
+            return items
+        return _LazyPages(items, lambda item: (item[0], self.with_body(*item)))
+
+    def get_page_entries(self, space_key: Optional[str] = None) -> List[tuple]:
+        """Get (space_key, page_data) for every page without reading split-format bodies.
+
+        Pages of split-format spaces come without 'body'; pass them to with_body() when needed.
+
+        Args:
+            space_key: Only return pages of this space
+
         Returns:
             List of (space_key, page_data) tuples
         """
         self.load_all_pickles()
-        return [(space_key, page) for space_key, page in self._pages_by_id.values()]
+        return [item for item in self._pages_by_id.values() if space_key is None or item[0] == space_key]
 
     def get_children(self, page_id: str, limit: int = 25,
                      start: int = 0) -> List[Dict[str, Any]]:
@@ -234,7 +381,7 @@ class PickleLoader:
         self.load_all_pickles()
         children = self._children_by_parent.get(str(page_id), [])
         return [
-            {'space_key': sk, 'page': page}
+            {'space_key': sk, 'page': self.with_body(sk, page)}
             for sk, page in children[start:start + limit]
         ]
 
@@ -253,7 +400,7 @@ class PickleLoader:
 
         for (title, space_key), (sk, page) in self._pages_by_title.items():
             if query_lower in title.lower():
-                results.append({'space_key': sk, 'page': page})
+                results.append({'space_key': sk, 'page': self.with_body(sk, page)})
 
         return results
 
@@ -289,13 +436,14 @@ class PickleLoader:
             if all(w in title for w in query_words):
                 title_results.append({
                     'space_key': sk,
-                    'page': page,
+                    'page': self.with_body(sk, page),
                     'match_type': 'title'
                 })
                 continue
 
             # Check body match (skip if title_only)
             if not title_only:
+                page = self.with_body(sk, page)
                 body_text = _extract_body_text(page).lower()
                 if all(w in body_text for w in query_words):
                     body_results.append({
@@ -337,7 +485,7 @@ class PickleLoader:
             if space_key and sk.upper() != space_key.upper():
                 continue
             if t.lower() == title_lower:
-                return {'space_key': space, 'page': page}
+                return {'space_key': space, 'page': self.with_body(space, page)}
 
         # 3. Partial match - prefer shorter titles that contain the query
         candidates = []
@@ -354,6 +502,7 @@ class PickleLoader:
         if candidates:
             # Prefer closest length match
             candidates.sort(key=lambda c: abs(c['title_len'] - len(title)))
-            return {'space_key': candidates[0]['space_key'], 'page': candidates[0]['page']}
+            best = candidates[0]
+            return {'space_key': best['space_key'], 'page': self.with_body(best['space_key'], best['page'])}
 
         return None
@@ -118,8 +118,9 @@ from fastmcp import FastMCP
 
 from config import get_config
 from pickle_loader import PickleLoader
+from utils.change_ledger import body_storage_value
 from indexer import ConfluenceIndexer
-from converters import html_to_markdown, html_to_text
+from converters import html_to_markdown, html_to_text, use_html_cleaner
 from search import translate_cql
 from fallback import ConfluenceFallbackClient
 
@@ -404,16 +405,7 @@ def confluence_get_labels(page_id: str) -> str:
 
 def _extract_body_html(page: Dict[str, Any]) -> str:
     """Extract HTML body content from a page dict."""
-    body_data = page.get('body', {})
-    if isinstance(body_data, dict):
-        storage = body_data.get('storage', {})
-        if isinstance(storage, dict):
-            return storage.get('value', '')
-        elif isinstance(storage, str):
-            return storage
-    elif isinstance(body_data, str):
-        return body_data
-    return ''
+    return body_storage_value(page.get('body'))
 
 
 def _format_page_text(page: Dict[str, Any], space_key: str,
@@ -490,9 +482,10 @@ def initialize_server():
     config = get_config()
     logger.info(f"Pickle directory: {config.pickle_dir}")
     logger.info(f"Index directory: {config.index_dir}")
+    use_html_cleaner(config.html_cleaner)
 
     # Initialize pickle loader
-    pickle_loader = PickleLoader(config.pickle_dir)
+    pickle_loader = PickleLoader(config.pickle_dir, config.body_store_dir or None, config.compress_bodies)
     pickle_loader.load_all_pickles()
 
     # Initialize indexer
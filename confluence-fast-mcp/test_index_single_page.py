@@ -24,7 +24,8 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(__file__))
 
 from converters import html_to_text
-from indexer import ConfluenceIndexer, MAX_BODY_HTML_BYTES
+from indexer import ConfluenceIndexer, STREAM_BODY_HTML_BYTES
+from utils.stream_cleaner import stream_text
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -98,13 +99,13 @@ def diagnose_page(space_key: str, page: dict) -> dict:
         print(f"    Pre-extracted body_text: {text_len:,} chars")
         print(f"    Raw HTML body:           {html_len:,} chars")
 
-        if html_len > MAX_BODY_HTML_BYTES:
-            print(f"    WARNING: HTML exceeds MAX_BODY_HTML_BYTES ({MAX_BODY_HTML_BYTES:,}), will be truncated")
+        if html_len > STREAM_BODY_HTML_BYTES:
+            print(f"    NOTE: HTML exceeds STREAM_BODY_HTML_BYTES ({STREAM_BODY_HTML_BYTES:,}), will be streamed")
 
         result['steps']['extract_html'] = {
             'html_len': html_len,
             'body_text_len': text_len,
-            'truncated': html_len > MAX_BODY_HTML_BYTES,
+            'streamed': html_len > STREAM_BODY_HTML_BYTES,
         }
     except Exception as e:
         print(f"    FAILED: {e}")
@@ -120,12 +121,13 @@ def diagnose_page(space_key: str, page: dict) -> dict:
             print(f"    Using pre-extracted body_text ({text_len:,} chars)")
             converted_text = body_text
         elif body_html:
-            if len(body_html) > MAX_BODY_HTML_BYTES:
-                body_html = body_html[:MAX_BODY_HTML_BYTES]
-                print(f"    Truncated to {MAX_BODY_HTML_BYTES:,} bytes")
-
             t0 = time.time()
-            converted_text = html_to_text(body_html)
+            if len(body_html) > STREAM_BODY_HTML_BYTES:
+                streamed = stream_text(body_html)
+                converted_text = streamed.text
+                print(f"    Streamed {streamed.pieces} pieces, {100 * streamed.coverage:.1f}% of the body")
+            else:
+                converted_text = html_to_text(body_html)
             elapsed = time.time() - t0
             print(f"    Converted in {elapsed:.2f}s -> {len(converted_text):,} chars of text")
 
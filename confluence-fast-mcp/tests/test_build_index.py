@@ -0,0 +1,101 @@
+"""Tests for incremental index builds."""
+
+import os
+import pickle
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('whoosh')
+
+import build_index
+import indexer
+from indexer import STREAM_BODY_HTML_BYTES, ConfluenceIndexer
+from utils import batch_cleaner
+from utils.change_ledger import set_body_hash
+
+
+def _write_space(pickle_dir, pages):
+    with open(os.path.join(pickle_dir, 'TEST.pkl'), 'wb') as f:
+        pickle.dump({'space_key': 'TEST', 'name': 'Test Space', 'sampled_pages': pages}, f)
+
+
+def _page(page_id, text):
+    return set_body_hash({'id': page_id, 'title': f'Page {page_id}', 'body': f'<p>{text}</p>'})
+
+
+@pytest.fixture
+def config():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pickle_dir = os.path.join(tmpdir, 'pickles')
+        os.makedirs(pickle_dir)
+        yield SimpleNamespace(pickle_dir=pickle_dir, index_dir=os.path.join(tmpdir, 'index'),
+                              body_store_dir='', compress_bodies=False, body_time_budget=None,
+                              text_cache='')
+
+
+def _indexed_ids(config):
+    ix = ConfluenceIndexer(config.index_dir).ix
+    with ix.searcher() as searcher:
+        return sorted(doc['page_id'] for doc in searcher.all_stored_fields())
+
+
+def test_incremental_indexes_only_changes(config, monkeypatch):
+    _write_space(config.pickle_dir, [_page('1', 'alpha'), _page('2', 'beta'), _page('3', 'gamma')])
+    build_index.rebuild_all(config)
+    assert _indexed_ids(config) == ['1', '2', '3']
+
+    _write_space(config.pickle_dir, [_page('1', 'alpha'), _page('2', 'beta edited'), _page('4', 'delta')])
+    indexed = []
+    original = ConfluenceIndexer.index_all_pages
+
+    def recording(self, pages, clear_first=False):
+        indexed.extend(page['id'] for _, page in pages)
+        return original(self, pages, clear_first)
+
+    monkeypatch.setattr(ConfluenceIndexer, 'index_all_pages', recording)
+    build_index.update_changed(config)
+
+    assert sorted(indexed) == ['2', '4']
+    assert _indexed_ids(config) == ['1', '2', '4']
+    with build_index.open_ledger(config) as ledger:
+        assert sorted(ledger.hashes()) == ['1', '2', '4']
+
+
+def test_rebuild_with_clean_workers(config, monkeypatch):
+    monkeypatch.setattr(batch_cleaner, 'MIN_PARALLEL_CHARS', 0)
+    pages = [_page(str(i), f'word{i} shared') for i in range(1, 8)]
+    pages.append({'id': '8', 'title': 'Page 8', 'body': '<p>ignored</p>', 'body_text': 'pretext'})
+    _write_space(config.pickle_dir, pages)
+    build_index.rebuild_all(config, clean_workers=2)
+
+    indexer = ConfluenceIndexer(config.index_dir)
+    assert [hit['page_id'] for hit in indexer.search('word5')] == ['5']
+    assert [hit['page_id'] for hit in indexer.search('pretext')] == ['8']
+    assert len(indexer.search('shared')) == 7
+
+
+def test_mega_page_is_indexed_to_the_end(config):
+    filler = '<p>' + 'filler text ' * 100 + '</p>'
+    body = filler * (2 * STREAM_BODY_HTML_BYTES // len(filler)) + '<p>needleword</p>'
+    indexer = ConfluenceIndexer(config.index_dir, body_time_budget=None)
+    indexer.index_all_pages([('TEST', {'id': '1', 'title': 'Minutes', 'body': body})], clear_first=True)
+    assert [hit['page_id'] for hit in indexer.search('needleword')] == ['1']
+    assert indexer.stream_stats['processed_bytes'] == indexer.stream_stats['bytes'] == len(body)
+    assert indexer.stream_stats['incomplete'] == 0
+
+
+def test_rebuild_reads_text_cache(config, monkeypatch):
+    config.text_cache = os.path.join(os.path.dirname(config.index_dir), 'text_cache.sqlite')
+    _write_space(config.pickle_dir, [_page(str(i), f'word{i} shared') for i in range(1, 6)])
+    cleaned = []
+    for module, name in ((batch_cleaner, 'clean_body'), (indexer, 'html_to_text')):
+        original = getattr(module, name)
+        monkeypatch.setattr(module, name, lambda *args, original=original: cleaned.append(args) or original(*args))
+
+    build_index.rebuild_all(config)
+    assert len(cleaned) == 5
+    build_index.rebuild_all(config)
+    assert len(cleaned) == 5
+    assert [hit['page_id'] for hit in ConfluenceIndexer(config.index_dir).search('word3')] == ['3']
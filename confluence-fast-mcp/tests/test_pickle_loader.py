@@ -5,6 +5,7 @@ import pickle
 import tempfile
 import os
 from pickle_loader import PickleLoader
+from utils.split_space import convert_pickle_to_split
 
 
 @pytest.fixture
@@ -106,3 +107,52 @@ def test_nonexistent_directory():
 
     spaces = loader.get_all_spaces()
     assert len(spaces) == 0
+
+
+def test_split_space_loads_metadata_and_reads_bodies_on_demand(temp_pickle_dir):
+    """Test that split-format spaces replace their pickle and hand out pages with bodies."""
+    convert_pickle_to_split(os.path.join(temp_pickle_dir, 'TEST.pkl'))
+    loader = PickleLoader(temp_pickle_dir)
+    loader.load_all_pickles()
+
+    assert [s['key'] for s in loader.get_all_spaces()] == ['TEST']
+    assert all('body' not in page for page in loader._cache['TEST']['sampled_pages'])
+
+    result = loader.get_page_by_id('67890')
+    assert result['page']['body']['storage']['value'] == '<p>More content</p>'
+
+    pages = loader.get_pages_in_space('TEST', limit=1, start=1)
+    assert [p['title'] for p in pages] == ['Test Page 2'] and 'body' in pages[0]
+
+    all_pages = loader.get_all_pages()
+    assert len(all_pages) == 2
+    assert all('body' in page for _, page in all_pages)
+
+    results = loader.search_content('more content')
+    assert [r['page']['id'] for r in results] == ['67890']
+
+
+def test_body_store_serves_legacy_pickles_from_mapped_files(temp_pickle_dir):
+    """Test that a body store keeps only metadata in memory and rebuilds when the pickle changes."""
+    store_dir = os.path.join(temp_pickle_dir, 'store')
+    loader = PickleLoader(temp_pickle_dir, body_store_dir=store_dir)
+    loader.load_all_pickles()
+
+    assert os.path.exists(os.path.join(store_dir, 'TEST.meta'))
+    assert all('body' not in page for page in loader._cache['TEST']['sampled_pages'])
+    assert loader.get_page_by_id('12345')['page']['body']['storage']['value'] == '<p>Test content</p>'
+    loader.close()
+
+    # A second process reuses the store; a changed pickle is converted again
+    with open(os.path.join(temp_pickle_dir, 'TEST.pkl'), 'rb') as f:
+        data = pickle.load(f)
+    data['sampled_pages'][0]['body'] = '<p>Changed</p>'
+    with open(os.path.join(temp_pickle_dir, 'TEST.pkl'), 'wb') as f:
+        pickle.dump(data, f)
+    os.utime(os.path.join(temp_pickle_dir, 'TEST.pkl'), (1, 1))
+
+    loader = PickleLoader(temp_pickle_dir, body_store_dir=store_dir)
+    loader.load_all_pickles()
+    assert loader.get_page_by_id('12345')['page']['body'] == '<p>Changed</p>'
+    assert len([name for name in os.listdir(store_dir) if name.endswith('.bodies')]) == 1
+    loader.close()
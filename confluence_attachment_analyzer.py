@@ -6,6 +6,8 @@ import sys
 import time
 from collections import defaultdict
 
+from utils.attachment_store import INDEX_FILENAME, AttachmentStore
+
 try:
     import magic
 except ImportError:
@@ -164,6 +166,19 @@ def human_readable_size(size):
     return f"{size:.2f}EB"
 
 
+def iter_directory_files(directory):
+    """Yield (name, path) for every file below directory."""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            yield name, os.path.join(root, name)
+
+
+def iter_store_files(store):
+    """Yield (title, blob path) for every attachment version in the store; shared blobs repeat."""
+    for entry in store.entries():
+        yield entry['title'] or entry['attachment_id'], entry['path']
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Summarize file types in a directory with metadata lookup.",
@@ -175,6 +190,10 @@ def main():
     parser.add_argument(
         "--human", action="store_true", help="Show human-readable sizes (e.g., 1.23MB)"
     )
+    parser.add_argument(
+        "--store", action="store_true",
+        help="Treat the directory as a content-addressed attachment store (sample_and_pickle_*.py) and classify attachments by their titles"
+    )
     args = parser.parse_args()
 
     # Validate directory parameter
@@ -183,8 +202,15 @@ def main():
         parser.print_help()
         sys.exit(1)
 
+    store = None
+    if args.store:
+        if not os.path.exists(os.path.join(args.directory, INDEX_FILENAME)):
+            print(f"Error: '{args.directory}' has no {INDEX_FILENAME}; it is not an attachment store.")
+            sys.exit(1)
+        store = AttachmentStore(args.directory)
+
     # Notify user of start
-    print(f"Scanning directory: {args.directory}")
+    print(f"Scanning {'attachment store' if store else 'directory'}: {args.directory}")
     print("This may take a while for large trees...")
     start_time = time.time()
 
@@ -195,44 +221,52 @@ def main():
     unknown_samples = {}
 
     mime_detector = magic.Magic(mime=True)
+    # A stored blob shared by many attachments is only inspected once
+    mime_cache = {}
     file_count = 0
 
-    for root, _, files in os.walk(args.directory):
-        for name in files:
-            file_count += 1
-            # Print a dot for every file to indicate progress
-            print('.', end='', flush=True)
-
-            path = os.path.join(root, name)
-            ext = os.path.splitext(name)[1].lower().lstrip('.')
-            if not ext:
-                try:
-                    ext = 'drawio' if zipfile.is_zipfile(path) else 'no_extension'
-                except:
-                    ext = 'no_extension'
+    for name, path in (iter_store_files(store) if store else iter_directory_files(args.directory)):
+        file_count += 1
+        # Print a dot for every file to indicate progress
+        print('.', end='', flush=True)
 
-            counts[ext] += 1
+        ext = os.path.splitext(name)[1].lower().lstrip('.')
+        if not ext:
             try:
-                size = os.path.getsize(path)
-                sizes[ext] += size
-            except OSError:
-                continue
+                ext = 'drawio' if zipfile.is_zipfile(path) else 'no_extension'
+            except:
+                ext = 'no_extension'
+
+        counts[ext] += 1
+        try:
+            size = os.path.getsize(path)
+            sizes[ext] += size
+        except OSError:
+            continue
 
+        if path not in mime_cache:
             try:
-                mime = mime_detector.from_file(path)
+                mime_cache[path] = mime_detector.from_file(path)
             except:
-                mime = 'unknown'
-            mimes[ext][mime] += 1
+                mime_cache[path] = 'unknown'
+        mime = mime_cache[path]
+        mimes[ext][mime] += 1
 
-            if ext not in EXTENSION_METADATA:
-                unknown[ext] += 1
-                if ext not in unknown_samples:
-                    unknown_samples[ext] = (path, mime)
+        if ext not in EXTENSION_METADATA:
+            unknown[ext] += 1
+            if ext not in unknown_samples:
+                unknown_samples[ext] = (path, mime)
 
     # Finish progress indicator
     print()  # newline after dots
     elapsed = time.time() - start_time
     print(f"Scan complete. Processed {file_count} files in {elapsed:.2f}s.")
+    if store:
+        stats = store.stats()
+        store.close()
+        fmt = human_readable_size if args.human else str
+        print(f"Attachment store: {stats['attachments']} attachment versions share {stats['blobs']} stored files "
+              f"({fmt(stats['stored_bytes'])} on disk for {fmt(stats['logical_bytes'])} of attachments).")
 
     size_strs = {
         ext: (human_readable_size(sizes[ext]) if args.human else str(sizes[ext]))
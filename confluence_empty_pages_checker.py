@@ -4,18 +4,17 @@ import os
 import argparse
 import sys
 import logging
-import time
 import json
-import requests
 import base64
-import random
 import datetime
-import pickle  # Required for loading pickled spaces
 from getpass import getpass # Use getpass if not using env vars for password
 import csv
 
 # Import the config loader
 from config_loader import load_confluence_settings, load_data_settings
+from utils.change_ledger import body_storage_value
+from utils.confluence_client import get_client
+from utils.corpus_loader import CorpusLoader
 
 # Suppress only the single InsecureRequestWarning from urllib3 needed
 import urllib3
@@ -89,67 +88,22 @@ if not CONFLUENCE_PASSWORD:
 
 # --- REST API Helpers ---
 def create_session():
-    """Create a requests session with basic auth and common headers"""
-    session = requests.Session()
-    session.auth = (CONFLUENCE_USERNAME, CONFLUENCE_PASSWORD)
-    session.headers.update({
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    })
-    session.verify = VERIFY_SSL
-    return session
+    """Return the shared pooled Confluence client (basic auth, keep-alive, gzip, retries)"""
+    return get_client(CONFLUENCE_URL, CONFLUENCE_USERNAME, CONFLUENCE_PASSWORD, VERIFY_SSL)
 
 def make_api_request(session, url, method='GET', params=None, data=None, max_retries=5):
     """
-    Make API request with exponential backoff for 429 responses
+    Make API request through the shared client, which retries 429 responses
+    (honouring Retry-After) and transient errors with exponential backoff
     """
-    retry_count = 0
-    base_wait_time = 2  # Start with 2 seconds
-    
-    while retry_count <= max_retries:
-        try:
-            if method == 'GET':
-                response = session.get(url, params=params)
-            elif method == 'POST':
-                response = session.post(url, json=data, params=params)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            # If successful or non-429 error, return immediately
-            if response.status_code != 429:
-                response.raise_for_status()  # Raise exception for 4xx/5xx (except 429)
-                return response.json()
-                
-            # Handle 429 Too Many Requests with Retry-After header
-            retry_count += 1
-            
-            # ALWAYS respect the Retry-After header if present (RFC 7231 compliance)
-            retry_after = response.headers.get('Retry-After')
-            if retry_after:
-                # Retry-After can be a timestamp or number of seconds
-                if retry_after.isdigit():
-                    wait_time = int(retry_after)
-            else:
-                # Fallback to exponential backoff with jitter if no Retry-After header
-                wait_time = base_wait_time * (2 ** (retry_count - 1)) + random.uniform(0, 1)
-                
-            if wait_time == 0:
-                wait_time = 2
-                
-            print(f"Rate limited (429). Server Retry-After: {retry_after or 'Not provided'}. Waiting {wait_time:.2f} seconds... (Attempt {retry_count}/{max_retries})")
-            time.sleep(wait_time)
-            
-        except requests.exceptions.RequestException as e:
-            # For connection errors or other issues, retry with backoff
-            retry_count += 1
-            if retry_count > max_retries:
-                raise Exception(f"Maximum retries reached. Last error: {str(e)}")
-            
-            wait_time = base_wait_time * (2 ** (retry_count - 1)) + random.uniform(0, 1)
-            print(f"Request failed: {str(e)}. Retrying in {wait_time:.2f} seconds... (Attempt {retry_count}/{max_retries})")
-            time.sleep(wait_time)
-    
-    raise Exception("Maximum retries reached without successful response")
+    if method not in ('GET', 'POST'):
+        raise ValueError(f"Unsupported HTTP method: {method}")
+
+    response = session.request(method, url, params=params, json=data, max_retries=max_retries)
+    if response is None:
+        raise Exception("Maximum retries reached without successful response")
+    response.raise_for_status()  # Raise exception for 4xx/5xx
+    return response.json()
 
 def get_current_user(session):
     """Get current user information"""
@@ -320,28 +274,11 @@ def load_spaces(temp_dir=TEMP_DIR, min_pages=0, max_pages=None):
         return spaces
 
     print(f"Loading spaces from {temp_dir}...")
-    pkl_count = 0
-    loaded_count = 0
-    
-    for fname in os.listdir(temp_dir):
-        if fname.endswith('.pkl'):
-            pkl_count += 1
-            try:
-                with open(os.path.join(temp_dir, fname), 'rb') as f:
-                    data = pickle.load(f)
-                    if 'space_key' in data and 'sampled_pages' in data:
-                        # Use total_pages for filtering if available, otherwise fallback to sampled_pages length
-                        page_count = data.get('total_pages', len(data['sampled_pages']))
-                        # Apply both min and max filters
-                        meets_min = page_count >= min_pages
-                        meets_max = max_pages is None or page_count <= max_pages
-                        if meets_min and meets_max:
-                            spaces.append(data)
-                            loaded_count += 1
-            except Exception as e:
-                print(f"Error loading {fname}: {e}")
-    
-    print(f"Loaded {loaded_count} spaces from {pkl_count} pickle files.")
+    # Page-count filters are applied from the pickle catalog / split metadata before anything is unpickled
+    loader = CorpusLoader(temp_dir, min_pages=min_pages, max_pages=max_pages,
+                          on_error=lambda path, e: print(f"Error loading {os.path.basename(path)}: {e}"))
+    spaces.extend(loader.iter_spaces())
+    print(loader.stats.summary())
     return spaces
 
 def calculate_avg_timestamps(spaces):
@@ -673,7 +610,7 @@ def check_pages_in_space(space_key):
             print(f"Checking page {page_count}/{len(pages)}: '{page_title}' (ID: {page_id})")
 
             # 1. Check for empty content
-            storage_value = page.get('body', {}).get('storage', {}).get('value', '').strip()
+            storage_value = body_storage_value(page.get('body')).strip()
             is_content_empty = not storage_value
 
             if not is_content_empty:
@@ -777,7 +714,7 @@ def check_single_page(page_id):
             print(f"Found page: '{page_title}' (ID: {page_id})")
 
             # 1. Check for empty content
-            storage_value = page.get('body', {}).get('storage', {}).get('value', '').strip()
+            storage_value = body_storage_value(page.get('body')).strip()
             is_content_empty = not storage_value
 
             # 2. Check for attachments
@@ -889,7 +826,7 @@ def check_all_spaces():
                         print(f"  Progress: Checked {page_idx}/{len(pages)} pages in space '{space_key}'")
                     
                     # 1. Check for empty content
-                    storage_value = page.get('body', {}).get('storage', {}).get('value', '').strip()
+                    storage_value = body_storage_value(page.get('body')).strip()
                     is_content_empty = not storage_value
                     
                     if not is_content_empty:
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Shared test fixtures: a synthetic page body corpus, one body exercising every artifact and
+a local HTTP server with a Confluence client pointed at it
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mock_confluence_server import MockConfluence
+from utils.confluence_client import ConfluenceClient
+from utils.rate_limiter import AdaptiveRateLimiter
+
+# Links of every kind, attachments, macros, SQL, a list and a table
+BODY = (
+    '<h2>Links</h2><p>See <a href="https://example.com/doc">the doc</a>, <a href="#top">top</a> and '
+    '<ac:link><ri:page ri:content-title="Runbook" ri:space-key="OPS"/></ac:link> or '
+    '<ac:link><ri:page ri:content-title="Runbook" ri:space-key="OPS"/><ac:plain-text-link-body>'
+    '<![CDATA[again]]></ac:plain-text-link-body></ac:link> in <ac:link><ri:space ri:space-key="DEV"/></ac:link>.</p>'
+    '<ac:image><ri:attachment ri:filename="diagram.png"/></ac:image>'
+    '<ac:link><ri:attachment ri:filename="spec.pdf"><ri:page ri:content-title="Specs"/></ri:attachment></ac:link>'
+    '<ac:structured-macro ac:name="view-file"><ac:parameter ac:name="name">'
+    '<ri:attachment ri:filename="diagram.png"/></ac:parameter></ac:structured-macro>'
+    '<ac:structured-macro ac:name="info"><ac:rich-text-body><p>Note</p></ac:rich-text-body></ac:structured-macro>'
+    '<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">sql</ac:parameter>'
+    '<ac:plain-text-body><![CDATA[SELECT id, name FROM customers WHERE active = 1 ORDER BY name;]]>'
+    '</ac:plain-text-body></ac:structured-macro>'
+    '<ac:structured-macro ac:name="Info"/><ul><li>one</li><li>two</li></ul>'
+    '<table><tr><th>Key</th><th>Value</th></tr><tr><td>a</td><td>b</td></tr></table>'
+)
+
+
+def mock_bodies(pages=30, body_bytes=3000, seed=11):
+    """Bodies of every page of a two-space mock Confluence, SQL in about a third of them."""
+    mock = MockConfluence(spaces=2, pages=pages, body_bytes=body_bytes, sql_rate=0.3, seed=seed)
+    return [mock.body(page) for page in mock.pages.values()]
+
+
+@pytest.fixture
+def bodies():
+    return mock_bodies() + [BODY]
+
+
+class LocalServer:
+    """What the local HTTP server serves and what it was asked."""
+
+    def __init__(self):
+        self.url = None
+        # Path -> bytes, served with Range support (404 for other paths); None answers
+        # every request with its path as JSON
+        self.files = None
+        # (status, headers) for the next requests, answered with the path as JSON
+        self.script = []
+        # (path without query, Range header) of every request
+        self.requests = []
+        self.connections = set()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        state = self.server.state
+        path = self.path.split('?')[0]
+        range_header = self.headers.get('Range')
+        state.requests.append((path, range_header))
+        state.connections.add(self.client_address)
+        if state.script or state.files is None:
+            status, headers = state.script.pop(0) if state.script else (200, {})
+            self._send(status, json.dumps({'path': self.path}).encode(),
+                       {'Content-Type': 'application/json', **headers})
+            return
+        data = state.files.get(path)
+        if data is None:
+            self._send(404, b'')
+        elif not range_header:
+            self._send(200, data)
+        else:
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(data):
+                self._send(416, b'')
+            else:
+                self._send(206, data[start:], {'Content-Range': f'bytes {start}-{len(data) - 1}/{len(data)}'})
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.state = LocalServer()
+    httpd.state.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_client(base_url, **kwargs):
+    """A ConfluenceClient with a dedicated, fast limiter, independent of the process-wide one."""
+    limiter = AdaptiveRateLimiter(initial_rate=1000, max_rate=1000)
+    return ConfluenceClient(base_url, verbose=False, rate_limiter=limiter, **kwargs)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Convert space pickles between the legacy single-pickle format (SPACE.pkl) and the split
+format (SPACE.meta plus a bodies file, see utils/split_space.py), in either direction.
+"""
+
+import os
+import sys
+
+from utils.split_space import META_SUFFIX, SplitSpace, convert_pickle_to_split, convert_split_to_pickle
+
+
+def collect_inputs(paths, suffix):
+    """Expand directories into the files with the given suffix they contain."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(suffix))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert space pickles to and from the split metadata/body format')
+    parser.add_argument('direction', choices=['to-split', 'to-pickle'],
+                       help='to-split: SPACE.pkl -> SPACE.meta + bodies; to-pickle: SPACE.meta -> SPACE.pkl')
+    parser.add_argument('paths', nargs='*', default=['temp'],
+                       help='Files or directories to convert (default: temp)')
+    parser.add_argument('--output-dir',
+                       help='Write converted files here instead of next to the originals')
+    parser.add_argument('--remove-source', action='store_true',
+                       help='Delete each original once it has been converted')
+    parser.add_argument('--compress', action='store_true',
+                       help='to-split: zstd-compress each body with a dictionary trained per space (needs zstandard)')
+
+    args = parser.parse_args()
+
+    suffix = '.pkl' if args.direction == 'to-split' else META_SUFFIX
+    inputs = collect_inputs(args.paths, suffix)
+    if not inputs:
+        print(f"No {suffix} files found in {', '.join(args.paths)}")
+        return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    converted = 0
+    failed = 0
+    for source in inputs:
+        stem = os.path.splitext(os.path.basename(source))[0]
+        target = None
+        if args.output_dir:
+            target = os.path.join(args.output_dir, stem + ('.meta' if args.direction == 'to-split' else '.pkl'))
+        try:
+            if args.direction == 'to-split':
+                target = convert_pickle_to_split(source, target, compression='zstd' if args.compress else None)
+            else:
+                target = convert_split_to_pickle(source, target)
+        except Exception as e:
+            print(f"Error converting {source}: {e}")
+            failed += 1
+            continue
+        converted += 1
+        print(f"{source} -> {target}")
+        if args.remove_source:
+            if args.direction == 'to-pickle':
+                # The bodies file goes with its .meta
+                with SplitSpace(source) as split:
+                    bodies_path = split.bodies_path
+                os.remove(bodies_path)
+            os.remove(source)
+
+    print(f"\nConverted {converted} space(s), {failed} failed")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,15 @@
 # description: Provides counting utilities for Confluence visualization.
 
-import requests
 import time
 import warnings
 import urllib3 # Import urllib3 to reference its warning class
 import argparse # Import argparse for command-line arguments
-import random # Import random for jitter
 import os
 import pickle
 import datetime # Import datetime for date parsing and timestamp operations
 from config_loader import load_confluence_settings
+from utils.confluence_client import get_client
+from utils.pickle_catalog import PickleCatalog, record_pickle
 import json
 
 # --- Suppress InsecureRequestWarning ---
@@ -46,65 +46,40 @@ API_SEARCH_ENDPOINT = f'{CONFLUENCE_BASE_URL}/rest/api/search'
 
 def make_api_request(url, params=None, max_retries=5):
     """
-    Makes an API request, handling 429 rate limiting and disabling SSL verification.
+    Makes an API request through the shared pooled Confluence client, which handles
+    429 rate limiting (honouring Retry-After), transient errors and SSL verification.
     """
-    retries = 0
-    while retries < max_retries:
-        # Print details about the request we're making
-        query_params = '&'.join([f"{k}={v}" for k, v in (params or {}).items()])
-        request_url = f"{url}?{query_params}" if query_params else url
-        print(f"REST Request: GET {request_url}")
-        
-        try:
-            # Use authentication if credentials are available
-            auth = None
-            if USERNAME and PASSWORD:
-                auth = (USERNAME, PASSWORD)
-                
-            # Use the VERIFY_SSL setting from config
-            response = requests.get(url, params=params, verify=VERIFY_SSL, auth=auth)
-            print(f"Response Status: {response.status_code}")
-
-            if response.status_code == 200:
-                json_response = response.json()
-                # Print summary of response data
-                if isinstance(json_response, dict):
-                    keys = list(json_response.keys())
-                    print(f"Response contains keys: {keys}")
-                    if 'results' in json_response:
-                        print(f"Results count: {len(json_response['results'])}")
-                    if 'size' in json_response:
-                        print(f"Size value: {json_response['size']}")
-                    if 'totalSize' in json_response:
-                        print(f"Total size value: {json_response['totalSize']}")
-                return json_response
-
-            elif response.status_code == 429:
-                retry_after = response.headers.get('Retry-After')
-                # Add a small buffer + random jitter to wait_time in case multiple clients hit 429
-                wait_time = int(retry_after) if retry_after else (2 ** retries) * 5 # Exponential backoff if no header
-                jitter = random.uniform(0, 1) * 2 # Add up to 2 seconds of jitter
-                wait_time += jitter
-                print(f"Rate limited (429). Server requested Retry-After: {retry_after or 'Not specified'}")
-                print(f"Waiting for {wait_time:.2f} seconds before retry {retries + 1}/{max_retries}")
-                time.sleep(wait_time)
-                retries += 1
-                continue # Retry the request
-
-            else:
-                print(f"Error: Received status code {response.status_code} for {url}")
-                print(f"Response body: {response.text}")
-                # Handle other errors like 401, 403, 404, 500 etc.
-                # For unauthorized/forbidden with no auth, check anonymous access config
-                return None # Or raise an exception
-
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            # Basic handling, could implement retry for network errors too
-            return None
-
-    print(f"Failed to fetch data from {url} after {max_retries} retries.")
-    return None
+    # Print details about the request we're making
+    query_params = '&'.join([f"{k}={v}" for k, v in (params or {}).items()])
+    request_url = f"{url}?{query_params}" if query_params else url
+    print(f"REST Request: GET {request_url}")
+
+    client = get_client(CONFLUENCE_BASE_URL, USERNAME, PASSWORD, VERIFY_SSL)
+    response = client.get(url, params=params, max_retries=max_retries)
+    if response is None:
+        print(f"Failed to fetch data from {url} after {max_retries} retries.")
+        return None
+    print(f"Response Status: {response.status_code}")
+
+    if response.status_code == 200:
+        json_response = response.json()
+        # Print summary of response data
+        if isinstance(json_response, dict):
+            keys = list(json_response.keys())
+            print(f"Response contains keys: {keys}")
+            if 'results' in json_response:
+                print(f"Results count: {len(json_response['results'])}")
+            if 'size' in json_response:
+                print(f"Size value: {json_response['size']}")
+            if 'totalSize' in json_response:
+                print(f"Total size value: {json_response['totalSize']}")
+        return json_response
+
+    print(f"Error: Received status code {response.status_code} for {url}")
+    print(f"Response body: {response.text}")
+    # Handle other errors like 401, 403, 404, 500 etc.
+    # For unauthorized/forbidden with no auth, check anonymous access config
+    return None # Or raise an exception
 
 # --- Command Line Argument Parsing ---
 parser = argparse.ArgumentParser(
@@ -251,6 +226,28 @@ def filter_pages_by_date(pages, date_filter):
     print(f"Filtered {len(filtered)} of {len(pages)} pages")
     return filtered
 
+# filter_pages_by_date ignores time zones, so catalog timestamps this close to the filter date are not trusted
+DATE_FILTER_MARGIN_SECONDS = 24 * 3600
+
+def count_matching_from_catalog(entry, date_filter):
+    """
+    Number of pages in a cached space that match date_filter, decided from the pickle catalog's
+    oldest/newest page dates alone. Returns None when the pages themselves have to be checked.
+    """
+    if entry.get('dated_pages') != entry.get('sampled_pages') or entry.get('min_updated') is None:
+        return None
+    try:
+        target_ts = datetime.datetime.strptime(date_filter[1:].strip(), '%Y-%m-%d').timestamp()
+    except ValueError:
+        return None
+    newest_before = entry['max_updated'] < target_ts - DATE_FILTER_MARGIN_SECONDS
+    oldest_after = entry['min_updated'] > target_ts + DATE_FILTER_MARGIN_SECONDS
+    if date_filter[0] == '>':
+        return entry['sampled_pages'] if oldest_after else 0 if newest_before else None
+    if date_filter[0] == '<':
+        return entry['sampled_pages'] if newest_before else 0 if oldest_after else None
+    return None
+
 # --- Pickle helpers ---
 def save_pages_pickle(space_key, pages, folder='temp_counter'):
     os.makedirs(folder, exist_ok=True)
@@ -260,6 +257,11 @@ def save_pages_pickle(space_key, pages, folder='temp_counter'):
         print(f"Successfully saved {len(pages)} pages for space {space_key} to cache.")
     except Exception as e:
         print(f"Error saving pickle for {space_key}: {str(e)}")
+        return
+    try:
+        record_pickle(os.path.join(folder, f'{space_key}.pkl'), pages)
+    except (OSError, TimeoutError) as e:
+        print(f"Warning: Could not update pickle catalog for {space_key}: {e}")
 
 def load_pages_pickle(space_key, folder='temp_counter'):
     path = os.path.join(folder, f'{space_key}.pkl')
@@ -533,9 +535,25 @@ def count_pages_from_pickle(date_filter=None):
             print(f"Proceeding with {len(non_personal_files)} non-personal spaces")
         
         total_spaces = len(non_personal_files)
+        # Page counts (and clear-cut date filters) come from the pickle catalog without unpickling
+        catalog = PickleCatalog(pickle_dir)
         
         for pkl_file in non_personal_files:
             space_key = os.path.splitext(pkl_file)[0]
+            try:
+                entry = catalog.entry(pkl_file)
+            except Exception:
+                entry = None  # load_pages_pickle below reports and removes unreadable pickles
+            if entry is not None and entry.get('format') == 'pages':
+                matching = count_matching_from_catalog(entry, date_filter) if date_filter else entry['sampled_pages']
+                if matching is not None:
+                    total_pages += entry['sampled_pages']
+                    if date_filter:
+                        filtered_pages += matching
+                        print(f"Space {space_key}: {matching} of {entry['sampled_pages']} pages match the date filter.")
+                    else:
+                        print(f"Space {space_key}: {entry['sampled_pages']} pages.")
+                    continue
             try:
                 pages = load_pages_pickle(space_key)
                 if pages is None:
@@ -554,6 +572,11 @@ def count_pages_from_pickle(date_filter=None):
             except Exception as e:
                 print(f"Error processing space {space_key}: {str(e)}")
         
+        try:
+            catalog.save()
+        except (OSError, TimeoutError) as e:
+            print(f"Warning: Could not update pickle catalog: {e}")
+        
         # Print summary
         print("\n" + "=" * 50)
         print("COUNTING RESULTS")
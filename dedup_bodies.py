@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Find identical and near-identical page bodies across all spaces and write a dedup map.
+
+Exact duplicates are found by body hash, near duplicates (template pages with a few words
+changed) by MinHash/LSH; see utils/body_dedup.py. The map (SQLite, body_dedup.sqlite in the
+pickle directory by default) records for every page its canonical page, so downstream stages
+can process each distinct body once; e.g. GENERIC_SCRIPTS/qdrant_confluence_pickle_uploader.py
+--dedup-db skips embedding pages that duplicate another page once that page is uploaded,
+and lists them in its payload.
+
+Usage:
+    python dedup_bodies.py temp
+    python dedup_bodies.py temp --threshold 0.9 --store-bodies
+"""
+
+import argparse
+import os
+import sys
+from functools import partial
+
+from utils.body_dedup import (DEDUP_MAP_FILENAME, DEFAULT_NUM_PERM, DEFAULT_THRESHOLD, DedupMap,
+                              DuplicateFinder, MinHasher, body_fingerprint)
+from utils.change_ledger import body_storage_value, page_body_hash
+from utils.corpus_loader import CorpusLoader
+
+
+def fingerprint_space(data, num_perm=DEFAULT_NUM_PERM, near=True, keep_bodies=False):
+    """
+    Hash and fingerprint the bodies of one space (run in worker processes).
+
+    Returns: dict with space_key, pages, a list of (page_id, title, body_hash, size, signature)
+    where size and signature are only filled for the first page with a body hash, and bodies,
+    {body_hash: body} of the distinct bodies if keep_bodies
+    """
+    hasher = MinHasher(num_perm) if near else None
+    seen = set()
+    pages = []
+    bodies = {}
+    for page in data.get('sampled_pages', []):
+        digest = page_body_hash(page)
+        size, signature = 0, None
+        if digest not in seen:
+            seen.add(digest)
+            size, signature = body_fingerprint(page.get('body'), hasher)
+            if keep_bodies:
+                bodies[digest] = body_storage_value(page.get('body'))
+        pages.append((str(page.get('id', '')), page.get('title', ''), digest, size, signature))
+    return {'space_key': data.get('space_key'), 'pages': pages, 'bodies': bodies}
+
+
+def format_mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find duplicate and near-duplicate page bodies across spaces')
+    parser.add_argument('directory', nargs='?', default='temp',
+                        help='Directory of space pickles and split spaces (default: temp)')
+    parser.add_argument('--db', help=f'Dedup map to write (default: DIRECTORY/{DEDUP_MAP_FILENAME})')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Estimated Jaccard similarity for near duplicates (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--num-perm', type=int, default=DEFAULT_NUM_PERM,
+                        help=f'MinHash permutations (default: {DEFAULT_NUM_PERM})')
+    parser.add_argument('--bands', type=int, default=None,
+                        help='LSH bands; more bands find less similar candidates (default: chosen from --threshold)')
+    parser.add_argument('--exact-only', action='store_true', help='Only group identical bodies (faster)')
+    parser.add_argument('--store-bodies', action='store_true',
+                        help='Also store each distinct body once in the dedup map')
+    parser.add_argument('--top', type=int, default=15, help='Largest duplicate groups to list (default: 15)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes fingerprinting spaces (default: number of CPU cores)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"ERROR: Directory not found: {args.directory}")
+        return 1
+
+    near = not args.exact_only
+    finder = DuplicateFinder(args.threshold, args.num_perm, args.bands, near=near)
+    titles = {}  # first page of each body hash -> title, for the report
+    bodies = {} if args.store_bodies else None
+    loader = CorpusLoader(args.directory, workers=args.workers,
+                          on_error=lambda path, e: print(f"{os.path.basename(path)}: ERROR - {e}"))
+    transform = partial(fingerprint_space, num_perm=args.num_perm, near=near, keep_bodies=args.store_bodies)
+    for corpus_file, result in loader.map(transform):
+        space_key = result['space_key'] or corpus_file.space_key
+        for page_id, title, digest, size, signature in result['pages']:
+            if digest not in finder.sizes:
+                titles[(space_key, page_id)] = title
+            finder.add_hashed((space_key, page_id), digest, size, signature)
+        if bodies is not None:
+            for digest, body in result['bodies'].items():
+                bodies.setdefault(digest, body)
+    print(loader.stats.summary())
+
+    stats = finder.stats()
+    if not stats['pages']:
+        print("No pages found")
+        return 1
+
+    db_path = args.db or os.path.join(args.directory, DEDUP_MAP_FILENAME)
+    with DedupMap(db_path) as dedup_map:
+        dedup_map.write(finder, bodies)
+
+    print("=" * 80)
+    print(f"Pages:                  {stats['pages']:,} ({format_mb(stats['total_bytes'])} of bodies)")
+    print(f"Distinct bodies:        {stats['distinct_bodies']:,} ({format_mb(stats['distinct_bytes'])}), "
+          f"{stats['pages'] - stats['distinct_bodies']:,} pages are exact duplicates")
+    if near:
+        print(f"After near duplicates:  {stats['clusters']:,} clusters ({format_mb(stats['cluster_bytes'])}) "
+              f"at similarity >= {args.threshold}")
+    print(f"Dedup map written to:   {db_path}")
+
+    groups = finder.groups()
+    if groups and args.top:
+        print("\nLargest duplicate groups:")
+        print(f"{'Pages':>7} {'Kind':<6} {'Canonical page':<60}")
+        for group in groups[:args.top]:
+            space_key, page_id = group.canonical
+            label = f"[{space_key}] {titles.get(group.canonical, '')} ({page_id})"
+            print(f"{len(group):>7} {group.kind:<6} {label[:60]:<60}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,6 @@
 # description: Explores clusters in Confluence data.
 
 import os
-import pickle
 import sys
 import numpy as np
 import re
@@ -14,6 +13,8 @@ import json
 from datetime import datetime
 import shutil
 from config_loader import load_data_settings
+from utils.change_ledger import body_storage_value, page_body_hash
+from utils.corpus_loader import iter_spaces
 import operator
 from html import escape  # Added for HTML escaping
 from scatter_plot_visualizer import generate_2d_scatter_plot_agglomerative # Added for Option 20
@@ -22,6 +23,8 @@ from proximity_visualizer import generate_proximity_scatter_plot # Added for Opt
 # Load configurable pickle directory from settings
 data_settings = load_data_settings()
 TEMP_DIR = data_settings.get('pickle_dir', 'temp')
+# Cleaned page texts kept between runs (utils/text_cache.py), so re-clustering skips HTML parsing
+TEXT_CACHE_PATH = os.path.join(TEMP_DIR, 'text_cache.sqlite')
 
 # Try to import Whoosh (will be used for options 14 and 15)
 try:
@@ -131,20 +134,9 @@ def calculate_color_data(spaces):
 
 # Load all pickles
 def load_spaces(temp_dir=TEMP_DIR, min_pages=0, max_pages=None):
-    spaces = []
-    for fname in os.listdir(temp_dir):
-        if fname.endswith('.pkl'):
-            with open(os.path.join(temp_dir, fname), 'rb') as f:
-                data = pickle.load(f)
-                if 'space_key' in data and 'sampled_pages' in data:
-                    # Use total_pages for filtering if available, otherwise fallback to sampled_pages length
-                    page_count = data.get('total_pages', len(data['sampled_pages']))
-                    # Apply both min and max filters
-                    meets_min = page_count >= min_pages
-                    meets_max = max_pages is None or page_count <= max_pages
-                    if meets_min and meets_max:
-                        spaces.append(data)
-    return spaces
+    # Page-count filters are applied from the pickle catalog / split metadata before anything is unpickled
+    return list(iter_spaces(temp_dir, min_pages=min_pages, max_pages=max_pages, report=True,
+                            on_error=lambda path, e: print(f"Error loading {os.path.basename(path)}: {e}")))
 
 def filter_spaces(spaces, min_pages, max_pages=None):
     return [s for s in spaces if (
@@ -201,70 +193,60 @@ def search_spaces(spaces, term):
             results.append((s['space_key'], len(s['sampled_pages'])))
     return results
 
-def get_vectors(spaces):
-    # Semantic vectorization: concatenate all sampled page bodies for each space
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    
-    # Try to import BeautifulSoup, if not available fall back to regex
-    try:
-        from bs4 import BeautifulSoup
-
-        # Function to clean HTML content
-        def clean_html(html_content):
-            if not html_content:
-                return ''
-            try:
-                # Confluence storage format uses XML namespaces (ac:, ri:, etc.)
-                # BeautifulSoup's html.parser doesn't handle these well.
-                # Pre-process to normalize namespace tags so content is extracted.
-
-                # Remove namespace prefixes from tags (ac:structured-macro -> structured-macro)
-                # This ensures BeautifulSoup can traverse into these elements
-                normalized = re.sub(r'<(/?)(\w+):', r'<\1\2-', html_content)
+def regex_clean_html(html_content):
+    if not html_content:
+        return ''
+    # Simple regex to remove HTML tags
+    text = re.sub(r'<[^>]+>', ' ', html_content)
+    # Remove special characters and excessive whitespace
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
 
-                # Also handle self-closing namespace tags
-                normalized = re.sub(r'<(\w+):(\w+)\s*/>', r'<\1-\2/>', normalized)
+def clean_page_bodies(bodies, digests, workers=None, text_cache=TEXT_CACHE_PATH):
+    """Plain text of each body, cleaned in one batch spread over worker processes.
 
-                # Parse with lxml if available (better XML handling), fallback to html.parser
-                try:
-                    soup = BeautifulSoup(normalized, 'lxml')
-                except Exception:
-                    soup = BeautifulSoup(normalized, 'html.parser')
+    digests are the bodies' hashes; bodies cleaned in an earlier run (by any option using
+    the same text cache) are read from the cache instead.
+    """
+    try:
+        from utils.batch_cleaner import clean_many
+        from utils.text_cache import TextCache
+    except ImportError:
+        print("BeautifulSoup not installed. Using simple regex for HTML cleaning.")
+        return [regex_clean_html(body) for body in bodies]
 
-                # Extract text from all elements
-                text = soup.get_text(separator=' ', strip=True)
+    cache = None
+    if text_cache and os.path.isdir(os.path.dirname(text_cache) or '.'):
+        cache = TextCache(text_cache)
+    try:
+        return clean_many(bodies, mode='plain', workers=workers, cache=cache, digests=digests)
+    finally:
+        if cache is not None:
+            print(cache.summary())
+            cache.close()
 
-                # Remove special characters and excessive whitespace
-                text = re.sub(r'\s+', ' ', text)
-                return text.strip()
-            except Exception as e:
-                print(f"Error cleaning HTML: {e}")
-                # Fallback: just strip all tags with regex
-                text = re.sub(r'<[^>]+>', ' ', html_content)
-                text = re.sub(r'\s+', ' ', text)
-                return text.strip()
+def get_vectors(spaces, workers=None, text_cache=TEXT_CACHE_PATH):
+    # Semantic vectorization: concatenate all sampled page bodies for each space
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    
+    try:
+        from utils.batch_cleaner import plain_text as clean_html
     except ImportError:
-        print("BeautifulSoup not installed. Using simple regex for HTML cleaning.")
-        def clean_html(html_content):
-            if not html_content:
-                return ''
-            # Simple regex to remove HTML tags
-            text = re.sub(r'<[^>]+>', ' ', html_content)
-            # Remove special characters and excessive whitespace
-            text = re.sub(r'\s+', ' ', text)
-            return text.strip()
+        clean_html = regex_clean_html
     
     texts = []
     valid_spaces = []
     spaces_with_content = 0
     total_spaces = len(spaces)
+    bodies = []
+    digests = []
+    space_pages = []  # (space, page_count, pages_with_body) in the order their bodies were added
 
     # DEBUG: Check first space's first page structure
     debug_shown = False
 
     for s in spaces:
         space_key = s.get('space_key', 'unknown')
-        cleaned_texts = []
 
         # Process each page in the space
         page_count = 0
@@ -297,9 +279,7 @@ def get_vectors(spaces):
                     print(f"Body unexpected type: {type(raw_body)}")
 
                 # DEBUG: Test cleaning on this body
-                test_body = raw_body
-                if isinstance(test_body, dict):
-                    test_body = test_body.get('storage', {}).get('value', '')
+                test_body = body_storage_value(raw_body)
                 if test_body:
                     print(f"\n--- Cleaning debug ---")
                     print(f"Input to clean_html length: {len(test_body)}")
@@ -324,7 +304,7 @@ def get_vectors(spaces):
             body = p.get('body', '')
 
             # DEBUG: Show body status for first 5 pages of first space
-            if page_count <= 5 and spaces_with_content == 0:
+            if page_count <= 5 and not space_pages:
                 print(f"  Page {page_count}: body type={type(body).__name__}, ", end="")
                 if isinstance(body, dict):
                     nested = body.get('storage', {}).get('value', '')
@@ -332,14 +312,21 @@ def get_vectors(spaces):
                 else:
                     print(f"str len={len(body) if body else 0}, truthy={bool(body)}")
 
-            if isinstance(body, dict):
-                # Nested structure from concurrent fetch
-                body = body.get('storage', {}).get('value', '')
+            body = body_storage_value(body)
             if body:
                 pages_with_body += 1
-                cleaned_text = clean_html(body)
-                if cleaned_text:
-                    cleaned_texts.append(cleaned_text)
+                bodies.append(body)
+                digests.append(page_body_hash(p))
+        space_pages.append((s, page_count, pages_with_body))
+
+    # Bodies of all spaces are cleaned in one batch; those cleaned before come from the text cache
+    cleaned = clean_page_bodies(bodies, digests, workers, text_cache)
+
+    offset = 0
+    for s, page_count, pages_with_body in space_pages:
+        space_key = s.get('space_key', 'unknown')
+        cleaned_texts = [text for text in cleaned[offset:offset + pages_with_body] if text]
+        offset += pages_with_body
         
         # Join all cleaned text for this space
         text = ' '.join(cleaned_texts).strip()
@@ -889,7 +876,7 @@ def search_for_applications(spaces):
                     continue
                     
                 # Check body content if we haven't already matched the title
-                body = page.get('body', '')
+                body = body_storage_value(page.get('body'))
                 if body and term_lower in body.lower():
                     matched_pages.append(page.get('title', 'Untitled'))
             
@@ -999,7 +986,7 @@ def search_for_applications(spaces):
     # Open the HTML file in the browser
     webbrowser.open('file://' + os.path.abspath(out_path))
 
-def preprocess_application_search_index(spaces):
+def preprocess_application_search_index(spaces, workers=None, text_cache=TEXT_CACHE_PATH):
     """
     Preprocess and index all spaces and pages using Whoosh for fast full-text search.
     This function creates a comprehensive index of all content, regardless of search terms.
@@ -1031,34 +1018,6 @@ def preprocess_application_search_index(spaces):
     # Create the index
     ix = create_in(WHOOSH_INDEX_DIR, schema)
     
-    # Import BeautifulSoup for HTML cleaning
-    try:
-        from bs4 import BeautifulSoup
-        has_beautifulsoup = True
-    except ImportError:
-        print("BeautifulSoup not installed. Using simple regex for HTML cleaning.")
-        has_beautifulsoup = False
-    
-    # Define HTML cleaning function
-    def clean_html(html_content):
-        if not html_content:
-            return ''
-        try:
-            if has_beautifulsoup:
-                # Use BeautifulSoup for better HTML cleaning
-                soup = BeautifulSoup(html_content, 'html.parser')
-                text = soup.get_text(separator=' ', strip=True)
-            else:
-                # Fallback to regex for HTML tag removal
-                text = re.sub(r'<[^>]+>', ' ', html_content)
-            
-            # Remove special characters and excessive whitespace
-            text = re.sub(r'\s+', ' ', text)
-            return text.strip()
-        except Exception as e:
-            print(f"Error cleaning HTML: {e}")
-            return html_content if html_content else ''
-    
     # Start indexing
     writer = ix.writer(limitmb=256, procs=1, multisegment=True)
     
@@ -1066,6 +1025,16 @@ def preprocess_application_search_index(spaces):
     pages_indexed = 0
     
     try:
+        # Clean all page bodies in one batch; bodies cleaned in an earlier run (here or for
+        # clustering) are read from the text cache instead of being parsed again
+        bodies = []
+        digests = []
+        for space in spaces:
+            for page in space.get('sampled_pages', []):
+                bodies.append(body_storage_value(page.get('body')))
+                digests.append(page_body_hash(page))
+        cleaned = iter(clean_page_bodies(bodies, digests, workers, text_cache))
+
         for space in spaces:
             space_key = space.get('space_key', 'unknown')
             print(f"Indexing space: {space_key}")
@@ -1079,10 +1048,7 @@ def preprocess_application_search_index(spaces):
                 
                 page_id = page.get('id', f"unknown_{total_pages}")
                 page_title = page.get('title', 'Untitled')
-                
-                # Get and clean page content (body)
-                body = page.get('body', '')
-                cleaned_body = clean_html(body)
+                cleaned_body = next(cleaned)
                 
                 # Index every page, regardless of content
                 writer.add_document(
@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the Confluence REST API, serving synthetic spaces for benchmarks and tests.
+
+Covers what the fetchers use: /rest/api/space, /rest/api/space/{key}, /rest/api/content
+(including expand=body.storage listings), /rest/api/content/{id}, /rest/api/content/search
+(CQL 'lastmodified > "..."' and 'space = KEY' clauses) and attachment downloads under
+/download/attachments/ with Range support. Content is generated deterministically from
+--seed: page trees, storage-format bodies with SQL code macros (snippets shared with
+confluence_test_data_generator.py), template pages with identical bodies, and attachments.
+
+Faults can be injected to exercise the retry and rate-limiting paths: per-request latency,
+per-body latency, a share of 429 responses with Retry-After, a request-rate cap answered
+with 429s, and a share of 500/502/503 responses.
+
+Control endpoints (not subject to faults):
+    GET  /_mock/stats             request counts by endpoint and status, bytes and bodies served
+    POST /_mock/reset             zero the counters
+    POST /_mock/touch?fraction=F  bump the version of a share of pages (for delta sync runs)
+
+Usage:
+    python mock_confluence_server.py --port 8099 --spaces 5 --pages 500
+    python mock_confluence_server.py --latency 50 --throttle-rate 0.05 --error-rate 0.01
+
+Then point settings.ini at it: base_url = http://127.0.0.1:8099 (any username/password).
+benchmark_fetchers.py starts one by itself.
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from confluence_test_data_generator import MSSQL_SNIPPETS, ORACLE_SQL_SNIPPETS
+
+DEFAULT_PORT = 8099
+# Largest page size the server accepts, and the cap when bodies are expanded (Confluence caps both)
+MAX_LIMIT = 200
+MAX_BODY_LIMIT = 50
+DEFAULT_RETRY_AFTER = 1
+ERROR_STATUSES = (500, 502, 503)
+# Synthetic page timestamps count back from here, one hour per page
+BASE_TIME = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+_WORDS = ('quarterly roadmap deployment pipeline stakeholder onboarding migration database schema '
+          'release checklist incident review architecture decision service owner runbook backlog '
+          'integration testing capacity planning retrospective dashboard metrics escalation vendor '
+          'contract compliance audit workflow template approval budget forecast upgrade cluster '
+          'network latency storage backup recovery policy training handover sprint milestone').split()
+_CQL_LASTMODIFIED = re.compile(r'lastmodified\s*>\s*"([^"]+)"', re.I)
+_CQL_SPACE = re.compile(r'space\s*=\s*"?([~\w-]+)"?', re.I)
+
+
+def iso_time(when):
+    return when.strftime('%Y-%m-%dT%H:%M:%S.') + f"{when.microsecond // 1000:03d}Z"
+
+
+class MockConfluence:
+    """Synthetic Confluence content, fault settings and request counters (shared by all handler threads)."""
+
+    def __init__(self, spaces=3, pages=200, personal_spaces=0, body_bytes=4000, template_rate=0.1,
+                 sql_rate=0.3, attachments_per_page=0.0, attachment_bytes=20000, latency_ms=0.0,
+                 body_latency_ms=0.0, throttle_rate=0.0, max_rps=0.0, error_rate=0.0,
+                 retry_after=DEFAULT_RETRY_AFTER, seed=1):
+        self.body_bytes = body_bytes
+        self.sql_rate = sql_rate
+        self.latency_ms = latency_ms
+        self.body_latency_ms = body_latency_ms
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = max_rps
+        self._token_time = time.monotonic()
+        self.reset_stats()
+
+        rng = random.Random(f"{seed}:content")
+        self._paragraphs = [' '.join(rng.choice(_WORDS) for _ in range(rng.randint(20, 80))).capitalize() + '.'
+                            for _ in range(300)]
+        self.spaces = []  # space dicts in listing order
+        self.pages = {}  # page id -> page record
+        self.attachments = {}  # (page id, file name) -> attachment record
+        next_id = 100000
+        keys = [f"SP{i:03d}" for i in range(spaces)] + [f"~user{i:03d}" for i in range(personal_spaces)]
+        for key in keys:
+            space = {'key': key, 'name': f"Synthetic space {key}", 'type': 'personal' if key.startswith('~') else 'global',
+                     'page_ids': []}
+            self.spaces.append(space)
+            for index in range(pages):
+                page_id = str(next_id)
+                next_id += 1
+                # Parents come from earlier pages, so every page has a finite ancestor chain
+                parent = rng.choice(space['page_ids']) if space['page_ids'] and rng.random() < 0.9 else None
+                page = {'id': page_id, 'space': key, 'title': f"{key} page {index}", 'parent': parent,
+                        'children': [], 'version': rng.randint(1, 12),
+                        'when': BASE_TIME - timedelta(hours=len(self.pages)),
+                        'template': rng.randrange(5) if rng.random() < template_rate else None,
+                        'attachments': []}
+                if attachments_per_page > 0:
+                    for n in range(int(rng.expovariate(1 / attachments_per_page))):
+                        title = f"file{n}-{page_id}.bin"
+                        attachment = {'id': f"att{page_id}{n}", 'title': title, 'page_id': page_id,
+                                      'size': max(1, int(attachment_bytes * rng.lognormvariate(0, 0.5)))}
+                        page['attachments'].append(attachment)
+                        self.attachments[(page_id, title)] = attachment
+                if parent is not None:
+                    self.pages[parent]['children'].append(page_id)
+                self.pages[page_id] = page
+                space['page_ids'].append(page_id)
+
+    # -- statistics ---------------------------------------------------------
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'requests': defaultdict(int), 'statuses': defaultdict(int), 'throttled': 0,
+                          'errors': 0, 'bodies': 0, 'bytes': 0, 'started': time.time()}
+
+    def record(self, endpoint, status, size, bodies=0):
+        with self._lock:
+            self.stats['requests'][endpoint] += 1
+            self.stats['statuses'][str(status)] += 1
+            self.stats['bytes'] += size
+            self.stats['bodies'] += bodies
+
+    def stats_snapshot(self):
+        with self._lock:
+            snapshot = dict(self.stats, requests=dict(self.stats['requests']), statuses=dict(self.stats['statuses']))
+        snapshot['total_requests'] = sum(snapshot['requests'].values())
+        snapshot['elapsed'] = time.time() - snapshot.pop('started')
+        return snapshot
+
+    # -- faults -------------------------------------------------------------
+
+    def fault(self):
+        """(status, headers) of an injected failure for the next request, or None."""
+        with self._lock:
+            if self.max_rps > 0:
+                now = time.monotonic()
+                self._tokens = min(self.max_rps, self._tokens + (now - self._token_time) * self.max_rps)
+                self._token_time = now
+                if self._tokens < 1:
+                    self.stats['throttled'] += 1
+                    return 429, {'Retry-After': str(self.retry_after)}
+                self._tokens -= 1
+            roll = self._rng.random()
+            if roll < self.throttle_rate:
+                self.stats['throttled'] += 1
+                return 429, {'Retry-After': str(self.retry_after)}
+            if roll < self.throttle_rate + self.error_rate:
+                self.stats['errors'] += 1
+                return self._rng.choice(ERROR_STATUSES), {}
+        return None
+
+    def delay(self, bodies=0):
+        seconds = bodies * self.body_latency_ms / 1000
+        if self.latency_ms > 0:
+            with self._lock:
+                jitter = self._rng.uniform(0.5, 1.5)
+            seconds += self.latency_ms * jitter / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    # -- content ------------------------------------------------------------
+
+    def body(self, page):
+        """Storage-format body of a page's current version; template pages share one body."""
+        if page['template'] is not None:
+            rng = random.Random(f"{self.seed}:template:{page['template']}")
+        else:
+            rng = random.Random(f"{self.seed}:{page['id']}:{page['version']}")
+        target = int(self.body_bytes * rng.lognormvariate(0, 0.75))
+        parts = [f"<h1>{html.escape(page['title'] if page['template'] is None else 'Meeting notes')}</h1>"]
+        size = len(parts[0])
+        if rng.random() < self.sql_rate:
+            sql = rng.choice(rng.choice((ORACLE_SQL_SNIPPETS, MSSQL_SNIPPETS)))
+            parts.append('<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">sql</ac:parameter>'
+                         f'<ac:plain-text-body><![CDATA[{sql}]]></ac:plain-text-body></ac:structured-macro>')
+            size += len(parts[-1])
+        while size < target:
+            kind = rng.random()
+            if kind < 0.1:
+                items = ''.join(f"<li>{rng.choice(_WORDS)} {rng.choice(_WORDS)}</li>" for _ in range(rng.randint(2, 6)))
+                part = f"<ul>{items}</ul>"
+            elif kind < 0.15:
+                row = ''.join(f"<td>{rng.choice(_WORDS)}</td>" for _ in range(4))
+                part = f"<table><tbody>{''.join(f'<tr>{row}</tr>' for _ in range(rng.randint(2, 8)))}</tbody></table>"
+            else:
+                part = f"<p>{rng.choice(self._paragraphs)}</p>"
+            parts.append(part)
+            size += len(part)
+        return ''.join(parts)
+
+    def attachment_content(self, attachment):
+        block = hashlib.sha256(attachment['id'].encode('ascii')).digest()
+        return (block * (attachment['size'] // len(block) + 1))[:attachment['size']]
+
+    def attachment_json(self, attachment):
+        return {
+            'id': attachment['id'], 'type': 'attachment', 'status': 'current', 'title': attachment['title'],
+            'version': {'number': 1},
+            'extensions': {'mediaType': 'application/octet-stream', 'fileSize': attachment['size']},
+            '_links': {'download': f"/download/attachments/{attachment['page_id']}/{quote(attachment['title'])}?version=1&api=v2"},
+        }
+
+    def ancestors(self, page):
+        chain = []
+        parent = page['parent']
+        while parent is not None:
+            chain.append(self.pages[parent])
+            parent = self.pages[parent]['parent']
+        return [{'id': p['id'], 'type': 'page', 'title': p['title']} for p in reversed(chain)]
+
+    def page_json(self, page, expand):
+        """A content result as the REST API returns it; expansions follow the expand set."""
+        data = {'id': page['id'], 'type': 'page', 'status': 'current', 'title': page['title'],
+                '_links': {'webui': f"/pages/viewpage.action?pageId={page['id']}"}}
+        if 'space' in expand:
+            data['space'] = {'key': page['space'], 'name': f"Synthetic space {page['space']}"}
+        if 'version' in expand:
+            data['version'] = {'number': page['version'], 'when': iso_time(page['when'])}
+        if 'ancestors' in expand:
+            data['ancestors'] = self.ancestors(page)
+        if 'children.page' in expand:
+            children = [{'id': c, 'type': 'page', 'title': self.pages[c]['title']} for c in page['children']]
+            data.setdefault('children', {})['page'] = {'results': children, 'size': len(children)}
+        if 'children.attachment' in expand:
+            attachments = [self.attachment_json(a) for a in page['attachments']]
+            data.setdefault('children', {})['attachment'] = {'results': attachments, 'size': len(attachments)}
+        if 'body.storage' in expand:
+            data['body'] = {'storage': {'value': self.body(page), 'representation': 'storage'}}
+        return data
+
+    def space_json(self, space):
+        return {'key': space['key'], 'name': space['name'], 'type': space['type'],
+                'description': {'plain': {'value': f"Generated space with {len(space['page_ids'])} pages",
+                                          'representation': 'plain'}},
+                'icon': {'path': '/images/logo/default-space-logo.svg', 'width': 48, 'height': 48}}
+
+    def find_space(self, key):
+        return next((space for space in self.spaces if space['key'] == key), None)
+
+    def touch(self, fraction, seed=None):
+        """Give a share of pages a new version modified now; returns their ids."""
+        rng = random.Random(seed if seed is not None else f"{self.seed}:touch:{time.time()}")
+        now = datetime.now(timezone.utc)
+        touched = [page_id for page_id in self.pages if rng.random() < fraction]
+        with self._lock:
+            for page_id in touched:
+                self.pages[page_id]['version'] += 1
+                self.pages[page_id]['when'] = now
+        return touched
+
+    def search(self, cql):
+        """Pages matching the lastmodified and space clauses of a CQL query, oldest change first."""
+        pages = list(self.pages.values())
+        match = _CQL_LASTMODIFIED.search(cql)
+        if match:
+            since = datetime.strptime(match.group(1), '%Y/%m/%d %H:%M').replace(tzinfo=timezone.utc)
+            pages = [page for page in pages if page['when'] > since]
+        match = _CQL_SPACE.search(cql)
+        if match:
+            pages = [page for page in pages if page['space'] == match.group(1)]
+        return sorted(pages, key=lambda page: page['when'])
+
+
+def _listing(results, start, limit, path):
+    return {'results': results, 'start': start, 'limit': limit, 'size': len(results),
+            '_links': {'base': '', 'context': '', 'self': path}}
+
+
+class MockConfluenceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real server
+    server_version = 'MockConfluence/1.0'
+    verbose = False
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload=b'', content_type='application/json', headers=None, endpoint='other', bodies=0):
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload).encode('utf-8')
+        elif isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+        self.mock.record(endpoint, status, len(payload), bodies)
+
+    def _error(self, status, message, endpoint, headers=None):
+        self._send(status, {'statusCode': status, 'message': message}, headers=headers, endpoint=endpoint)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/_mock/reset':
+            self.mock.reset_stats()
+            self._send(200, {'reset': True}, endpoint='mock')
+        elif url.path == '/_mock/touch':
+            fraction = float(query.get('fraction', ['0.05'])[0])
+            seed = query.get('seed', [None])[0]
+            touched = self.mock.touch(fraction, seed)
+            self._send(200, {'touched': len(touched), 'ids': touched}, endpoint='mock')
+        else:
+            self._error(405, 'Only GET is supported outside /_mock/', 'other')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+        if path == '/_mock/stats':
+            self._send(200, self.mock.stats_snapshot(), endpoint='mock')
+            return
+
+        endpoint = self._endpoint(path)
+        fault = self.mock.fault()
+        if fault is not None:
+            self.mock.delay()
+            status, headers = fault
+            self._error(status, 'Injected by mock_confluence_server', endpoint, headers=headers)
+            return
+        try:
+            handler = getattr(self, f"_get_{endpoint}", None)
+            if handler is None:
+                self.mock.delay()
+                self._error(404, f"No mock for {path}", endpoint)
+            else:
+                handler(path, query)
+        except (ValueError, KeyError) as e:
+            self._error(400, f"Bad request: {e}", endpoint)
+
+    do_HEAD = do_GET
+
+    @staticmethod
+    def _endpoint(path):
+        if path == '/rest/api/space':
+            return 'space'
+        if path.startswith('/rest/api/space/'):
+            return 'space_by_key'
+        if path == '/rest/api/content':
+            return 'content'
+        if path == '/rest/api/content/search':
+            return 'search'
+        if path.startswith('/rest/api/content/'):
+            return 'content_by_id'
+        if path.startswith('/download/attachments/'):
+            return 'download'
+        return 'other'
+
+    @staticmethod
+    def _paging(query, expand):
+        start = int(query.get('start', 0))
+        cap = MAX_BODY_LIMIT if 'body.storage' in expand else MAX_LIMIT
+        return start, max(1, min(int(query.get('limit', 25)), cap))
+
+    def _get_space(self, path, query):
+        self.mock.delay()
+        wanted = query.get('type')
+        spaces = [s for s in self.mock.spaces if not wanted or s['type'] == wanted]
+        start, limit = self._paging(query, ())
+        results = [self.mock.space_json(s) for s in spaces[start:start + limit]]
+        self._send(200, _listing(results, start, limit, path), endpoint='space')
+
+    def _get_space_by_key(self, path, query):
+        self.mock.delay()
+        space = self.mock.find_space(unquote(path.rsplit('/', 1)[1]))
+        if space is None:
+            self._error(404, 'No space with that key', 'space_by_key')
+        else:
+            self._send(200, self.mock.space_json(space), endpoint='space_by_key')
+
+    def _send_pages(self, pages, query, path, endpoint):
+        expand = set(query.get('expand', '').split(','))
+        start, limit = self._paging(query, expand)
+        chunk = pages[start:start + limit]
+        bodies = len(chunk) if 'body.storage' in expand else 0
+        self.mock.delay(bodies)
+        results = [self.mock.page_json(page, expand) for page in chunk]
+        self._send(200, _listing(results, start, limit, path), endpoint=endpoint, bodies=bodies)
+
+    def _get_content(self, path, query):
+        if query.get('type', 'page') != 'page':
+            self._send_pages([], query, path, 'content')
+            return
+        space_key = query.get('spaceKey')
+        if space_key:
+            space = self.mock.find_space(space_key)
+            page_ids = space['page_ids'] if space else []
+        else:
+            page_ids = list(self.mock.pages)
+        self._send_pages([self.mock.pages[page_id] for page_id in page_ids], query, path, 'content')
+
+    def _get_search(self, path, query):
+        self._send_pages(self.mock.search(query.get('cql', '')), query, path, 'search')
+
+    def _get_content_by_id(self, path, query):
+        page = self.mock.pages.get(path.rsplit('/', 1)[1])
+        expand = set(query.get('expand', '').split(','))
+        bodies = 1 if page is not None and 'body.storage' in expand else 0
+        self.mock.delay(bodies)
+        if page is None:
+            self._error(404, 'No content with that id', 'content_by_id')
+        else:
+            self._send(200, self.mock.page_json(page, expand), endpoint='content_by_id', bodies=bodies)
+
+    def _get_download(self, path, query):
+        self.mock.delay()
+        parts = path.split('/')
+        attachment = self.mock.attachments.get((parts[3], unquote(parts[4]))) if len(parts) == 5 else None
+        if attachment is None:
+            self._error(404, 'No such attachment', 'download')
+            return
+        content = self.mock.attachment_content(attachment)
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        if not match:
+            self._send(200, content, 'application/octet-stream', endpoint='download')
+            return
+        offset = int(match.group(1))
+        if offset >= len(content):
+            self._send(416, b'', 'application/octet-stream', headers={'Content-Range': f"bytes */{len(content)}"},
+                       endpoint='download')
+            return
+        self._send(206, content[offset:], 'application/octet-stream',
+                   headers={'Content-Range': f"bytes {offset}-{len(content) - 1}/{len(content)}"}, endpoint='download')
+
+
+class MockConfluenceServer:
+    """Runs a MockConfluence on a background thread; port 0 picks a free port."""
+
+    def __init__(self, mock, host='127.0.0.1', port=0, verbose=False):
+        self.mock = mock
+        handler = type('Handler', (MockConfluenceHandler,), {'verbose': verbose})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = mock
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-confluence', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def add_content_arguments(parser):
+    """Options describing the synthetic content and faults (shared with benchmark_fetchers.py)."""
+    parser.add_argument('--spaces', type=int, default=3, help='Number of global spaces (default: 3)')
+    parser.add_argument('--pages', type=int, default=200, help='Pages per space (default: 200)')
+    parser.add_argument('--personal-spaces', type=int, default=0, help='Number of personal (~user) spaces (default: 0)')
+    parser.add_argument('--body-bytes', type=int, default=4000, help='Median body size in bytes (default: 4000)')
+    parser.add_argument('--sql-rate', type=float, default=0.3, help='Share of pages with an SQL code macro (default: 0.3)')
+    parser.add_argument('--template-rate', type=float, default=0.1, help='Share of pages with a shared template body (default: 0.1)')
+    parser.add_argument('--attachments-per-page', type=float, default=0.0, help='Mean attachments per page (default: 0)')
+    parser.add_argument('--attachment-bytes', type=int, default=20000, help='Median attachment size in bytes (default: 20000)')
+    parser.add_argument('--latency', type=float, default=0.0, metavar='MS', help='Mean latency added to every request (default: 0)')
+    parser.add_argument('--body-latency', type=float, default=0.0, metavar='MS', help='Extra latency per body served (default: 0)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429 (default: 0)')
+    parser.add_argument('--max-rps', type=float, default=0.0, help='Requests per second above which the server answers 429 (default: no cap)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 500/502/503 (default: 0)')
+    parser.add_argument('--retry-after', type=int, default=DEFAULT_RETRY_AFTER, help=f'Retry-After seconds on 429s (default: {DEFAULT_RETRY_AFTER})')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for content and faults (default: 1)')
+
+
+def mock_from_args(args):
+    return MockConfluence(spaces=args.spaces, pages=args.pages, personal_spaces=args.personal_spaces,
+                          body_bytes=args.body_bytes, template_rate=args.template_rate, sql_rate=args.sql_rate,
+                          attachments_per_page=args.attachments_per_page, attachment_bytes=args.attachment_bytes,
+                          latency_ms=args.latency, body_latency_ms=args.body_latency, throttle_rate=args.throttle_rate,
+                          max_rps=args.max_rps, error_rate=args.error_rate, retry_after=args.retry_after, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic Confluence content over the REST API for offline runs.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    add_content_arguments(parser)
+    args = parser.parse_args()
+
+    mock = mock_from_args(args)
+    server = MockConfluenceServer(mock, args.host, args.port, verbose=args.verbose)
+    print(f"Mock Confluence with {len(mock.spaces)} spaces and {len(mock.pages)} pages at {server.base_url}")
+    print(f"Point settings.ini at it with: base_url = {server.base_url}")
+    print("Press Ctrl+C to stop.")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        stats = mock.stats_snapshot()
+        print(f"\nServed {stats['total_requests']} requests, {stats['bodies']} bodies, {stats['bytes']:,} bytes "
+              f"({stats['throttled']} throttled, {stats['errors']} errors injected)")
+
+
+if __name__ == '__main__':
+    main()
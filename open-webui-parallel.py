@@ -8,6 +8,7 @@ Uses concurrent processing for faster uploads.
 import sys
 import os
 import argparse
+import atexit
 import pickle
 import json
 import configparser
@@ -16,7 +17,8 @@ from typing import List, Dict, Optional, Any, Tuple
 import requests
 from requests.auth import HTTPBasicAuth
 import logging
-from utils.html_cleaner import clean_confluence_html
+from utils.html_cleaner import HTML_CLEANERS, clean_confluence_html, set_default_cleaner
+from utils.text_cache import TextCache
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 from threading import Lock
@@ -358,6 +360,25 @@ def load_confluence_pickle(pickle_path: Path) -> Optional[Dict]:
         logger.error(f"Failed to load pickle {pickle_path}: {e}")
         return None
 
+# Cleaned page texts kept between runs (--text-cache), so unchanged pages are not parsed again
+TEXT_CACHE = None
+
+def open_text_cache(path: str):
+    """Read and store cleaned page texts in the TextCache at path until the script exits."""
+    global TEXT_CACHE
+    TEXT_CACHE = TextCache(path)
+    atexit.register(close_text_cache)
+
+def close_text_cache():
+    logger.info(TEXT_CACHE.summary())
+    TEXT_CACHE.close()
+
+def clean_page_body(page: Dict, storage_body: str) -> str:
+    """clean_confluence_html of a page's body, from the text cache when one is open."""
+    if TEXT_CACHE is None:
+        return clean_confluence_html(storage_body)
+    return TEXT_CACHE.text(storage_body, digest=page.get('body_hash'))
+
 def process_confluence_page(page: Dict, space_key: str, space_name: str) -> Tuple[str, str]:
     """
     Process a Confluence page and return path and text content
@@ -399,7 +420,7 @@ def process_confluence_page(page: Dict, space_key: str, space_name: str) -> Tupl
     
     # Add body content
     if storage_body:
-        cleaned_body = clean_confluence_html(storage_body)
+        cleaned_body = clean_page_body(page, storage_body)
         logger.debug(f"Cleaned body length: {len(cleaned_body)}")
         logger.debug(f"Cleaned body preview: {cleaned_body[:200]}...")
         text_content += cleaned_body
@@ -663,8 +684,15 @@ Performance Tips:
                        help='Test mode: create temporary collection, upload TXT, delete (forces --format txt)')
     parser.add_argument('--test-limit', type=int, default=0,
                        help='Limit total pages to upload in test mode (0 = no limit)')
+    parser.add_argument('--html-cleaner', choices=HTML_CLEANERS, default='bs4',
+                       help='Text extraction: bs4 (reference) or lxml (same output, several times faster on large pages)')
+    parser.add_argument('--text-cache', metavar='PATH',
+                       help='SQLite cache of cleaned page text by body hash (see warm_text_cache.py); cached pages are not cleaned again')
     
     args = parser.parse_args()
+    set_default_cleaner(args.html_cleaner)
+    if args.text_cache:
+        open_text_cache(args.text_cache)
     
     # Log all parameters
     logger.info("Script parameters:")
@@ -22,7 +22,7 @@ from pgvector.psycopg2 import register_vector
 import ollama
 from tqdm import tqdm
 
-from utils.html_cleaner import clean_confluence_html
+from utils.html_cleaner import HTML_CLEANERS, clean_confluence_html, set_default_cleaner
 
 # ------ DEFAULT CONFIGURATION ------
 # These defaults are used if settings_gpu_load.ini is not found
@@ -313,7 +313,10 @@ def main():
                         help=f"Ollama API host URL (default: {config['ollama_host']})")
     parser.add_argument("--clear-checkpoint", action="store_true",
                         help="Clear checkpoint and start fresh")
+    parser.add_argument("--html-cleaner", choices=HTML_CLEANERS, default="bs4",
+                        help="Text extraction: bs4 (reference) or lxml (same output, several times faster on large pages)")
     args = parser.parse_args()
+    set_default_cleaner(args.html_cleaner)
     
     # Clear checkpoint if requested
     if args.clear_checkpoint:
@@ -7,6 +7,7 @@ Loads Confluence pickles and uploads HTML and text versions to Open-WebUI knowle
 import sys
 import os
 import argparse
+import atexit
 import pickle
 import json
 import configparser
@@ -16,7 +17,9 @@ from typing import List, Dict, Optional, Any
 import requests
 from requests.auth import HTTPBasicAuth
 import logging
-from utils.html_cleaner import clean_confluence_html
+from utils.change_ledger import ProcessedLedger, page_body_hash
+from utils.html_cleaner import HTML_CLEANERS, clean_confluence_html, set_default_cleaner
+from utils.text_cache import TextCache
 
 # Helper function to safely print text with emojis
 def safe_print(text: str):
@@ -258,6 +261,42 @@ class OpenWebUIClient:
         logger.info(f"Successfully uploaded document '{title}' to collection ID '{collection_id}' (file_id={new_file_id})")
         return True
 
+    def list_collection_files(self, collection_id: str) -> Dict[str, List[str]]:
+        """List the files in a knowledge collection and return as dict {filename: [file ids]}"""
+        url = f"{self.base_url}/api/v1/knowledge/{collection_id}"
+        try:
+            response = self.session.get(url, timeout=30)
+            if response.status_code != 200:
+                logger.warning(f"Failed to list files of collection ID '{collection_id}': HTTP {response.status_code}")
+                return {}
+            files = response.json().get('files') or []
+        except Exception as e:
+            logger.error(f"Exception listing files of collection ID '{collection_id}': {e}")
+            return {}
+        
+        file_dict = {}
+        for file in files:
+            name = (file.get('meta') or {}).get('name') or file.get('filename')
+            if name and file.get('id'):
+                file_dict.setdefault(name, []).append(file['id'])
+        return file_dict
+
+    def remove_document(self, collection_id: str, file_id: str) -> bool:
+        """Remove a file from a knowledge collection"""
+        url = f"{self.base_url}/api/v1/knowledge/{collection_id}/file/remove"
+        try:
+            response = self.session.post(url, json={"file_id": file_id})
+            logger.debug(f"KNOWLEDGE REMOVE [{response.status_code}]: {response.text}")
+        except Exception as e:
+            logger.error(f"Exception removing file {file_id} from collection ID '{collection_id}': {e}")
+            return False
+        
+        if response.status_code not in [200, 201]:
+            logger.error(f"Failed to remove file {file_id} from collection ID '{collection_id}': HTTP {response.status_code}")
+            return False
+        logger.info(f"Removed file {file_id} from collection ID '{collection_id}'")
+        return True
+
     def list_knowledge_collections(self) -> Dict[str, str]:
         """List all knowledge collections and return as dict {name: id}"""
         collections_url = f"{self.base_url}/api/v1/knowledge/"
@@ -374,6 +413,25 @@ def load_confluence_pickle(pickle_path: Path) -> Optional[Dict]:
         logger.error(f"Error loading pickle file '{pickle_path}': {e}")
         return None
 
+# Cleaned page texts kept between runs (--text-cache), so unchanged pages are not parsed again
+TEXT_CACHE = None
+
+def open_text_cache(path: str):
+    """Read and store cleaned page texts in the TextCache at path until the script exits."""
+    global TEXT_CACHE
+    TEXT_CACHE = TextCache(path)
+    atexit.register(close_text_cache)
+
+def close_text_cache():
+    logger.info(TEXT_CACHE.summary())
+    TEXT_CACHE.close()
+
+def clean_page_body(page: Dict, storage_body: str) -> str:
+    """clean_confluence_html of a page's body, from the text cache when one is open."""
+    if TEXT_CACHE is None:
+        return clean_confluence_html(storage_body)
+    return TEXT_CACHE.text(storage_body, digest=page.get('body_hash'))
+
 def process_confluence_page(page: Dict, space_key: str, space_name: str) -> tuple[str, str]:
     """
     Process a single Confluence page and return path and text versions
@@ -414,7 +472,7 @@ def process_confluence_page(page: Dict, space_key: str, space_name: str) -> tupl
     
     # Add body content
     if storage_body:
-        cleaned_body = clean_confluence_html(storage_body)
+        cleaned_body = clean_page_body(page, storage_body)
         logger.debug(f"Cleaned body length: {len(cleaned_body)}")
         logger.debug(f"Cleaned body preview: {cleaned_body[:200]}...")
         text_content += cleaned_body
@@ -455,12 +513,31 @@ def inspect_document(page: Dict, space_key: str, space_name: str, format_choice:
     
     safe_print("="*80)
 
+# Name of this uploader in the processed-pages ledger (--ledger); the collection and format are appended
+LEDGER_CONSUMER = 'open-webui'
+
+def remove_page_documents(client: OpenWebUIClient, collection_id: str, space_key: str,
+                          page_ids: List[str], format_choice: str) -> int:
+    """
+    Remove the documents uploaded earlier for pages of a space from a collection
+    Returns the number of documents removed
+    """
+    suffix = 'TEXT' if format_choice == 'txt' else 'PATH'
+    filenames = {f"{space_key}-{page_id}-{suffix}.txt" for page_id in page_ids}
+    removed = 0
+    for filename, file_ids in client.list_collection_files(collection_id).items():
+        if filename in filenames:
+            removed += sum(client.remove_document(collection_id, file_id) for file_id in file_ids)
+    return removed
+
 def upload_confluence_space(client: OpenWebUIClient, pickle_data: Dict, 
                           text_collection: str, path_collection: str = None,
                           inspect: bool = False, format_choice: str = 'both',
-                          interactive: bool = False) -> tuple:
+                          interactive: bool = False, ledger: ProcessedLedger = None) -> tuple:
     """
     Upload all pages from a Confluence space to Open-WebUI
+    With a ledger, pages unchanged since their last upload are skipped (and counted as uploaded),
+    and the earlier documents of pages that changed or are gone are removed first
     Returns tuple of (number of successfully uploaded pages, user_quit)
     """
     space_key = pickle_data.get('space_key', 'UNKNOWN')
@@ -475,10 +552,28 @@ def upload_confluence_space(client: OpenWebUIClient, pickle_data: Dict,
     
     success_count = 0
     
+    unchanged = set()
+    if ledger is not None:
+        recorded = ledger.hashes(space_key)
+        unchanged = {str(page.get('id')) for page in sampled_pages
+                     if recorded.get(str(page.get('id'))) == page_body_hash(page)}
+        stale = [page_id for page_id in recorded if page_id not in unchanged]
+        if stale:
+            collection_id = text_collection if format_choice == 'txt' else (path_collection or text_collection)
+            removed = remove_page_documents(client, collection_id, space_key, stale, format_choice)
+            logger.info(f"Removed {removed} earlier documents of {len(stale)} changed or deleted pages in space {space_key}")
+        ledger.forget(ledger.removed((page.get('id') for page in sampled_pages), space_key))
+        if unchanged:
+            logger.info(f"Skipping {len(unchanged)} pages unchanged since their last upload")
+            success_count += len(unchanged)
+    
     for i, page in enumerate(sampled_pages, 1):
         page_id = page.get('id', f'page_{i}')
         title = page.get('title', f'Untitled Page {i}')
         
+        if str(page_id) in unchanged:
+            continue
+        
         logger.debug(f"Processing page {i}/{len(sampled_pages)}: {title}")
         
         # If inspection is enabled, show the document
@@ -531,6 +626,8 @@ def upload_confluence_space(client: OpenWebUIClient, pickle_data: Dict,
             
             if upload_success:
                 success_count += 1
+                if ledger is not None and page.get('id'):
+                    ledger.mark([(page['id'], page_body_hash(page))], space_key)
                 logger.info(f"Successfully uploaded page '{title}' ({page_id}) - format: {format_choice}")
             else:
                 logger.warning(f"Failed to upload page '{title}' ({page_id})")
@@ -656,8 +753,28 @@ def main():
         default=0,
         help="Limit total pages to upload in test mode (0 = no limit)"
     )
+    parser.add_argument(
+        "--html-cleaner",
+        choices=HTML_CLEANERS,
+        default="bs4",
+        help="Text extraction: bs4 (reference) or lxml (same output, several times faster on large pages)"
+    )
+    parser.add_argument(
+        "--text-cache",
+        metavar="PATH",
+        help="SQLite cache of cleaned page text by body hash (see warm_text_cache.py); cached pages are not cleaned again"
+    )
+    parser.add_argument(
+        "--ledger",
+        metavar="PATH",
+        help="SQLite ledger of uploaded pages by body hash (utils/change_ledger.py); pages unchanged since their "
+             "last upload to the collection are skipped, changed and deleted pages have their earlier document removed"
+    )
     
     args = parser.parse_args()
+    set_default_cleaner(args.html_cleaner)
+    if args.text_cache:
+        open_text_cache(args.text_cache)
     
     # Ensure path_collection attribute exists
     if not hasattr(args, 'path_collection'):
@@ -997,6 +1114,12 @@ def main():
         safe_print("\n✅ All spaces have already been processed!")
         return 0
     
+    # The ledger is kept per collection and format; a test collection is deleted afterwards, so it gets none
+    ledger = None
+    if args.ledger and not (hasattr(args, 'test_mode') and args.test_mode):
+        ledger_collection = path_collection_id if args.format == 'path' else text_collection_id
+        ledger = ProcessedLedger(args.ledger, f"{LEDGER_CONSUMER}:{ledger_collection}:{args.format}")
+    
     # Process files sequentially
     total_success = 0
     total_pages = 0
@@ -1042,7 +1165,8 @@ def main():
             success_count, user_quit = upload_confluence_space(
                 client, pickle_data, text_collection_id,
                 path_collection=path_collection_id,
-                inspect=args.inspect, format_choice=args.format, interactive=args.interactive
+                inspect=args.inspect, format_choice=args.format, interactive=args.interactive,
+                ledger=ledger
             )
             
             pages_uploaded_so_far += success_count
@@ -1073,6 +1197,9 @@ def main():
         except Exception as e:
             logger.error(f"❌ Processing {pickle_file.name} failed: {e}")
     
+    if ledger is not None:
+        ledger.close()
+    
     logger.info(f"🎉 Upload complete: {total_success}/{total_pages} pages uploaded successfully")
     
     # Clear checkpoint on successful completion
@@ -6,25 +6,24 @@ and new naming convention (SPACENAME.pkl) by keeping the larger file.
 
 import os
 import shutil
-import pickle
 from pathlib import Path
 
-def get_pickle_info(filepath):
-    """Get information about a pickle file"""
+from utils.pickle_catalog import PickleCatalog
+
+def get_pickle_info(filepath, catalog=None):
+    """Get information about a pickle file from the pickle catalog (the pickle is only read if its entry is stale)"""
     try:
-        file_size = os.path.getsize(filepath)
-        file_mtime = os.path.getmtime(filepath)
-        with open(filepath, 'rb') as f:
-            data = pickle.load(f)
-            num_pages = len(data.get('sampled_pages', []))
-            space_key = data.get('space_key', 'Unknown')
-            space_name = data.get('name', 'Unknown')
+        if catalog is None:
+            catalog = PickleCatalog(os.path.dirname(os.path.abspath(filepath)))
+        entry = catalog.entry(os.path.basename(filepath))
+        if entry is None:
+            raise FileNotFoundError(filepath)
         return {
-            'size': file_size,
-            'pages': num_pages,
-            'space_key': space_key,
-            'space_name': space_name,
-            'mtime': file_mtime
+            'size': entry['size'],
+            'pages': entry.get('sampled_pages', 0),
+            'space_key': entry.get('space_key') or 'Unknown',
+            'space_name': entry.get('name') or 'Unknown',
+            'mtime': entry['mtime']
         }
     except Exception as e:
         print(f"Error reading {filepath}: {e}")
@@ -42,6 +41,7 @@ def reconcile_pickles(directory, dry_run=True):
     
     # Find all pickle files
     all_files = list(Path(directory).glob("*.pkl"))
+    catalog = PickleCatalog(str(directory))
     
     # Group files by space key
     space_files = {}
@@ -71,8 +71,8 @@ def reconcile_pickles(directory, dry_run=True):
             full_path = files['full']
             standard_path = files['standard']
             
-            full_info = get_pickle_info(full_path)
-            standard_info = get_pickle_info(standard_path)
+            full_info = get_pickle_info(full_path, catalog)
+            standard_info = get_pickle_info(standard_path, catalog)
             
             if not full_info or not standard_info:
                 print(f"\n[ERROR] {space_key}: Could not read one or both files")
@@ -103,7 +103,7 @@ def reconcile_pickles(directory, dry_run=True):
                     remove_file = full_path
                     source = "standard"
             
-            print(f"  → Keeping {source} file with {get_pickle_info(keep_file)['pages']} pages")
+            print(f"  → Keeping {source} file with {get_pickle_info(keep_file, catalog)['pages']} pages")
             
             if not dry_run:
                 try:
@@ -129,7 +129,7 @@ def reconcile_pickles(directory, dry_run=True):
         elif 'full' in files and 'standard' not in files:
             # Only full file exists - rename it
             full_path = files['full']
-            full_info = get_pickle_info(full_path)
+            full_info = get_pickle_info(full_path, catalog)
             
             if not full_info:
                 print(f"\n[ERROR] {space_key}: Could not read {full_path.name}")
@@ -157,6 +157,12 @@ def reconcile_pickles(directory, dry_run=True):
             # Only standard file exists - nothing to do
             already_good += 1
     
+    try:
+        # Keep entries rebuilt during this scan for the next reader
+        catalog.save()
+    except (OSError, TimeoutError) as e:
+        print(f"Warning: Could not update pickle catalog: {e}")
+    
     print("\n" + "=" * 80)
     print("SUMMARY:")
     print(f"  - Spaces already using new naming: {already_good}")
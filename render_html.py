@@ -1,14 +1,13 @@
 # description: Renders HTML for Confluence visualization from individual space pickle files.
 
-import pickle
 import json
 import os
 import sys
 import webbrowser
 import numpy as np
-from datetime import datetime
 import argparse
 from config_loader import load_data_settings
+from utils.pickle_catalog import load_catalog_entries
 
 OUTPUT_HTML = "confluence_treepack.html"
 DEFAULT_PICKLE_DIR = "temp"  # Default directory for individual space pickles
@@ -101,26 +100,11 @@ def calculate_color_data(data):
     return percentile_thresholds, color_range_hex
 
 
-def parse_timestamp(ts_str):
-    """Parse various timestamp formats to Unix timestamp."""
-    if not ts_str:
-        return 0
-
-    try:
-        # Handle timezone suffix
-        if ts_str.endswith('Z'):
-            ts_str = ts_str[:-1]
-        elif '+' in ts_str:
-            ts_str = ts_str.split('+')[0]
-
-        dt = datetime.fromisoformat(ts_str)
-        return dt.timestamp()
-    except Exception:
-        return 0
-
-
 def load_spaces_from_pickles(pickle_dir):
-    """Load individual space pickle files and build visualization data structure."""
+    """Build the visualization data structure from the pickle catalog of a pickle directory.
+
+    Only pickles that are new or changed since they were cataloged are unpickled.
+    """
     if not os.path.exists(pickle_dir):
         print(f"Error: Pickle directory '{pickle_dir}' does not exist.", file=sys.stderr)
         sys.exit(1)
@@ -136,45 +120,29 @@ def load_spaces_from_pickles(pickle_dir):
     spaces = []
     skipped = 0
 
-    for pkl_file in sorted(pickle_files):
-        pkl_path = os.path.join(pickle_dir, pkl_file)
-        try:
-            with open(pkl_path, 'rb') as f:
-                data = pickle.load(f)
-
-            # Skip placeholder/processing pickles
-            if data.get('status') == 'processing':
-                skipped += 1
-                continue
-
-            space_key = data.get('space_key', os.path.splitext(pkl_file)[0])
-            space_name = data.get('name', space_key)
-            pages = data.get('sampled_pages', [])
-            total_pages = data.get('total_pages_in_space', len(pages))
-
-            # Calculate average timestamp from pages
-            timestamps = []
-            for page in pages:
-                # Try different timestamp fields
-                ts_str = (page.get('lastModified') or
-                         page.get('when') or
-                         page.get('version', {}).get('when', ''))
-                ts = parse_timestamp(ts_str)
-                if ts > 0:
-                    timestamps.append(ts)
-
-            avg_timestamp = sum(timestamps) / len(timestamps) if timestamps else 0
-
-            spaces.append({
-                'key': space_key,
-                'name': space_name,
-                'value': total_pages,
-                'avg': avg_timestamp
-            })
-
-        except Exception as e:
-            print(f"  Warning: Error reading {pkl_file}: {e}", file=sys.stderr)
+    def report_error(pkl_file, e):
+        nonlocal skipped
+        print(f"  Warning: Error reading {pkl_file}: {e}", file=sys.stderr)
+        skipped += 1
+
+    for entry in load_catalog_entries(pickle_dir, on_error=report_error):
+        # Skip placeholder/processing pickles
+        if entry.get('status') == 'processing' or entry.get('format') == 'other':
             skipped += 1
+            continue
+
+        space_key = entry.get('space_key')
+        total_pages = entry.get('total_pages_in_space')
+        if total_pages is None:
+            total_pages = entry.get('sampled_pages', 0)
+
+        spaces.append({
+            'key': space_key,
+            'name': entry.get('name') or space_key,
+            'value': total_pages,
+            # Average page update time, recorded when the pickle was written
+            'avg': entry.get('avg_updated', 0)
+        })
 
     if not spaces:
         print("Error: No valid space data found.", file=sys.stderr)
@@ -2,7 +2,8 @@
 """
 Script to sample and pickle Confluence attachments.
 Cloned from sample_and_pickle_spaces.py but modified to handle attachments.
-Stores attachments in ./attachments/{spacekey}/{pageid}_attachmentname format.
+Stores attachment files in the shared content-addressed store (attachment_store_dir) and
+per-space metadata in ./attachments/{spacekey}/{spacekey}_attachments.pkl.
 """
 
 import os
@@ -16,8 +17,9 @@ import configparser
 from typing import List, Dict, Tuple, Optional
 import time
 import logging
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from utils.confluence_client import get_client
+from utils.attachment_downloader import DEFAULT_DOWNLOAD_WORKERS, AttachmentDownloader
+from utils.attachment_store import DEFAULT_STORE_DIR, AttachmentStore, StoreItem
 
 # Load configuration
 config = configparser.ConfigParser()
@@ -34,10 +36,15 @@ API_ENDPOINT = '/rest/api'
 
 # Attachment storage settings - will use new config value
 ATTACHMENTS_DIR = config.get('data', 'attachments_dir', fallback='attachments')
+# Attachment files themselves live in the store shared with sample_and_pickle_spaces.py
+ATTACHMENT_STORE_DIR = config.get('data', 'attachment_store_dir', fallback=DEFAULT_STORE_DIR)
 
 # Checkpoint file for tracking progress
 CHECKPOINT_FILE = 'confluence_attachments_checkpoint.json'
 
+# Attachments downloaded at once per space (--download-workers)
+DOWNLOAD_WORKERS = DEFAULT_DOWNLOAD_WORKERS
+
 # Logging setup
 def setup_logging():
     """Setup logging configuration"""
@@ -53,26 +60,15 @@ def setup_logging():
 
 logger = setup_logging()
 
-# Create session with retry strategy
-def create_session():
-    """Create a requests session with retry strategy"""
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        status_forcelist=[429, 500, 502, 503, 504],
-        method_whitelist=["HEAD", "GET", "OPTIONS"],
-        backoff_factor=1
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
-
-session = create_session()
+# Shared pooled client: retries, Retry-After handling and the process-wide rate limiter
+CONFLUENCE_CLIENT = get_client(BASE_URL, USERNAME, PASSWORD, VERIFY_SSL)
 
 def get_with_retry(url, **kwargs):
     """Wrapper for requests.get with built-in retry logic"""
-    return session.get(url, **kwargs)
+    response = CONFLUENCE_CLIENT.get(url, **kwargs)
+    if response is None:
+        raise requests.exceptions.ConnectionError(f"No response from {url} after retries")
+    return response
 
 def load_checkpoint():
     """Load checkpoint file to resume from previous run"""
@@ -176,9 +172,8 @@ def sanitize_filename(filename):
         safe_name = name[:196] + ext
     return safe_name or "unnamed_attachment"
 
-def download_and_pickle_attachment(attachment, page_id, space_key, auth_tuple):
-    """Download an attachment and save metadata"""
-    att_id = attachment.get('id')
+def attachment_store_item(attachment, page_id, space_key):
+    """Build the StoreItem for one attachment, or None if it has no download link"""
     att_title = attachment.get('title', 'unnamed')
     att_download_link = attachment.get('_links', {}).get('download')
     
@@ -192,64 +187,45 @@ def download_and_pickle_attachment(attachment, page_id, space_key, auth_tuple):
     else:
         download_url = f"{BASE_URL}/{att_download_link}"
     
-    # Create directory structure
-    space_dir = os.path.join(ATTACHMENTS_DIR, space_key)
-    os.makedirs(space_dir, exist_ok=True)
-    
-    # Create filename with page ID prefix
-    safe_filename = sanitize_filename(att_title)
-    filename = f"{page_id}_{safe_filename}"
-    file_path = os.path.join(space_dir, filename)
-    
-    # Skip if already exists
-    if os.path.exists(file_path):
-        logger.debug(f"Attachment already exists: {file_path}")
-        # Still return metadata even if file exists
-        return {
-            'id': att_id,
-            'title': att_title,
-            'filename': filename,
-            'page_id': page_id,
-            'space_key': space_key,
-            'file_path': file_path,
-            'size': os.path.getsize(file_path),
-            'download_date': datetime.fromtimestamp(os.path.getctime(file_path)).isoformat(),
-            'existed': True
-        }
+    return StoreItem(space_key, page_id, attachment, download_url)
+
+def attachment_metadata(result):
+    """Metadata record for a stored attachment, or None if it failed"""
+    item = result.item
+    attachment = item.attachment
+    att_title = attachment.get('title', 'unnamed')
+    if not result.ok:
+        logger.error(f"Error downloading attachment {att_title}: {result.error}")
+        return None
     
-    try:
-        # Download the attachment
-        logger.info(f"Downloading: {att_title} from page {page_id}")
-        response = get_with_retry(download_url, auth=auth_tuple, verify=VERIFY_SSL, stream=True, timeout=60)
-        response.raise_for_status()
-        
-        # Write to file
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
-        file_size = os.path.getsize(file_path)
-        
-        # Return metadata
-        return {
-            'id': att_id,
-            'title': att_title,
-            'filename': filename,
-            'page_id': page_id,
-            'space_key': space_key,
-            'file_path': file_path,
-            'size': file_size,
-            'download_date': datetime.now().isoformat(),
-            'media_type': attachment.get('extensions', {}).get('mediaType', 'unknown'),
-            'created_date': attachment.get('version', {}).get('when'),
-            'created_by': attachment.get('version', {}).get('by', {}).get('displayName'),
-            'existed': False
-        }
-        
-    except Exception as e:
-        logger.error(f"Error downloading attachment {att_title}: {e}")
+    return {
+        'id': attachment.get('id'),
+        'title': att_title,
+        # Name the file had in the old per-page layout; the content is at file_path
+        'filename': f"{item.page_id}_{sanitize_filename(att_title)}",
+        'page_id': item.page_id,
+        'space_key': item.space_key,
+        'file_path': result.path,
+        'sha256': result.sha256,
+        'version': item.version,
+        'size': result.size,
+        'download_date': datetime.now().isoformat(),
+        'media_type': attachment.get('extensions', {}).get('mediaType', 'unknown'),
+        'created_date': attachment.get('version', {}).get('when'),
+        'created_by': attachment.get('version', {}).get('by', {}).get('displayName'),
+        # Known versions were not downloaded again; deduplicated ones were downloaded but not stored twice
+        'existed': result.status == 'known'
+    }
+
+def download_and_pickle_attachment(attachment, page_id, space_key, auth_tuple):
+    """Download an attachment and save metadata"""
+    item = attachment_store_item(attachment, page_id, space_key)
+    if item is None:
         return None
+    logger.info(f"Downloading: {attachment.get('title', 'unnamed')} from page {page_id}")
+    with AttachmentStore(ATTACHMENT_STORE_DIR) as store:
+        result = store.fetch(AttachmentDownloader(CONFLUENCE_CLIENT, max_workers=1), [item])[0]
+    return attachment_metadata(result)
 
 def process_space_attachments(space_key, space_name):
     """Process all attachments for a given space"""
@@ -266,8 +242,9 @@ def process_space_attachments(space_key, space_name):
     all_attachments_metadata = []
     total_attachments = 0
     downloaded_attachments = 0
+    items = []
     
-    # Process each page
+    # Collect the attachments of every page, then download them concurrently
     for page in pages:
         page_id = page.get('id')
         page_title = page.get('title', 'Untitled')
@@ -281,25 +258,34 @@ def process_space_attachments(space_key, space_name):
         logger.debug(f"Processing {len(attachments)} attachments from page: {page_title}")
         total_attachments += len(attachments)
         
-        # Download and store each attachment
         for attachment in attachments:
-            metadata = download_and_pickle_attachment(
-                attachment, 
-                page_id, 
-                space_key, 
-                (USERNAME, PASSWORD)
-            )
-            
-            if metadata:
-                all_attachments_metadata.append(metadata)
-                if not metadata.get('existed', False):
-                    downloaded_attachments += 1
+            item = attachment_store_item(attachment, page_id, space_key)
+            if item is not None:
+                items.append(item)
+    
+    def report(result, done, total):
+        if result.downloaded:
+            logger.info(f"Downloaded ({done}/{total}): {result.item.title} [{result.status}]")
+    
+    downloader = AttachmentDownloader(CONFLUENCE_CLIENT, max_workers=DOWNLOAD_WORKERS)
+    with AttachmentStore(ATTACHMENT_STORE_DIR) as store:
+        results = store.fetch(downloader, items, on_result=report)
+        store_stats = store.stats()
+    for result in results:
+        metadata = attachment_metadata(result)
+        if metadata:
+            all_attachments_metadata.append(metadata)
+            if not metadata.get('existed', False):
+                downloaded_attachments += 1
     
     logger.info(f"Space {space_key}: Total attachments: {total_attachments}, "
                 f"Downloaded: {downloaded_attachments}, "
                 f"Already existed: {total_attachments - downloaded_attachments}")
+    logger.info(f"Attachment store: {store_stats['attachments']} attachment versions in {store_stats['blobs']} files, "
+                f"{store_stats['stored_bytes'] / (1024*1024):.1f} MB on disk for {store_stats['logical_bytes'] / (1024*1024):.1f} MB of attachments")
     
     # Save metadata pickle for this space
+    os.makedirs(os.path.join(ATTACHMENTS_DIR, space_key), exist_ok=True)
     pickle_path = os.path.join(ATTACHMENTS_DIR, space_key, f"{space_key}_attachments.pkl")
     try:
         with open(pickle_path, 'wb') as f:
@@ -318,14 +304,22 @@ def process_space_attachments(space_key, space_name):
 
 def main():
     """Main function"""
+    global DOWNLOAD_WORKERS
     parser = argparse.ArgumentParser(description="Sample and pickle Confluence attachments")
     parser.add_argument('--space', help="Process attachments for a specific space")
     parser.add_argument('--all-spaces', action='store_true', help="Process attachments for all spaces")
     parser.add_argument('--reset', action='store_true', help="Reset checkpoint and start fresh")
     parser.add_argument('--list-spaces', action='store_true', help="List all available spaces")
+    parser.add_argument('--download-workers', type=int, default=DOWNLOAD_WORKERS, metavar='N',
+                        help=f"Number of attachments downloaded at once (default: {DOWNLOAD_WORKERS}). Interrupted downloads resume where they stopped.")
     
     args = parser.parse_args()
     
+    if args.download_workers < 1:
+        print("Error: --download-workers must be at least 1")
+        sys.exit(1)
+    DOWNLOAD_WORKERS = args.download_workers
+    
     # Create attachments directory if it doesn't exist
     os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
     
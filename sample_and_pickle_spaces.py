@@ -4,14 +4,30 @@ import os
 import pickle
 import json
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import requests
 import time
 import urllib3
 import argparse
 import sys # Added import
+import itertools
 import logging
+import multiprocessing
+import queue
+import socket
+import sqlite3
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from config_loader import load_confluence_settings, load_data_settings # MODIFIED IMPORT
+from utils.confluence_client import get_client
+from utils.rate_limiter import DEFAULT_INITIAL_RATE, DEFAULT_MAX_RATE, configure_rate_limiter, get_rate_limiter
+from utils.atomic_io import FileLock, atomic_pickle_dump, atomic_write_json
+from utils.page_journal import PageJournal, same_page_version
+from utils.change_ledger import set_body_hash
+from utils.streaming_pickle import OUT_OF_BAND_MIN_BYTES, StreamingSpaceWriter, dump_space, load_space
+from utils.pickle_catalog import record_pickle
+from utils.attachment_downloader import DEFAULT_DOWNLOAD_WORKERS, AttachmentDownloader
+from utils.attachment_store import DEFAULT_STORE_DIR, AttachmentStore, StoreItem
 
 # Load settings
 confluence_settings = load_confluence_settings()
@@ -24,6 +40,8 @@ VERIFY_SSL = confluence_settings['verify_ssl']
 # Load data settings to get pickle directories
 data_settings = load_data_settings()
 REMOTE_FULL_PICKLE_DIR = data_settings.get('remote_full_pickle_dir')
+# Shared content-addressed attachment store (also used by sample_and_pickle_attachments.py)
+ATTACHMENT_STORE_DIR = data_settings.get('attachment_store_dir') or DEFAULT_STORE_DIR
 
 if not VERIFY_SSL:
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -79,6 +97,13 @@ def write_log(log_filename, level, message):
         except Exception as e:
             print(f"Error writing to log: {e}")
 
+def log_rate_limiter_stats(log_file=None):
+    """Print and log the current request rate and throttle count of the shared rate limiter."""
+    summary = get_rate_limiter().summary()
+    print(f"  Rate limiter: {summary}")
+    logging.info(f"Rate limiter: {summary}")
+    write_log(log_file, "INFO", f"Rate limiter: {summary}")
+
 def print_spaces_nicely(spaces_data):
     """Prints a list of space data in a readable format."""
     if not spaces_data:
@@ -109,65 +134,65 @@ def print_space_keys_only(spaces_data):
     print("--- End of Space Keys List ---")
 
 
-def get_with_retry(url, params=None, auth=None, headers=None, verify=False, stream=False, timeout=30):
+# Shared pooled keep-alive client; connections are reused across requests and body-fetch threads
+CONFLUENCE_CLIENT = get_client(BASE_URL, USERNAME, PASSWORD, VERIFY_SSL)
+
+def get_with_retry(url, params=None, auth=None, headers=None, verify=False, stream=False, timeout=30, max_retries=None):
     logging.info(f"Making HTTP request to: {url}")
     logging.info(f"Request params: {params}")
-    
-    while True:
-        try:
-            logging.info("About to make requests.get call")
-            resp = requests.get(url, params=params, auth=auth, headers=headers, verify=verify, stream=stream, timeout=timeout)
-            logging.info(f"requests.get completed with status: {resp.status_code}")
-            
-            if resp.status_code == 429:
-                # Extract the Retry-After header value
-                retry_after = resp.headers.get('Retry-After')
-                
-                if retry_after:
-                    # Retry-After can be either a number of seconds or a date
-                    if retry_after.isdigit():
-                        wait_time = int(retry_after)
-                    else:
-                        # Parse HTTP date format
-                        try:
-                            retry_date = datetime.strptime(retry_after, '%a, %d %b %Y %H:%M:%S %Z')
-                            wait_time = max(1, (retry_date - datetime.now()).total_seconds())
-                        except (ValueError, TypeError):
-                            # Fallback to 2 seconds if parsing fails
-                            wait_time = 2
-                else:
-                    # Default to 2 seconds if no Retry-After header
-                    wait_time = 2
-                    
-                print(f"Warning: Rate limited (429). Retrying {url} in {wait_time}s as specified by server...")
-                logging.warning(f"Rate limited (429). Retrying in {wait_time}s")
-                time.sleep(wait_time)
-                continue
-                
-            if resp.status_code >= 400:
-                error_msg = f"Error {resp.status_code} fetching {url}. Response: {resp.text}"
-                print(error_msg)
-                logging.error(error_msg)
-                
-            logging.info(f"Request successful, returning response")
-            return resp
-            
-        except requests.exceptions.Timeout as e:
-            error_msg = f"Request timeout after {timeout}s for {url}: {e}"
-            logging.error(error_msg)
-            print(error_msg)
-            return None
-            
-        except requests.exceptions.RequestException as e:
-            error_msg = f"Request exception for {url}: {e}"
-            logging.error(error_msg, exc_info=True)
-            print(error_msg)
-            return None
+
+    # 429s (honouring Retry-After), gateway errors and connection errors are retried by the client
+    resp = CONFLUENCE_CLIENT.get(url, params=params, auth=auth, headers=headers, verify=verify,
+                                 stream=stream, timeout=timeout, max_retries=max_retries)
+    if resp is None:
+        error_msg = f"Request failed for {url} (timeout or connection error, retries exhausted)"
+        logging.error(error_msg)
+        print(error_msg)
+        return None
+    logging.info(f"Request completed with status: {resp.status_code}")
+
+    if resp.status_code >= 400:
+        error_msg = f"Error {resp.status_code} fetching {url}. Response: {resp.text}"
+        print(error_msg)
+        logging.error(error_msg)
+
+    return resp
 
 TOP_N_ROOT = 10
 TOP_N_RECENT = 30
 TOP_N_FREQUENT = 30
 
+# Number of concurrent workers used to fetch page bodies (overridable with --body-workers)
+BODY_FETCH_WORKERS = 8
+# Concurrent attachment downloads per space (--download-attachments)
+ATTACHMENT_DOWNLOAD_WORKERS = DEFAULT_DOWNLOAD_WORKERS
+# With --out-of-band-bodies, bodies of at least this many bytes are written to a buffers file
+# (SPACE.pkl.<token>.buffers) next to the pickle instead of into it (None keeps every body in the pickle)
+OUT_OF_BAND_BODY_BYTES = None
+
+# Single-pass harvesting (--single-pass): page size bounds and the per-response size/latency it adapts towards
+HARVEST_INITIAL_LIMIT = 25
+HARVEST_MIN_LIMIT = 5
+HARVEST_MAX_LIMIT = 200
+HARVEST_TARGET_BYTES = 8 * 1024 * 1024
+HARVEST_TARGET_SECONDS = 10
+HARVEST_TIMEOUT = 120
+
+# Space-parallel full pickling (--workers): a space whose worker process dies this many times is reported as failed
+FULL_PICKLE_MAX_ATTEMPTS = 3
+WORKER_POLL_SECONDS = 2
+# Placeholder pickles older than this are assumed to belong to a crashed run and are re-pickled
+STALE_PLACEHOLDER_SECONDS = 6 * 60 * 60
+# Placeholder pickles are tiny; anything larger is a finished space pickle
+PLACEHOLDER_MAX_BYTES = 4096
+
+# Delta sync (--delta-sync): high-water mark state file kept next to the pickles it refreshes
+DELTA_SYNC_STATE_FILENAME = 'confluence_delta_sync_state.json'
+# CQL dates have minute resolution and are read in the API user's time zone, so the query starts this
+# far before the high-water mark; pages that turn out to be up to date are filtered out locally
+DELTA_SYNC_OVERLAP_HOURS = 24
+DELTA_SYNC_PAGE_LIMIT = 100
+
 # Load configurable pickle directory from settings
 OUTPUT_DIR = data_settings.get('pickle_dir', 'temp')
 
@@ -212,6 +237,21 @@ if not os.path.exists(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR):
 FULL_PICKLE_CHECKPOINT_FILE_PATH = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, FULL_PICKLE_CHECKPOINT_FILENAME)
 
 
+def build_page_info(page, space_key):
+    """Convert a /rest/api/content result into the page dict stored in the pickles."""
+    return {
+        'id': page.get('id'),
+        'title': page.get('title'),
+        'updated': page.get('version', {}).get('when', ''),
+        'update_count': page.get('version', {}).get('number', 0),
+        'parent_id': page['ancestors'][0]['id'] if page.get('ancestors') else None,
+        'level': len(page.get('ancestors', [])),
+        'space_key': space_key,
+        # NEW METADATA
+        'attachments': page.get('children', {}).get('attachment', {}).get('results', []),
+        'child_pages': [{'id': child.get('id'), 'title': child.get('title')} for child in page.get('children', {}).get('page', {}).get('results', [])]
+    }
+
 def fetch_page_metadata(space_key):
     print(f"  Fetching page metadata for space: {space_key}")
     pages = []
@@ -229,38 +269,121 @@ def fetch_page_metadata(space_key):
         if not results:
             break
         for page in results:
-            page_info = {
-                'id': page.get('id'),
-                'title': page.get('title'),
-                'updated': page.get('version', {}).get('when', ''),
-                'update_count': page.get('version', {}).get('number', 0),
-                'parent_id': page['ancestors'][0]['id'] if page.get('ancestors') else None,
-                'level': len(page.get('ancestors', [])),
-                'space_key': space_key,
-                # NEW METADATA
-                'attachments': page.get('children', {}).get('attachment', {}).get('results', []),
-                'child_pages': [{'id': child.get('id'), 'title': child.get('title')} for child in page.get('children', {}).get('page', {}).get('results', [])]
-            }
-            pages.append(page_info)
+            pages.append(build_page_info(page, space_key))
         if len(results) < page_limit:
             break
         start += page_limit
     print(f"  Total metadata pages fetched for space {space_key}: {len(pages)}")
     return pages
 
-def fetch_page_body(page_id):
+def harvest_space_pages(space_key, verbose=False, log_file=None, journal=None):
+    """Fetch metadata and bodies for every page of a space in a single paginated listing.
+
+    Requests body.storage in the same /rest/api/content call used by fetch_page_metadata,
+    so there is no extra GET per page. The page size adapts to response size and latency:
+    it grows while responses are small and fast, and shrinks when they are large, slow or fail.
+    Returns the same (pages, total_pages) tuple as sample_and_fetch_bodies(fetch_all=True);
+    with a journal, bodies are spooled to it instead of being kept on the page dicts.
+    """
+    print(f"  Harvesting page metadata and bodies for space: {space_key} (single-pass mode)")
+    pages = []
+    start = 0
+    page_limit = HARVEST_INITIAL_LIMIT
+    request_count = 0
+    started = time.time()
+    while True:
+        url = f"{BASE_URL}{API_ENDPOINT}/content"
+        params = {"type": "page", "spaceKey": space_key, "start": start, "limit": page_limit,
+                  "expand": "version,ancestors,children.page,children.attachment,body.storage"}
+        request_started = time.time()
+        # Only one retry: a failing or slow listing is better answered by shrinking the page size
+        r = get_with_retry(url, params=params, auth=(USERNAME, PASSWORD), verify=VERIFY_SSL, timeout=HARVEST_TIMEOUT, max_retries=1)
+        elapsed = time.time() - request_started
+        request_count += 1
+        if r is None or r.status_code != 200:
+            status_code = r.status_code if r is not None else 'no response'
+            if page_limit > HARVEST_MIN_LIMIT:
+                page_limit = max(HARVEST_MIN_LIMIT, page_limit // 2)
+                print(f"  Listing request failed for space {space_key} (status: {status_code}). Retrying with limit={page_limit}.")
+                write_log(log_file, "WARNING", f"Harvest request failed for {space_key} at start={start} (status: {status_code}), shrinking limit to {page_limit}")
+                continue
+            print(f"  Failed to harvest pages for space {space_key}. Status code: {status_code}")
+            break
+        data = r.json()
+        results = data.get("results", [])
+        if not results:
+            break
+        for page in results:
+            page_info = build_page_info(page, space_key)
+            page_info['body'] = page.get('body', {}).get('storage', {}).get('value', '')
+            set_body_hash(page_info)
+            if journal is not None:
+                journal.append(page_info)
+                del page_info['body']
+            pages.append(page_info)
+        if verbose:
+            print(f"    Harvested {len(results)} pages (start={start}, limit={page_limit}, {len(r.content):,} bytes, {elapsed:.1f}s)")
+            write_log(log_file, "INFO", f"Harvested {len(results)} pages for {space_key} start={start} limit={page_limit} bytes={len(r.content)} elapsed={elapsed:.2f}s")
+        elif request_count % 10 == 0:
+            print(f"    Harvested {len(pages)} pages so far for space {space_key} (limit={page_limit})...")
+        # The server may cap the limit (e.g. when bodies are expanded), so compare against what it actually used
+        effective_limit = data.get('limit', page_limit)
+        if len(results) < min(page_limit, effective_limit):
+            break
+        start += len(results)
+        page_limit = _next_harvest_limit(min(page_limit, effective_limit), len(r.content), elapsed)
+    total_elapsed = time.time() - started
+    print(f"  Total pages harvested for space {space_key}: {len(pages)} in {request_count} requests ({total_elapsed:.1f}s)")
+    write_log(log_file, "INFO", f"Harvested {len(pages)} pages for {space_key} in {request_count} requests ({total_elapsed:.1f}s)")
+    return pages, len(pages)
+
+def _next_harvest_limit(current_limit, response_bytes, elapsed):
+    """Pick the next listing page size from the size and latency of the last response."""
+    if response_bytes > HARVEST_TARGET_BYTES or elapsed > HARVEST_TARGET_SECONDS:
+        return max(HARVEST_MIN_LIMIT, current_limit // 2)
+    if response_bytes < HARVEST_TARGET_BYTES / 2 and elapsed < HARVEST_TARGET_SECONDS / 2:
+        return min(HARVEST_MAX_LIMIT, current_limit * 2)
+    return current_limit
+
+def fetch_page_body(page_id, default=''):
+    """Return the storage-format body of a page, or default if it could not be fetched."""
     # Construct URL using BASE_URL and API_ENDPOINT
     url = f"{BASE_URL}{API_ENDPOINT}/content/{page_id}"
     params = {"expand": "body.storage"}
     r = get_with_retry(url, params=params, auth=(USERNAME, PASSWORD), verify=VERIFY_SSL)
-    if r.status_code == 200:
+    if r is not None and r.status_code == 200:
         body = r.json().get('body', {}).get('storage', {}).get('value', '')
         return body
     else:
-        print(f"    Failed to fetch body for page {page_id}. Status code: {r.status_code}")
-        return ''
-
-def sample_and_fetch_bodies(space_key, pages, fetch_all=False, verbose=False, log_file=None):
+        status_code = r.status_code if r is not None else 'no response'
+        print(f"    Failed to fetch body for page {page_id}. Status code: {status_code}")
+        return default
+
+def _fetch_bodies_bounded(executor, page_ids, window):
+    """Yield (index, future) as body fetches finish, keeping at most `window` fetches in flight.
+
+    Bounding the in-flight set stops finished-but-unhandled bodies from piling up in memory
+    when the network is faster than the caller.
+    """
+    pending = iter(enumerate(page_ids))
+    in_flight = {}
+    for index, page_id in itertools.islice(pending, window):
+        in_flight[executor.submit(fetch_page_body, page_id, None)] = index
+    while in_flight:
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            index = in_flight.pop(future)
+            for next_index, page_id in itertools.islice(pending, 1):
+                in_flight[executor.submit(fetch_page_body, page_id, None)] = next_index
+            yield index, future
+
+def sample_and_fetch_bodies(space_key, pages, fetch_all=False, verbose=False, log_file=None, max_workers=None, journal=None):
+    """Fetch bodies for all (fetch_all) or a sample of the pages. Returns (pages_with_bodies, total_pages).
+
+    With a journal, bodies are spooled to the journal instead of being kept on the page dicts,
+    so memory stays flat; write the space with write_space_pickle_from_journal. Pages already
+    journaled at the same version by an interrupted run are not fetched again.
+    """
     if fetch_all:
         print(f"  Fetching bodies for all {len(pages)} pages in space {space_key} (full pickle mode)...")
         deduped = pages # In full mode, all fetched metadata pages are processed
@@ -282,23 +405,78 @@ def sample_and_fetch_bodies(space_key, pages, fetch_all=False, verbose=False, lo
                 seen.add(pid)
         print(f"  Sampling resulted in {len(deduped)} unique pages to fetch bodies for space {space_key}.")
 
-    # Fetch bodies for each page (either all or sampled)
-    for i, p in enumerate(deduped):
-        page_id = p.get('id')
-        page_title = p.get('title', '(no title)')
-        if verbose:
-            print(f"    [{i+1:>4}/{len(deduped)}] Fetching ID {page_id}: {page_title[:60]}")
-            write_log(log_file, "INFO", f"Fetching page {i+1}/{len(deduped)} ID={page_id} title={page_title}")
-        elif (i + 1) % 10 == 0 or i == 0 or (i + 1) == len(deduped):
-            print(f"    Fetching body for page {i+1}/{len(deduped)} (ID: {page_id})...")
-        p['body'] = fetch_page_body(page_id)
-        body_len = len(p['body']) if isinstance(p['body'], str) else 0
-        if verbose:
-            status = f"{body_len:,} chars" if body_len > 0 else "EMPTY"
-            print(f"             -> {status}")
-            write_log(log_file, "INFO", f"Fetched page ID={page_id} body={status}")
+    # With a journal, bodies already fetched by an interrupted run at the same page version are reused
+    to_fetch = deduped
+    if journal is not None:
+        journaled = journal.index()
+        to_fetch = []
+        for p in deduped:
+            previous = journaled.get(p.get('id'))
+            if previous is None or not same_page_version(previous, p):
+                to_fetch.append(p)
+        if len(to_fetch) < len(deduped):
+            print(f"  Resuming: {len(deduped) - len(to_fetch)} of {len(deduped)} page bodies for space {space_key} are already journaled.")
+            write_log(log_file, "INFO", f"Resuming {space_key}: {len(deduped) - len(to_fetch)} of {len(deduped)} bodies taken from the journal")
+
+    # Fetch bodies for each page (either all or sampled) with a bounded worker pool.
+    # Bodies are assigned back onto the page dicts, so the output keeps the original page order.
+    workers = max(1, max_workers if max_workers is not None else BODY_FETCH_WORKERS)
+    total = len(to_fetch)
+    if total > 1 and workers > 1:
+        print(f"  Using {min(workers, total)} concurrent workers to fetch bodies for space {space_key}.")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        page_ids = [p.get('id') for p in to_fetch]
+        for done, (index, future) in enumerate(_fetch_bodies_bounded(executor, page_ids, workers * 2), 1):
+            p = to_fetch[index]
+            page_id = p.get('id')
+            page_title = p.get('title', '(no title)')
+            try:
+                body = future.result()
+            except Exception as e:
+                print(f"    Failed to fetch body for page {page_id}. Error: {e}")
+                write_log(log_file, "ERROR", f"Failed to fetch body for page ID={page_id}: {e}")
+                body = None
+            p['body'] = body if body is not None else ''
+            set_body_hash(p)
+            body_len = len(p['body']) if isinstance(p['body'], str) else 0
+            if journal is not None:
+                # Failed fetches are not journaled, so a restart retries them
+                if body is not None:
+                    journal.append(p)
+                del p['body']
+            if verbose:
+                status = f"{body_len:,} chars" if body_len > 0 else "EMPTY"
+                print(f"    [{done:>4}/{total}] Fetched ID {page_id}: {page_title[:60]} -> {status}")
+                write_log(log_file, "INFO", f"Fetched page {done}/{total} ID={page_id} title={page_title} body={status}")
+            elif done % 10 == 0 or done == 1 or done == total:
+                print(f"    Fetched body for page {done}/{total} (ID: {page_id})...")
     return deduped, len(pages)
 
+def write_space_pickle_from_journal(out_path, space_key, space_name, pages, journal):
+    """Stream a full space pickle to out_path in listing order, reading each body from the journal.
+
+    Only one page body is held in memory at a time, whatever the size of the space. Pages
+    without a journaled body at their current version (failed fetches) get an empty body.
+    The file has the usual layout and replaces out_path atomically. Returns {page_id: body length}.
+    """
+    journaled = journal.index()
+    body_lengths = {}
+    with StreamingSpaceWriter(out_path, {'space_key': space_key, 'name': space_name},
+                              out_of_band_min_bytes=OUT_OF_BAND_BODY_BYTES) as writer:
+        for p in pages:
+            page = dict(p)
+            entry = journaled.get(p.get('id'))
+            if entry is not None and same_page_version(entry, p):
+                page['body'] = journal.read(entry['offset']).get('body', '')
+            else:
+                page['body'] = ''
+            # Pages resumed from the journal were not hashed in this run
+            set_body_hash(page)
+            body_lengths[p.get('id')] = len(page['body']) if isinstance(page['body'], str) else 0
+            writer.append(page)
+        writer.commit({'total_pages_in_space': len(pages)})
+    return body_lengths
+
 def load_checkpoint(filename=CHECKPOINT_FILE): # Added filename parameter with default
     """Load the checkpoint file if it exists."""
     if os.path.exists(filename):
@@ -331,14 +509,311 @@ def load_checkpoint(filename=CHECKPOINT_FILE): # Added filename parameter with d
         }
 
 def save_checkpoint(checkpoint, filename=CHECKPOINT_FILE): # Added filename parameter with default
-    """Save the current checkpoint to disk."""
+    """Save the current checkpoint to disk (via a temp file, so a crash never leaves it truncated)."""
     checkpoint["last_updated"] = datetime.now().isoformat()
     try:
-        with open(filename, 'w') as f:
-            json.dump(checkpoint, f, indent=2)
+        atomic_write_json(filename, checkpoint)
     except Exception as e:
         print(f"Error saving checkpoint file {filename}: {e}")
 
+def mark_space_processed(space_key, filename=FULL_PICKLE_CHECKPOINT_FILE_PATH):
+    """Add space_key to processed_space_keys in the full pickle checkpoint.
+
+    The checkpoint is re-read under a lock file before it is written, so parallel workers
+    (or another run sharing the pickle directory) never overwrite each other's progress.
+    """
+    try:
+        with FileLock(filename + '.lock'):
+            checkpoint = {"all_fetched_space_keys": [], "processed_space_keys": []}
+            if os.path.exists(filename):
+                with open(filename, 'r') as f:
+                    checkpoint = json.load(f)
+            processed = checkpoint.setdefault("processed_space_keys", [])
+            if space_key not in processed:
+                processed.append(space_key)
+                save_checkpoint(checkpoint, filename)
+    except (OSError, ValueError, TimeoutError) as e:
+        print(f"Error updating checkpoint file {filename} for space {space_key}: {e}")
+
+def full_pickle_status(path):
+    """Return 'missing', 'placeholder' (claimed but never finished) or 'complete' for a full pickle."""
+    if not os.path.exists(path):
+        return 'missing'
+    if os.path.getsize(path) > PLACEHOLDER_MAX_BYTES:
+        return 'complete'
+    try:
+        data = load_space(path)
+    except Exception:
+        # A truncated file from an interrupted write is as good as unclaimed
+        return 'placeholder'
+    if isinstance(data, dict) and data.get('status') == 'processing':
+        return 'placeholder'
+    return 'complete'
+
+def catalog_pickle(path, data):
+    """Record a pickle that was written with pickle.dump in its directory's catalog.
+
+    Pickles written through StreamingSpaceWriter/dump_space are recorded automatically.
+    A failure is only reported: readers rebuild a missing entry from the pickle itself.
+    """
+    try:
+        record_pickle(path, data)
+    except (OSError, TimeoutError) as e:
+        print(f"  Warning: Could not update pickle catalog for {path}: {e}")
+
+def placeholder_record(space_key, space_name):
+    """Contents of the placeholder pickle that claims a space while it is being pickled."""
+    return {
+        'space_key': space_key,
+        'name': space_name,
+        'status': 'processing',
+        'started_at': datetime.now().isoformat(),
+        'host': socket.gethostname(),
+        'pid': os.getpid()
+    }
+
+def _process_alive(pid):
+    if os.name == 'nt':
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def placeholder_is_abandoned(path):
+    """True if a placeholder pickle was left behind by a run that is no longer running.
+
+    Placeholders written on this host are checked by process ID; others (e.g. on a shared
+    network drive) are considered abandoned once they are STALE_PLACEHOLDER_SECONDS old.
+    """
+    if time.time() - os.path.getmtime(path) >= STALE_PLACEHOLDER_SECONDS:
+        return True
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except Exception:
+        return True
+    if data.get('host') == socket.gethostname() and data.get('pid'):
+        return not _process_alive(data['pid'])
+    return False
+
+def space_journal_path(space_key):
+    """Path of the page journal that lets an interrupted full pickle of space_key resume."""
+    return os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, f'{space_key}.journal')
+
+def release_placeholder(space_key):
+    """Delete the placeholder pickle of an unfinished space so the next run retries it."""
+    out_path = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, f'{space_key}.pkl')
+    if full_pickle_status(out_path) == 'placeholder':
+        try:
+            os.remove(out_path)
+        except OSError:
+            pass
+
+def pickle_space_full(space_info, single_pass=False, download_attachments=False, log_file=None, reclaim=False):
+    """Pickle every page of one space into EFFECTIVE_FULL_PICKLE_OUTPUT_DIR and mark it processed.
+
+    Returns 'done', 'skipped' (already pickled, or claimed by another live run) or 'failed'.
+    With reclaim=True a placeholder left behind by a crashed worker of this run is overwritten.
+    """
+    target_space_key = space_info.get('key')
+    space_name_for_pickle = space_info.get('name', "N/A (Full Pickle)")
+    out_path = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, f'{target_space_key}.pkl')
+
+    status = full_pickle_status(out_path)
+    if status == 'complete':
+        print(f"  Pickle file {out_path} already exists. Skipping space {target_space_key}.")
+        mark_space_processed(target_space_key)
+        return 'skipped'
+    if status == 'placeholder' and not reclaim:
+        if not placeholder_is_abandoned(out_path):
+            print(f"  Space {target_space_key} is being pickled by another run. Skipping.")
+            return 'skipped'
+        print(f"  Found a placeholder for {target_space_key} left by an interrupted run; resuming it.")
+
+    print(f"\nProcessing space: {target_space_key} (Name: {space_name_for_pickle})")
+
+    # Create placeholder pickle immediately to claim this space and prevent race conditions
+    try:
+        atomic_pickle_dump(placeholder_record(target_space_key, space_name_for_pickle), out_path)
+        print(f"  Created placeholder pickle for {target_space_key}")
+    except Exception as e:
+        print(f"  Could not create placeholder pickle: {e}. Skipping to avoid race condition.")
+        return 'failed'
+
+    # Bodies are spooled to a journal: memory stays flat and a crash part-way through a large space can resume
+    journal = PageJournal(space_journal_path(target_space_key))
+    written = False
+    try:
+        if single_pass:
+            # Metadata and bodies come back together; bodies go straight to the journal
+            pages_metadata, total_pages_metadata = harvest_space_pages(target_space_key, journal=journal)
+        else:
+            pages_metadata = fetch_page_metadata(target_space_key)
+
+        if not pages_metadata:
+            print(f"  No pages found for space {target_space_key} or error fetching metadata. Skipping.")
+            return 'failed'
+
+        if single_pass:
+            pages_with_bodies = pages_metadata
+        else:
+            pages_with_bodies, total_pages_metadata = sample_and_fetch_bodies(
+                target_space_key, pages_metadata, fetch_all=True, journal=journal)
+
+        write_space_pickle_from_journal(out_path, target_space_key, space_name_for_pickle, pages_with_bodies, journal)
+        written = True
+    finally:
+        if written:
+            journal.remove()
+        else:
+            journal.close()
+            release_placeholder(target_space_key)
+
+    print(f'  Successfully wrote {len(pages_with_bodies)} pages for space {target_space_key} to {out_path} (total pages in space: {total_pages_metadata})')
+    write_log(log_file, "INFO", f"Successfully wrote {len(pages_with_bodies)} pages for space {target_space_key} to {out_path}")
+    log_rate_limiter_stats(log_file)
+    mark_space_processed(target_space_key)
+
+    if download_attachments:
+        print(f"  Initiating attachment download for space {target_space_key}...")
+        download_attachments_for_space(target_space_key, pages_metadata, BASE_URL)
+    return 'done'
+
+def _full_pickle_worker(worker_id, task_queue, result_queue, options):
+    """Worker process for --workers: pickles the spaces the coordinator hands over until it gets None."""
+    global BODY_FETCH_WORKERS, ATTACHMENT_DOWNLOAD_WORKERS, OUT_OF_BAND_BODY_BYTES
+    BODY_FETCH_WORKERS = options['body_workers']
+    ATTACHMENT_DOWNLOAD_WORKERS = options['download_workers']
+    OUT_OF_BAND_BODY_BYTES = options.get('out_of_band_bytes')
+    CONFLUENCE_CLIENT.ensure_pool_size(BODY_FETCH_WORKERS)
+    configure_rate_limiter(initial_rate=options['initial_rate'], max_rate=options['max_rate'])
+
+    result_queue.put(('ready', worker_id, None))
+    while True:
+        item = task_queue.get()
+        if item is None:
+            break
+        space_info, reclaim = item
+        try:
+            outcome = pickle_space_full(space_info, single_pass=options['single_pass'],
+                                        download_attachments=options['download_attachments'],
+                                        log_file=options['log_file'], reclaim=reclaim)
+        except Exception as e:
+            print(f"  An unexpected error occurred during pickling or attachment download for space {space_info.get('key')}: {e}")
+            outcome = 'failed'
+        result_queue.put((outcome, worker_id, space_info.get('key')))
+
+def pickle_spaces_in_parallel(spaces, num_workers, options, log_file=None):
+    """Pickle spaces with num_workers processes that pull from a shared work queue.
+
+    The coordinator hands out one space at a time and remembers which worker holds it. When a
+    worker process dies, its space is put back at the front of the queue (up to
+    FULL_PICKLE_MAX_ATTEMPTS times) and a replacement worker is started. Workers record their
+    own progress with mark_space_processed. Returns (newly_processed, failed).
+    """
+    ctx = multiprocessing.get_context('spawn')
+    result_queue = ctx.Queue()
+    pending = deque((space_info, False) for space_info in spaces)
+    attempts = defaultdict(int)
+    workers = {}   # worker_id -> (process, task_queue)
+    assigned = {}  # worker_id -> space_info currently being pickled
+    next_worker_id = 0
+    startup_failures = 0
+    newly_processed = 0
+    failed = 0
+
+    def start_worker():
+        nonlocal next_worker_id
+        worker_id = next_worker_id
+        next_worker_id += 1
+        task_queue = ctx.Queue()
+        process = ctx.Process(target=_full_pickle_worker, args=(worker_id, task_queue, result_queue, options),
+                              name=f'pickle-worker-{worker_id}', daemon=True)
+        process.start()
+        workers[worker_id] = (process, task_queue)
+
+    num_workers = min(num_workers, len(pending))
+    print(f"Starting {num_workers} worker processes for {len(pending)} spaces.")
+    write_log(log_file, "INFO", f"Starting {num_workers} worker processes for {len(pending)} spaces")
+    for _ in range(num_workers):
+        start_worker()
+
+    try:
+        while workers:
+            try:
+                outcome, worker_id, space_key = result_queue.get(timeout=WORKER_POLL_SECONDS)
+            except queue.Empty:
+                outcome = None
+
+            if outcome is not None:
+                if outcome != 'ready':
+                    assigned.pop(worker_id, None)
+                    if outcome == 'done':
+                        newly_processed += 1
+                    elif outcome == 'failed':
+                        failed += 1
+                    remaining = len(pending) + len(assigned)
+                    print(f"[worker {worker_id}] {space_key}: {outcome} ({newly_processed} done, {failed} failed, {remaining} remaining)")
+                    write_log(log_file, "INFO", f"Worker {worker_id} finished {space_key}: {outcome}")
+                if worker_id in workers:
+                    task_queue = workers[worker_id][1]
+                    if pending:
+                        space_info, reclaim = pending.popleft()
+                        attempts[space_info.get('key')] += 1
+                        assigned[worker_id] = space_info
+                        task_queue.put((space_info, reclaim))
+                    else:
+                        task_queue.put(None)
+
+            # Re-queue the space of any worker that died mid-space and replace the worker
+            for worker_id, (process, _) in list(workers.items()):
+                if process.is_alive():
+                    continue
+                del workers[worker_id]
+                space_info = assigned.pop(worker_id, None)
+                if space_info is None:
+                    if process.exitcode != 0:
+                        startup_failures += 1
+                        print(f"Worker {worker_id} exited with code {process.exitcode} before taking any work.")
+                else:
+                    space_key = space_info.get('key')
+                    print(f"Worker {worker_id} died (exit code {process.exitcode}) while pickling {space_key}.")
+                    write_log(log_file, "WARNING", f"Worker {worker_id} died (exit code {process.exitcode}) while pickling {space_key}")
+                    if attempts[space_key] < FULL_PICKLE_MAX_ATTEMPTS:
+                        print(f"  Re-queued {space_key} (attempt {attempts[space_key] + 1} of {FULL_PICKLE_MAX_ATTEMPTS}).")
+                        pending.appendleft((space_info, True))
+                    else:
+                        print(f"  Giving up on {space_key} after {attempts[space_key]} attempts.")
+                        release_placeholder(space_key)
+                        failed += 1
+                if startup_failures >= FULL_PICKLE_MAX_ATTEMPTS:
+                    continue
+                if pending and len(workers) < num_workers:
+                    start_worker()
+
+            if startup_failures >= FULL_PICKLE_MAX_ATTEMPTS and not workers:
+                print(f"Error: worker processes keep failing to start. {len(pending)} spaces were not attempted.")
+                failed += len(pending)
+                pending.clear()
+    except KeyboardInterrupt:
+        print("\nInterrupted. Stopping worker processes; unfinished spaces will be picked up on the next run.")
+        for process, _ in workers.values():
+            process.terminate()
+        for space_info in assigned.values():
+            release_placeholder(space_info.get('key'))
+        raise
+
+    return newly_processed, failed
+
 def fetch_space_details(target_space_key, auth_details, verify_ssl_cert):
     """Fetches details for a specific space, including description and icon."""
     # Construct URL using BASE_URL and API_ENDPOINT
@@ -425,29 +900,15 @@ def fetch_personal_spaces_with_details(auth_details, verify_ssl_cert):
     return spaces_data
 
 
-def download_attachments_for_space(space_key, pages_metadata_list, base_output_dir, auth_tuple, verify_ssl_flag, base_confluence_url):
+def download_attachments_for_space(space_key, pages_metadata_list, base_confluence_url):
+    """Bring the attachments of a space into the shared content-addressed attachment store."""
     if not pages_metadata_list:
         print(f"  No page metadata provided for space {space_key}, cannot download attachments.")
         return
 
-    # Attachments will be stored in a folder named after the space_key, inside the base_output_dir
-    space_attachment_dir = os.path.join(base_output_dir, space_key)
-    
-    if not os.path.exists(base_output_dir):
-        print(f"  Error: Base output directory {base_output_dir} does not exist. Cannot create attachment folder for {space_key}.")
-        return
-
-    try:
-        if not os.path.exists(space_attachment_dir):
-            os.makedirs(space_attachment_dir)
-            print(f"  Created attachment directory: {space_attachment_dir}")
-    except OSError as e:
-        print(f"  Error creating attachment directory {space_attachment_dir}: {e}. Skipping attachment downloads for this space.")
-        return
-
-    print(f"  Downloading attachments for space {space_key} to {space_attachment_dir}...")
-    download_count = 0
+    print(f"  Downloading attachments for space {space_key} into {ATTACHMENT_STORE_DIR} ({ATTACHMENT_DOWNLOAD_WORKERS} at a time)...")
     total_attachments_processed = 0
+    items = []
 
     for page_meta in pages_metadata_list:
         page_id = page_meta.get('id')
@@ -457,24 +918,10 @@ def download_attachments_for_space(space_key, pages_metadata_list, base_output_d
 
         for att in attachments_on_page:
             total_attachments_processed += 1
-            att_title = att.get('title')
             att_download_link_suffix = att.get('_links', {}).get('download')
 
-            if not att_title or not att_download_link_suffix:
-                print(f"    Skipping attachment with missing title or download link on page {page_id}.")
-                continue
-            
-            # Sanitize filename (basic sanitization)
-            # Replace characters that are problematic in filenames on some OSes
-            # This is a basic sanitization, more robust might be needed depending on titles
-            safe_att_title = "".join(c if c.isalnum() or c in ('.', '_', '-') else '_' for c in att_title)
-            if not safe_att_title:
-                safe_att_title = f"attachment_{att.get('id', 'unknown')}" # Fallback if title becomes empty
-
-            file_path = os.path.join(space_attachment_dir, safe_att_title)
-            
-            if os.path.exists(file_path):
-                # print(f"    Attachment {safe_att_title} already exists. Skipping download.")
+            if not att.get('id') or not att_download_link_suffix:
+                print(f"    Skipping attachment with missing id or download link on page {page_id}.")
                 continue
 
             # Construct full download URL
@@ -483,28 +930,28 @@ def download_attachments_for_space(space_key, pages_metadata_list, base_output_d
             else:
                 att_download_url = f"{base_confluence_url.rstrip('/')}/{att_download_link_suffix}"
 
-            try:
-                # print(f"    Downloading: {safe_att_title} (Page ID: {page_id})")
-                response = get_with_retry(att_download_url, auth=auth_tuple, verify=verify_ssl_flag, stream=True, timeout=60) # Increased timeout for downloads
-                response.raise_for_status()
-
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                download_count += 1
-                if download_count % 20 == 0: # Log progress less frequently for downloads
-                     print(f"    Downloaded {download_count} new attachments so far for space {space_key}...")
-            except requests.exceptions.RequestException as e:
-                print(f"    Error downloading attachment {safe_att_title} from {att_download_url}: {e}")
-            except IOError as e:
-                print(f"    Error writing attachment {safe_att_title} to {file_path}: {e}")
-            except Exception as e:
-                print(f"    Unexpected error with attachment {safe_att_title} on page {page_id}: {e}")
-    
-    if download_count > 0:
-        print(f"  Finished: Downloaded {download_count} new attachments for space {space_key} (out of {total_attachments_processed} total attachment entries found).")
-    elif total_attachments_processed > 0:
-        print(f"  Finished: No new attachments downloaded for space {space_key} (all {total_attachments_processed} found attachments may already exist or had errors).")
+            items.append(StoreItem(space_key, page_id, att, att_download_url))
+
+    counts = defaultdict(int)
+
+    def report(result, done, total):
+        counts[result.status] += 1
+        if result.downloaded and (counts['stored'] + counts['deduplicated']) % 20 == 0: # Log progress less frequently for downloads
+            print(f"    Downloaded {counts['stored'] + counts['deduplicated']} new attachments so far for space {space_key}...")
+        elif result.status == 'failed':
+            print(f"    Error downloading attachment {result.item.title} from {result.item.url}: {result.error}")
+
+    try:
+        with AttachmentStore(ATTACHMENT_STORE_DIR) as store:
+            downloader = AttachmentDownloader(CONFLUENCE_CLIENT, max_workers=ATTACHMENT_DOWNLOAD_WORKERS)
+            store.fetch(downloader, items, on_result=report)
+    except (OSError, sqlite3.Error) as e:
+        print(f"  Error opening attachment store {ATTACHMENT_STORE_DIR}: {e}. Skipping attachment downloads for this space.")
+        return
+
+    if total_attachments_processed > 0:
+        print(f"  Finished: {total_attachments_processed} attachment entries for space {space_key}: {counts['stored']} new files, "
+              f"{counts['deduplicated']} downloaded but already stored, {counts['known']} known versions skipped, {counts['failed']} failed.")
     else:
         print(f"  Finished: No attachments found or processed for space {space_key}.")
 
@@ -630,8 +1077,7 @@ def update_existing_pickles(target_dir, log_file=None, reverse_order=False):
         
         try:
             # Load existing pickle data
-            with open(pickle_path, 'rb') as f:
-                existing_data = pickle.load(f)
+            existing_data = load_space(pickle_path)
             
             existing_pages = existing_data.get('sampled_pages', [])
             if not existing_pages:
@@ -707,8 +1153,12 @@ def update_existing_pickles(target_dir, log_file=None, reverse_order=False):
                 print(f"  Found {len(pages_to_update)} pages that need processing ({updated_count} updates, {new_count} new)")
                 logging.info(f"Found {len(pages_to_update)} pages that need processing in space: {space_key} ({updated_count} updates, {new_count} new)")
                 
-                # Fetch full content for changed pages
-                updated_pages_data = []
+                # Fetch full content for changed pages and patch each one in as it arrives,
+                # so at most one new body is held on top of the loaded pickle
+                position_by_id = {page.get('id'): i for i, page in enumerate(existing_pages)}
+                metadata_by_id = {p.get('id'): p for p in current_page_metadata}
+                pages_patched = 0
+                new_pages_added = 0
                 for i, page_id in enumerate(pages_to_update, 1):
                     # Progress indicator every 20 pages or at the end
                     if i % 20 == 0 or i == len(pages_to_update):
@@ -725,7 +1175,7 @@ def update_existing_pickles(target_dir, log_file=None, reverse_order=False):
                         continue
                     
                     # Find the corresponding metadata
-                    page_metadata = next((p for p in current_page_metadata if p.get('id') == page_id), None)
+                    page_metadata = metadata_by_id.get(page_id)
                     if page_metadata:
                         updated_page = {
                             'id': page_id,
@@ -735,33 +1185,24 @@ def update_existing_pickles(target_dir, log_file=None, reverse_order=False):
                             'space_key': space_key,
                             'body': page_body
                         }
-                        updated_pages_data.append(updated_page)
+                        set_body_hash(updated_page)
+                        if is_new_page:
+                            existing_pages.append(updated_page)
+                            new_pages_added += 1
+                        else:
+                            existing_pages[position_by_id[page_id]] = updated_page
+                        pages_patched += 1
                 
-                # Update the pickle data in-place
-                if updated_pages_data:
-                    # Create a lookup for updated pages
-                    updated_lookup = {page['id']: page for page in updated_pages_data}
-                    
-                    # Replace existing pages that were updated
-                    for i, page in enumerate(existing_pages):
-                        page_id = page.get('id')
-                        if page_id in updated_lookup and page_id not in new_page_ids:
-                            existing_pages[i] = updated_lookup[page_id]
-                    
-                    # Add new pages to the list
-                    new_pages_to_add = [updated_lookup[page_id] for page_id in new_page_ids if page_id in updated_lookup]
-                    existing_pages.extend(new_pages_to_add)
-                    
+                if pages_patched:
                     # Update the total count in the pickle data
                     existing_data['total_pages_in_space'] = len(existing_pages)
                     
-                    # Save updated pickle
-                    with open(pickle_path, 'wb') as f:
-                        pickle.dump(existing_data, f)
+                    # Save updated pickle, streamed page by page and swapped in atomically
+                    dump_space(existing_data, pickle_path, out_of_band_min_bytes=OUT_OF_BAND_BODY_BYTES)
                     
-                    print(f"  Successfully updated {updated_count} pages and added {len(new_pages_to_add)} new pages in {pickle_file}")
-                    logging.info(f"Successfully updated {updated_count} pages and added {len(new_pages_to_add)} new pages in {pickle_file}")
-                    total_updated_pages += len(updated_pages_data)
+                    print(f"  Successfully updated {updated_count} pages and added {new_pages_added} new pages in {pickle_file}")
+                    logging.info(f"Successfully updated {updated_count} pages and added {new_pages_added} new pages in {pickle_file}")
+                    total_updated_pages += pages_patched
             else:
                 print(f"  No updates needed for {pickle_file}")
                 logging.info(f"No updates needed for {pickle_file}")
@@ -805,8 +1246,231 @@ def update_existing_pickles(target_dir, log_file=None, reverse_order=False):
         for filename, reason in skipped_files:
             logging.info(f"  {filename}: {reason}")
     
+    log_rate_limiter_stats(log_file)
     logging.info("Update process log completed")
 
+def parse_confluence_timestamp(value):
+    """Parse a version.when timestamp into an aware datetime (naive values are taken as UTC)."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def find_space_pickle(target_dir, space_key):
+    """Return the pickle path for space_key in target_dir ('KEY.pkl' or 'KEY_full.pkl'), or None."""
+    for filename in (f'{space_key}.pkl', f'{space_key}_full.pkl'):
+        path = os.path.join(target_dir, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+def load_delta_sync_state(target_dir):
+    state_path = os.path.join(target_dir, DELTA_SYNC_STATE_FILENAME)
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading delta sync state {state_path}: {e}")
+    return {}
+
+def save_delta_sync_state(target_dir, state):
+    state_path = os.path.join(target_dir, DELTA_SYNC_STATE_FILENAME)
+    state["last_updated"] = datetime.now().isoformat()
+    try:
+        atomic_write_json(state_path, state)
+    except Exception as e:
+        print(f"Error saving delta sync state {state_path}: {e}")
+
+def derive_high_water_mark(target_dir):
+    """Latest page 'updated' timestamp across the pickles in target_dir, used to bootstrap delta sync."""
+    high_water_mark = None
+    for pickle_file in sorted(f for f in os.listdir(target_dir) if f.endswith('.pkl')):
+        try:
+            data = load_space(os.path.join(target_dir, pickle_file))
+        except Exception as e:
+            print(f"  Could not read {pickle_file}: {e}")
+            continue
+        for page in data.get('sampled_pages', []) if isinstance(data, dict) else []:
+            updated = parse_confluence_timestamp(page.get('updated'))
+            if updated and (high_water_mark is None or updated > high_water_mark):
+                high_water_mark = updated
+    return high_water_mark
+
+def fetch_pages_modified_since(since, log_file=None):
+    """Return page metadata for every page modified after `since`, across all spaces.
+
+    Uses a single paginated CQL search instead of walking every space. Returns None if the
+    query failed part-way, so callers do not advance their high-water mark on partial results.
+    """
+    window_start = since.astimezone(timezone.utc) - timedelta(hours=DELTA_SYNC_OVERLAP_HOURS)
+    cql = f'type=page AND lastmodified > "{window_start.strftime("%Y/%m/%d %H:%M")}" ORDER BY lastmodified ASC'
+    print(f"  CQL delta query: {cql}")
+    write_log(log_file, "INFO", f"CQL delta query: {cql}")
+    pages = []
+    start = 0
+    while True:
+        url = f"{BASE_URL}{API_ENDPOINT}/content/search"
+        params = {"cql": cql, "start": start, "limit": DELTA_SYNC_PAGE_LIMIT,
+                  "expand": "space,version,ancestors,children.page,children.attachment"}
+        r = get_with_retry(url, params=params, auth=(USERNAME, PASSWORD), verify=VERIFY_SSL)
+        if r is None or r.status_code != 200:
+            status_code = r.status_code if r is not None else 'no response'
+            print(f"  CQL delta query failed at start={start}. Status code: {status_code}")
+            write_log(log_file, "ERROR", f"CQL delta query failed at start={start} (status: {status_code})")
+            return None
+        data = r.json()
+        results = data.get("results", [])
+        for page in results:
+            pages.append(build_page_info(page, page.get('space', {}).get('key')))
+        if results and (start // DELTA_SYNC_PAGE_LIMIT) % 10 == 9:
+            print(f"    Listed {len(pages)} changed pages so far...")
+        # The server may cap the limit, so compare against what it actually used
+        if not results or len(results) < min(DELTA_SYNC_PAGE_LIMIT, data.get('limit', DELTA_SYNC_PAGE_LIMIT)):
+            break
+        start += len(results)
+    return pages
+
+def patch_space_pickle(pickle_path, space_key, changed_pages, log_file=None):
+    """Apply changed page metadata to one space pickle, fetching bodies only for pages that are newer.
+
+    Returns (updated, added, failed) page counts. The pickle is rewritten atomically, and pages
+    whose body could not be fetched are left untouched so a later run retries them.
+    """
+    data = load_space(pickle_path)
+    if not isinstance(data, dict) or 'sampled_pages' not in data:
+        print(f"  {os.path.basename(pickle_path)} is a placeholder or has no pages; skipping")
+        return 0, 0, 0
+    pages = data['sampled_pages']
+    index_by_id = {page.get('id'): i for i, page in enumerate(pages)}
+
+    to_fetch = []
+    for page_info in changed_pages:
+        i = index_by_id.get(page_info['id'])
+        if i is not None:
+            stored = parse_confluence_timestamp(pages[i].get('updated'))
+            current = parse_confluence_timestamp(page_info.get('updated'))
+            if stored and current and current <= stored:
+                continue
+        to_fetch.append(page_info)
+    if not to_fetch:
+        return 0, 0, 0
+
+    print(f"  Fetching {len(to_fetch)} changed page bodies for space {space_key}")
+    with ThreadPoolExecutor(max_workers=max(1, min(BODY_FETCH_WORKERS, len(to_fetch)))) as executor:
+        bodies = dict(zip([p['id'] for p in to_fetch],
+                          executor.map(lambda p: fetch_page_body(p['id'], default=None), to_fetch)))
+
+    updated = added = failed = 0
+    for page_info in to_fetch:
+        body = bodies.get(page_info['id'])
+        if body is None:
+            failed += 1
+            continue
+        page_info['body'] = body
+        set_body_hash(page_info)
+        i = index_by_id.get(page_info['id'])
+        if i is None:
+            index_by_id[page_info['id']] = len(pages)
+            pages.append(page_info)
+            added += 1
+        else:
+            pages[i] = page_info
+            updated += 1
+
+    if updated or added:
+        data['total_pages_in_space'] = max(len(pages), (data.get('total_pages_in_space') or 0) + added)
+        dump_space(data, pickle_path, out_of_band_min_bytes=OUT_OF_BAND_BODY_BYTES)
+    write_log(log_file, "INFO", f"Delta sync {space_key}: {updated} updated, {added} added, {failed} failed")
+    return updated, added, failed
+
+def delta_sync_pickles(target_dir, log_file=None):
+    """Refresh the pickles in target_dir from one instance-wide CQL lastmodified query.
+
+    Only pages modified since the stored high-water mark are listed, only their bodies are
+    fetched, and only the pickles of the affected spaces are rewritten. The high-water mark
+    advances only when every affected pickle was patched, so a failed run is simply repeated.
+    """
+    abs_target_dir = os.path.abspath(target_dir)
+    print(f"Pickle directory: {abs_target_dir}")
+    write_log(log_file, "INFO", f"Starting delta sync in directory: {abs_target_dir}")
+    if not os.path.isdir(target_dir):
+        print(f"Target directory {target_dir} does not exist.")
+        return
+
+    state = load_delta_sync_state(target_dir)
+    high_water_mark = parse_confluence_timestamp(state.get('high_water_mark'))
+    if high_water_mark is None:
+        print("No delta sync high-water mark yet; deriving it from the newest page in the existing pickles (one-time scan)...")
+        high_water_mark = derive_high_water_mark(target_dir)
+        if high_water_mark is None:
+            print("No page timestamps found in the existing pickles. Pickle the spaces first, then run --delta-sync.")
+            return
+    print(f"High-water mark: {high_water_mark.isoformat()}")
+    write_log(log_file, "INFO", f"High-water mark: {high_water_mark.isoformat()}")
+
+    changed_pages = fetch_pages_modified_since(high_water_mark, log_file)
+    if changed_pages is None:
+        print("Delta sync aborted; the high-water mark was not advanced.")
+        return
+
+    pages_by_space = defaultdict(list)
+    new_high_water_mark = high_water_mark
+    for page_info in changed_pages:
+        updated = parse_confluence_timestamp(page_info.get('updated'))
+        if updated and updated > new_high_water_mark:
+            new_high_water_mark = updated
+        pages_by_space[page_info.get('space_key')].append(page_info)
+    print(f"Found {len(changed_pages)} pages modified in the query window across {len(pages_by_space)} spaces")
+
+    total_updated = total_added = 0
+    spaces_patched = 0
+    spaces_without_pickle = []
+    failed_spaces = []
+    for space_key in sorted(k for k in pages_by_space if k):
+        if space_key.startswith('~'):
+            continue
+        pickle_path = find_space_pickle(target_dir, space_key)
+        if not pickle_path:
+            spaces_without_pickle.append(space_key)
+            continue
+        try:
+            updated, added, failed = patch_space_pickle(pickle_path, space_key, pages_by_space[space_key], log_file)
+        except Exception as e:
+            print(f"  Error patching {pickle_path}: {e}")
+            logging.error(f"Error patching {pickle_path}: {e}", exc_info=True)
+            failed_spaces.append(space_key)
+            continue
+        if failed:
+            failed_spaces.append(space_key)
+        if updated or added:
+            spaces_patched += 1
+            print(f"  {space_key}: {updated} pages updated, {added} new pages added")
+        total_updated += updated
+        total_added += added
+
+    if failed_spaces:
+        print(f"Delta sync incomplete for {len(failed_spaces)} spaces ({', '.join(failed_spaces[:10])}); the high-water mark was not advanced.")
+        write_log(log_file, "WARNING", f"Delta sync incomplete for spaces: {', '.join(failed_spaces)}")
+    else:
+        state['high_water_mark'] = new_high_water_mark.isoformat()
+        state['last_changed_pages'] = len(changed_pages)
+        save_delta_sync_state(target_dir, state)
+
+    print(f"\nDelta sync summary:")
+    print(f"  Spaces patched: {spaces_patched}")
+    print(f"  Pages updated: {total_updated}")
+    print(f"  New pages added: {total_added}")
+    print(f"  Changed spaces without a pickle (not synced): {len(spaces_without_pickle)}")
+    print(f"  High-water mark: {state.get('high_water_mark', high_water_mark.isoformat())}")
+    write_log(log_file, "INFO", f"Delta sync finished: {spaces_patched} spaces patched, {total_updated} pages updated, {total_added} added")
+    log_rate_limiter_stats(log_file)
+
 def compare_and_suggest_pruning(target_dir, log_file=None, auto_prune=False):
     """Compare spaces in pickle files with current live instance and suggest which should be pruned."""
     abs_target_dir = os.path.abspath(target_dir)
@@ -1033,6 +1697,7 @@ def compare_and_suggest_pruning(target_dir, log_file=None, auto_prune=False):
                 write_log(log_file, "INFO", "User chose to skip deletion")
 
 def main():
+    global BODY_FETCH_WORKERS, ATTACHMENT_DOWNLOAD_WORKERS, OUT_OF_BAND_BODY_BYTES
     # Initialize log_file variable (will be set if logging is enabled)
     log_file = None
     
@@ -1048,6 +1713,8 @@ def main():
     mode_group.add_argument('--resume-from-pickles', action='store_true', help='Resume work based on scanning existing pickle files in output directory (non-interactive).')
     mode_group.add_argument('--update-pickles', action='store_true', help='Update existing pickle files with latest page versions based on timestamp comparison (non-interactive).')
     mode_group.add_argument('--update-pickles-reverse', action='store_true', help='Update existing pickle files with latest page versions in Z-A order (non-interactive).')
+    mode_group.add_argument('--delta-sync', nargs='?', const=OUTPUT_DIR, metavar='DIR',
+                               help=f'Refresh existing pickles in DIR (default: {OUTPUT_DIR}) using one instance-wide CQL lastmodified query since the stored high-water mark. Only changed bodies are fetched and only affected space pickles are rewritten (non-interactive).')
     mode_group.add_argument('--pickle-space-full', type=str, metavar='SPACE_KEY',
                                help=f'Pickle all pages for a single space. Saves to {EFFECTIVE_FULL_PICKLE_OUTPUT_DIR}. Bypasses sampling, checkpointing, and interactive menu.') # Updated help
     mode_group.add_argument('--pickle-all-spaces-full', action='store_true',
@@ -1057,13 +1724,48 @@ def main():
     parser.add_argument('--list-spaces', action='store_true', help='List all non-user spaces (key, name, description) to the console and exit.') # MODIFIED HELP
     parser.add_argument('--list-space-keys', action='store_true', help='List only the keys of all non-user spaces to the console and exit.') # NEW ARGUMENT
     parser.add_argument('--download-attachments', action='store_true',
-                           help='Download attachments for processed spaces during full pickle modes. Attachments are saved into a subfolder named after the space key, within the full pickle output directory.')
+                           help='Download attachments for processed spaces during full pickle modes. Attachments go into the shared content-addressed attachment store (attachment_store_dir in settings.ini); attachment versions already in the store are not downloaded again.')
     parser.add_argument('--verbose', action='store_true',
                            help='Show detailed page listing during --pickle-space-full (page ID, title, body size, level).')
     parser.add_argument('--prune-retired', action='store_true',
                            help='When used with --compare-spaces, automatically delete pickle files for spaces that no longer exist in the live instance (no confirmation prompt).')
+    parser.add_argument('--single-pass', action='store_true',
+                           help='With --pickle-space-full or --pickle-all-spaces-full, request page bodies in the same paginated listing call as the metadata instead of one extra request per page. The page size adapts to response size and latency.')
+    parser.add_argument('--max-rate', type=float, default=None, metavar='REQ_PER_SEC',
+                           help='Upper bound for the adaptive rate limiter shared by all Confluence requests (requests per second). The limiter backs off on 429/Retry-After and climbs back towards this bound when the server recovers.')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                           help='With --pickle-all-spaces-full, pickle N spaces at once in separate processes that pull from a shared work queue (default: 1). A space whose worker crashes is re-queued automatically.')
+    parser.add_argument('--body-workers', type=int, default=BODY_FETCH_WORKERS, metavar='N',
+                           help=f'Number of concurrent workers used to fetch page bodies (default: {BODY_FETCH_WORKERS}). Use 1 to fetch sequentially.')
+    parser.add_argument('--download-workers', type=int, default=ATTACHMENT_DOWNLOAD_WORKERS, metavar='N',
+                           help=f'With --download-attachments, number of attachments downloaded at once (default: {ATTACHMENT_DOWNLOAD_WORKERS}). Interrupted downloads resume where they stopped.')
+    parser.add_argument('--out-of-band-bodies', type=int, nargs='?', const=OUT_OF_BAND_MIN_BYTES, default=None, metavar='MIN_BYTES',
+                           help=f'Write bodies of at least MIN_BYTES (default: {OUT_OF_BAND_MIN_BYTES}) to a buffers file (SPACE.pkl.<token>.buffers) next to each pickle, using pickle protocol 5 out-of-band buffers. '
+                                'Readers built on utils.streaming_pickle.load_space then map them without copying; plain pickle.load can no longer read those pickles.')
     args = parser.parse_args()
 
+    if args.body_workers < 1:
+        print("Error: --body-workers must be at least 1")
+        sys.exit(1)
+    BODY_FETCH_WORKERS = args.body_workers
+    if args.download_workers < 1:
+        print("Error: --download-workers must be at least 1")
+        sys.exit(1)
+    ATTACHMENT_DOWNLOAD_WORKERS = args.download_workers
+    if args.out_of_band_bodies is not None and args.out_of_band_bodies < 1:
+        print("Error: --out-of-band-bodies must be at least 1")
+        sys.exit(1)
+    OUT_OF_BAND_BODY_BYTES = args.out_of_band_bodies
+    if args.workers < 1:
+        print("Error: --workers must be at least 1")
+        sys.exit(1)
+    CONFLUENCE_CLIENT.ensure_pool_size(BODY_FETCH_WORKERS)
+    if args.max_rate is not None:
+        if args.max_rate <= 0:
+            print("Error: --max-rate must be greater than 0")
+            sys.exit(1)
+        configure_rate_limiter(max_rate=args.max_rate)
+
     # Handle --list-spaces mode first as it's a simple informational command
     if args.list_spaces:
         print("Mode: Listing all non-user spaces from Confluence...")
@@ -1105,6 +1807,17 @@ def main():
         compare_and_suggest_pruning(OUTPUT_DIR, log_file, auto_prune=args.prune_retired)
         sys.exit(0)
 
+    if args.delta_sync:
+        print("Mode: Delta sync of existing pickle files via CQL lastmodified query")
+
+        # Setup logging for delta sync process
+        log_file = setup_simple_logging('.')
+        if log_file:
+            print(f"Logging to: {log_file}")
+
+        delta_sync_pickles(args.delta_sync, log_file)
+        sys.exit(0)
+
     # Handle --update-pickles-reverse mode
     if args.update_pickles_reverse:
         print(f"Mode: Updating existing pickle files with latest page versions (Z-A order)")
@@ -1123,6 +1836,13 @@ def main():
         print(f"Mode: Pickling all pages for ALL non-user spaces (Target dir: {EFFECTIVE_FULL_PICKLE_OUTPUT_DIR}, Checkpoint: {FULL_PICKLE_CHECKPOINT_FILE_PATH}).")
         if args.download_attachments:
             print("Attachment download enabled via --download-attachments flag.")
+        if args.single_pass:
+            print("Single-pass harvesting enabled via --single-pass flag (bodies fetched with the page listing).")
+        if args.workers > 1:
+            print(f"Space-parallel pickling enabled via --workers flag ({args.workers} worker processes).")
+
+        # Run log records per-space progress and the rate limiter state
+        log_file = setup_simple_logging('.')
         
         checkpoint = load_checkpoint(FULL_PICKLE_CHECKPOINT_FILE_PATH) # MODIFIED
         processed_space_keys_set = set(checkpoint.get("processed_space_keys", []))
@@ -1158,82 +1878,38 @@ def main():
         newly_processed_this_run = 0
         failed_this_run = 0
 
-        for space_info in spaces_to_actually_process: # Iterate only through spaces not yet processed
-            target_space_key = space_info.get('key')
-            space_name_for_pickle = space_info.get('name', "N/A (Full Pickle)")
-            
-            if not target_space_key: # Should have been filtered by current_api_space_keys logic, but good check
-                print(f"  Warning: Found a space without a key during iteration. Skipping: {space_info}")
-                failed_this_run += 1
-                continue
-
-            # Check if pickle file already exists BEFORE attempting to process
-            out_filename_check = f'{target_space_key}.pkl'
-            out_path_check = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, out_filename_check)
-            if os.path.exists(out_path_check):
-                print(f"  Pickle file {out_path_check} already exists. Skipping space {target_space_key}.")
-                # Ensure it's marked as processed in checkpoint if not already, then continue
-                if target_space_key not in processed_space_keys_set:
-                    checkpoint["processed_space_keys"].append(target_space_key)
-                    processed_space_keys_set.add(target_space_key) # Keep the set in sync
-                    save_checkpoint(checkpoint, FULL_PICKLE_CHECKPOINT_FILE_PATH) # MODIFIED
-                continue
-
-            print(f"\nProcessing space: {target_space_key} (Name: {space_name_for_pickle})")
-            
-            # Create placeholder pickle immediately to claim this space and prevent race conditions
-            out_filename = f'{target_space_key}.pkl'
-            out_path = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, out_filename)
-            try:
-                with open(out_path, 'wb') as f:
-                    pickle.dump({
-                        'space_key': target_space_key,
-                        'name': space_name_for_pickle,
-                        'status': 'processing',
-                        'started_at': datetime.now().isoformat()
-                    }, f)
-                print(f"  Created placeholder pickle for {target_space_key}")
-            except Exception as e:
-                print(f"  Could not create placeholder pickle: {e}. Skipping to avoid race condition.")
-                failed_this_run += 1
-                continue
-            
-            try:
-                pages_metadata = fetch_page_metadata(target_space_key)
-
-                if not pages_metadata:
-                    print(f"  No pages found for space {target_space_key} or error fetching metadata. Skipping.")
-                    failed_this_run +=1
+        if args.workers > 1:
+            worker_options = {
+                'body_workers': BODY_FETCH_WORKERS,
+                'download_workers': ATTACHMENT_DOWNLOAD_WORKERS,
+                'out_of_band_bytes': OUT_OF_BAND_BODY_BYTES,
+                'single_pass': args.single_pass,
+                'download_attachments': args.download_attachments,
+                'log_file': log_file,
+                # Workers share the request budget a single process would have had
+                'initial_rate': DEFAULT_INITIAL_RATE / args.workers,
+                'max_rate': (args.max_rate or DEFAULT_MAX_RATE) / args.workers,
+            }
+            newly_processed_this_run, failed_this_run = pickle_spaces_in_parallel(
+                spaces_to_actually_process, args.workers, worker_options, log_file)
+        else:
+            for space_info in spaces_to_actually_process: # Iterate only through spaces not yet processed
+                target_space_key = space_info.get('key')
+                if not target_space_key: # Should have been filtered by current_api_space_keys logic, but good check
+                    print(f"  Warning: Found a space without a key during iteration. Skipping: {space_info}")
+                    failed_this_run += 1
                     continue
 
-                pages_with_bodies, total_pages_metadata = sample_and_fetch_bodies(target_space_key, pages_metadata, fetch_all=True)
-
-                out_filename = f'{target_space_key}.pkl'
-                out_path = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, out_filename) # Use effective path
-                
-                with open(out_path, 'wb') as f:
-                    pickle.dump({
-                        'space_key': target_space_key,
-                        'name': space_name_for_pickle,
-                        'sampled_pages': pages_with_bodies, # These are all pages with their bodies
-                        'total_pages_in_space': total_pages_metadata
-                    }, f)
-                print(f'  Successfully wrote {len(pages_with_bodies)} pages for space {target_space_key} to {out_path} (total pages in space: {total_pages_metadata})')
-                
-                # Update checkpoint after successful processing
-                checkpoint["processed_space_keys"].append(target_space_key)
-                # No need to re-add to set, just save checkpoint
-                save_checkpoint(checkpoint, FULL_PICKLE_CHECKPOINT_FILE_PATH) # MODIFIED
-                newly_processed_this_run += 1
-
-                # Download attachments if flag is set
-                if args.download_attachments:
-                    print(f"  Initiating attachment download for space {target_space_key}...")
-                    # pages_metadata was fetched for this space_info earlier in the loop
-                    download_attachments_for_space(target_space_key, pages_metadata, EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, (USERNAME, PASSWORD), VERIFY_SSL, BASE_URL)
-            except Exception as e:
-                print(f"  An unexpected error occurred during pickling or attachment download for space {target_space_key}: {e}")
-                failed_this_run += 1
+                try:
+                    outcome = pickle_space_full(space_info, single_pass=args.single_pass,
+                                                download_attachments=args.download_attachments, log_file=log_file)
+                except Exception as e:
+                    print(f"  An unexpected error occurred during pickling or attachment download for space {target_space_key}: {e}")
+                    outcome = 'failed'
+                if outcome == 'done':
+                    newly_processed_this_run += 1
+                elif outcome == 'failed':
+                    failed_this_run += 1
         
         overall_processed_count += newly_processed_this_run
         print(f"\nFinished pickling all non-user spaces for this run.")
@@ -1242,6 +1918,8 @@ def main():
         print(f"Failed to process in this run: {failed_this_run} spaces.")
         if failed_this_run > 0:
             print("Rerun the script to attempt processing failed spaces.")
+        write_log(log_file, "INFO", f"Run finished: {newly_processed_this_run} spaces processed, {failed_this_run} failed")
+        log_rate_limiter_stats(log_file)
         sys.exit(0)
 
     # Handle --pickle-space-full first as it\'s a distinct mode
@@ -1255,13 +1933,21 @@ def main():
                 write_log(log_file, "INFO", f"Starting --pickle-space-full for space {target_space_key}")
         if args.download_attachments:
             print("Attachment download enabled via --download-attachments flag.")
+        if args.single_pass:
+            print("Single-pass harvesting enabled via --single-pass flag (bodies fetched with the page listing).")
 
         # Check if pickle file already exists
         out_filename_check = f'{target_space_key}.pkl'
         out_path_check = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, out_filename_check)
-        if os.path.exists(out_path_check):
+        pickle_status = full_pickle_status(out_path_check)
+        if pickle_status == 'complete':
             print(f"Pickle file {out_path_check} already exists. Exiting.")
             sys.exit(0)
+        if pickle_status == 'placeholder':
+            if not placeholder_is_abandoned(out_path_check):
+                print(f"Space {target_space_key} is being pickled by another run ({out_path_check} is a placeholder). Exiting.")
+                sys.exit(0)
+            print(f"Found a placeholder for {target_space_key} left by an interrupted run; resuming it.")
 
         # Fetch space details to get the name
         # Construct URL using BASE_URL and API_ENDPOINT
@@ -1288,39 +1974,39 @@ def main():
         out_filename = f'{target_space_key}.pkl'
         out_path = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, out_filename)
         try:
-            with open(out_path, 'wb') as f:
-                pickle.dump({
-                    'space_key': target_space_key,
-                    'name': space_name_for_pickle,
-                    'status': 'processing',
-                    'started_at': datetime.now().isoformat()
-                }, f)
+            atomic_pickle_dump(placeholder_record(target_space_key, space_name_for_pickle), out_path)
             print(f"  Created placeholder pickle for {target_space_key}")
         except Exception as e:
             print(f"  Could not create placeholder pickle: {e}. Exiting to avoid race condition.")
             sys.exit(1)
+        # Bodies are spooled to a journal: memory stays flat and an interrupted run can resume
+        journal = PageJournal(space_journal_path(target_space_key))
         
-        pages_metadata = fetch_page_metadata(target_space_key)
+        if args.single_pass:
+            # Metadata and bodies come back together; bodies go straight to the journal
+            pages_metadata, total_pages_metadata = harvest_space_pages(
+                target_space_key, verbose=args.verbose, log_file=log_file if args.verbose else None, journal=journal)
+        else:
+            pages_metadata = fetch_page_metadata(target_space_key)
 
         if not pages_metadata:
             print(f"  No pages found for space {target_space_key} or error fetching metadata. Exiting.")
             sys.exit(1)
 
-        pages_with_bodies, total_pages_metadata = sample_and_fetch_bodies(
-            target_space_key, pages_metadata, fetch_all=True,
-            verbose=args.verbose, log_file=log_file if args.verbose else None)
+        if args.single_pass:
+            pages_with_bodies = pages_metadata
+        else:
+            pages_with_bodies, total_pages_metadata = sample_and_fetch_bodies(
+                target_space_key, pages_metadata, fetch_all=True,
+                verbose=args.verbose, log_file=log_file if args.verbose else None, journal=journal)
 
         out_filename = f'{target_space_key}.pkl'
         out_path = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, out_filename) # MODIFIED path
         try:
-            with open(out_path, 'wb') as f:
-                pickle.dump({
-                    'space_key': target_space_key,
-                    'name': space_name_for_pickle,
-                    'sampled_pages': pages_with_bodies, # These are all pages with their bodies
-                    'total_pages_in_space': total_pages_metadata
-                }, f)
+            body_lengths = write_space_pickle_from_journal(out_path, target_space_key, space_name_for_pickle, pages_with_bodies, journal)
+            journal.remove()
             print(f'  Successfully wrote {len(pages_with_bodies)} pages for space {target_space_key} to {out_path} (total pages in space: {total_pages_metadata})')
+            log_rate_limiter_stats(log_file)
 
             if args.verbose:
                 write_log(log_file, "INFO", f"Pickle written: {len(pages_with_bodies)} pages to {out_path}")
@@ -1331,21 +2017,20 @@ def main():
                     title = p.get('title', '(no title)')
                     level = p.get('level', '?')
                     updated = p.get('updated', '')[:22]
-                    body = p.get('body', '')
-                    body_len = len(body) if isinstance(body, str) else 0
+                    body_len = body_lengths.get(p.get('id'), 0)
                     body_str = f"{body_len:,}" if body_len > 0 else "EMPTY"
                     print(f"  {pid:<12} {level:<6} {body_str:<10} {updated:<22} {title[:60]}")
                     write_log(log_file, "INFO", f"  Page ID={pid} level={level} body={body_str} title={title}")
 
                 # Summary stats
-                empty_bodies = sum(1 for p in pages_with_bodies if not p.get('body'))
+                empty_bodies = sum(1 for p in pages_with_bodies if not body_lengths.get(p.get('id')))
                 summary = f"Total: {len(pages_with_bodies)} pages, {empty_bodies} with empty bodies"
                 print(f"\n  {summary}")
                 write_log(log_file, "INFO", summary)
                 if empty_bodies > 0:
                     print(f"  Pages with empty bodies:")
                     for p in pages_with_bodies:
-                        if not p.get('body'):
+                        if not body_lengths.get(p.get('id')):
                             msg = f"    EMPTY: {p.get('id', '?')}: {p.get('title', '?')}"
                             print(msg)
                             write_log(log_file, "WARNING", msg)
@@ -1361,7 +2046,7 @@ def main():
         if args.download_attachments:
             print(f"  Initiating attachment download for space {target_space_key}...")
             # pages_metadata was fetched for this space earlier
-            download_attachments_for_space(target_space_key, pages_metadata, EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, (USERNAME, PASSWORD), VERIFY_SSL, BASE_URL)
+            download_attachments_for_space(target_space_key, pages_metadata, BASE_URL)
 
         sys.exit(0)
 
@@ -1419,6 +2104,7 @@ def main():
         print("  --resume-from-pickles         : Resume work based on scanning existing pickle files in output directory.") # NEW help line
         print("  --update-pickles              : Update existing pickle files with latest page versions based on timestamp comparison.") # NEW help line
         print("  --update-pickles-reverse      : Update existing pickle files with latest page versions in Z-A order.") # NEW help line
+        print("  --delta-sync [DIR]            : Refresh pickles from pages changed since the last sync (one CQL query for the whole instance).")
         print("  --compare-spaces              : Compare pickled spaces with live instance and suggest which should be pruned.") # NEW help line
         print("  --prune-retired               : When used with --compare-spaces, auto-delete retired spaces without confirmation.") # NEW help line
         print(f"  --pickle-space-full SPACE_KEY : Pickles all pages for a single space. Saves to {EFFECTIVE_FULL_PICKLE_OUTPUT_DIR}.") # Updated help
@@ -1427,6 +2113,12 @@ def main():
         print("  --list-spaces                 : Lists all non-user spaces (key, name, description) to the console and exits.") # MODIFIED HELP
         print("  --list-space-keys             : Lists only the keys of all non-user spaces to the console and exits.") # NEW HELP LINE
         print("  --download-attachments        : When used with --pickle-space-full or --pickle-all-spaces-full, downloads attachments.") # NEW HELP LINE FOR INTERACTIVE MODE
+        print("  --single-pass                 : With the full pickle modes, fetch bodies in the page listing calls (no per-page requests).")
+        print("  --workers N                   : With --pickle-all-spaces-full, pickle N spaces at once in separate processes.")
+        print("  --max-rate REQ_PER_SEC        : Upper bound for the adaptive request rate limiter (backs off on 429s automatically).")
+        print(f"  --body-workers N              : Number of concurrent workers used to fetch page bodies (default: {BODY_FETCH_WORKERS}).")
+        print(f"  --download-workers N          : Number of attachments downloaded at once with --download-attachments (default: {ATTACHMENT_DOWNLOAD_WORKERS}).")
+        print(f"  --out-of-band-bodies [BYTES]  : Keep bodies of at least BYTES (default: {OUT_OF_BAND_MIN_BYTES}) in a buffers file next to each pickle, loaded without copying.")
         print("------------------------------------\n") # Corrected to \\n
         while True:
             choice = input("Choose an action:\n" # Updated prompt
@@ -1617,6 +2309,7 @@ def main():
                         # Save pickle
                         with open(out_path, 'wb') as f:
                             pickle.dump(pickle_data, f)
+                        catalog_pickle(out_path, pickle_data)
 
                         print(f"  Saved {len(pages_with_bodies)} pages to {out_path}")
                         write_log(log_file, "INFO", f"Saved {len(pages_with_bodies)} pages for {space_key}")
@@ -1735,13 +2428,15 @@ def main():
                 out_filename = f'{args.pickle_space_full}.pkl'
                 out_path = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, out_filename) # MODIFIED path
                 try:
+                    space_data = {
+                        'space_key': args.pickle_space_full,
+                        'name': space_name_for_pickle,
+                        'sampled_pages': pages_with_bodies,
+                        'total_pages_in_space': total_pages_metadata
+                    }
                     with open(out_path, 'wb') as f:
-                        pickle.dump({
-                            'space_key': args.pickle_space_full,
-                            'name': space_name_for_pickle,
-                            'sampled_pages': pages_with_bodies,
-                            'total_pages_in_space': total_pages_metadata
-                        }, f)
+                        pickle.dump(space_data, f)
+                    catalog_pickle(out_path, space_data)
                     print(f'  Successfully wrote {len(pages_with_bodies)} pages for space {args.pickle_space_full} to {out_path} (total pages in space: {total_pages_metadata})')
 
                     if args.verbose:
@@ -1783,7 +2478,7 @@ def main():
                 if should_download_attachments_interactive_single:
                     print(f"  Initiating attachment download for space {args.pickle_space_full}...")
                     # pages_metadata was fetched for this space earlier in this block
-                    download_attachments_for_space(args.pickle_space_full, pages_metadata, EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, (USERNAME, PASSWORD), VERIFY_SSL, BASE_URL)
+                    download_attachments_for_space(args.pickle_space_full, pages_metadata, BASE_URL)
 
                 sys.exit(0) # Exit after this action
             elif choice == '7':
@@ -1888,13 +2583,15 @@ def main():
                         out_filename = f'{target_space_key}.pkl'
                         out_path = os.path.join(EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, out_filename) # MODIFIED path
                         
+                        space_data = {
+                            'space_key': target_space_key,
+                            'name': space_name_for_pickle,
+                            'sampled_pages': pages_with_bodies,
+                            'total_pages_in_space': total_pages_metadata
+                        }
                         with open(out_path, 'wb') as f:
-                            pickle.dump({
-                                'space_key': target_space_key,
-                                'name': space_name_for_pickle,
-                                'sampled_pages': pages_with_bodies,
-                                'total_pages_in_space': total_pages_metadata
-                            }, f)
+                            pickle.dump(space_data, f)
+                        catalog_pickle(out_path, space_data)
                         print(f'  Successfully wrote {len(pages_with_bodies)} pages for space {target_space_key} to {out_path} (total pages in space: {total_pages_metadata})')
                         
                         checkpoint["processed_space_keys"].append(target_space_key)
@@ -1905,7 +2602,7 @@ def main():
                         if should_download_attachments_interactive_all:
                             print(f"  Initiating attachment download for space {target_space_key}...")
                             # pages_metadata was fetched for this space_info earlier in this loop
-                            download_attachments_for_space(target_space_key, pages_metadata, EFFECTIVE_FULL_PICKLE_OUTPUT_DIR, (USERNAME, PASSWORD), VERIFY_SSL, BASE_URL)
+                            download_attachments_for_space(target_space_key, pages_metadata, BASE_URL)
                     except Exception as e:
                         print(f"  An unexpected error occurred during pickling or attachment download for space {target_space_key}: {e}")
                         failed_this_run += 1
@@ -2152,10 +2849,13 @@ def main():
                 write_log(log_file, "INFO", f"Sampling pages for space {space_key} (SAMPLE mode)")
             
             out_path = os.path.join(OUTPUT_DIR, f'{space_key}.pkl')
+            pickle_data = {'space_key': space_key, 'name': space_data.get('name'), 'sampled_pages': pages_with_bodies, 'total_pages_in_space': total_pages_in_space}
             with open(out_path, 'wb') as f:
-                pickle.dump({'space_key': space_key, 'name': space_data.get('name'), 'sampled_pages': pages_with_bodies, 'total_pages_in_space': total_pages_in_space}, f)
+                pickle.dump(pickle_data, f)
+            catalog_pickle(out_path, pickle_data)
             print(f'  Successfully wrote {len(pages_with_bodies)} pages for space {space_key} to {out_path} (total pages in space: {total_pages_in_space})')
             write_log(log_file, "INFO", f"Successfully wrote {len(pages_with_bodies)} pages for space {space_key} to {out_path} (total pages in space: {total_pages_in_space})")
+            log_rate_limiter_stats(log_file)
             
             # Update checkpoint after each successful space processing
             if space_key not in checkpoint["processed_spaces"]: # Add only if not already there (e.g. due to a partial run)
@@ -2188,6 +2888,7 @@ def main():
         print(f"{skipped_count} spaces may have been skipped due to errors or if the script was interrupted.")
         print("You can re-run the script to attempt processing remaining/failed spaces.")
         write_log(log_file, "WARNING", f"{skipped_count} spaces may have been skipped due to errors or interruption.")
+    log_rate_limiter_stats(log_file)
     write_log(log_file, "INFO", "Script execution completed.")
     print_runtime(option_start_time)
 
@@ -1,16 +1,15 @@
 # description: Explores Confluence spaces.
 
 import requests
-import time
 import warnings
 import urllib3 # Import urllib3 to reference its warning class
 import argparse # Import argparse for command-line arguments (optional for menu)
-import random # Import random for jitter
 import os
 import pickle
 import datetime # Import datetime for date parsing and timestamp operations
 import re # Import re for regular expressions
 from config_loader import load_confluence_settings
+from utils.confluence_client import get_client
 from urllib.parse import urlparse, parse_qs
 import pprint # Import pprint for pretty printing
 import urllib.parse # Make sure urllib.parse is imported
@@ -46,93 +45,46 @@ API_BASE = f'{CONFLUENCE_API_BASE_URL}{API_ENDPOINT}'
 API_CONTENT_ENDPOINT = f'{API_BASE}/content'
 API_USER_ENDPOINT = f'{API_BASE}/user' # May need this later
 
+CONFLUENCE_CLIENT = get_client(CONFLUENCE_API_BASE_URL, USERNAME, PASSWORD, VERIFY_SSL)
+
 def make_api_request(url, params=None, max_retries=10):
     """
-    Makes an API request, handling authentication, 429 rate limiting, and SSL verification.
-    For 429 errors, retries indefinitely. For other errors, respects max_retries limit.
+    Makes an API request through the shared pooled Confluence client.
+    The client retries 429 responses (honouring Retry-After) until they succeed and
+    retries transient server/network errors up to max_retries.
     """
-    retries = 0
-    while True:
-        query_params = '&'.join([f"{k}={v}" for k, v in (params or {}).items()])
-        request_url = f"{url}?{query_params}" if query_params else url
-        print(f"REST Request: GET {request_url}")
+    query_params = '&'.join([f"{k}={v}" for k, v in (params or {}).items()])
+    request_url = f"{url}?{query_params}" if query_params else url
+    print(f"REST Request: GET {request_url}")
 
-        try:
-            auth = None
-            if USERNAME and PASSWORD:
-                auth = (USERNAME, PASSWORD)
-
-            response = requests.get(url, params=params, verify=VERIFY_SSL, auth=auth)
-            print(f"Response Status: {response.status_code}")
-
-            if response.status_code == 200:
-                try:
-                    return response.json()
-                except requests.exceptions.JSONDecodeError:
-                    print("Error: Response was not valid JSON.")
-                    print(f"Response text: {response.text[:500]}...") # Show beginning of text
-                    return None # Treat as failure
-
-            elif response.status_code == 429:
-                retry_after = response.headers.get('Retry-After')
-                if retry_after:
-                    # Retry-After can be in seconds or HTTP-date format
-                    try:
-                        # Try parsing as integer (seconds)
-                        wait_time = float(retry_after)
-                    except ValueError:
-                        # If not a number, might be HTTP-date, default to exponential backoff
-                        wait_time = min((2 ** retries) * 5, 300)  # Cap at 5 minutes
-                else:
-                    # No Retry-After header, use exponential backoff with cap
-                    wait_time = min((2 ** retries) * 5, 300)  # Cap at 5 minutes
-                
-                # Add small jitter to prevent thundering herd
-                jitter = random.uniform(0, min(wait_time * 0.1, 5))  # Max 10% jitter or 5 seconds
-                wait_time += jitter
-                
-                print(f"Rate limited (429). Server requested Retry-After: {retry_after or 'Not specified'}")
-                print(f"Waiting for {wait_time:.2f} seconds before retrying (infinite retries for 429)")
-                time.sleep(wait_time)
-                # Don't increment retries for 429 errors - retry indefinitely
-                continue
+    response = CONFLUENCE_CLIENT.get(url, params=params, max_retries=max_retries)
+    if response is None:
+        print(f"Network error. Max retries ({max_retries}) exceeded.")
+        return None
+    print(f"Response Status: {response.status_code}")
 
-            elif response.status_code in [401, 403]:
-                 print(f"Error: Authentication failed ({response.status_code}). Check username/password in settings.ini.")
-                 print(f"Response body: {response.text}")
-                 return None # Authentication errors are unlikely to succeed on retry
-
-            elif response.status_code == 404:
-                 print(f"Error: Resource not found ({response.status_code}) for URL: {request_url}")
-                 print(f"Response body: {response.text}")
-                 return None # Not found errors won't succeed on retry
-
-            elif response.status_code >= 500:
-                # Server errors might be temporary, retry them
-                if retries >= max_retries:
-                    print(f"Server error ({response.status_code}). Max retries ({max_retries}) exceeded.")
-                    return None
-                wait_time = min((2 ** retries) * 3, 60)  # Shorter wait for server errors, cap at 1 minute
-                print(f"Server error ({response.status_code}). Waiting {wait_time} seconds before retry {retries + 1}/{max_retries}")
-                time.sleep(wait_time)
-                retries += 1
-                continue
+    if response.status_code == 200:
+        try:
+            return response.json()
+        except requests.exceptions.JSONDecodeError:
+            print("Error: Response was not valid JSON.")
+            print(f"Response text: {response.text[:500]}...") # Show beginning of text
+            return None # Treat as failure
+
+    elif response.status_code in [401, 403]:
+         print(f"Error: Authentication failed ({response.status_code}). Check username/password in settings.ini.")
+         print(f"Response body: {response.text}")
+         return None # Authentication errors are unlikely to succeed on retry
+
+    elif response.status_code == 404:
+         print(f"Error: Resource not found ({response.status_code}) for URL: {request_url}")
+         print(f"Response body: {response.text}")
+         return None # Not found errors won't succeed on retry
 
-            else:
-                print(f"Error: Received status code {response.status_code} for {url}")
-                print(f"Response body: {response.text}")
-                return None
-
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            if retries >= max_retries:
-                print(f"Network error. Max retries ({max_retries}) exceeded.")
-                return None
-            # Wait briefly before retrying network errors
-            wait_time = min((2 ** retries) * 2, 30)  # Cap at 30 seconds for network errors
-            print(f"Network error. Waiting {wait_time} seconds before retry {retries + 1}/{max_retries}")
-            time.sleep(wait_time)
-            retries += 1
+    else:
+        print(f"Error: Received status code {response.status_code} for {url}")
+        print(f"Response body: {response.text}")
+        return None
 
 def get_page_id_from_url(url):
     """Extracts the page ID from various Confluence URL formats."""
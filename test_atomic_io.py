@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/atomic_io.py
+"""
+import json
+import os
+import pickle
+import threading
+
+import pytest
+
+from utils.atomic_io import FileLock, atomic_pickle_dump, atomic_write_json
+
+
+def test_atomic_write_json_replaces_file_and_leaves_no_temp(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    path.write_text('old')
+    atomic_write_json(str(path), {'processed_space_keys': ['A']})
+    assert json.loads(path.read_text()) == {'processed_space_keys': ['A']}
+    assert os.listdir(tmp_path) == ['checkpoint.json']
+
+
+def test_failed_write_keeps_previous_content(tmp_path):
+    path = tmp_path / 'space.pkl'
+    atomic_pickle_dump({'space_key': 'A'}, str(path))
+    with pytest.raises(TypeError):
+        atomic_write_json(str(path), {'bad': object()})
+    with open(path, 'rb') as f:
+        assert pickle.load(f) == {'space_key': 'A'}
+    assert os.listdir(tmp_path) == ['space.pkl']
+
+
+def test_file_lock_serialises_read_modify_write(tmp_path):
+    path = str(tmp_path / 'counter.json')
+    atomic_write_json(path, {'count': 0})
+
+    def bump():
+        for _ in range(20):
+            with FileLock(path + '.lock'):
+                with open(path) as f:
+                    data = json.load(f)
+                data['count'] += 1
+                atomic_write_json(path, data)
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with open(path) as f:
+        assert json.load(f)['count'] == 80
+    assert not os.path.exists(path + '.lock')
+
+
+def test_file_lock_times_out_and_breaks_stale_locks(tmp_path):
+    lock_path = str(tmp_path / 'x.lock')
+    with FileLock(lock_path):
+        with pytest.raises(TimeoutError):
+            FileLock(lock_path, timeout=0.2).acquire()
+    open(lock_path, 'w').close()
+    os.utime(lock_path, (0, 0))
+    with FileLock(lock_path, timeout=1, stale_after=60):
+        assert os.path.exists(lock_path)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/attachment_downloader.py against a local HTTP server that supports Range requests
+"""
+import os
+
+import pytest
+
+from conftest import make_client
+from utils.attachment_downloader import AttachmentDownloader, DownloadTask, expected_attachment_size
+
+FILES = {
+    '/download/a.bin': bytes(range(256)) * 40,
+    '/download/b.bin': b'hello world' * 100,
+}
+
+
+@pytest.fixture
+def server(local_server):
+    local_server.files = FILES
+    return local_server
+
+
+def make_downloader(base_url, **kwargs):
+    return AttachmentDownloader(make_client(base_url), chunk_size=64, **kwargs)
+
+
+def test_expected_attachment_size():
+    assert expected_attachment_size({'extensions': {'fileSize': '120'}}) == 120
+    assert expected_attachment_size({'extensions': {}}) is None
+    assert expected_attachment_size({}) is None
+
+
+def test_download_all_in_task_order(server, tmp_path):
+    downloader = make_downloader(server.url, max_workers=4, per_host_limit=2)
+    tasks = [DownloadTask(f"{server.url}{name}", str(tmp_path / name.rsplit('/', 1)[1]), len(data))
+             for name, data in FILES.items()]
+    tasks.append(DownloadTask(f"{server.url}/download/missing.bin", str(tmp_path / 'missing.bin')))
+    results = downloader.download_all(tasks)
+    assert [r.status for r in results] == ['downloaded', 'downloaded', 'failed']
+    assert (tmp_path / 'a.bin').read_bytes() == FILES['/download/a.bin']
+    assert not os.path.exists(tmp_path / 'missing.bin')
+
+    # A second run skips files whose size already matches
+    assert [r.status for r in downloader.download_all(tasks[:2])] == ['skipped', 'skipped']
+
+
+def test_resumes_partial_download_with_range(server, tmp_path):
+    data = FILES['/download/a.bin']
+    target = tmp_path / 'a.bin'
+    (tmp_path / 'a.bin.part').write_bytes(data[:1000])
+    result = make_downloader(server.url).download(DownloadTask(f"{server.url}/download/a.bin", str(target), len(data)))
+    assert result.status == 'resumed'
+    assert [range_header for _, range_header in server.requests] == ['bytes=1000-']
+    assert target.read_bytes() == data
+    assert not os.path.exists(tmp_path / 'a.bin.part')
+
+
+def test_size_mismatch_is_downloaded_again(server, tmp_path):
+    data = FILES['/download/b.bin']
+    target = tmp_path / 'b.bin'
+    target.write_bytes(data[:10])  # truncated file from an older, non-atomic download
+    result = make_downloader(server.url).download(DownloadTask(f"{server.url}/download/b.bin", str(target), len(data)))
+    assert result.status == 'downloaded'
+    assert target.read_bytes() == data
+
+    # Metadata that never matches the served file fails without leaving a finished file behind
+    other = tmp_path / 'other.bin'
+    result = make_downloader(server.url).download(DownloadTask(f"{server.url}/download/b.bin", str(other), len(data) + 5))
+    assert result.status == 'failed'
+    assert not os.path.exists(other)
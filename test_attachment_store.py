@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/attachment_store.py: content addressing, cross-space dedup and known-version skips
+"""
+import hashlib
+import os
+
+import pytest
+
+from conftest import make_client
+from utils.attachment_downloader import AttachmentDownloader
+from utils.attachment_store import AttachmentStore, StoreItem, attachment_version
+
+LOGO = b'\x89PNG' + b'logo' * 500
+FILES = {
+    '/download/attachments/1/logo.png': LOGO,
+    '/download/attachments/2/logo-copy.png': LOGO,
+    '/download/attachments/3/spec.pdf': b'%PDF' + b'spec' * 300,
+}
+
+
+@pytest.fixture
+def server(local_server):
+    local_server.files = FILES
+    return local_server
+
+
+def make_downloader(base_url):
+    return AttachmentDownloader(make_client(base_url))
+
+
+def item(base_url, space_key, page_id, att_id, path, version=1):
+    attachment = {'id': att_id, 'title': os.path.basename(path), 'version': {'number': version},
+                  'extensions': {'fileSize': len(FILES[path])}, '_links': {'download': f"{path}?version={version}"}}
+    return StoreItem(space_key, page_id, attachment, f"{base_url}{path}?version={version}")
+
+
+def test_attachment_version():
+    assert attachment_version({'version': {'number': 4}}) == 4
+    assert attachment_version({'_links': {'download': '/download/attachments/1/a.png?version=3&api=v2'}}) == 3
+    assert attachment_version({}) == 1
+
+
+def test_identical_content_is_stored_once(server, tmp_path):
+    with AttachmentStore(str(tmp_path / 'store')) as store:
+        items = [item(server.url, 'ONE', '10', 'att1', '/download/attachments/1/logo.png'),
+                 item(server.url, 'TWO', '20', 'att2', '/download/attachments/2/logo-copy.png'),
+                 item(server.url, 'TWO', '21', 'att3', '/download/attachments/3/spec.pdf')]
+        results = store.fetch(make_downloader(server.url), items)
+        assert sorted(r.status for r in results[:2]) == ['deduplicated', 'stored']
+        assert results[0].sha256 == results[1].sha256 == hashlib.sha256(LOGO).hexdigest()
+        assert open(results[0].path, 'rb').read() == LOGO
+
+        stats = store.stats()
+        assert stats['attachments'] == 3 and stats['blobs'] == 2
+        assert stats['logical_bytes'] - stats['stored_bytes'] == len(LOGO)
+        assert os.listdir(tmp_path / 'store' / 'incoming') == []
+
+
+def test_known_versions_are_not_downloaded_again(server, tmp_path):
+    root = str(tmp_path / 'store')
+    with AttachmentStore(root) as store:
+        store.fetch(make_downloader(server.url), [item(server.url, 'ONE', '10', 'att1', '/download/attachments/1/logo.png')])
+    assert len(server.requests) == 1
+
+    # A later run (another script, or the attachment listed on a second page) reuses the blob
+    with AttachmentStore(root) as store:
+        results = store.fetch(make_downloader(server.url), [
+            item(server.url, 'ONE', '10', 'att1', '/download/attachments/1/logo.png'),
+            item(server.url, 'ONE', '11', 'att1', '/download/attachments/1/logo.png'),
+        ])
+        assert [r.status for r in results] == ['known', 'known']
+        assert len(list(store.entries())) == 2
+    assert len(server.requests) == 1
+
+    # A new version of the attachment is fetched
+    with AttachmentStore(root) as store:
+        result, = store.fetch(make_downloader(server.url), [item(server.url, 'ONE', '10', 'att1', '/download/attachments/1/logo.png', version=2)])
+        assert result.status == 'deduplicated'
+    assert len(server.requests) == 2
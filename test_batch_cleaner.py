@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/batch_cleaner.py: batches cleaned on a process pool match one-at-a-time cleaning
+"""
+import pytest
+
+from utils import batch_cleaner, html_cleaner
+from utils.batch_cleaner import BatchCleaner, clean_body, clean_many, plain_text
+from utils.html_cleaner import clean_confluence_html
+
+
+@pytest.fixture
+def bodies(bodies):
+    # Empty bodies keep their place in the output
+    return bodies[:5] + ['', None] + bodies[5:]
+
+
+@pytest.fixture
+def always_parallel(monkeypatch):
+    monkeypatch.setattr(batch_cleaner, 'MIN_PARALLEL_CHARS', 0)
+
+
+def test_serial_matches_clean_confluence_html(bodies):
+    expected = [clean_confluence_html(body) if body else '' for body in bodies]
+    assert clean_many(bodies, workers=1) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 7])
+def test_pool_preserves_order(bodies, always_parallel, chunk_size):
+    expected = clean_many(bodies, workers=1)
+    assert clean_many(bodies, workers=2, chunk_size=chunk_size) == expected
+
+
+def test_pool_is_reused_across_batches(bodies, always_parallel):
+    with BatchCleaner(workers=2) as batch:
+        first = batch.clean(bodies[:10])
+        executor = batch._executor
+        second = batch.clean(bodies[10:])
+        assert batch._executor is executor
+    assert batch._executor is None
+    assert first + second == clean_many(bodies, workers=1)
+
+
+def test_small_batches_stay_in_process(bodies):
+    with BatchCleaner(workers=4) as batch:
+        batch.clean(bodies[:2])
+        assert batch._executor is None
+
+
+def test_cleaner_reaches_workers(bodies, always_parallel):
+    pytest.importorskip('lxml')
+    expected = [html_cleaner.clean_confluence_html(body, 'lxml') if body else '' for body in bodies]
+    assert clean_many(bodies, workers=2, cleaner='lxml') == expected
+
+
+def test_plain_mode():
+    body = '<p>Hello <strong>world</strong></p><ac:structured-macro ac:name="info"><ac:rich-text-body>' \
+           '<p>inside   macro</p></ac:rich-text-body></ac:structured-macro>'
+    assert plain_text(body) == 'Hello world inside macro'
+    assert clean_many([body, ''], mode='plain', workers=1) == ['Hello world inside macro', '']
+
+
+def test_markdown_mode(bodies):
+    pytest.importorskip('html2text')
+    expected = [batch_cleaner.html_to_markdown_text(clean_confluence_html(body)) if body else '' for body in bodies]
+    assert clean_many(bodies, mode='markdown', workers=1) == expected
+
+
+def test_failed_body_comes_back_as_none(monkeypatch):
+    def failing(html_content, cleaner=None):
+        if 'bad' in html_content:
+            raise RuntimeError('cannot clean')
+        return html_content.upper()
+
+    monkeypatch.setattr(html_cleaner, 'clean_confluence_html', failing)
+    assert clean_many(['<p>a</p>', '<p>bad</p>', '<p>b</p>'], workers=1) == ['<P>A</P>', None, '<P>B</P>']
+    with pytest.raises(RuntimeError):
+        clean_body('<p>bad</p>')
+
+
+def test_unknown_mode_and_cleaner():
+    with pytest.raises(ValueError):
+        clean_many(['<p>x</p>'], mode='pdf')
+    with pytest.raises(ValueError):
+        clean_many(['<p>x</p>'], cleaner='regex')
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/body_dedup.py and dedup_bodies.py
+"""
+import sys
+
+from dedup_bodies import main as dedup_main
+from utils.body_dedup import DedupMap, DuplicateFinder, DuplicateSkipper, MinHasher, body_words, estimated_similarity
+from utils.change_ledger import body_hash
+from utils.split_space import write_split_space
+from utils.streaming_pickle import dump_space
+
+TEMPLATE = ('<h2>Attendees</h2><p>{who}</p><h2>Agenda</h2><ul><li>Review the action items from the last '
+            'meeting and decide which of them are still open</li><li>Walk through the release checklist '
+            'for the next version and assign owners</li><li>Any other business raised by the team</li></ul>'
+            '<h2>Action items</h2><ac:task-list><ac:task><ac:task-body>{task}</ac:task-body></ac:task></ac:task-list>')
+
+
+def notes(who, task):
+    return TEMPLATE.format(who=who, task=task)
+
+
+def test_minhash_estimates_similarity():
+    hasher = MinHasher()
+    base = body_words(notes('Alice and Bob', 'Send the summary'))
+    similar = body_words(notes('Alice and Carol', 'Send the summary'))
+    different = body_words('<p>' + ' '.join(f'word{i}' for i in range(60)) + '</p>')
+    assert estimated_similarity(hasher.signature(base), hasher.signature(base)) == 1.0
+    assert estimated_similarity(hasher.signature(base), hasher.signature(similar)) > 0.7
+    assert estimated_similarity(hasher.signature(base), hasher.signature(different)) < 0.2
+
+
+def test_finder_groups_exact_and_near_duplicates():
+    finder = DuplicateFinder(threshold=0.7)
+    finder.add(('A', '1'), {'body': notes('Alice', 'Ship it')})
+    finder.add(('B', '2'), {'body': {'storage': {'value': notes('Alice', 'Ship it')}}})
+    finder.add(('C', '3'), {'body': notes('Alice', 'Ship it today')})
+    finder.add(('C', '4'), {'body': '<p>Something else entirely</p>'})
+
+    groups = finder.groups()
+    assert len(groups) == 1
+    assert groups[0].canonical == ('A', '1')
+    assert sorted(groups[0].members) == [('A', '1'), ('B', '2'), ('C', '3')]
+    kinds = {key: (canonical, kind) for key, _, canonical, kind, _ in finder.assignments()}
+    assert kinds[('A', '1')] == (('A', '1'), 'unique')
+    assert kinds[('B', '2')] == (('A', '1'), 'exact')
+    assert kinds[('C', '3')] == (('A', '1'), 'near')
+    assert kinds[('C', '4')] == (('C', '4'), 'unique')
+
+    exact_only = DuplicateFinder(near=False)
+    for key, body in [(('A', '1'), notes('Alice', 'x')), (('C', '3'), notes('Alice', 'y'))]:
+        exact_only.add(key, {'body': body})
+    assert exact_only.groups() == []
+
+
+def test_dedup_bodies_writes_map(tmp_path, monkeypatch):
+    pages = lambda key, count: [{'id': f'{key}{i}', 'title': f'Notes {i}', 'body': notes('Team', f'Task {i % 2}')}
+                                for i in range(count)]
+    dump_space({'space_key': 'AAA', 'sampled_pages': pages('AAA', 3)}, str(tmp_path / 'AAA.pkl'))
+    write_split_space({'space_key': 'BBB', 'sampled_pages': pages('BBB', 2)}, str(tmp_path / 'BBB.meta'))
+    db = str(tmp_path / 'map.sqlite')
+    monkeypatch.setattr(sys, 'argv', ['dedup_bodies.py', str(tmp_path), '--db', db, '--exact-only',
+                                      '--store-bodies', '--workers', '1'])
+    assert dedup_main() == 0
+
+    with DedupMap(db) as dedup_map:
+        assert dedup_map.duplicates() == {('AAA', 'AAA2'): ('AAA', 'AAA0'), ('BBB', 'BBB0'): ('AAA', 'AAA0'),
+                                          ('BBB', 'BBB1'): ('AAA', 'AAA1')}
+        assert dedup_map.canonical('BBB', 'BBB1') == ('AAA', 'AAA1', 'exact')
+        assert dedup_map.canonical('AAA', 'AAA0')[2] == 'unique'
+        assert dedup_map.body(body_hash(notes('Team', 'Task 1'))) == notes('Team', 'Task 1')
+
+
+def test_skipper_only_skips_duplicates_whose_canonical_page_was_uploaded(tmp_path):
+    body, other = notes('Team', 'Task'), notes('Team', 'Other task')
+    finder = DuplicateFinder(near=False)
+    for key in [('AAA', '1'), ('BBB', '2'), ('CCC', '3'), ('~me', '4')]:
+        finder.add(key, {'body': body})
+    with DedupMap(str(tmp_path / 'map.sqlite')) as dedup_map:
+        dedup_map.write(finder)
+        duplicate_hashes = dedup_map.duplicate_hashes()
+    assert duplicate_hashes[('BBB', '2')] == (body_hash(body), ('AAA', '1'), body_hash(body))
+
+    skipper = DuplicateSkipper(duplicate_hashes)
+    duplicate = {'id': '2', 'title': 'Notes', 'body': body}
+    # The canonical page is not uploaded (yet)
+    assert skipper.canonical('BBB', duplicate) == ('AAA', '1')
+    assert not skipper.skip('BBB', duplicate)
+
+    skipper.mark_uploaded('AAA', {'id': '1', 'body': body})
+    assert skipper.skip('BBB', duplicate)
+    assert skipper.skip('~me', {'id': '4', 'body_hash': body_hash(body)})
+    # A duplicate edited since the map was built is uploaded on its own
+    assert skipper.canonical('CCC', {'id': '3', 'body': other}) is None
+    assert not skipper.skip('CCC', {'id': '3', 'body': other})
+    # Pages outside the map are never skipped
+    assert not skipper.skip('EEE', {'id': '9', 'body': body})
+    assert dict(skipper.skipped) == {('AAA', '1'): [('BBB', '2', 'Notes'), ('~me', '4', '')]}
+
+    # Canonical page uploaded by an earlier run, with the body the map recorded
+    assert DuplicateSkipper(duplicate_hashes, uploaded={('AAA', '1'): body_hash(body)}).skip('BBB', duplicate)
+    # The canonical page changed since the map was built: its upload no longer covers the duplicates
+    stale = DuplicateSkipper(duplicate_hashes)
+    stale.mark_uploaded('AAA', {'id': '1', 'body': other})
+    assert not stale.skip('BBB', duplicate)
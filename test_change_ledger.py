@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/change_ledger.py
+"""
+from utils.change_ledger import ProcessedLedger, body_hash, page_body_hash, set_body_hash
+
+
+def test_body_hash_is_the_same_for_both_body_layouts():
+    assert body_hash('<p>x</p>') == body_hash({'storage': {'value': '<p>x</p>'}})
+    assert body_hash('<p>x</p>') != body_hash('<p>y</p>')
+    assert body_hash(None) == body_hash('')
+
+
+def test_page_body_hash_prefers_the_stored_hash():
+    page = set_body_hash({'id': '1', 'body': '<p>x</p>'})
+    assert page_body_hash(page) == body_hash('<p>x</p>')
+    # Pickles written before body_hash existed fall back to hashing the body
+    assert page_body_hash({'id': '1', 'body': '<p>x</p>'}) == page['body_hash']
+
+
+def test_ledger_reports_changed_and_removed_pages_per_consumer(tmp_path):
+    path = str(tmp_path / 'ledger.sqlite')
+    with ProcessedLedger(path, 'index') as ledger:
+        ledger.mark([('1', 'a'), ('2', 'b'), ('3', 'c')], 'SP')
+        ledger.mark([(9, 'z')], 'OTHER')
+
+    with ProcessedLedger(path, 'index') as ledger, ProcessedLedger(path, 'upload') as other:
+        assert ledger.changed([('1', 'a'), ('2', 'B'), ('4', 'd')], 'SP') == [('2', 'B'), ('4', 'd')]
+        assert ledger.removed(['1', '2'], 'SP') == ['3']
+        assert ledger.removed(['1', '2', '3']) == ['9']
+        assert len(other) == 0
+
+        ledger.forget(['3'])
+        ledger.forget_space('OTHER')
+        assert ledger.hashes() == {'1': 'a', '2': 'b'}
+        ledger.clear()
+        assert len(ledger) == 0
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for compact_pickles.py
+"""
+import os
+import pickle
+import time
+
+from compact_pickles import compact_space, group_pickles, merge_spaces
+from utils.change_ledger import body_hash
+
+
+def _write(path, data, protocol=2):
+    with open(path, 'wb') as f:
+        pickle.dump(data, f, protocol=protocol)
+
+
+def _space(pages, total=None):
+    return {'space_key': 'SP', 'name': 'Space', 'sampled_pages': pages, 'total_pages_in_space': total or len(pages)}
+
+
+def test_merge_keeps_newest_version_and_normalizes_bodies():
+    old = _space([{'id': '1', 'update_count': 1, 'body': {'storage': {'value': '<p>old</p>'}}},
+                  {'id': '2', 'body': '<p>two</p>'}, {'title': 'no id'}], total=10)
+    new = _space([{'id': 1, 'update_count': 2, 'body': '<p>new</p>'}])
+    merged, counts = merge_spaces([new, old])
+
+    assert [page['id'] for page in merged['sampled_pages']] == [1, '2']
+    assert merged['sampled_pages'][0]['body'] == '<p>new</p>'
+    assert all(page['body_hash'] == body_hash(page['body']) for page in merged['sampled_pages'])
+    assert merged['total_pages_in_space'] == 10
+    assert counts == {'invalid': 1, 'duplicates': 1, 'newer': 1, 'normalized': 2}
+
+
+def test_compact_space_merges_in_place_and_is_idempotent(tmp_path):
+    _write(tmp_path / 'SP.pkl', _space([{'id': '1', 'body': {'storage': {'value': '<p>a</p>'}}}]))
+    _write(tmp_path / 'SP_full.pkl', _space([{'id': '2', 'body': '<p>b</p>'}]))
+    paths = group_pickles(str(tmp_path))['SP']
+    output = str(tmp_path / 'SP.pkl')
+
+    report = compact_space('SP', paths, output)
+    assert report['action'] == 'rewrite' and report['removed'] == ['SP_full.pkl']
+    assert os.path.exists(tmp_path / 'SP_full.pkl')  # dry run
+
+    compact_space('SP', paths, output, execute=True)
+    assert not os.path.exists(tmp_path / 'SP_full.pkl')
+    with open(output, 'rb') as f:
+        data = pickle.load(f)
+    assert [page['body'] for page in data['sampled_pages']] == ['<p>a</p>', '<p>b</p>']
+
+    report = compact_space('SP', group_pickles(str(tmp_path))['SP'], output, execute=True)
+    assert report['action'] == 'unchanged'
+
+
+def test_compact_space_respects_placeholders(tmp_path):
+    _write(tmp_path / 'SP.pkl', {'status': 'processing', 'space_key': 'SP'})
+    paths = [str(tmp_path / 'SP.pkl')]
+    assert compact_space('SP', paths, paths[0], execute=True)['action'] == 'skipped: being pickled'
+
+    old = time.time() - 24 * 3600
+    os.utime(paths[0], (old, old))
+    assert compact_space('SP', paths, paths[0], execute=True)['action'] == 'remove abandoned placeholder'
+    assert not os.path.exists(paths[0])
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/confluence_client.py against a local HTTP server
+"""
+from conftest import make_client
+from utils.confluence_client import parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after(None, default=2) == 2
+    assert parse_retry_after('not a date', default=7) == 7
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+
+def test_retries_429_with_retry_after(local_server):
+    local_server.script = [(429, {'Retry-After': '0'}), (429, {'Retry-After': '0'})]
+    client = make_client(local_server.url)
+    assert client.get_json('/rest/api/space') == {'path': '/rest/api/space'}
+    assert client.rate_limiter.stats()['throttle_count'] == 2
+
+
+def test_retries_gateway_errors_then_gives_up(local_server):
+    local_server.script = [(503, {'Retry-After': '0'})] * 3
+    client = make_client(local_server.url, max_retries=1)
+    assert client.get('/rest/api/content').status_code == 503
+
+
+def test_rate_limit_retry_cap(local_server):
+    local_server.script = [(429, {'Retry-After': '0'})] * 3
+    client = make_client(local_server.url, max_rate_limit_retries=1)
+    assert client.get('/rest/api/content').status_code == 429
+
+
+def test_connections_are_reused(local_server):
+    client = make_client(local_server.url)
+    for _ in range(5):
+        assert client.get(f"{local_server.url}/rest/api/content").status_code == 200
+    assert len(local_server.connections) == 1
+
+
+def test_connection_error_returns_none():
+    client = make_client('http://127.0.0.1:1', max_retries=0)
+    assert client.get('/rest/api/space') is None
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/corpus_loader.py
+"""
+import os
+import pickle
+
+import pytest
+
+from utils.corpus_loader import CorpusLoader, load_spaces
+from utils.split_space import write_split_space
+from utils.streaming_pickle import BodyBuffer, dump_space
+
+
+def space(key, count):
+    return {'space_key': key, 'name': f'Space {key}',
+            'sampled_pages': [{'id': f'{key}{i}', 'title': f'Page {i}', 'body': f'<p>{i}</p>'} for i in range(count)]}
+
+
+def page_count(data):
+    return len(data['sampled_pages'])
+
+
+def write_corpus(directory):
+    dump_space(space('AAA', 2), str(directory / 'AAA.pkl'))
+    dump_space(space('BBB', 5), str(directory / 'BBB.pkl'))
+    write_split_space(space('CCC', 3), str(directory / 'CCC.meta'))
+    with open(directory / 'WIP.pkl', 'wb') as f:
+        pickle.dump({'space_key': 'WIP', 'status': 'processing'}, f)
+
+
+def test_loads_pickles_and_split_spaces_in_order_and_skips_placeholders(tmp_path):
+    write_corpus(tmp_path)
+    loader = CorpusLoader(str(tmp_path), workers=3)
+    spaces = loader.load()
+    assert list(spaces) == ['AAA', 'BBB', 'CCC']
+    assert spaces['CCC']['sampled_pages'][2]['body'] == '<p>2</p>'
+    assert loader.stats.loaded == 3 and loader.stats.skipped == 1
+    assert 'Loaded 3 of 4 selected spaces' in loader.stats.summary()
+
+
+def test_filters_are_applied_before_loading(tmp_path):
+    write_corpus(tmp_path)
+    # Would fail to unpickle if it were ever read
+    with open(tmp_path / 'BAD.pkl', 'wb') as f:
+        f.write(b'not a pickle')
+    errors = []
+
+    selected = CorpusLoader(str(tmp_path), min_pages=3, on_error=lambda path, e: errors.append(path)).select()
+    assert [f.space_key for f in selected] == ['BBB', 'CCC']
+    assert [f.page_count for f in selected] == [5, 3]
+
+    spaces = load_spaces(str(tmp_path), space_keys=['AAA', 'CCC'], on_error=lambda path, e: errors.append(path))
+    assert list(spaces) == ['AAA', 'CCC']
+    # Only the catalog rebuild touched BAD.pkl
+    assert errors == [str(tmp_path / 'BAD.pkl')]
+
+
+def test_split_space_wins_over_pickle_of_same_space(tmp_path):
+    dump_space(space('AAA', 1), str(tmp_path / 'AAA.pkl'))
+    write_split_space(space('AAA', 4), str(tmp_path / 'AAA.meta'))
+    selected = CorpusLoader(str(tmp_path)).select()
+    assert [(f.space_key, f.kind) for f in selected] == [('AAA', 'split')]
+
+
+def test_map_runs_transform_in_worker_processes_and_reports_errors(tmp_path):
+    write_corpus(tmp_path)
+    with open(tmp_path / 'BAD.pkl', 'wb') as f:
+        f.write(b'not a pickle')
+    errors = []
+    loader = CorpusLoader(str(tmp_path), workers=2, on_error=lambda path, e: errors.append(os.path.basename(path)))
+    results = [(f.space_key, count) for f, count in loader.map(page_count)]
+    assert results == [('AAA', 2), ('BBB', 5), ('CCC', 3)]
+    assert errors == ['BAD.pkl']
+    assert loader.stats.failed == 1 and loader.stats.mode == 'processes'
+
+
+def test_explore_clusters_reads_out_of_band_bodies(tmp_path, monkeypatch):
+    whoosh_index = pytest.importorskip('whoosh.index')
+    import explore_clusters
+    data = space('OOB', 3)
+    data['sampled_pages'][1]['body'] = '<p>Deployed with Kubernetes</p>' + '<p>filler</p>' * 200
+    dump_space(data, str(tmp_path / 'OOB.pkl'), out_of_band_min_bytes=1000)
+    spaces = list(load_spaces(str(tmp_path)).values())
+    assert isinstance(spaces[0]['sampled_pages'][1]['body'], BodyBuffer)
+
+    X, valid_spaces = explore_clusters.get_vectors(spaces, workers=1, text_cache=None)
+    assert [s['space_key'] for s in valid_spaces] == ['OOB']
+
+    monkeypatch.setattr(explore_clusters, 'WHOOSH_INDEX_DIR', str(tmp_path / 'whoosh_index'))
+    explore_clusters.preprocess_application_search_index(spaces, workers=1, text_cache=None)
+    ix = whoosh_index.open_dir(str(tmp_path / 'whoosh_index'))
+    with ix.searcher() as searcher:
+        query = explore_clusters.QueryParser('page_content', ix.schema).parse('kubernetes')
+        assert [hit['page_id'] for hit in searcher.search(query)] == ['OOB1']
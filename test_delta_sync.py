@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for sample_and_pickle_spaces.py --delta-sync against mock_confluence_server.py
+"""
+import importlib
+import os
+
+import pytest
+import requests
+
+from benchmark_fetchers import write_settings
+from mock_confluence_server import MockConfluence, MockConfluenceServer, iso_time
+from utils.change_ledger import set_body_hash
+from utils.streaming_pickle import dump_space, load_space
+
+PAGE_EXPAND = {'version', 'ancestors', 'children.page', 'children.attachment'}
+
+
+@pytest.fixture(scope='module')
+def sync(tmp_path_factory):
+    # The script reads settings.ini from the working directory on import
+    workdir = str(tmp_path_factory.mktemp('delta_sync'))
+    write_settings(workdir, 'http://127.0.0.1:1')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return importlib.import_module('sample_and_pickle_spaces')
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def server(sync, monkeypatch):
+    with MockConfluenceServer(MockConfluence(spaces=2, pages=40, seed=4)) as server:
+        monkeypatch.setattr(sync, 'BASE_URL', server.base_url)
+        yield server
+
+
+def pickle_spaces(sync, mock, target_dir):
+    """Space pickles as a full pickle run against the mock writes them."""
+    for space in mock.spaces:
+        pages = []
+        for page_id in space['page_ids']:
+            page = mock.pages[page_id]
+            page_info = sync.build_page_info(mock.page_json(page, PAGE_EXPAND), space['key'])
+            page_info['body'] = mock.body(page)
+            pages.append(set_body_hash(page_info))
+        dump_space({'space_key': space['key'], 'name': space['name'], 'sampled_pages': pages,
+                    'total_pages_in_space': len(pages)}, os.path.join(target_dir, f"{space['key']}.pkl"))
+
+
+def load_pages(target_dir):
+    pages = {}
+    for name in sorted(os.listdir(target_dir)):
+        if name.endswith('.pkl'):
+            pages.update((page['id'], page) for page in load_space(os.path.join(target_dir, name))['sampled_pages'])
+    return pages
+
+
+def touch(server, fraction, seed):
+    """Give a share of the mock's pages a new version through /_mock/touch; returns their ids."""
+    response = requests.post(f"{server.base_url}/_mock/touch", params={'fraction': fraction, 'seed': seed})
+    return response.json()['ids']
+
+
+def high_water_mark(sync, target_dir):
+    return sync.load_delta_sync_state(target_dir).get('high_water_mark')
+
+
+def test_only_touched_pages_are_patched(sync, server, tmp_path):
+    target_dir = str(tmp_path)
+    pickle_spaces(sync, server.mock, target_dir)
+    before = load_pages(target_dir)
+    touched = set(touch(server, 0.1, seed=3))
+    assert touched
+
+    sync.delta_sync_pickles(target_dir)
+
+    after = load_pages(target_dir)
+    assert set(after) == set(before)
+    for page_id, page in after.items():
+        if page_id in touched:
+            assert page['updated'] == iso_time(server.mock.pages[page_id]['when'])
+            assert page['update_count'] == before[page_id]['update_count'] + 1
+            assert page['body'] == server.mock.body(server.mock.pages[page_id])
+        else:
+            assert page == before[page_id]
+    # Pages in the overlap window that were not modified are listed but their bodies are not fetched
+    assert server.mock.stats_snapshot()['requests']['content_by_id'] == len(touched)
+    newest = max(server.mock.pages[page_id]['when'] for page_id in touched)
+    assert sync.parse_confluence_timestamp(high_water_mark(sync, target_dir)) == \
+        sync.parse_confluence_timestamp(iso_time(newest))
+
+
+def test_high_water_mark_holds_after_partial_failure(sync, server, tmp_path, monkeypatch):
+    target_dir = str(tmp_path)
+    pickle_spaces(sync, server.mock, target_dir)
+    touch(server, 0.1, seed=3)
+    sync.delta_sync_pickles(target_dir)
+    first_mark = high_water_mark(sync, target_dir)
+    assert first_mark
+
+    touched = touch(server, 0.1, seed=8)
+    assert len(touched) > 1
+    failing = touched[0]
+    fetch_page_body = sync.fetch_page_body
+    monkeypatch.setattr(sync, 'fetch_page_body',
+                        lambda page_id, default='': default if page_id == failing else fetch_page_body(page_id, default))
+    sync.delta_sync_pickles(target_dir)
+
+    pages = load_pages(target_dir)
+    assert high_water_mark(sync, target_dir) == first_mark
+    assert pages[failing]['updated'] != iso_time(server.mock.pages[failing]['when'])
+    assert all(pages[page_id]['updated'] == iso_time(server.mock.pages[page_id]['when']) for page_id in touched[1:])
+
+    # The next run repeats the window and picks up the page that failed
+    monkeypatch.setattr(sync, 'fetch_page_body', fetch_page_body)
+    sync.delta_sync_pickles(target_dir)
+    assert load_pages(target_dir)[failing]['updated'] == iso_time(server.mock.pages[failing]['when'])
+    assert high_water_mark(sync, target_dir) != first_mark
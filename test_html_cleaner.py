@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/html_cleaner.py: the lxml fast path against the BeautifulSoup cleaner
+"""
+import random
+
+import pytest
+
+from mock_confluence_server import MockConfluence
+from utils import html_cleaner
+from utils.html_cleaner import clean_confluence_html, clean_confluence_html_lxml, set_default_cleaner
+
+pytest.importorskip('lxml')
+
+# Storage-format bodies covering every rule and the places where the passes of the
+# BeautifulSoup cleaner interact (rules inside the subtrees of other rules)
+GOLDEN_CORPUS = {
+    'paragraphs': '<p>First <strong>bold</strong> and <em>italic</em>.</p>\n  <p>Second&nbsp;one &amp; more &mdash; &#8212;&#x2014;</p>',
+    'headings': '<h1>Title</h1><h2>Sub <span style="color: red">colored</span></h2><h3>  </h3><h6>deep</h6>',
+    'heading backslashes': '<h2>C:\\\\\\\\path\\\\\\to</h2><h3>a\\b</h3>',
+    'nested headings': '<h2>outer <h1>inner</h1> tail</h2><h1>one <h1>two</h1></h1>',
+    'lists': '<ul><li>one</li><li>two <strong>bold</strong></li><li>  </li></ul><ul></ul><ul>\n</ul><ol><li>ordered</li></ol>',
+    'nested lists': '<ul><li>a<ul><li>b</li><li>c<ul><li>d</li></ul></li></ul></li><li>e</li></ul>',
+    'list with rules inside': ('<ul><li><h3>head</h3> text</li><li><ac:structured-macro ac:name="toc"/> after</li>'
+                               '<li><table><tr><td>cell</td></tr></table></li><li>x<hr/>y</li></ul>'),
+    'macros': ('<ac:structured-macro ac:name="drawio" ac:schema-version="1"><ac:parameter ac:name="diagramName">D</ac:parameter>'
+               '</ac:structured-macro><ac:structured-macro ac:name="Gliffy"/><ac:structured-macro ac:name="children"/>'
+               '<ac:structured-macro ac:name="pagetree"/><ac:structured-macro ac:name="lucidchart"/>'
+               '<ac:structured-macro ac:name="carousel"><p>hidden</p></ac:structured-macro>'
+               '<ac:structured-macro ac:name="info"><ac:rich-text-body><p>Info text</p></ac:rich-text-body></ac:structured-macro>'),
+    'attachments': ('<ac:structured-macro ac:name="view-file"><ac:parameter ac:name="name"><ri:attachment ri:filename="a.docx"/>'
+                    '</ac:parameter></ac:structured-macro><ac:structured-macro ac:name="viewpdf"><ac:parameter ac:name="name">'
+                    '<ri:attachment ri:filename="b.pdf"/></ac:parameter></ac:structured-macro>'
+                    '<ac:structured-macro ac:name="view-pdf"/><ac:structured-macro ac:name="multimedia"><ac:parameter ac:name="name">'
+                    '<ri:attachment ri:filename=""/></ac:parameter></ac:structured-macro>'),
+    'jira': ('<ac:structured-macro ac:name="jira"><ac:parameter ac:name="key"> EX-123 </ac:parameter></ac:structured-macro>'
+             '<ac:structured-macro ac:name="jiraissues"><ac:parameter ac:name="key"><![CDATA[ ]]></ac:parameter>'
+             '</ac:structured-macro><ac:structured-macro ac:name="JIRA"/>'),
+    'macros inside removed macros': ('<ac:structured-macro ac:name="gallery"><ac:structured-macro ac:name="toc"/></ac:structured-macro>'
+                                     '<ac:structured-macro ac:name="panel"><ac:structured-macro ac:name="toc"/></ac:structured-macro>'),
+    'code and cdata': ('<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">sql</ac:parameter>'
+                       '<ac:plain-text-body><![CDATA[SELECT a\r\n  FROM t -- <b> & "x"\n WHERE 1 = 1]]></ac:plain-text-body>'
+                       '</ac:structured-macro><p>before<![CDATA[inside]]>after<![CDATA[]]>end</p>'),
+    'tables': ('<table><tbody><tr><th>Name</th><th>Value</th></tr><tr><td>alpha</td><td>1</td></tr>'
+               '<tr><td>only one cell</td></tr><tr><td>a</td><td>b</td><td>extra</td></tr></tbody></table>'
+               '<table></table><table><tr></tr></table>'),
+    'nested tables': ('<table><tr><td>outer<table><tr><td>inner</td><td>cell</td></tr></table></td></tr>'
+                      '<tr><td><ul><li>listed</li></ul></td><td><h4>head</h4></td></tr></table>'),
+    'table with macros': ('<table><tr><th><ac:structured-macro ac:name="jira"><ac:parameter ac:name="key">K-1</ac:parameter>'
+                          '</ac:structured-macro></th><td><hr/>x</td></tr></table>'),
+    'horizontal rules': '<p>above</p><hr/><p>below</p><hr></hr>',
+    'whitespace': '<p>a</p>   <p>b</p>\n\n\t<p> c </p><p><b>x</b>  <i>y</i></p><p>tab\there</p>\r\n<p>cr\rlf</p>',
+    'preformatted': '<pre>  keep   this\n  <b> </b>  </pre> <pre><code>x  =  1\n\n</code></pre>',
+    'comments': '<p>split<!-- note -->text</p><!-- between --><p>after</p>',
+    'links and users': ('<p><ac:link><ri:page ri:content-title="Other page" ri:space-key="SP"/><ac:plain-text-link-body>'
+                        '<![CDATA[link text]]></ac:plain-text-link-body></ac:link> by <ac:link><ri:user ri:userkey="abc"/></ac:link></p>'),
+    'tasks and layout': ('<ac:layout><ac:layout-section ac:type="two_equal"><ac:layout-cell><ac:task-list><ac:task>'
+                         '<ac:task-id>1</ac:task-id><ac:task-status>incomplete</ac:task-status><ac:task-body>Do it</ac:task-body>'
+                         '</ac:task></ac:task-list></ac:layout-cell><ac:layout-cell><p>Right</p></ac:layout-cell>'
+                         '</ac:layout-section></ac:layout>'),
+    'emoticons and images': '<p>Hi <ac:emoticon ac:name="smile"/> <ac:image><ri:attachment ri:filename="pic.png"/></ac:image><br/>next</p>',
+    'unicode': '<p>Grüße — 日本語 <span>\xa0</span> ✓</p>',
+    'other prefixes': '<p><at:var at:name="x">var</at:var> <x-y:z>q</x-y:z></p>',
+}
+
+# Markup the lxml path leaves to BeautifulSoup (html.parser reads it differently from XML)
+UNSUPPORTED = {
+    'unclosed void element': '<p>one<br>two</p>',
+    'content in void element': '<hr>text</hr>',
+    'unknown entity': '<p>&foo; bar</p>',
+    'windows-1252 reference': '<p>a &#150; b</p>',
+    'bare ampersand': '<p>a & b</p>',
+    'script': '<script>var a = "<p>";</script><p>x</p>',
+    'upper-case tag': '<P>x</P>',
+    'upper-case attribute': '<ac:structured-macro AC:NAME="toc"/>',
+    'multi-line attribute': '<p title="a\nb">x</p>',
+    'stray end tag': '<p>x</p></div>',
+    'doctype': '<!DOCTYPE html><p>x</p>',
+}
+
+EXPECTED_TABLES = """[TABLE_START]
+Name          | Value
+-----------------------
+alpha         | 1
+only one cell |
+a             | b
+[TABLE_END]
+[TABLE DATA (empty)] [TABLE DATA (no cells in first row)]"""
+
+
+@pytest.mark.parametrize('name', sorted(GOLDEN_CORPUS))
+def test_lxml_cleaner_matches_bs4(name):
+    html = GOLDEN_CORPUS[name]
+    fast = clean_confluence_html_lxml(html, fallback=False)
+    assert fast is not None, 'body fell back to BeautifulSoup'
+    assert fast == clean_confluence_html(html, cleaner='bs4')
+
+
+@pytest.mark.parametrize('name', sorted(UNSUPPORTED))
+def test_unsupported_markup_falls_back_to_bs4(name):
+    html = UNSUPPORTED[name]
+    assert clean_confluence_html_lxml(html, fallback=False) is None
+    assert clean_confluence_html_lxml(html) == clean_confluence_html(html, cleaner='bs4')
+
+
+def test_table_layout_is_unchanged():
+    html = GOLDEN_CORPUS['tables']
+    assert clean_confluence_html(html, cleaner='bs4') == EXPECTED_TABLES
+    assert clean_confluence_html_lxml(html) == EXPECTED_TABLES
+
+
+def test_synthetic_bodies_match():
+    mock = MockConfluence(spaces=1, pages=40, body_bytes=3000, sql_rate=0.5)
+    for page in mock.pages.values():
+        body = mock.body(page)
+        assert clean_confluence_html_lxml(body, fallback=False) == clean_confluence_html(body, cleaner='bs4')
+
+
+def test_random_nesting_of_corpus_fragments_matches():
+    rng = random.Random(7)
+    fragments = list(GOLDEN_CORPUS.values())
+    wrappers = ['<li>{}</li>', '<ul>{}</ul>', '<td>{}</td>', '<tr>{}</tr>', '<table>{}</table>', '<h2>{}</h2>',
+                '<ac:structured-macro ac:name="panel">{}</ac:structured-macro>', '<pre>{}</pre>',
+                '<ac:structured-macro ac:name="jira"><ac:parameter ac:name="key">{}</ac:parameter></ac:structured-macro>']
+    for _ in range(200):
+        html = ''.join(rng.choice(fragments) for _ in range(rng.randint(1, 3)))
+        for _ in range(rng.randint(0, 4)):
+            html = rng.choice(wrappers).format(html)
+        assert clean_confluence_html_lxml(html, fallback=False) == clean_confluence_html(html, cleaner='bs4'), html
+
+
+def test_default_cleaner_selection(monkeypatch):
+    monkeypatch.setattr(html_cleaner, 'DEFAULT_CLEANER', 'bs4')
+    calls = []
+    monkeypatch.setattr(html_cleaner, 'clean_confluence_html_lxml', lambda html: calls.append(html) or 'fast')
+    assert clean_confluence_html('<p>x</p>') == 'x'
+    set_default_cleaner('lxml')
+    assert clean_confluence_html('<p>x</p>') == 'fast' and calls == ['<p>x</p>']
+    assert clean_confluence_html('<p>x</p>', cleaner='bs4') == 'x'
+    with pytest.raises(ValueError):
+        set_default_cleaner('regex')
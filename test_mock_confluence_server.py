@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for mock_confluence_server.py and benchmark_fetchers.py
+"""
+import pytest
+import requests
+
+from benchmark_fetchers import compare_with_baseline, run_mode
+from mock_confluence_server import MAX_BODY_LIMIT, MockConfluence, MockConfluenceServer
+
+
+@pytest.fixture
+def server():
+    with MockConfluenceServer(MockConfluence(spaces=2, pages=60, attachments_per_page=1.0)) as server:
+        yield server
+
+
+def test_listing_pages_through_a_space_with_bodies(server):
+    url = f"{server.base_url}/rest/api/content"
+    params = {'type': 'page', 'spaceKey': 'SP000', 'limit': 500, 'expand': 'version,ancestors,children.page,body.storage'}
+    first = requests.get(url, params=params).json()
+    assert first['limit'] == MAX_BODY_LIMIT and first['size'] == MAX_BODY_LIMIT
+    rest = requests.get(url, params=dict(params, start=MAX_BODY_LIMIT)).json()['results']
+    pages = first['results'] + rest
+    assert len(pages) == 60 and all(page['body']['storage']['value'].startswith('<h1>') for page in pages)
+
+    by_id = {page['id']: page for page in pages}
+    for page in pages:
+        for child in page['children']['page']['results']:
+            assert by_id[child['id']]['ancestors'][-1]['id'] == page['id']
+    single = requests.get(f"{url}/{pages[0]['id']}", params={'expand': 'body.storage'}).json()
+    assert single['body'] == pages[0]['body']
+    assert server.mock.stats_snapshot()['bodies'] == 61
+
+
+def test_search_download_and_touch(server):
+    touched = requests.post(f"{server.base_url}/_mock/touch", params={'fraction': 0.1, 'seed': 3}).json()['ids']
+    assert touched
+    cql = 'type=page AND lastmodified > "2025/01/01 00:00" ORDER BY lastmodified ASC'
+    found = requests.get(f"{server.base_url}/rest/api/content/search", params={'cql': cql, 'limit': 200}).json()
+    assert sorted(page['id'] for page in found['results']) == sorted(touched)
+
+    attachment = next(iter(server.mock.attachments.values()))
+    link = server.mock.attachment_json(attachment)['_links']['download']
+    whole = requests.get(server.base_url + link).content
+    assert len(whole) == attachment['size']
+    partial = requests.get(server.base_url + link, headers={'Range': 'bytes=10-'})
+    assert partial.status_code == 206 and partial.content == whole[10:]
+    assert requests.get(server.base_url + link, headers={'Range': f"bytes={len(whole)}-"}).status_code == 416
+
+
+def test_injected_faults():
+    mock = MockConfluence(spaces=1, pages=5, error_rate=1.0)
+    with MockConfluenceServer(mock) as server:
+        assert requests.get(f"{server.base_url}/rest/api/space").status_code in (500, 502, 503)
+        mock.error_rate, mock.throttle_rate = 0.0, 1.0
+        response = requests.get(f"{server.base_url}/rest/api/space")
+        assert response.status_code == 429 and response.headers['Retry-After'] == '1'
+        assert requests.get(f"{server.base_url}/_mock/stats").json()['throttled'] == 1
+
+
+def test_single_pass_benchmark_fetches_every_page():
+    with MockConfluenceServer(MockConfluence(spaces=2, pages=30)) as server:
+        result = run_mode(server, 'single-pass', timeout=300)
+    assert result['exit_code'] == 0
+    assert result['pages'] == result['pages_with_body'] == 60
+    # Bodies come with the listings: no per-page requests
+    assert set(result['requests_by_endpoint']) == {'space', 'content'}
+    assert result['requests_by_endpoint']['space'] == 1
+
+
+def test_regressions_against_baseline():
+    baseline = {'results': [{'mode': 'per-page', 'pages_per_sec': 100, 'requests_per_page': 1.0, 'peak_rss_mb': 50}]}
+    same = [{'mode': 'per-page', 'pages_per_sec': 90, 'requests_per_page': 1.1, 'peak_rss_mb': 55}]
+    assert compare_with_baseline(same, baseline) == []
+    worse = [{'mode': 'per-page', 'pages_per_sec': 70, 'requests_per_page': 2.0, 'peak_rss_mb': 55}]
+    assert len(compare_with_baseline(worse, baseline)) == 2
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for open-webui.py --ledger: pages unchanged since their last upload are skipped
+"""
+import importlib.util
+import itertools
+import os
+
+import pytest
+
+from utils.change_ledger import ProcessedLedger
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'open-webui.py')
+
+
+@pytest.fixture(scope='module')
+def uploader():
+    spec = importlib.util.spec_from_file_location('open_webui', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeClient:
+    """Keeps the collection in memory: {file id: filename}"""
+
+    def __init__(self):
+        self.files = {}
+        self.uploads = []
+        self._ids = itertools.count(1)
+
+    def upload_document(self, title, content, collection_id, is_html=False):
+        self.uploads.append(title)
+        self.files[f"file-{next(self._ids)}"] = f"{title}.txt"
+        return True
+
+    def list_collection_files(self, collection_id):
+        names = {}
+        for file_id, filename in self.files.items():
+            names.setdefault(filename, []).append(file_id)
+        return names
+
+    def remove_document(self, collection_id, file_id):
+        return self.files.pop(file_id, None) is not None
+
+
+def space(*pages):
+    return {'space_key': 'ENG', 'name': 'Engineering',
+            'sampled_pages': [{'id': page_id, 'title': page_id, 'body': body} for page_id, body in pages]}
+
+
+def test_unchanged_pages_are_skipped(uploader, tmp_path):
+    client = FakeClient()
+    with ProcessedLedger(str(tmp_path / 'ledger.sqlite'), 'open-webui:KB:txt') as ledger:
+        def upload(data):
+            return uploader.upload_confluence_space(client, data, 'KB', format_choice='txt', ledger=ledger)
+
+        assert upload(space(('1', '<p>one</p>'), ('2', '<p>two</p>'), ('3', '<p>three</p>'))) == (3, False)
+
+        # Page 2 edited, page 3 deleted: only page 2 is uploaded again, and the stale documents go
+        client.uploads.clear()
+        assert upload(space(('1', '<p>one</p>'), ('2', '<p>two, edited</p>'))) == (2, False)
+        assert client.uploads == ['ENG-2-TEXT']
+        assert sorted(client.files.values()) == ['ENG-1-TEXT.txt', 'ENG-2-TEXT.txt']
+        assert sorted(ledger.hashes('ENG')) == ['1', '2']
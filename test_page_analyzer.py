@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/page_analyzer.py: one parse gives the same artifacts as the separate passes
+"""
+import pytest
+
+import extract_sql_from_pickles
+from conftest import BODY
+from utils import html_cleaner, page_analyzer
+from utils.change_ledger import set_body_hash
+from utils.html_cleaner import clean_confluence_html
+from utils.page_analyzer import PageAnalyzer, analyze_page, default_artifacts
+from utils.sql_extraction import extract_all_sql_from_page
+from utils.text_cache import TextCache
+
+
+def test_artifacts_match_separate_passes(bodies):
+    for body in bodies:
+        analysis = analyze_page(body, ('text', 'sql'))
+        assert analysis['text'] == clean_confluence_html(body)
+        assert analysis['sql'] == extract_all_sql_from_page(body)
+
+
+def test_all_artifacts_from_one_parse(monkeypatch):
+    parses = []
+    original = page_analyzer.BeautifulSoup
+
+    def counting(*args, **kwargs):
+        parses.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(page_analyzer, 'BeautifulSoup', counting)
+    artifacts = ('text', 'sql', 'links', 'macros', 'attachments')
+    analysis = analyze_page(BODY, artifacts)
+    assert len(parses) == 1
+    assert set(analysis) == set(artifacts)
+
+
+def test_links_macros_attachments():
+    analysis = analyze_page(BODY, ('links', 'macros', 'attachments'))
+    assert analysis['links'] == [
+        {'kind': 'url', 'target': 'https://example.com/doc', 'space_key': ''},
+        {'kind': 'page', 'target': 'Runbook', 'space_key': 'OPS'},
+        {'kind': 'space', 'target': 'DEV', 'space_key': 'DEV'},
+    ]
+    assert analysis['macros'] == {'view-file': 1, 'info': 2, 'code': 1}
+    assert analysis['attachments'] == [
+        {'filename': 'diagram.png', 'page_title': ''},
+        {'filename': 'spec.pdf', 'page_title': 'Specs'},
+    ]
+
+
+def test_lxml_text(bodies):
+    pytest.importorskip('lxml')
+    for body in bodies:
+        assert analyze_page(body, ('text', 'links'), cleaner='lxml')['text'] == clean_confluence_html(body)
+
+
+def test_markdown_artifact():
+    pytest.importorskip('html2text')
+    analysis = analyze_page(BODY, ('text', 'markdown'))
+    assert analysis['markdown'] == page_analyzer.html_to_markdown_text(analysis['text'])
+
+
+def test_empty_and_unknown():
+    assert analyze_page('', ('text', 'sql', 'macros')) == {'text': '', 'sql': [], 'macros': {}}
+    assert analyze_page({'storage': {'value': '<p>x</p>'}}, ('text',)) == {'text': 'x'}
+    with pytest.raises(ValueError):
+        analyze_page(BODY, ('pdf',))
+    assert 'markdown' not in default_artifacts() or page_analyzer.html2text is not None
+
+
+def test_cache_by_body_hash():
+    analyzer = PageAnalyzer(('text',), max_bodies=2)
+    first = set_body_hash({'id': '1', 'body': BODY})
+    same_body = set_body_hash({'id': '2', 'body': BODY})
+    assert analyzer.analyze_page(first) is analyzer.analyze_page(same_body)
+    assert (analyzer.parses, analyzer.hits) == (1, 1)
+
+    # A stored body_hash is trusted, so the body is not hashed again
+    assert analyzer.artifact({'body': '<p>other</p>', 'body_hash': first['body_hash']}, 'text') == clean_confluence_html(BODY)
+
+    # Missing artifacts are added with one more parse
+    assert analyzer.artifact(first, 'macros')['code'] == 1
+    assert analyzer.parses == 2
+
+    analyzer.analyze('<p>b</p>')
+    analyzer.analyze('<p>c</p>')
+    assert len(analyzer) == 2 and analyzer.evictions == 1
+    assert 'lookups' in analyzer.summary()
+
+
+def test_extract_space_sql_reads_sql_artifact():
+    extract_sql_from_pickles._SQL_ANALYZERS.clear()
+    pages = [set_body_hash({'id': str(i), 'title': f'P{i}', 'body': BODY}) for i in range(3)]
+    extracted = extract_sql_from_pickles.extract_space_sql({'space_key': 'S', 'sampled_pages': pages})
+    assert [page_id for page_id, _, _, _ in extracted['pages']] == ['0', '1', '2']
+    assert extracted['pages'][0][3] == extract_all_sql_from_page(BODY)
+    analyzer = extract_sql_from_pickles.sql_analyzer()
+    assert (analyzer.parses, analyzer.hits) == (1, 2)
+
+
+def test_analyses_persist_in_text_cache(tmp_path, bodies):
+    path = str(tmp_path / 'text_cache.sqlite')
+    artifacts = ('text', 'sql', 'links', 'macros', 'attachments')
+    with TextCache(path) as cache:
+        first = PageAnalyzer(artifacts, text_cache=cache)
+        expected = [dict(first.analyze(body)) for body in bodies]
+        assert first.parses == len(set(bodies))
+
+    with TextCache(path) as cache:
+        # Another run: nothing is parsed, and the cleaners read the same text entries
+        second = PageAnalyzer(artifacts, text_cache=cache)
+        assert [second.analyze(body) for body in bodies] == expected
+        assert second.parses == 0 and second.loads == len(set(bodies))
+        assert cache.text(BODY) == expected[-1]['text']
+        # SQL found with the plain-text scan is kept apart
+        plain = PageAnalyzer(('sql',), scan_plain_text=True, text_cache=cache)
+        plain.analyze(BODY)
+        assert plain.parses == 1
+
+
+def test_mega_page_text_matches_the_streaming_cleaner(monkeypatch, tmp_path):
+    # Over STREAM_MIN_CHARS the cleaners stream the body and split oversized tables; the
+    # analyzer's text (and what it stores in the shared TextCache entries) must be the same
+    rows = ''.join(f'<tr><td>row {i}</td><td>value {i}</td></tr>' for i in range(30000))
+    body = '<p>intro</p><table>' + rows + '</table>'
+    assert len(body) > html_cleaner.STREAM_MIN_CHARS
+    expected = clean_confluence_html(body)
+    assert expected.count('[TABLE_START]') > 1
+
+    parses = []
+    original = page_analyzer.BeautifulSoup
+
+    def counting(*args, **kwargs):
+        parses.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(page_analyzer, 'BeautifulSoup', counting)
+    assert analyze_page(body, ('text',))['text'] == expected
+    assert not parses
+
+    with TextCache(str(tmp_path / 'text_cache.sqlite')) as cache:
+        PageAnalyzer(('text', 'macros'), text_cache=cache).analyze(body)
+        assert cache.text(body) == expected
+
+
+def test_extract_space_sql_with_text_cache(tmp_path):
+    path = str(tmp_path / 'text_cache.sqlite')
+    pages = [set_body_hash({'id': '1', 'title': 'P1', 'body': BODY})]
+    for _ in range(2):
+        # A fresh process each time: only the text cache carries over
+        extract_sql_from_pickles._SQL_ANALYZERS.clear()
+        extracted = extract_sql_from_pickles.extract_space_sql({'space_key': 'S', 'sampled_pages': pages}, text_cache=path)
+        assert extracted['pages'][0][3] == extract_all_sql_from_page(BODY)
+    analyzer = extract_sql_from_pickles.sql_analyzer(text_cache=path)
+    assert (analyzer.parses, analyzer.loads) == (0, 1)
+    analyzer.text_cache.close()
+    extract_sql_from_pickles._SQL_ANALYZERS.clear()
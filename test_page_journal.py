@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/page_journal.py
+"""
+import os
+
+from utils.page_journal import PageJournal, same_page_version
+
+
+def test_journal_round_trip_and_remove(tmp_path):
+    path = str(tmp_path / 'SPACE.journal')
+    journal = PageJournal(path)
+    journal.append({'id': '1', 'updated': 'a', 'update_count': 1, 'body': 'one'})
+    journal.append({'id': '2', 'updated': 'b', 'update_count': 1, 'body': 'two'})
+    journal.append({'id': '1', 'updated': 'c', 'update_count': 2, 'body': 'one v2'})
+    journal.close()
+
+    pages = PageJournal(path).load()
+    assert sorted(pages) == ['1', '2']
+    assert pages['1']['body'] == 'one v2'
+
+    journal.remove()
+    assert not os.path.exists(path)
+
+
+def test_torn_tail_is_dropped_and_appends_continue(tmp_path):
+    path = str(tmp_path / 'SPACE.journal')
+    journal = PageJournal(path)
+    journal.append({'id': '1', 'body': 'one'})
+    journal.close()
+    good_size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'\x80\x04\x95garbage')  # a record cut short by a crash
+
+    journal = PageJournal(path)
+    assert list(journal.load()) == ['1']
+    assert os.path.getsize(path) == good_size
+    journal.append({'id': '2', 'body': 'two'})
+    journal.close()
+    assert sorted(PageJournal(path).load()) == ['1', '2']
+
+
+def test_same_page_version():
+    journaled = {'id': '1', 'updated': '2024-01-01T00:00:00.000Z', 'update_count': 3, 'body': 'x'}
+    assert same_page_version(journaled, {'id': '1', 'updated': '2024-01-01T00:00:00.000Z', 'update_count': 3})
+    assert not same_page_version(journaled, {'id': '1', 'updated': '2024-02-01T00:00:00.000Z', 'update_count': 4})
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/pickle_catalog.py
+"""
+import json
+import os
+import pickle
+
+import pytest
+
+import utils.streaming_pickle as streaming_pickle
+from utils.pickle_catalog import CATALOG_FILENAME, PickleCatalog, catalog_page_count, load_catalog_entries
+from utils.streaming_pickle import dump_space
+
+
+def space(key, count, total=None):
+    pages = [{'id': str(i), 'updated': f'2023-01-{i + 1:02d}T10:00:00.000Z', 'update_count': 1, 'body': 'é' * 10}
+             for i in range(count)]
+    return {'space_key': key, 'name': f'Space {key}', 'sampled_pages': pages, 'total_pages_in_space': total or count}
+
+
+def test_writer_records_entry_and_readers_skip_unpickling(tmp_path, monkeypatch):
+    dump_space(space('AAA', 3, total=40), str(tmp_path / 'AAA.pkl'))
+    with open(tmp_path / CATALOG_FILENAME) as f:
+        entry = json.load(f)['spaces']['AAA.pkl']
+    assert entry['space_key'] == 'AAA' and entry['name'] == 'Space AAA'
+    assert entry['sampled_pages'] == 3 and entry['total_pages_in_space'] == 40
+    assert entry['body_bytes'] == 3 * 20
+    assert entry['min_updated'] < entry['avg_updated'] < entry['max_updated']
+
+    def no_unpickling(*args, **kwargs):
+        raise AssertionError('pickle should not be loaded')
+    monkeypatch.setattr(streaming_pickle, 'load_space', no_unpickling)
+    entries = load_catalog_entries(str(tmp_path))
+    assert [e['space_key'] for e in entries] == ['AAA']
+
+
+def test_missing_and_stale_entries_are_rebuilt(tmp_path):
+    with open(tmp_path / 'BBB.pkl', 'wb') as f:
+        pickle.dump(space('BBB', 2), f)  # written without the catalog
+    with open(tmp_path / 'CCC.pkl', 'wb') as f:
+        pickle.dump([{'id': '1', 'version': {'when': '2022-05-01T00:00:00Z', 'number': 2}}], f)
+    with open(tmp_path / 'DDD.pkl', 'wb') as f:
+        pickle.dump({'space_key': 'DDD', 'status': 'processing'}, f)
+
+    entries = {e['file']: e for e in load_catalog_entries(str(tmp_path))}
+    assert entries['BBB.pkl']['format'] == 'space' and entries['BBB.pkl']['sampled_pages'] == 2
+    assert entries['CCC.pkl']['format'] == 'pages' and entries['CCC.pkl']['dated_pages'] == 1
+    assert entries['DDD.pkl']['format'] == 'placeholder'
+    fingerprint = entries['BBB.pkl']['fingerprint']
+
+    # Rewriting a pickle outside the catalog makes its entry stale; readers notice and rebuild it
+    with open(tmp_path / 'BBB.pkl', 'wb') as f:
+        pickle.dump(space('BBB', 5), f)
+    os.remove(tmp_path / 'CCC.pkl')
+    entries = {e['file']: e for e in load_catalog_entries(str(tmp_path))}
+    assert entries['BBB.pkl']['sampled_pages'] == 5
+    assert entries['BBB.pkl']['fingerprint'] != fingerprint
+    assert set(PickleCatalog(str(tmp_path))._entries) == {'BBB.pkl', 'DDD.pkl'}
+
+
+def test_unreadable_pickles_are_reported(tmp_path):
+    (tmp_path / 'BAD.pkl').write_bytes(b'not a pickle')
+    errors = []
+    assert load_catalog_entries(str(tmp_path), on_error=lambda name, e: errors.append(name)) == []
+    assert errors == ['BAD.pkl']
+
+
+@pytest.mark.parametrize('fields, expected', [
+    ({'sampled_pages': 4, 'total_pages': None}, 4),
+    ({'sampled_pages': 4, 'total_pages': 90}, 90),
+])
+def test_catalog_page_count(fields, expected):
+    assert catalog_page_count(fields) == expected
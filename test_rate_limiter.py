@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/rate_limiter.py
+"""
+import time
+
+from utils.rate_limiter import AdaptiveRateLimiter, RECOVERY_STEP, RECOVERY_WINDOW
+
+
+def test_throttle_halves_rate_and_counts():
+    limiter = AdaptiveRateLimiter(initial_rate=10, min_rate=1, max_rate=50)
+    limiter.on_throttled()
+    assert limiter.rate == 5
+    limiter.on_throttled()
+    assert limiter.rate == 2.5
+    assert limiter.stats()['throttle_count'] == 2
+    assert 'throttled=2' in limiter.summary()
+
+
+def test_rate_never_drops_below_minimum():
+    limiter = AdaptiveRateLimiter(initial_rate=2, min_rate=1, max_rate=50)
+    for _ in range(5):
+        limiter.on_throttled()
+    assert limiter.rate == 1
+
+
+def test_recovers_after_clean_window():
+    limiter = AdaptiveRateLimiter(initial_rate=10, min_rate=1, max_rate=11)
+    for _ in range(RECOVERY_WINDOW):
+        limiter.on_success(0.05)
+    assert limiter.rate == 11
+    for _ in range(RECOVERY_WINDOW):
+        limiter.on_success(0.05)
+    assert limiter.rate == 11  # capped at max_rate
+
+
+def test_burst_of_429s_lowers_rate_once():
+    limiter = AdaptiveRateLimiter(initial_rate=20, min_rate=0.5, max_rate=50)
+    sent_at = time.monotonic()
+    # Eight workers' requests were in flight when the server started throttling
+    for _ in range(8):
+        limiter.on_throttled(retry_after=0.01, sent_at=sent_at)
+    assert limiter.rate == 10
+    assert limiter.stats()['throttle_count'] == 8
+    # A request sent after the decrease that is throttled again lowers the rate further
+    limiter.on_throttled(retry_after=0.01, sent_at=time.monotonic())
+    assert limiter.rate == 5
+
+
+def test_recovery_is_additive_and_quick_from_the_floor():
+    limiter = AdaptiveRateLimiter(initial_rate=0.5, min_rate=0.5, max_rate=50)
+    # At low rates a window is about one second's worth of responses
+    limiter.on_success(0.05)
+    assert limiter.rate == 0.5 + RECOVERY_STEP
+    for _ in range(200):
+        limiter.on_success(0.05)
+    assert limiter.rate >= 20
+
+
+def test_degraded_latency_lowers_rate():
+    limiter = AdaptiveRateLimiter(initial_rate=10, min_rate=1, max_rate=50)
+    limiter.on_success(0.01)
+    for _ in range(RECOVERY_WINDOW * 2):
+        limiter.on_success(1.0)
+    assert limiter.rate < 10
+
+
+def test_retry_after_pauses_acquire():
+    limiter = AdaptiveRateLimiter(initial_rate=1000, min_rate=1, max_rate=1000)
+    limiter.on_throttled(retry_after=0.2)
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.19
+
+
+def test_acquire_paces_requests():
+    limiter = AdaptiveRateLimiter(initial_rate=20, min_rate=20, max_rate=20)
+    started = time.monotonic()
+    for _ in range(30):
+        limiter.acquire()
+    # The first token is available immediately, the other 29 arrive at 20/s
+    assert time.monotonic() - started >= 1.3
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/split_space.py
+"""
+import os
+import pickle
+
+import pytest
+
+import utils.split_space as split_space
+from utils.split_space import SplitSpace, convert_pickle_to_split, convert_split_to_pickle, find_split_spaces
+
+
+def space(key):
+    return {
+        'space_key': key,
+        'name': f'Space {key}',
+        'sampled_pages': [
+            {'id': '1', 'title': 'Text', 'updated': '2023-01-01T10:00:00.000Z', 'body': '<p>héllo</p>'},
+            {'id': '2', 'title': 'Storage', 'body': {'storage': {'value': '<p>stored</p>'}}},
+            {'id': '3', 'title': 'Empty', 'body': ''},
+            {'id': '4', 'title': 'No body'},
+        ],
+        'total_pages_in_space': 10,
+    }
+
+
+def test_round_trip_preserves_legacy_pickle(tmp_path):
+    original = space('AAA')
+    with open(tmp_path / 'AAA.pkl', 'wb') as f:
+        pickle.dump(original, f)
+
+    meta_path = convert_pickle_to_split(str(tmp_path / 'AAA.pkl'))
+    assert find_split_spaces(str(tmp_path)) == [meta_path]
+
+    back = convert_split_to_pickle(meta_path, str(tmp_path / 'BACK.pkl'))
+    with open(back, 'rb') as f:
+        restored = pickle.load(f)
+    assert restored == original
+    assert list(restored) == list(original)
+
+
+def test_metadata_loads_without_bodies_and_bodies_load_lazily(tmp_path):
+    meta_path = str(tmp_path / 'AAA.meta')
+    split_space.write_split_space(space('AAA'), meta_path)
+
+    with SplitSpace(meta_path) as split:
+        assert split.space_key == 'AAA' and split.header['total_pages_in_space'] == 10
+        assert [page['title'] for page in split.pages] == ['Text', 'Storage', 'Empty', 'No body']
+        assert all('body' not in page for page in split.pages)
+        assert split._file is None
+
+        assert split.body_by_id('2') == {'storage': {'value': '<p>stored</p>'}}
+        assert split.body(0) == '<p>héllo</p>'
+        assert split.body(2) == ''
+        assert split.body(3) is None and 'body' not in split.page(3)
+        assert split.body_by_id('missing') is None
+
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    data = space('AAA')
+    data['sampled_pages'] += [{'id': '5', 'title': 'Copy', 'body': '<p>héllo</p>'},
+                              {'id': '6', 'title': 'Storage copy', 'body': {'storage': {'value': '<p>stored</p>'}}}]
+    meta_path = str(tmp_path / 'AAA.meta')
+    split_space.write_split_space(data, meta_path)
+
+    with SplitSpace(meta_path) as split:
+        assert os.path.getsize(split.bodies_path) == len('<p>héllo</p>'.encode('utf-8')) + len(split.raw_body(1)[1])
+        assert split.body_by_id('5') == '<p>héllo</p>'
+        assert split.body_by_id('6') == {'storage': {'value': '<p>stored</p>'}}
+        assert split.to_space_dict() == data
+
+
+def test_mmap_reads_match_file_reads(tmp_path):
+    meta_path = str(tmp_path / 'AAA.meta')
+    split_space.write_split_space(space('AAA'), meta_path)
+    with SplitSpace(meta_path) as plain, SplitSpace(meta_path, use_mmap=True) as mapped:
+        assert [mapped.page(i) for i in range(len(mapped))] == [plain.page(i) for i in range(len(plain))]
+
+    # Nothing but empty bodies: the bodies file is empty and cannot be mapped
+    empty = {'space_key': 'E', 'name': 'E', 'sampled_pages': [{'id': '1', 'body': ''}]}
+    split_space.write_split_space(empty, str(tmp_path / 'E.meta'))
+    with SplitSpace(str(tmp_path / 'E.meta'), use_mmap=True) as mapped:
+        assert mapped.body(0) == ''
+
+
+def test_zstd_compressed_bodies_read_back_transparently(tmp_path):
+    pytest.importorskip('zstandard')
+    original = space('AAA')
+    original['sampled_pages'] += [{'id': str(i), 'title': f'Page {i}',
+                                   'body': f'<ac:structured-macro ac:name="info"><p>page {i}</p></ac:structured-macro>' * 20}
+                                  for i in range(10, 200)]
+    meta_path = str(tmp_path / 'AAA.meta')
+    split_space.write_split_space(original, meta_path, compression='zstd')
+
+    with SplitSpace(meta_path, use_mmap=True) as split:
+        assert split.compression == 'zstd'
+        assert split.raw_body(10)[0] == split_space.BODY_ZSTD_TEXT
+        assert split.to_space_dict() == original
+        raw = sum(len(split.body_bytes(i)[1]) for i in range(len(split)))
+        assert os.path.getsize(split.bodies_path) < raw / 4
+
+
+def test_rewrite_switches_bodies_file_and_removes_old_one(tmp_path):
+    meta_path = str(tmp_path / 'AAA.meta')
+    split_space.write_split_space(space('AAA'), meta_path)
+    first = SplitSpace(meta_path).bodies_path
+
+    updated = space('AAA')
+    updated['sampled_pages'][0]['body'] = '<p>new</p>'
+    split_space.write_split_space(updated, meta_path)
+
+    with SplitSpace(meta_path) as split:
+        assert split.bodies_path != first
+        assert split.body(0) == '<p>new</p>'
+    assert not os.path.exists(first)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_failed_write_leaves_existing_space_untouched(tmp_path):
+    meta_path = str(tmp_path / 'AAA.meta')
+    split_space.write_split_space(space('AAA'), meta_path)
+    before = sorted(os.listdir(tmp_path))
+
+    with pytest.raises(RuntimeError):
+        with split_space.SplitSpaceWriter(meta_path, space('AAA')) as writer:
+            writer.append({'id': '9', 'body': 'partial'})
+            raise RuntimeError('crash')
+
+    assert sorted(os.listdir(tmp_path)) == before
+    with SplitSpace(meta_path) as split:
+        assert len(split) == 4
+
+
+def test_reads_version_1_and_rejects_newer_versions(tmp_path):
+    meta_path = str(tmp_path / 'AAA.meta')
+    split_space.write_split_space(space('AAA'), meta_path)
+    with open(meta_path, 'rb') as f:
+        meta = pickle.load(f)
+    assert meta['version'] == split_space.FORMAT_VERSION
+
+    meta['version'] = 1
+    with open(meta_path, 'wb') as f:
+        pickle.dump(meta, f)
+    with SplitSpace(meta_path) as split:
+        assert split.body(0) == '<p>héllo</p>'
+
+    meta['version'] = split_space.FORMAT_VERSION + 1
+    with open(meta_path, 'wb') as f:
+        pickle.dump(meta, f)
+    with pytest.raises(ValueError, match='unsupported split space version'):
+        SplitSpace(meta_path)
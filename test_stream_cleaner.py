@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/stream_cleaner.py: mega-pages cleaned piece by piece give the whole-body text
+"""
+import re
+from collections import Counter
+
+import pytest
+
+from conftest import BODY, mock_bodies
+from utils import html_cleaner
+from utils.stream_cleaner import iter_pieces, stream_text
+
+
+@pytest.fixture
+def bodies():
+    # Mega-pages, so bodies span many pieces
+    return mock_bodies(pages=20, body_bytes=20000, seed=5) + [BODY]
+
+
+@pytest.mark.parametrize('piece_chars', [200, 5000])
+def test_pieces_give_whole_body_text(bodies, piece_chars):
+    for body in bodies:
+        result = stream_text(body, piece_chars=piece_chars, cleaner='bs4')
+        assert result.text == html_cleaner._clean_with_bs4(body)
+        assert result.complete and result.coverage == 1.0
+
+
+def test_lxml_pieces(bodies):
+    pytest.importorskip('lxml')
+    for body in bodies:
+        assert stream_text(body, piece_chars=200, cleaner='lxml').text == html_cleaner.clean_confluence_html_lxml(body)
+
+
+def test_pieces_cover_the_body():
+    body = '<p>a</p><!-- <p> --><ac:structured-macro ac:name="code"><ac:plain-text-body><![CDATA[<b>]]>' \
+           '</ac:plain-text-body></ac:structured-macro><br/><p title="x>y">b</p>tail'
+    pieces = list(iter_pieces(body, piece_chars=1))
+    assert ''.join(piece for _, piece in pieces) == body
+    # Cut after each top-level element; never inside the comment, the CDATA or the attribute
+    assert [end for end, _ in pieces] == [8, body.index('<br/>'), body.index('<p title'), body.index('tail'), len(body)]
+
+
+def test_oversized_element_is_cut_between_rows():
+    rows = ''.join(f'<tr><td>row{i}</td><td><p>cell{i}</p></td></tr>' for i in range(2000))
+    body = f'<h2>Log</h2><table><tbody><tr><th>A</th><th>B</th></tr>{rows}</tbody></table><p>after</p>'
+    result = stream_text(body, piece_chars=2000, cleaner='bs4')
+    assert result.pieces > 5
+    # Every piece after a cut reopens the table, so only table markers are added
+    whole = Counter(re.findall(r'\w+', html_cleaner._clean_with_bs4(body)))
+    added = Counter(re.findall(r'\w+', result.text)) - whole
+    assert not whole - Counter(re.findall(r'\w+', result.text))
+    assert set(added) == {'TABLE_START', 'TABLE_END'}
+    assert all(piece.startswith('<table><tbody><tr>') for _, piece in list(iter_pieces(body, 2000))[1:-1])
+
+
+def test_time_budget_reports_coverage():
+    body = ('<p>' + 'word ' * 50 + '</p>') * 4000
+    result = stream_text(body, time_budget=0, piece_chars=1000)
+    assert not result.complete
+    assert result.pieces == 1 and result.processed_chars < result.total_chars
+    assert 0 < result.coverage < 0.01
+    assert stream_text('').complete
+
+
+def test_clean_confluence_html_streams_large_bodies(bodies, monkeypatch):
+    expected = [html_cleaner.clean_confluence_html(body) for body in bodies]
+    monkeypatch.setattr(html_cleaner, 'STREAM_MIN_CHARS', 1000)
+    streamed = []
+    original = stream_text
+
+    def counting(*args, **kwargs):
+        streamed.append(args[0])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr('utils.stream_cleaner.stream_text', counting)
+    assert [html_cleaner.clean_confluence_html(body) for body in bodies] == expected
+    assert len(streamed) == len(bodies)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/streaming_pickle.py
+"""
+import os
+import pickle
+import struct
+import tracemalloc
+import uuid
+
+import pytest
+
+from utils.change_ledger import body_hash, body_storage_value
+from utils import streaming_pickle
+from utils.pickle_catalog import CATALOG_FILENAME
+from utils.streaming_pickle import (BUFFERS_SUFFIX, BodyBuffer, StreamingSpaceWriter, buffers_path, dump_space,
+                                    load_space)
+
+
+def test_streamed_pickle_loads_as_regular_space_dict(tmp_path):
+    path = str(tmp_path / 'SPACE.pkl')
+    shared = [{'id': 'att'}]
+    pages = [{'id': str(i), 'title': 'same', 'body': '<p>' * i, 'attachments': shared} for i in range(50)]
+    with StreamingSpaceWriter(path, {'space_key': 'SPACE', 'name': 'Space'}) as writer:
+        for page in pages:
+            writer.append(page)
+        writer.commit({'total_pages_in_space': 50})
+
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+    assert list(data) == ['space_key', 'name', 'sampled_pages', 'total_pages_in_space']
+    assert data['sampled_pages'] == pages
+    assert data['total_pages_in_space'] == 50
+    assert sorted(os.listdir(tmp_path)) == sorted(['SPACE.pkl', CATALOG_FILENAME])
+
+
+def test_error_before_commit_leaves_existing_file_untouched(tmp_path):
+    path = str(tmp_path / 'SPACE.pkl')
+    dump_space({'space_key': 'SPACE', 'sampled_pages': [{'id': '1'}], 'total_pages_in_space': 1}, path)
+    with pytest.raises(RuntimeError):
+        with StreamingSpaceWriter(path, {'space_key': 'SPACE'}) as writer:
+            writer.append({'id': '2'})
+            raise RuntimeError('fetch failed')
+    with open(path, 'rb') as f:
+        assert pickle.load(f)['sampled_pages'] == [{'id': '1'}]
+    assert sorted(os.listdir(tmp_path)) == sorted(['SPACE.pkl', CATALOG_FILENAME])
+
+
+def test_dump_space_keeps_key_order_and_extra_keys(tmp_path):
+    path = str(tmp_path / 'SPACE.pkl')
+    space = {'space_key': 'S', 'name': 'N', 'sampled_pages': [{'id': '1', 'body': 'x'}], 'total_pages_in_space': 7, 'extra': (1, 2)}
+    dump_space(space, path)
+    with open(path, 'rb') as f:
+        loaded = pickle.load(f)
+    assert loaded == space
+    assert list(loaded) == list(space)
+
+
+def test_out_of_band_bodies_load_lazily_and_round_trip(tmp_path):
+    path = str(tmp_path / 'SPACE.pkl')
+    big = '<p>caf\u00e9</p>' * 100
+    space = {'space_key': 'S', 'sampled_pages': [{'id': '1', 'body': big, 'title': 't'}, {'id': '2', 'body': '<p>small</p>'}],
+             'total_pages_in_space': 2}
+    dump_space(space, path, out_of_band_min_bytes=1000)
+    assert os.path.exists(buffers_path(path))
+    with open(path, 'rb') as f, pytest.raises(pickle.UnpicklingError):
+        pickle.load(f)
+
+    for use_mmap in (True, False):
+        loaded = load_space(path, use_mmap=use_mmap)
+        first, second = loaded['sampled_pages']
+        assert isinstance(first['body'], BodyBuffer) and list(first) == ['id', 'body', 'title']
+        assert body_storage_value(first['body']) == big and body_hash(first['body']) == body_hash(big)
+        assert second['body'] == '<p>small</p>'
+        # Copies made with pickle (e.g. for worker processes) hold plain strings
+        assert pickle.loads(pickle.dumps(first))['body'] == big
+
+    # Rewriting in place keeps bodies out of band; writing without the option inlines them again
+    dump_space(load_space(path), path, out_of_band_min_bytes=1000)
+    assert isinstance(load_space(path)['sampled_pages'][0]['body'], BodyBuffer)
+    dump_space(load_space(path), path)
+    assert buffers_path(path) is None
+    assert sorted(os.listdir(tmp_path)) == sorted(['SPACE.pkl', CATALOG_FILENAME])
+    with open(path, 'rb') as f:
+        assert pickle.load(f) == space
+
+
+def test_rewrite_leaves_mapped_buffers_of_previous_version_intact(tmp_path):
+    path = str(tmp_path / 'SPACE.pkl')
+    old_body, new_body = '<p>old</p>' * 200, '<p>new</p>' * 300
+    dump_space({'space_key': 'S', 'sampled_pages': [{'id': '1', 'body': old_body}]}, path, out_of_band_min_bytes=1000)
+    old_buffers = buffers_path(path)
+    with open(path, 'rb') as f:
+        old_pickle = f.read()
+    held = load_space(path)
+
+    dump_space({'space_key': 'S', 'sampled_pages': [{'id': '1', 'body': new_body}]}, path, out_of_band_min_bytes=1000)
+    assert buffers_path(path) != old_buffers
+    assert os.path.basename(buffers_path(path)).startswith('SPACE.pkl.') and buffers_path(path).endswith(BUFFERS_SUFFIX)
+    # The mapped buffers of the earlier load were not overwritten
+    assert body_storage_value(held['sampled_pages'][0]['body']) == old_body
+    assert body_storage_value(load_space(path)['sampled_pages'][0]['body']) == new_body
+    # The new buffers file is never paired with the old pickle
+    assert buffers_path(path, old_pickle) == old_buffers
+
+
+def test_loads_buffers_file_named_after_pickle_only(tmp_path):
+    # Pickles written before buffers files were named by their token
+    path = str(tmp_path / 'SPACE.pkl')
+    token = uuid.uuid4().hex
+    data = ('<p>legacy</p>' * 100).encode('utf-8')
+    space = {'space_key': 'S', 'body_buffers': token, 'sampled_pages': [{'id': '1', 'body': pickle.PickleBuffer(data)}]}
+    with open(path, 'wb') as f:
+        f.write(pickle.dumps(space, protocol=5, buffer_callback=lambda buffer: None))
+    with open(path + BUFFERS_SUFFIX, 'wb') as f:
+        f.write(streaming_pickle._BUFFERS_MAGIC + token.encode('ascii') + b'\n' + struct.pack('<Q', len(data)) + data)
+    assert buffers_path(path) == path + BUFFERS_SUFFIX
+    assert bytes(load_space(path)['sampled_pages'][0]['body']) == data
+
+    space['body_buffers'] = uuid.uuid4().hex
+    with open(path, 'wb') as f:
+        f.write(pickle.dumps(space, protocol=5, buffer_callback=lambda buffer: None))
+    with pytest.raises(pickle.UnpicklingError):
+        load_space(path)
+
+
+def test_plain_pickle_loads_without_a_second_copy(tmp_path):
+    path = str(tmp_path / 'SPACE.pkl')
+    with open(path, 'wb') as f:
+        pickle.dump({'space_key': 'SPACE', 'sampled_pages': [{'id': str(i), 'body': 'x' * 20000 + str(i)}
+                                                             for i in range(500)]}, f)
+    size = os.path.getsize(path)
+    tracemalloc.start()
+    try:
+        data = load_space(path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert len(data['sampled_pages']) == 500
+    # The loaded objects themselves take about the pickle's size; the file is never held whole as well
+    assert peak < 1.5 * size
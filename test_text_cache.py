@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/text_cache.py: cleaned texts by body hash, LRU size cap and hit statistics
+"""
+import os
+import pickle
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import warm_text_cache
+from utils import batch_cleaner, html_cleaner, text_cache
+from utils.batch_cleaner import BatchCleaner, clean_many
+from utils.change_ledger import body_hash, set_body_hash
+from utils.html_cleaner import clean_confluence_html
+from utils.text_cache import TextCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with TextCache(str(tmp_path / 'text_cache.sqlite')) as cache:
+        yield cache
+
+
+@pytest.fixture
+def counting_clean(monkeypatch):
+    cleaned = []
+    original = batch_cleaner.clean_body
+
+    def counting(body, mode='text', cleaner=None):
+        cleaned.append(body)
+        return original(body, mode, cleaner)
+
+    monkeypatch.setattr(batch_cleaner, 'clean_body', counting)
+    return cleaned
+
+
+def test_get_and_put(cache):
+    assert cache.get('abc') is None
+    cache.put('abc', 'some text')
+    assert cache.get('abc') == 'some text'
+    # Modes are kept apart
+    assert cache.get('abc', 'plain') is None
+    assert cache.get_many(['abc', 'abc', 'def']) == {'abc': 'some text'}
+    assert (cache.stats['hits'], cache.stats['misses']) == (2, 3)
+    assert len(cache) == 1
+
+
+def test_batch_cleaner_cleans_each_body_once(cache, bodies, counting_clean):
+    expected = [clean_confluence_html(body) for body in bodies]
+    with BatchCleaner(workers=1, cache=cache) as batch:
+        assert batch.clean(bodies + ['', bodies[0]]) == expected + ['', expected[0]]
+        assert len(counting_clean) == len(set(bodies))
+        assert batch.clean(bodies) == expected
+    assert len(counting_clean) == len(set(bodies))
+    assert cache.stats['hits'] == len(set(bodies))
+
+    # Stored body hashes are trusted
+    digests = [body_hash(body) for body in bodies]
+    assert clean_many(['<p>not read</p>'] * len(bodies), workers=1, cache=cache, digests=digests) == expected
+
+
+def test_text_of_one_body(cache, bodies, counting_clean):
+    assert cache.text(bodies[0], 'plain') == batch_cleaner.plain_text(bodies[0])
+    assert cache.text({'storage': {'value': bodies[0]}}, 'plain') == batch_cleaner.plain_text(bodies[0])
+    assert len(counting_clean) == 1
+    assert cache.text('') == ''
+
+
+def test_least_recently_used_are_evicted(tmp_path, monkeypatch):
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr(text_cache, 'time', SimpleNamespace(time=lambda: next(clock)))
+    with TextCache(str(tmp_path / 'small.sqlite'), max_mb=0.01) as cache:
+        text = os.urandom(3000).hex()  # over 3 KB compressed: the fourth text passes the 10 KB cap
+        cache.put('first', text)
+        cache.put('second', text)
+        cache.get('first')
+        cache.put('third', text)
+        cache.put('fourth', text)
+        assert cache.stats['evictions'] >= 1
+        assert cache.get('second') is None
+        assert cache.get('fourth') == text
+
+
+def test_new_cleaner_version_misses(cache, monkeypatch):
+    cache.put('abc', 'old output')
+    monkeypatch.setattr(html_cleaner, 'CLEANER_VERSION', html_cleaner.CLEANER_VERSION + 1)
+    assert cache.get('abc') is None
+    assert cache.prune_stale() == 1
+    assert len(cache) == 0
+
+
+def test_statistics_add_up_across_runs(tmp_path):
+    path = str(tmp_path / 'text_cache.sqlite')
+    for _ in range(2):
+        with TextCache(path) as cache:
+            cache.get('abc')
+            cache.put('abc', 'text')
+            cache.get('abc')
+    with TextCache(path) as cache:
+        assert cache.totals() == {'hits': 3, 'misses': 1, 'stores': 2, 'evictions': 0}
+        assert cache.counts() == {'text': (1, cache.counts()['text'][1])}
+        assert '0 lookups' in cache.summary()
+
+
+def test_warm_cli(tmp_path, bodies, monkeypatch, capsys):
+    pages = [set_body_hash({'id': str(i), 'title': f'P{i}', 'body': body}) for i, body in enumerate(bodies)]
+    with open(tmp_path / 'SP.pkl', 'wb') as f:
+        pickle.dump({'space_key': 'SP', 'name': 'Space', 'sampled_pages': pages}, f)
+
+    monkeypatch.setattr(sys, 'argv', ['warm_text_cache.py', str(tmp_path), '--workers', '1', '--mode', 'text', '--mode', 'plain'])
+    assert warm_text_cache.main() == 0
+    with TextCache(str(tmp_path / 'text_cache.sqlite')) as cache:
+        assert cache.get(pages[0]['body_hash']) == clean_confluence_html(bodies[0])
+        assert cache.get(pages[0]['body_hash'], 'plain') == batch_cleaner.plain_text(bodies[0])
+
+    # A second run finds everything cached
+    assert warm_text_cache.main() == 0
+    assert f"SP: {len(set(bodies))} bodies, 0 cleaned" in capsys.readouterr().out
+
+
+def test_search_index_and_clustering_share_cached_texts(tmp_path, bodies, counting_clean, monkeypatch):
+    pytest.importorskip('whoosh')
+    import explore_clusters
+    monkeypatch.setattr(explore_clusters, 'WHOOSH_INDEX_DIR', str(tmp_path / 'whoosh_index'))
+    path = str(tmp_path / 'text_cache.sqlite')
+    spaces = [{'space_key': 'SP', 'sampled_pages': [set_body_hash({'id': str(i), 'title': f'P{i}', 'body': body})
+                                                    for i, body in enumerate(bodies)]}]
+
+    explore_clusters.preprocess_application_search_index(spaces, workers=1, text_cache=path)
+    assert len(counting_clean) == len(set(bodies))
+    # A second index build and the clustering vectors read every text from the cache
+    explore_clusters.preprocess_application_search_index(spaces, workers=1, text_cache=path)
+    explore_clusters.get_vectors(spaces, workers=1, text_cache=path)
+    assert len(counting_clean) == len(set(bodies))
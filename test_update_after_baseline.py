@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Smoke tests for GENERIC_SCRIPTS/qdrant_confluence_update_after_baseline.py
+"""
+import importlib.util
+import os
+
+import pytest
+
+for _module in ('psycopg2', 'qdrant_client', 'sentence_transformers', 'torch', 'html2text'):
+    pytest.importorskip(_module)
+
+from utils.text_cache import TextCache
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'GENERIC_SCRIPTS', 'qdrant_confluence_update_after_baseline.py')
+BODY = '<h1>Release notes</h1><p>Deployed <strong>v2</strong> to production.</p>'
+
+
+@pytest.fixture(scope='module')
+def sync():
+    spec = importlib.util.spec_from_file_location('qdrant_confluence_update_after_baseline', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize('body', [BODY, {'storage': {'value': BODY}}])
+def test_convert_pages_with_text_cache(sync, tmp_path, body):
+    pages = [{'id': '1', 'title': 'Release', 'body': body}, {'id': '2', 'title': 'Empty', 'body': ''}]
+    with TextCache(str(tmp_path / 'text_cache.sqlite')) as cache:
+        contents = sync.convert_pages(pages, {'html_to_markdown': True}, workers=1, text_cache=cache)
+    assert list(contents) == ['1']
+    assert 'Release notes' in contents['1']
+
+
+def test_convert_pages_without_workers_or_cache(sync):
+    assert sync.convert_pages([{'id': '1', 'body': BODY}], {}, workers=1) == {}
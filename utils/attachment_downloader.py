@@ -0,0 +1,178 @@
+"""Concurrent, resumable attachment downloads for the Confluence harvesting scripts.
+
+Downloads run on a thread pool with a cap on concurrent requests per host. Each file is
+streamed in large chunks to '<target>.part' and only renamed into place once its size
+matches the attachment metadata, so a crash never leaves a truncated file that looks
+finished. An existing .part file is resumed with an HTTP Range request.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+
+DEFAULT_DOWNLOAD_WORKERS = 8
+DEFAULT_PER_HOST_LIMIT = 4
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 120
+# Attempts per file; every retry resumes from what is already in the .part file
+DOWNLOAD_ATTEMPTS = 3
+PART_SUFFIX = '.part'
+
+logger = logging.getLogger(__name__)
+
+
+def expected_attachment_size(attachment):
+    """File size recorded in Confluence attachment metadata, or None if it is not present."""
+    size = (attachment.get('extensions') or {}).get('fileSize')
+    try:
+        return int(size) if size is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class DownloadTask:
+    """One attachment to fetch from url into path, optionally checked against expected_size."""
+
+    def __init__(self, url, path, expected_size=None, context=None):
+        self.url = url
+        self.path = path
+        self.expected_size = expected_size
+        # Caller data (attachment, page id, ...) handed back with the result
+        self.context = context
+
+
+class DownloadResult:
+    """Outcome of a DownloadTask: status is 'downloaded', 'resumed', 'skipped' or 'failed'."""
+
+    def __init__(self, task, status, size=0, error=None):
+        self.task = task
+        self.status = status
+        self.size = size
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status != 'failed'
+
+
+class AttachmentDownloader:
+    """Download many attachments concurrently through a ConfluenceClient."""
+
+    def __init__(self, client, max_workers=DEFAULT_DOWNLOAD_WORKERS, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, timeout=DOWNLOAD_TIMEOUT):
+        self.client = client
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        client.ensure_pool_size(self.max_workers)
+
+    def _host_slot(self, url):
+        host = urlsplit(self.client.url_for(url)).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def download(self, task):
+        """Download one task, resuming a previous partial download if there is one."""
+        if os.path.exists(task.path):
+            size = os.path.getsize(task.path)
+            if task.expected_size is None or size == task.expected_size:
+                return DownloadResult(task, 'skipped', size)
+            logger.warning(f"{task.path} is {size} bytes but metadata says {task.expected_size}; downloading again")
+
+        directory = os.path.dirname(task.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        part_path = task.path + PART_SUFFIX
+        resumed = os.path.exists(part_path) and os.path.getsize(part_path) > 0
+        error = None
+        for _ in range(DOWNLOAD_ATTEMPTS):
+            try:
+                with self._host_slot(task.url):
+                    complete = self._fetch_to_part(task, part_path)
+            except requests.exceptions.HTTPError as e:
+                status_code = e.response.status_code if e.response is not None else None
+                if status_code is not None and 400 <= status_code < 500:
+                    # Missing or forbidden attachments will not appear on a retry
+                    return DownloadResult(task, 'failed', error=str(e))
+                error = str(e)
+                continue
+            except (requests.exceptions.RequestException, OSError) as e:
+                # Keep the .part file: the next attempt continues from where this one stopped
+                error = str(e)
+                continue
+            if not complete:
+                error = f"size mismatch (expected {task.expected_size} bytes)"
+                continue
+            os.replace(part_path, task.path)
+            return DownloadResult(task, 'resumed' if resumed else 'downloaded', os.path.getsize(task.path))
+        return DownloadResult(task, 'failed', error=error)
+
+    def _fetch_to_part(self, task, part_path):
+        """Stream task.url into part_path. Returns True once the .part file holds the whole attachment."""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if task.expected_size is not None and offset == task.expected_size:
+            return True
+        if task.expected_size is not None and offset > task.expected_size:
+            os.remove(part_path)
+            offset = 0
+
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        response = self.client.get(task.url, headers=headers, stream=True, timeout=self.timeout)
+        if response is None:
+            raise requests.exceptions.ConnectionError(f"No response for {task.url}")
+        try:
+            if response.status_code == 416:
+                # Nothing left to fetch from this offset: the .part file already holds the whole
+                # file, or it is longer than the attachment and has to be fetched again
+                if task.expected_size is None:
+                    return True
+                os.remove(part_path)
+                return False
+            response.raise_for_status()
+            if response.status_code == 206:
+                mode = 'ab'
+            else:
+                # The server ignored the Range header and sent the whole file
+                mode = 'wb'
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if chunk:
+                        f.write(chunk)
+        finally:
+            response.close()
+
+        size = os.path.getsize(part_path)
+        if task.expected_size is None or size == task.expected_size:
+            return True
+        if size > task.expected_size:
+            os.remove(part_path)
+        return False
+
+    def download_all(self, tasks, on_result=None):
+        """Download tasks concurrently and return their DownloadResults in task order.
+
+        on_result(result, done_count, total) is called from the calling thread as each download finishes.
+        """
+        results = [None] * len(tasks)
+        if not tasks:
+            return results
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as executor:
+            future_to_index = {executor.submit(self.download, task): i for i, task in enumerate(tasks)}
+            for done, future in enumerate(as_completed(future_to_index), 1):
+                index = future_to_index[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = DownloadResult(tasks[index], 'failed', error=str(e))
+                results[index] = result
+                if on_result is not None:
+                    on_result(result, done, len(tasks))
+        return results
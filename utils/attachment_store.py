@@ -0,0 +1,256 @@
+"""Content-addressed attachment store shared by the attachment downloading scripts.
+
+Every attachment file is stored once under blobs/<aa>/<sha256>, however many spaces or
+pages it is attached to. A SQLite index (index.sqlite in the store directory) maps each
+(space key, page id, attachment id, version) to its blob, so an attachment version that is
+already in the store is never downloaded again. Downloads land in incoming/ first (where
+the resumable downloader keeps its .part files), are hashed and then moved into blobs/,
+or simply dropped when the same content is already stored.
+
+SQLite is used for the index because several worker processes (--workers) write to it at
+the same time; each write is a short transaction.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+from utils.attachment_downloader import DownloadTask, expected_attachment_size
+
+DEFAULT_STORE_DIR = 'attachment_store'
+INDEX_FILENAME = 'index.sqlite'
+HASH_CHUNK_SIZE = 1024 * 1024
+# Seconds a writer waits for another process holding the index lock
+INDEX_BUSY_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    media_type TEXT,
+    stored_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    space_key TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    attachment_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    title TEXT,
+    media_type TEXT,
+    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+    recorded_at TEXT NOT NULL,
+    PRIMARY KEY (space_key, page_id, attachment_id, version)
+);
+CREATE INDEX IF NOT EXISTS attachments_by_id ON attachments (attachment_id, version);
+"""
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file, read in large chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def attachment_version(attachment):
+    """Version number of an attachment from its metadata or download link (1 if neither has one)."""
+    number = (attachment.get('version') or {}).get('number')
+    if number is None:
+        query = parse_qs(urlsplit(attachment.get('_links', {}).get('download', '')).query)
+        number = (query.get('version') or [1])[0]
+    try:
+        return int(number)
+    except (TypeError, ValueError):
+        return 1
+
+
+class StoreItem:
+    """One attachment on one page to bring into the store."""
+
+    def __init__(self, space_key, page_id, attachment, url):
+        self.space_key = space_key
+        self.page_id = str(page_id)
+        self.attachment = attachment
+        self.url = url
+        self.attachment_id = str(attachment.get('id'))
+        self.version = attachment_version(attachment)
+        self.title = attachment.get('title')
+        self.media_type = (attachment.get('extensions') or {}).get('mediaType')
+
+
+class StoreResult:
+    """Outcome of storing a StoreItem.
+
+    status is 'known' (version already in the store, nothing downloaded), 'stored' (new
+    content), 'deduplicated' (downloaded, but identical content was already stored) or 'failed'.
+    """
+
+    def __init__(self, item, status, sha256=None, path=None, size=0, error=None):
+        self.item = item
+        self.status = status
+        self.sha256 = sha256
+        self.path = path
+        self.size = size
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status != 'failed'
+
+    @property
+    def downloaded(self):
+        return self.status in ('stored', 'deduplicated')
+
+
+class AttachmentStore:
+    """Blob directory plus SQLite index; safe to share between threads and processes."""
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.incoming_dir = os.path.join(root, 'incoming')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, INDEX_FILENAME), timeout=INDEX_BUSY_TIMEOUT,
+                                   check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def incoming_path(self, item):
+        return os.path.join(self.incoming_dir, f"{item.attachment_id}-v{item.version}")
+
+    def lookup(self, attachment_id, version):
+        """sha256 of a stored attachment version (from any space or page), or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256 FROM attachments WHERE attachment_id = ? AND version = ? LIMIT 1",
+                (str(attachment_id), int(version))).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row['sha256'])):
+            return None
+        return row['sha256']
+
+    def record(self, item, sha256):
+        """Map an attachment version on a page to a stored blob."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO attachments (space_key, page_id, attachment_id, version, title, media_type, sha256, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (item.space_key, item.page_id, item.attachment_id, item.version, item.title, item.media_type,
+                 sha256, datetime.now().isoformat()))
+
+    def add_file(self, path, item):
+        """Move a downloaded file into the store and index it. Returns (sha256, was_new_content)."""
+        sha256 = file_sha256(path)
+        blob_path = self.blob_path(sha256)
+        is_new = not os.path.exists(blob_path)
+        if is_new:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(path, blob_path)
+        else:
+            os.remove(path)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO blobs (sha256, size, media_type, stored_at) VALUES (?, ?, ?, ?)",
+                             (sha256, os.path.getsize(blob_path), item.media_type, datetime.now().isoformat()))
+        self.record(item, sha256)
+        return sha256, is_new
+
+    def fetch(self, downloader, items, on_result=None):
+        """Bring items into the store, downloading only attachment versions it does not hold yet.
+
+        Returns StoreResults in item order; on_result(result, done_count, total) is called
+        from the calling thread as each item is settled.
+        """
+        results = [None] * len(items)
+        to_download = []
+        done = 0
+        for i, item in enumerate(items):
+            sha256 = self.lookup(item.attachment_id, item.version)
+            if sha256 is None:
+                to_download.append(i)
+                continue
+            # Seen before (possibly on another page or in another space): only record where it appears
+            self.record(item, sha256)
+            results[i] = StoreResult(item, 'known', sha256, self.blob_path(sha256), os.path.getsize(self.blob_path(sha256)))
+            done += 1
+            if on_result is not None:
+                on_result(results[i], done, len(items))
+
+        # Several pages can carry the same attachment version; download it once
+        first_index = {}
+        tasks = []
+        for i in to_download:
+            key = (items[i].attachment_id, items[i].version)
+            if key not in first_index:
+                first_index[key] = i
+                tasks.append(DownloadTask(items[i].url, self.incoming_path(items[i]),
+                                          expected_attachment_size(items[i].attachment), context=i))
+
+        def settle(download, finished, total):
+            nonlocal done
+            i = download.task.context
+            if not download.ok:
+                results[i] = StoreResult(items[i], 'failed', error=download.error)
+            else:
+                try:
+                    sha256, is_new = self.add_file(download.task.path, items[i])
+                    status = 'stored' if is_new else 'deduplicated'
+                    results[i] = StoreResult(items[i], status, sha256, self.blob_path(sha256), download.size)
+                except (OSError, sqlite3.Error) as e:
+                    results[i] = StoreResult(items[i], 'failed', error=str(e))
+            done += 1
+            if on_result is not None:
+                on_result(results[i], done, len(items))
+
+        downloader.download_all(tasks, on_result=settle)
+
+        for i in to_download:
+            if results[i] is not None:
+                continue
+            first = results[first_index[(items[i].attachment_id, items[i].version)]]
+            if first.ok:
+                self.record(items[i], first.sha256)
+                results[i] = StoreResult(items[i], 'known', first.sha256, first.path, first.size)
+            else:
+                results[i] = StoreResult(items[i], 'failed', error=first.error)
+            done += 1
+            if on_result is not None:
+                on_result(results[i], done, len(items))
+        return results
+
+    def entries(self):
+        """Yield one dict per indexed attachment version, with the path and size of its blob."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT a.space_key, a.page_id, a.attachment_id, a.version, a.title, a.media_type, a.sha256, b.size "
+                "FROM attachments a JOIN blobs b ON a.sha256 = b.sha256 ORDER BY a.space_key, a.page_id").fetchall()
+        for row in rows:
+            entry = dict(row)
+            entry['path'] = self.blob_path(row['sha256'])
+            yield entry
+
+    def stats(self):
+        """Counts and sizes: logical_bytes is what per-page copies would take, stored_bytes what the blobs take."""
+        with self._lock:
+            attachments, logical_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(b.size), 0) FROM attachments a JOIN blobs b ON a.sha256 = b.sha256").fetchone()
+            blobs, stored_bytes = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {'attachments': attachments, 'blobs': blobs, 'logical_bytes': logical_bytes, 'stored_bytes': stored_bytes}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
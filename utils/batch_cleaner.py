@@ -0,0 +1,216 @@
+"""Clean many Confluence page bodies at once, spread over worker processes.
+
+Cleaning is CPU work on one body at a time, so a batch is split into chunks of bodies that
+run on a process pool, and the results come back in input order. Batches that are too small
+to pay for the pool, and workers=1, are cleaned in this process.
+
+Modes:
+* text: clean_confluence_html, the text indexed and embedded by most scripts
+* markdown: clean_confluence_html followed by html_to_markdown_text, as the Qdrant uploaders do
+* plain: tags stripped and whitespace collapsed, as explore_clusters vectorizes spaces
+
+A body whose cleaning raises comes back as None, so callers can redo it with their own fallback.
+With a TextCache (utils/text_cache.py), bodies cleaned in an earlier run are not cleaned again.
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from bs4 import BeautifulSoup
+
+try:
+    import html2text
+except ImportError:
+    html2text = None
+
+from utils import html_cleaner
+from utils.change_ledger import body_hash
+
+CLEAN_MODES = ('text', 'markdown', 'plain')
+DEFAULT_CLEAN_WORKERS = os.cpu_count() or 1
+# A batch is split into about this many chunks per worker, so one slow chunk (a few mega-pages)
+# does not leave the other workers idle at the end; chunks never exceed MAX_CHUNK_PAGES bodies
+CHUNKS_PER_WORKER = 4
+MAX_CHUNK_PAGES = 64
+# Batches with fewer characters than this are cleaned in this process
+MIN_PARALLEL_CHARS = 256 * 1024
+
+
+def html_to_markdown_text(html_content):
+    """Convert (cleaned) Confluence HTML to markdown, with runs of blank lines collapsed."""
+    if not html_content:
+        return ""
+
+    h = html2text.HTML2Text()
+    h.ignore_links = False
+    h.ignore_images = False
+    h.body_width = 0  # Don't wrap lines
+    h.single_line_break = True
+
+    try:
+        soup = BeautifulSoup(html_content, 'html.parser')
+        for script in soup(["script", "style"]):
+            script.decompose()
+        markdown = h.handle(str(soup))
+
+        cleaned_lines = []
+        prev_empty = False
+        for line in markdown.split('\n'):
+            line = line.rstrip()
+            if line:
+                cleaned_lines.append(line)
+                prev_empty = False
+            elif not prev_empty:
+                cleaned_lines.append('')
+                prev_empty = True
+
+        return '\n'.join(cleaned_lines).strip()
+    except Exception as e:
+        print(f"Warning: Failed to convert HTML to markdown: {e}")
+        try:
+            soup = BeautifulSoup(html_content, 'html.parser')
+            return soup.get_text(separator='\n', strip=True)
+        except Exception:
+            return html_content
+
+
+def plain_text(html_content):
+    """Text of every element with namespace prefixes unwrapped and whitespace collapsed."""
+    if not html_content:
+        return ''
+    try:
+        # html.parser does not descend into ac:/ri: elements, so turn the prefixes into plain names
+        normalized = re.sub(r'<(/?)(\w+):', r'<\1\2-', html_content)
+        normalized = re.sub(r'<(\w+):(\w+)\s*/>', r'<\1-\2/>', normalized)
+        try:
+            soup = BeautifulSoup(normalized, 'lxml')
+        except Exception:
+            soup = BeautifulSoup(normalized, 'html.parser')
+        text = soup.get_text(separator=' ', strip=True)
+        return re.sub(r'\s+', ' ', text).strip()
+    except Exception as e:
+        print(f"Error cleaning HTML: {e}")
+        text = re.sub(r'<[^>]+>', ' ', html_content)
+        return re.sub(r'\s+', ' ', text).strip()
+
+
+def clean_body(body, mode='text', cleaner=None):
+    """Clean one body the way clean_many does; '' for an empty body."""
+    if not body:
+        return ''
+    if mode == 'plain':
+        return plain_text(body)
+    text = html_cleaner.clean_confluence_html(body, cleaner)
+    if mode == 'markdown':
+        return html_to_markdown_text(text)
+    return text
+
+
+def _clean_chunk(mode, cleaner, bodies):
+    results = []
+    for body in bodies:
+        try:
+            results.append(clean_body(body, mode, cleaner))
+        except Exception:
+            results.append(None)
+    return results
+
+
+def _chunks(bodies, size):
+    return [bodies[i:i + size] for i in range(0, len(bodies), size)]
+
+
+class BatchCleaner:
+    """Cleans batches of bodies on a process pool that is kept between batches.
+
+    Use as a context manager, or call close(), to shut the pool down. The pool is only
+    started by the first batch that is worth cleaning in parallel.
+    """
+
+    def __init__(self, mode='text', workers=None, chunk_size=None, cleaner=None, cache=None):
+        """
+        Args:
+            mode: 'text', 'markdown' or 'plain' (see the module docstring)
+            workers: Worker processes (default: one per core); 1 cleans in this process
+            chunk_size: Bodies per task (default: sized from the batch and the worker count)
+            cleaner: clean_confluence_html implementation, 'bs4' or 'lxml' (default: the
+                process default, as set with set_default_cleaner)
+            cache: TextCache consulted before cleaning and filled with the cleaned texts
+        """
+        if mode not in CLEAN_MODES:
+            raise ValueError(f"Unknown clean mode {mode!r}, expected one of {', '.join(CLEAN_MODES)}")
+        if mode == 'markdown' and html2text is None:
+            raise ImportError("markdown mode needs html2text: pip install html2text")
+        if cleaner is not None and cleaner not in html_cleaner.HTML_CLEANERS:
+            raise ValueError(f"Unknown HTML cleaner {cleaner!r}, expected one of {', '.join(html_cleaner.HTML_CLEANERS)}")
+        self.mode = mode
+        self.workers = DEFAULT_CLEAN_WORKERS if workers is None else max(1, workers)
+        self.chunk_size = chunk_size
+        self.cleaner = cleaner
+        self.cache = cache
+        self._executor = None
+
+    def _chunk_size(self, count):
+        if self.chunk_size:
+            return self.chunk_size
+        return max(1, min(MAX_CHUNK_PAGES, -(-count // (self.workers * CHUNKS_PER_WORKER))))
+
+    def clean(self, bodies, digests=None):
+        """
+        Clean bodies (storage-format strings); returns their texts in the same order.
+
+        digests are the bodies' hashes for the cache, if the caller has them already.
+        """
+        bodies = list(bodies)
+        if self.cache is None:
+            return self._clean(bodies)
+
+        digests = [body_hash(body) if body else None for body in bodies] if digests is None else list(digests)
+        cached = self.cache.get_many([digest for digest, body in zip(digests, bodies) if body], self.mode)
+        # Bodies sharing a hash are cleaned once
+        missing = {}
+        for digest, body in zip(digests, bodies):
+            if body and digest not in cached:
+                missing.setdefault(digest, body)
+        if missing:
+            texts = self._clean(list(missing.values()))
+            cleaned = dict(zip(missing, texts))
+            self.cache.put_many(cleaned.items(), self.mode)
+            cached.update(cleaned)
+        return [cached[digest] if body else '' for digest, body in zip(digests, bodies)]
+
+    def _clean(self, bodies):
+        # Workers are told the cleaner explicitly; a spawned worker would not see set_default_cleaner
+        cleaner = self.cleaner or html_cleaner.DEFAULT_CLEANER
+        if (self.workers <= 1 or len(bodies) < 2
+                or sum(len(body) for body in bodies if body) < MIN_PARALLEL_CHARS):
+            return _clean_chunk(self.mode, cleaner, bodies)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        results = []
+        for chunk_results in self._executor.map(partial(_clean_chunk, self.mode, cleaner),
+                                                _chunks(bodies, self._chunk_size(len(bodies)))):
+            results.extend(chunk_results)
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def clean_many(bodies, mode='text', workers=None, chunk_size=None, cleaner=None, cache=None, digests=None):
+    """Clean a batch of bodies on a one-off pool; see BatchCleaner for the arguments.
+
+    Returns the cleaned texts in input order, None for a body whose cleaning raised.
+    """
+    with BatchCleaner(mode, workers, chunk_size, cleaner, cache) as batch:
+        return batch.clean(bodies, digests)
@@ -0,0 +1,412 @@
+"""Find pages whose bodies are identical or nearly identical, across spaces.
+
+Template-generated pages (meeting notes, retrospectives, how-to stubs) repeat the same body
+hundreds of times. DuplicateFinder groups pages so that a stage can handle each distinct
+body once and fan the result out to the other members of its group:
+
+- exact duplicates share a body_hash (utils/change_ledger.py), so they cost one dict lookup;
+- near duplicates are found with MinHash signatures over word shingles of the body text and
+  locality-sensitive hashing: two bodies become candidates when any band of their signatures
+  matches, and are grouped when the estimated Jaccard similarity reaches the threshold.
+
+The result can be saved to a SQLite dedup map (DedupMap) that downstream stages query for
+the canonical page of any page, and which can also hold each distinct body once.
+"""
+import re
+import sqlite3
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from html import unescape
+
+import numpy as np
+
+from utils.change_ledger import body_storage_value, page_body_hash
+
+DEDUP_MAP_FILENAME = 'body_dedup.sqlite'
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.85
+# Bodies with fewer words than this are only matched exactly; short texts make MinHash noisy
+MIN_WORDS_FOR_NEAR = 20
+# How much more a missed near duplicate counts than a wasted comparison when choosing LSH bands
+LSH_FALSE_NEGATIVE_WEIGHT = 0.8
+
+# Universal hashing (a * x + b) mod p with 32-bit shingle hashes and a < 2**31 stays below 2**64
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_CDATA_RE = re.compile(r'<!\[CDATA\[(.*?)\]\]>', re.S)
+_WORD_RE = re.compile(r'\w+')
+
+
+def body_words(body):
+    """Lower-cased words of a body's text; markup and entities are dropped."""
+    html = _CDATA_RE.sub(r' \1 ', body_storage_value(body))
+    return _WORD_RE.findall(unescape(_TAG_RE.sub(' ', html)).lower())
+
+
+class MinHasher:
+    """MinHash signatures of word shingles; the same seed gives comparable signatures in any process."""
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+    def shingle_hashes(self, words):
+        """Distinct 32-bit hashes of the word shingles (the whole text if it is shorter than one)."""
+        size = self.shingle_size
+        count = max(len(words) - size + 1, 1)
+        shingles = {' '.join(words[i:i + size]) for i in range(count)}
+        return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+    def signature(self, words):
+        """MinHash signature (uint32 array of num_perm values) of a list of words."""
+        hashes = self.shingle_hashes(words)
+        if not len(hashes):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def body_fingerprint(body, hasher=None):
+    """(size in bytes, MinHash signature or None) of a body; no signature for short bodies or without hasher."""
+    body = body_storage_value(body)
+    size = len(body.encode('utf-8'))
+    if hasher is None:
+        return size, None
+    words = body_words(body)
+    if len(words) < MIN_WORDS_FOR_NEAR:
+        return size, None
+    return size, hasher.signature(words)
+
+
+def lsh_params(threshold, num_perm=DEFAULT_NUM_PERM, false_negative_weight=LSH_FALSE_NEGATIVE_WEIGHT):
+    """(bands, rows) whose candidate probability 1 - (1 - s**rows)**bands best matches the threshold.
+
+    Too many bands make bodies well below the threshold candidates (wasted comparisons, which
+    dominate on corpora full of lightly edited templates); too few miss real near duplicates.
+    """
+    below = np.linspace(0, threshold, 100)
+    above = np.linspace(threshold, 1, 100)
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = (1 - (1 - below ** rows) ** bands).mean() * threshold
+            false_negative = ((1 - above ** rows) ** bands).mean() * (1 - threshold)
+            error = (1 - false_negative_weight) * false_positive + false_negative_weight * false_negative
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def estimated_similarity(sig1, sig2):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.count_nonzero(sig1 == sig2)) / len(sig1)
+
+
+class DuplicateGroup:
+    """Pages sharing one body (kind 'exact') or bodies at least threshold-similar (kind 'near').
+
+    canonical is the key of the first page added; members includes it.
+    """
+
+    def __init__(self, canonical, members, kind, similarity):
+        self.canonical = canonical
+        self.members = members
+        self.kind = kind
+        self.similarity = similarity
+
+    def __len__(self):
+        return len(self.members)
+
+    def __repr__(self):
+        return f"DuplicateGroup({self.canonical!r}, {len(self.members)} pages, {self.kind})"
+
+
+class DuplicateFinder:
+    """Collects pages and groups them by exact and near-duplicate bodies.
+
+    Keys are whatever identifies a page to the caller, usually (space_key, page_id).
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, bands=None,
+                 shingle_size=DEFAULT_SHINGLE_SIZE, near=True):
+        self.threshold = threshold
+        self.near = near
+        if bands:
+            self.bands, self.rows = bands, num_perm // bands
+        else:
+            self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.sizes = {}  # body hash -> body size in bytes
+        self._by_hash = {}  # body hash -> keys of the pages with that body
+        self._signatures = {}  # body hash -> MinHash signature
+        self._buckets = defaultdict(list)  # (band, band values) -> body hashes
+        self._parent = {}  # body hash -> union-find parent
+        self._order = {}  # body hash -> position in which it was first added
+        self._similarity = {}  # body hash -> similarity to the body it was merged into
+
+    def add(self, key, page):
+        """Add a page; its body is hashed unless page['body_hash'] is already there."""
+        digest = page_body_hash(page)
+        if digest in self._by_hash:
+            return self.add_hashed(key, digest)
+        size, signature = body_fingerprint(page.get('body'), self.hasher if self.near else None)
+        return self.add_hashed(key, digest, size, signature)
+
+    def add_hashed(self, key, digest, size=0, signature=None):
+        """Add a page from body_fingerprint() output computed elsewhere (e.g. in a worker process).
+
+        size and signature are only used the first time a body hash is seen.
+        """
+        keys = self._by_hash.get(digest)
+        if keys is not None:
+            keys.append(key)
+            return digest
+        self._by_hash[digest] = [key]
+        self._parent[digest] = digest
+        self._order[digest] = len(self._order)
+        self.sizes[digest] = size
+        if self.near and signature is not None:
+            self._add_signature(digest, signature)
+        return digest
+
+    def _add_signature(self, digest, signature):
+        self._signatures[digest] = signature
+        compared = set()
+        for band in range(self.bands):
+            bucket = self._buckets[(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())]
+            represented = False
+            for other in bucket:
+                if self._find(other) == self._find(digest):
+                    represented = True
+                    continue
+                if other in compared:
+                    # Already found too different through an earlier band
+                    continue
+                compared.add(other)
+                similarity = estimated_similarity(signature, self._signatures[other])
+                if similarity >= self.threshold:
+                    self._union(other, digest, similarity)
+                    represented = True
+            # A bucket keeps one body per cluster, so a template repeated with small edits
+            # thousands of times is compared once per band instead of against every copy
+            if not represented:
+                bucket.append(digest)
+
+    def _find(self, digest):
+        root = digest
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[digest] != root:
+            self._parent[digest], digest = root, self._parent[digest]
+        return root
+
+    def _union(self, first, second, similarity):
+        # The body added first stays the root, so the canonical page is stable across runs
+        root, other = sorted((self._find(first), self._find(second)), key=self._order.get)
+        self._parent[other] = root
+        self._similarity[other] = similarity
+
+    def groups(self, min_size=2):
+        """DuplicateGroups of at least min_size pages, largest first."""
+        clusters = defaultdict(list)
+        for digest in self._by_hash:
+            clusters[self._find(digest)].append(digest)
+        result = []
+        for root, digests in clusters.items():
+            members = [key for digest in digests for key in self._by_hash[digest]]
+            if len(members) < min_size:
+                continue
+            near = len(digests) > 1
+            similarity = min((self._similarity.get(d, 1.0) for d in digests), default=1.0)
+            result.append(DuplicateGroup(self._by_hash[root][0], members, 'near' if near else 'exact', similarity))
+        result.sort(key=lambda group: -len(group))
+        return result
+
+    def assignments(self):
+        """Yield (key, body_hash, canonical_key, kind, similarity) for every page added.
+
+        kind is 'unique' for canonical pages, 'exact' for pages with the same body as their
+        canonical page and 'near' for pages whose body only resembles it.
+        """
+        for digest, keys in self._by_hash.items():
+            root = self._find(digest)
+            canonical = self._by_hash[root][0]
+            for key in keys:
+                if key == canonical:
+                    yield key, digest, canonical, 'unique', 1.0
+                elif digest == root:
+                    yield key, digest, canonical, 'exact', 1.0
+                else:
+                    yield key, digest, canonical, 'near', self._similarity.get(digest, self.threshold)
+
+    def stats(self):
+        """Counts and byte totals of all pages, of distinct bodies and of clusters (one body per near-duplicate group)."""
+        pages = sum(len(keys) for keys in self._by_hash.values())
+        total_bytes = sum(self.sizes[digest] * len(keys) for digest, keys in self._by_hash.items())
+        unique_bytes = sum(self.sizes.values())
+        roots = {self._find(digest) for digest in self._by_hash}
+        return {
+            'pages': pages,
+            'distinct_bodies': len(self._by_hash),
+            'clusters': len(roots),
+            'total_bytes': total_bytes,
+            'distinct_bytes': unique_bytes,
+            'cluster_bytes': sum(self.sizes[root] for root in roots),
+        }
+
+
+_MAP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_bodies (
+    space_key TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    body_hash TEXT NOT NULL,
+    canonical_space_key TEXT NOT NULL,
+    canonical_page_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    PRIMARY KEY (space_key, page_id)
+);
+CREATE INDEX IF NOT EXISTS page_bodies_by_canonical ON page_bodies (canonical_space_key, canonical_page_id);
+CREATE TABLE IF NOT EXISTS bodies (
+    body_hash TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dedup_info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class DedupMap:
+    """SQLite map from each page to its canonical page, written by dedup_bodies.py.
+
+    Pages of kind 'exact' can reuse anything computed from their canonical page's body;
+    'near' pages only resemble it, so whether to reuse is up to the stage.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        with self._db:
+            self._db.executescript(_MAP_SCHEMA)
+
+    def write(self, finder, bodies=None):
+        """Replace the map with the finder's assignments; bodies ({body_hash: body}) are stored once each."""
+        with self._db:
+            self._db.execute("DELETE FROM page_bodies")
+            self._db.executemany(
+                "INSERT INTO page_bodies VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((str(key[0]), str(key[1]), digest, str(canonical[0]), str(canonical[1]), kind, similarity)
+                 for key, digest, canonical, kind, similarity in finder.assignments()))
+            if bodies is not None:
+                self._db.execute("DELETE FROM bodies")
+                self._db.executemany("INSERT INTO bodies VALUES (?, ?)", bodies.items())
+            self._db.executemany("INSERT OR REPLACE INTO dedup_info VALUES (?, ?)", [
+                ('created_at', datetime.now().isoformat()),
+                ('threshold', str(finder.threshold)),
+                ('near', str(finder.near)),
+            ])
+
+    def canonical(self, space_key, page_id, near=True):
+        """(canonical_space_key, canonical_page_id, kind) of a page, or None if it is not in the map.
+
+        With near=False a near duplicate counts as its own canonical page.
+        """
+        row = self._db.execute(
+            "SELECT canonical_space_key, canonical_page_id, kind FROM page_bodies WHERE space_key = ? AND page_id = ?",
+            (str(space_key), str(page_id))).fetchone()
+        if row is None:
+            return None
+        if row[2] == 'near' and not near:
+            return str(space_key), str(page_id), 'unique'
+        return row
+
+    def duplicates(self, near=True):
+        """{(space_key, page_id): (canonical_space_key, canonical_page_id)} of every non-canonical page."""
+        kinds = ('exact', 'near') if near else ('exact',)
+        rows = self._db.execute(
+            f"SELECT space_key, page_id, canonical_space_key, canonical_page_id FROM page_bodies "
+            f"WHERE kind IN ({', '.join('?' * len(kinds))})", kinds)
+        return {(row[0], row[1]): (row[2], row[3]) for row in rows}
+
+    def duplicate_hashes(self, near=True):
+        """{(space_key, page_id): (body_hash, (canonical_space_key, canonical_page_id), canonical_body_hash)}
+        of every non-canonical page, with the body hashes the map was built from."""
+        kinds = ('exact', 'near') if near else ('exact',)
+        rows = self._db.execute(
+            f"SELECT d.space_key, d.page_id, d.body_hash, d.canonical_space_key, d.canonical_page_id, c.body_hash "
+            f"FROM page_bodies d JOIN page_bodies c "
+            f"ON c.space_key = d.canonical_space_key AND c.page_id = d.canonical_page_id "
+            f"WHERE d.kind IN ({', '.join('?' * len(kinds))})", kinds)
+        return {(row[0], row[1]): (row[2], (row[3], row[4]), row[5]) for row in rows}
+
+    def body(self, body_hash):
+        """A stored body by hash, or None."""
+        row = self._db.execute("SELECT body FROM bodies WHERE body_hash = ?", (body_hash,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class DuplicateSkipper:
+    """Decides which pages an upload can leave out because their canonical page carries their content.
+
+    A page is only left out when the dedup map lists it as a duplicate, its body is still the
+    one the map was built from, and its canonical page was uploaded (in this run or an earlier
+    one) with the body the map recorded for it. Anything else (a stale map, a canonical page in
+    a space that is not uploaded, a failed upload) means the page is uploaded on its own.
+    """
+
+    def __init__(self, duplicate_hashes, uploaded=None):
+        """
+        Args:
+            duplicate_hashes: DedupMap.duplicate_hashes() output
+            uploaded: {(space_key, page_id): body_hash} of pages uploaded in earlier runs
+        """
+        self._duplicates = duplicate_hashes
+        self._canonical_hashes = {canonical: digest for _, canonical, digest in duplicate_hashes.values()}
+        self.uploaded = dict(uploaded or {})
+        # Canonical page -> [(space_key, page_id, title)] of the duplicates left out in its favour
+        self.skipped = defaultdict(list)
+
+    def __len__(self):
+        return len(self._duplicates)
+
+    def canonical(self, space_key, page):
+        """Canonical page key of a page that is still the duplicate the map recorded, else None."""
+        entry = self._duplicates.get((str(space_key), str(page.get('id', ''))))
+        if entry is None or entry[0] != page_body_hash(page):
+            return None
+        return entry[1]
+
+    def is_uploaded(self, canonical):
+        """Whether a canonical page was uploaded with the body the map recorded for it."""
+        digest = self.uploaded.get(canonical)
+        return digest is not None and digest == self._canonical_hashes.get(canonical)
+
+    def mark_uploaded(self, space_key, page):
+        """Record that a page was uploaded with its current body."""
+        self.uploaded[(str(space_key), str(page.get('id', '')))] = page_body_hash(page)
+
+    def skip(self, space_key, page):
+        """Leave a page out if its canonical page's upload covers it; returns whether it was."""
+        canonical = self.canonical(space_key, page)
+        if canonical is None or not self.is_uploaded(canonical):
+            return False
+        self.skipped[canonical].append((str(space_key), str(page.get('id', '')), page.get('title', '')))
+        return True
@@ -0,0 +1,138 @@
+"""Body hashes per page, and per-consumer ledgers of what has already been processed.
+
+sample_and_pickle_spaces.py stores page['body_hash'] (SHA-256 of the storage-format body)
+on every page it fetches. A downstream stage (search index, SQL extraction, uploads, ...)
+keeps a ProcessedLedger recording the hash each page had when the stage last processed it.
+On the next run it processes only pages whose hash differs, and drops its output for pages
+that disappeared, so the work after a sync grows with the number of edits, not the corpus.
+
+A ledger is a table in a SQLite file. Putting it in the consumer's own database or index
+directory keeps the two in step: delete the output and the ledger goes with it.
+"""
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+
+LEDGER_FILENAME = 'processed_ledger.sqlite'
+# Seconds a writer waits for another process holding the ledger lock
+LEDGER_BUSY_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_pages (
+    consumer TEXT NOT NULL,
+    space_key TEXT,
+    page_id TEXT NOT NULL,
+    body_hash TEXT NOT NULL,
+    processed_at TEXT NOT NULL,
+    PRIMARY KEY (consumer, page_id)
+);
+CREATE INDEX IF NOT EXISTS processed_pages_by_space ON processed_pages (consumer, space_key);
+"""
+
+
+def body_storage_value(body):
+    """Storage-format HTML of a body stored as a string or as {'storage': {'value': ...}}.
+
+    Pickles rewritten by compact_pickles.py hold plain strings only. Bodies loaded out of band
+    (utils/streaming_pickle.py) are BodyBuffers and are decoded here.
+    """
+    if isinstance(body, str):
+        return body
+    if isinstance(body, dict):
+        # A few older fetchers kept the rendered 'view' representation instead
+        storage = body.get('storage') or body.get('view') or {}
+        if isinstance(storage, dict):
+            return storage.get('value', '') or ''
+        return storage if isinstance(storage, str) else ''
+    if hasattr(body, 'decode'):
+        return body.decode('utf-8', errors='replace')
+    return ''
+
+
+def body_hash(body):
+    """Stable SHA-256 hex digest of a page body (the same for both body layouts)."""
+    return hashlib.sha256(body_storage_value(body).encode('utf-8')).hexdigest()
+
+
+def set_body_hash(page):
+    """Store the hash of page['body'] on the page; returns the page."""
+    page['body_hash'] = body_hash(page.get('body'))
+    return page
+
+
+def page_body_hash(page):
+    """The page's stored body hash, or one computed from its body (pickles from before body_hash)."""
+    return page.get('body_hash') or body_hash(page.get('body'))
+
+
+class ProcessedLedger:
+    """What one consumer has processed: page id -> body hash at the time. Safe to share between threads."""
+
+    def __init__(self, path, consumer):
+        self.path = path
+        self.consumer = consumer
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=LEDGER_BUSY_TIMEOUT, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+
+    def hashes(self, space_key=None):
+        """{page_id: body_hash} recorded for this consumer, optionally for one space only."""
+        query = "SELECT page_id, body_hash FROM processed_pages WHERE consumer = ?"
+        params = [self.consumer]
+        if space_key is not None:
+            query += " AND space_key = ?"
+            params.append(space_key)
+        with self._lock:
+            return dict(self._db.execute(query, params).fetchall())
+
+    def changed(self, items, space_key=None):
+        """The (page_id, body_hash) items whose hash differs from the recorded one (or is new)."""
+        recorded = self.hashes(space_key)
+        return [(str(page_id), digest) for page_id, digest in items if recorded.get(str(page_id)) != digest]
+
+    def removed(self, current_page_ids, space_key=None):
+        """Recorded page ids that are not in current_page_ids (deleted or moved pages)."""
+        current = {str(page_id) for page_id in current_page_ids}
+        return sorted(page_id for page_id in self.hashes(space_key) if page_id not in current)
+
+    def mark(self, items, space_key=None):
+        """Record (page_id, body_hash) items as processed, in one transaction."""
+        now = datetime.now().isoformat()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO processed_pages (consumer, space_key, page_id, body_hash, processed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(self.consumer, space_key, str(page_id), digest, now) for page_id, digest in items])
+
+    def forget(self, page_ids):
+        """Drop pages from the ledger so they count as new next time."""
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM processed_pages WHERE consumer = ? AND page_id = ?",
+                                 [(self.consumer, str(page_id)) for page_id in page_ids])
+
+    def forget_space(self, space_key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM processed_pages WHERE consumer = ? AND space_key = ?",
+                             (self.consumer, space_key))
+
+    def clear(self):
+        """Forget everything this consumer processed (before a full rebuild)."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM processed_pages WHERE consumer = ?", (self.consumer,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM processed_pages WHERE consumer = ?",
+                                    (self.consumer,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,202 @@
+"""Shared HTTP client for the scripts that talk to the Confluence REST API.
+
+All Confluence-facing scripts go through a ConfluenceClient so that requests reuse
+pooled keep-alive connections (no TCP+TLS handshake per call), negotiate gzip and
+retry rate-limited (429) and transient failures while honouring Retry-After.
+Requests are paced by the process-wide adaptive limiter in utils.rate_limiter.
+"""
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.rate_limiter import get_rate_limiter
+
+DEFAULT_POOL_SIZE = 32
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 5
+# Status codes worth retrying besides 429 (gateway/proxy hiccups in front of Confluence)
+RETRY_STATUS_CODES = (502, 503, 504)
+# Fallback wait when a 429 carries no usable Retry-After header
+DEFAULT_RATE_LIMIT_WAIT = 2
+MAX_BACKOFF_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value, default=None):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds to wait."""
+    if not value:
+        return default
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_date is None:
+        return default
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt, base=2, cap=MAX_BACKOFF_SECONDS):
+    """Exponential backoff with jitter for the given (0-based) retry attempt."""
+    delay = min(base * (2 ** attempt), cap)
+    return delay + random.uniform(0, min(delay * 0.1, 5))
+
+
+class ConfluenceClient:
+    """Thread-safe Confluence REST client backed by a pooled keep-alive requests.Session."""
+
+    def __init__(self, base_url=None, username=None, password=None, verify_ssl=True,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 max_rate_limit_retries=None, verbose=True, rate_limiter=None):
+        self.base_url = (base_url or '').rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # None means 429 responses are retried until the server lets us through
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.verbose = verbose
+        self.pool_size = pool_size
+        # Shared by every client in the process unless a dedicated limiter is passed in
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+
+        self.session = requests.Session()
+        if username and password:
+            self.session.auth = (username, password)
+        self.session.verify = verify_ssl
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        self._mount_adapters(pool_size)
+
+    def _mount_adapters(self, pool_size):
+        # Retries are handled in request() so that Retry-After and logging stay under our control
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+
+    def ensure_pool_size(self, pool_size):
+        """Grow the connection pool so that pool_size threads can hold a connection each."""
+        if pool_size > self.pool_size:
+            self._mount_adapters(pool_size)
+
+    def url_for(self, url):
+        """Resolve a path such as '/rest/api/space' against base_url; absolute URLs pass through."""
+        if url.startswith('http://') or url.startswith('https://'):
+            return url
+        return f"{self.base_url}/{url.lstrip('/')}"
+
+    def _log(self, message):
+        logger.warning(message)
+        if self.verbose:
+            print(message)
+
+    def request(self, method, url, params=None, timeout=None, max_retries=None, **kwargs):
+        """Send a request, retrying 429s, transient 5xx responses and connection errors.
+
+        Returns the final Response (which may still carry a 4xx/5xx status), or None when
+        the request could not be completed after max_retries network failures.
+        """
+        url = self.url_for(url)
+        timeout = self.timeout if timeout is None else timeout
+        max_retries = self.max_retries if max_retries is None else max_retries
+        retries = 0
+        rate_limit_retries = 0
+        while True:
+            self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, params=params, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.rate_limiter.on_error()
+                if retries >= max_retries:
+                    self._log(f"Request failed for {url} after {retries} retries: {e}")
+                    return None
+                wait_time = backoff_delay(retries)
+                self._log(f"Request error for {url}: {e}. Retrying in {wait_time:.1f}s ({retries + 1}/{max_retries})")
+                time.sleep(wait_time)
+                retries += 1
+                continue
+
+            if response.status_code == 429:
+                if self.max_rate_limit_retries is not None and rate_limit_retries >= self.max_rate_limit_retries:
+                    self._log(f"Rate limited (429) on {url}; giving up after {rate_limit_retries} retries")
+                    return response
+                retry_after = response.headers.get('Retry-After')
+                wait_time = parse_retry_after(retry_after, default=DEFAULT_RATE_LIMIT_WAIT)
+                # The limiter pauses every thread for wait_time and lowers the request rate
+                self.rate_limiter.on_throttled(wait_time, sent_at=started)
+                self._log(f"Warning: Rate limited (429). Retrying {url} in {wait_time:.1f}s "
+                          f"(Retry-After: {retry_after or 'not specified'}; {self.rate_limiter.summary()})")
+                response.close()
+                rate_limit_retries += 1
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES:
+                self.rate_limiter.on_error()
+            else:
+                self.rate_limiter.on_success(time.monotonic() - started)
+
+            if response.status_code in RETRY_STATUS_CODES and retries < max_retries:
+                wait_time = parse_retry_after(response.headers.get('Retry-After'), default=backoff_delay(retries))
+                self._log(f"Server error ({response.status_code}) for {url}. Retrying in {wait_time:.1f}s ({retries + 1}/{max_retries})")
+                response.close()
+                time.sleep(wait_time)
+                retries += 1
+                continue
+
+            return response
+
+    def get(self, url, params=None, **kwargs):
+        return self.request('GET', url, params=params, **kwargs)
+
+    def post(self, url, json=None, params=None, **kwargs):
+        return self.request('POST', url, params=params, json=json, **kwargs)
+
+    def get_json(self, url, params=None, **kwargs):
+        """GET a URL and return the decoded JSON body, or None on a non-200 status or bad JSON."""
+        response = self.get(url, params=params, **kwargs)
+        if response is None:
+            return None
+        if response.status_code != 200:
+            self._log(f"Error: Received status code {response.status_code} for {self.url_for(url)}")
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            self._log(f"Error: Response from {self.url_for(url)} was not valid JSON: {response.text[:500]}")
+            return None
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url, username=None, password=None, verify_ssl=True, **kwargs):
+    """Return the process-wide client for these credentials, creating it on first use.
+
+    Extra keyword arguments (pool_size, timeout, ...) only apply when the client is created.
+    """
+    key = ((base_url or '').rstrip('/'), username, password, verify_ssl)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ConfluenceClient(base_url, username, password, verify_ssl, **kwargs)
+            _clients[key] = client
+        return client
@@ -0,0 +1,273 @@
+"""Parallel loading of a directory of spaces: legacy pickles and split-format spaces (.meta).
+
+Spaces are selected before any of them is unpickled: space-key filters work on file names,
+and page-count filters on the pickle catalog or split-space metadata. Selected spaces are
+then loaded on a pool, in file-name order:
+
+* iter_spaces() / load() read and unpickle on threads. Unpickling holds the GIL, but the
+  reads (local disk or a network share) overlap. Loading whole spaces in worker processes
+  would cost more than it saves, since every space is pickled again to reach the parent.
+* map(transform) calls transform(space) in worker processes and only ships back its result,
+  so per-space work such as HTML parsing or SQL extraction scales with the number of cores.
+  transform (and validate) have to be picklable: module-level functions or functools.partials.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.pickle_catalog import catalog_page_count, load_catalog_entries
+from utils.split_space import META_SUFFIX, SplitSpace
+from utils.streaming_pickle import load_space
+
+# Reads are I/O bound, so a few threads help even on a single core
+DEFAULT_LOAD_THREADS = 4
+DEFAULT_LOAD_PROCESSES = os.cpu_count() or 1
+# Spaces loaded ahead of the consumer, per worker; bounds memory when the consumer is slow
+PREFETCH_PER_WORKER = 2
+
+
+def space_key_from_filename(filename):
+    """Space key a pickle or split space file is named after (SPACE.pkl, SPACE_full.pkl, SPACE.meta)."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return stem[:-len('_full')] if stem.endswith('_full') else stem
+
+
+def is_space(data):
+    """True for a loaded space dict (not a 'processing' placeholder or some other pickle)."""
+    return isinstance(data, dict) and 'sampled_pages' in data and data.get('status') != 'processing'
+
+
+class CorpusFile:
+    """One space on disk selected for loading."""
+
+    def __init__(self, path, kind, space_key, size, page_count=None):
+        self.path = path
+        self.kind = kind  # 'pickle' or 'split'
+        self.space_key = space_key
+        self.size = size
+        self.page_count = page_count
+
+
+class CorpusLoadStats:
+    """Counts and timing of one load, for throughput reporting."""
+
+    def __init__(self, workers, mode):
+        self.workers = workers
+        self.mode = mode
+        self.selected = 0
+        self.loaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.seconds = 0.0
+
+    def summary(self):
+        mb = self.bytes / (1024 * 1024)
+        rate = mb / self.seconds if self.seconds else 0
+        text = (f"Loaded {self.loaded} of {self.selected} selected spaces ({mb:.1f} MB) in {self.seconds:.1f}s "
+                f"({rate:.0f} MB/s, {self.workers} {self.mode})")
+        if self.failed:
+            text += f", {self.failed} failed"
+        return text
+
+
+def _read_space(path, kind):
+    if kind == 'split':
+        with SplitSpace(path) as space:
+            return space.to_space_dict()
+    # Reads the file first so the I/O happens outside the GIL, then unpickles from memory;
+    # out-of-band bodies stay in their memory-mapped buffers file
+    return load_space(path)
+
+
+def _load_and_transform(path, kind, transform, validate):
+    data = _read_space(path, kind)
+    if not validate(data):
+        return False, None
+    return True, transform(data)
+
+
+class CorpusLoader:
+    """Select and load the spaces in a directory.
+
+    space_keys limits loading to those keys; key_filter(space_key) -> bool filters further;
+    min_pages/max_pages filter on a space's 'total_pages' if it has one, else its page count.
+    on_error(path, exception) is called for each space that fails to load. Loaded pickles for
+    which validate(data) is false (by default: anything but a space dict) are skipped.
+    """
+
+    def __init__(self, directory, space_keys=None, key_filter=None, min_pages=0, max_pages=None,
+                 workers=None, include_split=True, on_error=None, validate=is_space):
+        self.directory = directory
+        self.space_keys = set(space_keys) if space_keys is not None else None
+        self.key_filter = key_filter
+        self.min_pages = min_pages
+        self.max_pages = max_pages
+        self.workers = workers
+        self.include_split = include_split
+        self.on_error = on_error
+        self.validate = validate
+        self.stats = None
+
+    def _wants_key(self, space_key):
+        if self.space_keys is not None and space_key not in self.space_keys:
+            return False
+        return self.key_filter is None or self.key_filter(space_key)
+
+    def _wants_count(self, page_count):
+        return page_count >= self.min_pages and (self.max_pages is None or page_count <= self.max_pages)
+
+    def _error(self, path, e):
+        if self.on_error is not None:
+            self.on_error(path, e)
+
+    def select(self):
+        """CorpusFiles that pass the filters, sorted by file name. No page bodies are read.
+
+        Where a space exists both as SPACE.pkl and SPACE.meta, the split format is used.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(os.listdir(self.directory))
+        split_stems = {name[:-len(META_SUFFIX)] for name in names if name.endswith(META_SUFFIX)} if self.include_split else set()
+        count_filter = self.min_pages > 0 or self.max_pages is not None
+
+        catalog = {}
+        if count_filter and any(name.endswith('.pkl') for name in names):
+            entries = load_catalog_entries(self.directory, on_error=lambda fname, e: self._error(
+                os.path.join(self.directory, fname), e))
+            catalog = {entry['file']: entry for entry in entries}
+
+        selected = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith('.pkl') and os.path.splitext(name)[0] not in split_stems:
+                space_key = space_key_from_filename(name)
+                if not self._wants_key(space_key):
+                    continue
+                page_count = None
+                if count_filter:
+                    entry = catalog.get(name)
+                    if entry is None or entry.get('format') != 'space':
+                        continue
+                    page_count = catalog_page_count(entry)
+                    if not self._wants_count(page_count):
+                        continue
+                selected.append(CorpusFile(path, 'pickle', space_key, os.path.getsize(path), page_count))
+            elif name.endswith(META_SUFFIX) and self.include_split:
+                space_key = space_key_from_filename(name)
+                if not self._wants_key(space_key):
+                    continue
+                try:
+                    with SplitSpace(path) as space:
+                        page_count = space.header.get('total_pages', len(space))
+                        size = os.path.getsize(path) + os.path.getsize(space.bodies_path)
+                except Exception as e:
+                    self._error(path, e)
+                    continue
+                if count_filter and not self._wants_count(page_count):
+                    continue
+                selected.append(CorpusFile(path, 'split', space_key, size, page_count))
+        return selected
+
+    def _run(self, files, workers, submit):
+        """Yield (CorpusFile, result) in file order with a bounded number of loads in flight."""
+        window = workers * PREFETCH_PER_WORKER
+        remaining = iter(files)
+        pending = deque()
+        for corpus_file in remaining:
+            pending.append((corpus_file, submit(corpus_file)))
+            if len(pending) >= window:
+                break
+        while pending:
+            corpus_file, future = pending.popleft()
+            next_file = next(remaining, None)
+            if next_file is not None:
+                pending.append((next_file, submit(next_file)))
+            try:
+                result = future.result()
+            except Exception as e:
+                self.stats.failed += 1
+                self._error(corpus_file.path, e)
+                continue
+            yield corpus_file, result
+        self.stats.seconds = time.monotonic() - self.stats.started
+
+    def _start(self, files, workers, mode):
+        self.stats = CorpusLoadStats(workers, mode)
+        self.stats.selected = len(files)
+
+    def _finish_one(self, corpus_file, loaded):
+        if loaded:
+            self.stats.loaded += 1
+            self.stats.bytes += corpus_file.size
+        else:
+            self.stats.skipped += 1
+        self.stats.seconds = time.monotonic() - self.stats.started
+
+    def load_files(self, files=None):
+        """Yield (CorpusFile, loaded data) for the selected spaces (or files) in file-name order."""
+        files = self.select() if files is None else files
+        workers = max(1, min(self.workers or DEFAULT_LOAD_THREADS, len(files) or 1))
+        self._start(files, workers, 'threads')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for corpus_file, data in self._run(files, workers,
+                                               lambda f: executor.submit(_read_space, f.path, f.kind)):
+                loaded = self.validate(data)
+                self._finish_one(corpus_file, loaded)
+                if loaded:
+                    yield corpus_file, data
+
+    def iter_spaces(self, files=None):
+        """Yield the selected space dicts (or those of files, from select()) in file-name order."""
+        for _, data in self.load_files(files):
+            yield data
+
+    def load(self):
+        """Dict of space_key -> space dict for the selected spaces."""
+        return {data.get('space_key') or corpus_file.space_key: data for corpus_file, data in self.load_files()}
+
+    def map(self, transform, files=None):
+        """Yield (CorpusFile, transform(space)) for the selected spaces (or files), computed in worker processes."""
+        files = self.select() if files is None else files
+        workers = max(1, min(self.workers or DEFAULT_LOAD_PROCESSES, len(files) or 1))
+        self._start(files, workers, 'processes')
+        if workers == 1:
+            # One worker gains nothing from a pool; stay in process (also easier to debug)
+            for corpus_file in files:
+                try:
+                    loaded, result = _load_and_transform(corpus_file.path, corpus_file.kind, transform, self.validate)
+                except Exception as e:
+                    self.stats.failed += 1
+                    self._error(corpus_file.path, e)
+                    continue
+                self._finish_one(corpus_file, loaded)
+                if loaded:
+                    yield corpus_file, result
+            self.stats.seconds = time.monotonic() - self.stats.started
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for corpus_file, (loaded, result) in self._run(
+                    files, workers, lambda f: executor.submit(_load_and_transform, f.path, f.kind, transform, self.validate)):
+                self._finish_one(corpus_file, loaded)
+                if loaded:
+                    yield corpus_file, result
+
+
+def iter_spaces(directory, report=False, **options):
+    """Yield space dicts from directory; options are CorpusLoader's. report prints the throughput at the end."""
+    loader = CorpusLoader(directory, **options)
+    yield from loader.iter_spaces()
+    if report:
+        print(loader.stats.summary())
+
+
+def load_spaces(directory, report=False, **options):
+    """Dict of space_key -> space dict for the spaces in directory; options are CorpusLoader's."""
+    loader = CorpusLoader(directory, **options)
+    spaces = loader.load()
+    if report:
+        print(loader.stats.summary())
+    return spaces
@@ -1,5 +1,23 @@
 import re
+import threading
+from typing import Optional
+
 from bs4 import BeautifulSoup, Tag
+from bs4.dammit import EntitySubstitution
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Implementations of clean_confluence_html: 'bs4' is the reference, 'lxml' the single-pass fast path
+HTML_CLEANERS = ('bs4', 'lxml')
+DEFAULT_CLEANER = 'bs4'
+# Bump when the output of clean_confluence_html changes: texts cached by an older version
+# (utils/text_cache.py) are then cleaned again
+CLEANER_VERSION = 1
+# Bodies longer than this (characters) are cleaned piece by piece, see utils/stream_cleaner.py
+STREAM_MIN_CHARS = 1_000_000
 
 # Configuration for handling specific Confluence macros
 MACROS_TO_REMOVE = [
@@ -54,7 +72,6 @@ def get_jira_placeholder(macro_tag: Tag) -> str:
 
 def _format_table_for_console(table_tag: Tag) -> str:
     """Formats a BeautifulSoup table Tag into a simple text-based table for console output."""
-    output_lines = []
     rows = table_tag.find_all('tr')
     if not rows:
         return "[TABLE DATA (empty)]"
@@ -64,17 +81,24 @@ def _format_table_for_console(table_tag: Tag) -> str:
     first_row_cells = rows[0].find_all(['td', 'th'])
     if not first_row_cells:
         return "[TABLE DATA (no cells in first row)]"
-    
+
     num_cols = len(first_row_cells)
+    cell_texts = [[cell.get_text(separator=' ', strip=True) for cell in row.find_all(['td', 'th'])[:num_cols]]
+                  for row in rows]
+    has_header = any(c.name == 'th' for c in rows[0].find_all(True, recursive=False))
+    return _layout_table(cell_texts, num_cols, has_header)
+
+def _layout_table(cell_texts: list, num_cols: int, has_header: bool) -> str:
+    """Lays out rows of cell texts as a console table; has_header adds a separator after the first row."""
+    output_lines = []
     col_widths = [0] * num_cols
     table_data = []
 
-    for row_idx, row in enumerate(rows):
-        cells = row.find_all(['td', 'th'])
+    for cells in cell_texts:
         row_data = []
         for i in range(num_cols):
             if i < len(cells):
-                cell_text = cells[i].get_text(separator=' ', strip=True)
+                cell_text = cells[i]
                 row_data.append(cell_text)
                 col_widths[i] = max(col_widths[i], len(cell_text))
             else:
@@ -89,23 +113,63 @@ def _format_table_for_console(table_tag: Tag) -> str:
         for i in range(num_cols):
             line_parts.append(row_data[i].ljust(col_widths[i]))
         output_lines.append(" | ".join(line_parts))
-        if row_idx == 0 and any(c.name == 'th' for c in rows[0].find_all(True, recursive=False)):
+        if row_idx == 0 and has_header:
              # Add a separator after the header row if it contains <th> elements
             output_lines.append(header_separator)
     
     return "\n[TABLE_START]\n" + "\n".join(output_lines) + "\n[TABLE_END]\n"
 
-def clean_confluence_html(html_content: str) -> str:
+def set_default_cleaner(name: str) -> None:
+    """Selects the implementation clean_confluence_html uses when none is passed ('bs4' or 'lxml')."""
+    global DEFAULT_CLEANER
+    if name not in HTML_CLEANERS:
+        raise ValueError(f"Unknown HTML cleaner {name!r}, expected one of {', '.join(HTML_CLEANERS)}")
+    DEFAULT_CLEANER = name
+
+def clean_confluence_html(html_content: str, cleaner: Optional[str] = None) -> str:
     """
     Cleans Confluence HTML content by removing/replacing specific macros 
     and then extracting text with improved readability.
     Headings (h1-h6) are converted to Markdown-style headings.
+
+    cleaner picks the implementation ('bs4' or 'lxml', see clean_confluence_html_lxml);
+    by default the one selected with set_default_cleaner().
     """
     if not html_content:
         return ""
+    if len(html_content) > STREAM_MIN_CHARS:
+        # Imported here: utils/stream_cleaner.py builds on this module
+        from utils.stream_cleaner import stream_text
+        return stream_text(html_content, cleaner=cleaner).text
+    if (cleaner or DEFAULT_CLEANER) == 'lxml':
+        return clean_confluence_html_lxml(html_content)
+    return _clean_with_bs4(html_content)
 
-    soup = BeautifulSoup(html_content, 'html.parser')
+def _clean_with_bs4(html_content: str) -> str:
+    return clean_soup(BeautifulSoup(html_content, 'html.parser'))
+
+def clean_soup(soup: BeautifulSoup) -> str:
+    """
+    The bs4 cleaner on a body already parsed with html.parser (see utils/page_analyzer.py).
+    The rules replace and remove elements, so soup cannot be read for anything else afterwards.
+    """
+    return _normalize_text(_soup_text(soup))
+
+def raw_text(html_content: str, cleaner: Optional[str] = None) -> str:
+    """
+    clean_confluence_html before _normalize_text: the strings left by the rules, joined with
+    spaces. The raw texts of consecutive pieces of a body, joined with a space, normalize to
+    the text of the whole body (see utils/stream_cleaner.py).
+    """
+    if not html_content:
+        return ""
+    if (cleaner or DEFAULT_CLEANER) == 'lxml':
+        text = _lxml_raw_text(html_content)
+        if text is not None:
+            return text
+    return _soup_text(BeautifulSoup(html_content, 'html.parser'))
 
+def _soup_text(soup: BeautifulSoup) -> str:
     # Handle headings first: convert h1-h6 to Markdown style
     for i in range(1, 7):
         for header in soup.find_all(f'h{i}'):
@@ -196,8 +260,10 @@ def clean_confluence_html(html_content: str) -> str:
         hr_tag.replace_with(soup.new_string(' ---HR_PLACEHOLDER--- '))
 
     # Extract text, using space as default separator but handling block elements properly
-    text = soup.get_text(separator=' ')
+    return soup.get_text(separator=' ')
 
+def _normalize_text(text: str) -> str:
+    """Turns the extracted text into the cleaned output (HR lines, stripped and non-empty lines)."""
     # Replace the HR_PLACEHOLDER with a visual line, surrounded by newlines.
     text = text.replace('---HR_PLACEHOLDER---', '\n-----\n')
     
@@ -221,6 +287,309 @@ def clean_confluence_html(html_content: str) -> str:
     
     return text
 
+# --- lxml fast path ----------------------------------------------------------
+#
+# Storage format is XHTML whose ac:/ri: elements only lack namespace declarations, so a body
+# can be parsed by lxml's XML parser with every prefix it uses bound to a namespace. The
+# BeautifulSoup cleaner runs its rules as passes (h1 .. h6, ul, macros, table, hr), each one
+# replacing elements by strings before the next pass looks at the tree. Here every rule has a
+# rank in that order and one walk over the tree produces the final strings: an element is
+# replaced by the first rule that matches it, and the text a rule reads from its subtree is
+# collected with only the lower-ranked rules applied, which is what the later pass would see.
+
+class _Unsupported(Exception):
+    """The body uses markup that html.parser and an XML parser would read differently."""
+
+_NS = 'urn:confluence-viz:'
+_CDATA_NS = 'urn:confluence-viz-cdata'
+_CDATA_TAG = '{%s}s' % _CDATA_NS
+_AC_NAME = '{%sac}name' % _NS
+_RI_FILENAME = '{%sri}filename' % _NS
+
+_HEADING_LEVELS = {f'h{i}': i for i in range(1, 7)}
+_RANK_LIST = 7
+_RANK_MACRO = 8
+_RANK_TABLE = 9
+_RANK_HR = 10
+_RANK_NONE = 11
+
+# Whitespace-only strings are reduced to one space or newline by BeautifulSoup outside these tags
+_PRESERVE_WHITESPACE = frozenset(('pre', 'textarea'))
+_ASCII_SPACES = ' \n\t\x0c\r'
+# Elements html.parser closes right after the start tag (bs4's empty element tags)
+_VOID_ELEMENTS = ('area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr',
+                  'image', 'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid',
+                  'param', 'source', 'spacer', 'track', 'wbr')
+
+_CDATA_RE = re.compile(r'<!\[CDATA\[(.*?)\]\s*\]\s*>', re.S)
+# Bodies with markup html.parser reads differently from an XML parser are left to BeautifulSoup:
+# processing instructions and declarations, upper-case tag names (html.parser lower-cases them),
+# raw-text elements, and quoted attribute values spanning lines or tabs (normalized to spaces in XML)
+_UNSUPPORTED_RE = re.compile(
+    r'<(?:\?|!(?!--)|/?[\w:.-]*[A-Z]'
+    r'|/?(?:script|style|textarea|title|xmp|iframe|noembed|noframes|noscript|plaintext)\b)'
+    r'|=\s*(?:"[^"<\t\n]*[\t\n]|\'[^\'<\t\n]*[\t\n])')
+# The two attributes the rules read, spelled with upper-case letters
+_MIXED_CASE_ATTRIBUTE_RE = re.compile(
+    r':(?:(?<=[Aa][Cc]:)(?<!ac:)(?=[Nn][Aa][Mm][Ee]\s*=)|(?<=ac:)(?=[Nn][Aa][Mm][Ee]\s*=)(?!name)'
+    r'|(?<=[Rr][Ii]:)(?<!ri:)(?=[Ff][Ii][Ll][Ee][Nn][Aa][Mm][Ee]\s*=)'
+    r'|(?<=ri:)(?=[Ff][Ii][Ll][Ee][Nn][Aa][Mm][Ee]\s*=)(?!filename))')
+_REFERENCE_RE = re.compile(r'&(?:#([0-9]+)|#x([0-9a-fA-F]+)|([A-Za-z][A-Za-z0-9]*));')
+_XML_ENTITIES = frozenset(('amp', 'lt', 'gt', 'quot', 'apos'))
+_UNDEFINED_PREFIX_RE = re.compile(r'Namespace prefix (\S+) (?:for \S+ )?on \S+ is not defined')
+# Prefixes other than ac: and ri: are declared as the parser reports them
+MAX_EXTRA_PREFIXES = 16
+
+_TAG_NAMES = {}
+_parsers = threading.local()
+
+def _xml_parser():
+    # lxml parsers must not be shared between threads
+    parser = getattr(_parsers, 'parser', None)
+    if parser is None:
+        parser = _parsers.parser = etree.XMLParser(resolve_entities=False, huge_tree=True, no_network=True)
+    return parser
+
+def _cdata_element(match) -> str:
+    # BeautifulSoup keeps a CDATA section as a string of its own, so it becomes an element here
+    text = match.group(1).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+    return f'<_cdata:s>{text}</_cdata:s>'
+
+def _xml_reference(match) -> str:
+    name = match.group(3)
+    if name is None:
+        number = int(match.group(1), 10) if match.group(1) else int(match.group(2), 16)
+        if 0x80 <= number <= 0x9f:
+            # bs4 reads these as windows-1252 characters
+            raise _Unsupported(match.group(0))
+        return match.group(0)
+    if name in _XML_ENTITIES:
+        return match.group(0)
+    character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+    if character is None:
+        # bs4 keeps unknown entities as literal text
+        raise _Unsupported(match.group(0))
+    return ''.join(f'&#{ord(c)};' for c in character)
+
+def _parse_storage_format(html_content: str):
+    """Root element of a body parsed as XML; raises _Unsupported or XMLSyntaxError where bs4 would differ."""
+    if '_cdata:' in html_content:
+        raise _Unsupported('_cdata prefix')
+    text = _CDATA_RE.sub(_cdata_element, html_content) if '<![' in html_content else html_content
+    if _UNSUPPORTED_RE.search(text) or _MIXED_CASE_ATTRIBUTE_RE.search(text) or 'xmlns' in text:
+        raise _Unsupported('markup outside the XML subset')
+    if '&' in text:
+        text = _REFERENCE_RE.sub(_xml_reference, text)
+    if '\r' in text:
+        # An XML parser turns CR and CRLF into LF, html.parser keeps them
+        text = text.replace('\r', '&#13;')
+    body = text.encode('utf-8')
+    prefixes = ['ac', 'ri']
+    while True:
+        declarations = ''.join(f' xmlns:{prefix}="{_NS}{prefix}"' for prefix in prefixes)
+        document = b''.join((f'<_cdata:root xmlns:_cdata="{_CDATA_NS}"{declarations}>'.encode('utf-8'),
+                             body, b'</_cdata:root>'))
+        try:
+            root = etree.fromstring(document, _xml_parser())
+            break
+        except etree.XMLSyntaxError as e:
+            match = _UNDEFINED_PREFIX_RE.search(str(e))
+            if match is None or match.group(1) in prefixes or len(prefixes) >= MAX_EXTRA_PREFIXES + 2:
+                raise
+            prefixes.append(match.group(1))
+    for element in root.iter(*_VOID_ELEMENTS):
+        if len(element) or element.text:
+            # html.parser would have closed the element and made its content a sibling
+            raise _Unsupported(f'content inside <{element.tag}>')
+    return root
+
+def _tag_name(tag: str) -> str:
+    """html.parser's name of an lxml tag: '{urn:confluence-viz:ac}parameter' -> 'ac:parameter'."""
+    name = _TAG_NAMES.get(tag)
+    if name is None:
+        if tag[0] == '{':
+            uri, local = tag[1:].split('}', 1)
+            name = f'{uri[len(_NS):]}:{local}'
+        else:
+            name = tag
+        _TAG_NAMES[tag] = name
+    return name
+
+def _bs4_string(text: str, preserve: bool) -> str:
+    if preserve or text.strip(_ASCII_SPACES):
+        return text
+    return '\n' if '\n' in text else ' '
+
+def _macro_rule(macro_name: str) -> Optional[str]:
+    """What the macro pass does with a macro: 'remove', 'placeholder', 'attachment', 'jira' or None."""
+    if macro_name in MACROS_TO_REMOVE:
+        return 'remove'
+    if macro_name in MACRO_PLACEHOLDERS:
+        return 'placeholder'
+    if 'view-file' in macro_name or 'view-pdf' in macro_name or 'multimedia' in macro_name:
+        return 'attachment'
+    if 'jira' in macro_name:
+        return 'jira'
+    return None
+
+def _rule_rank(name: str, element) -> int:
+    """Rank of the first rule that replaces element, _RANK_NONE if none does."""
+    level = _HEADING_LEVELS.get(name)
+    if level:
+        return level
+    if name == 'ul':
+        return _RANK_LIST
+    macro_name = element.get(_AC_NAME)
+    if macro_name is not None and _macro_rule(macro_name.lower()):
+        return _RANK_MACRO
+    if name == 'table':
+        return _RANK_TABLE
+    if name == 'hr':
+        return _RANK_HR
+    return _RANK_NONE
+
+def _collect_strings(element, limit: int, preserve: bool, out: list) -> None:
+    """Appends the strings BeautifulSoup has under element once the rules ranked below limit ran."""
+    text = element.text
+    if text:
+        out.append(_bs4_string(text, preserve))
+    for child in element:
+        tag = child.tag
+        if tag.__class__ is str:
+            if tag == _CDATA_TAG:
+                out.append(_bs4_string(child.text or '', preserve))
+            else:
+                name = _TAG_NAMES.get(tag) or _tag_name(tag)
+                rank = _rule_rank(name, child)
+                if rank < limit:
+                    replacement = _apply_rule(child, name, rank, preserve)
+                    if replacement is not None:
+                        out.append(replacement)
+                else:
+                    _collect_strings(child, limit, preserve or name in _PRESERVE_WHITESPACE, out)
+        # Comments are dropped, but like in BeautifulSoup they split the text around them
+        tail = child.tail
+        if tail:
+            out.append(_bs4_string(tail, preserve))
+
+def _get_text(element, limit: int, preserve: bool, separator: str = '', strip: bool = False) -> str:
+    """Tag.get_text() of element once the rules ranked below limit ran."""
+    out = []
+    _collect_strings(element, limit, preserve or _tag_name(element.tag) in _PRESERVE_WHITESPACE, out)
+    if strip:
+        return separator.join(s for s in (s.strip() for s in out) if s)
+    return separator.join(out)
+
+def _preserves_whitespace(element) -> bool:
+    return any(_tag_name(a.tag) in _PRESERVE_WHITESPACE for a in element.iterancestors())
+
+def _tags(element, limit: int):
+    """(name, element) of the descendants that are still tags once the rules ranked below limit ran."""
+    stack = [iter(element)]
+    while stack:
+        for child in stack[-1]:
+            tag = child.tag
+            if tag.__class__ is not str or tag == _CDATA_TAG:
+                continue
+            name = _TAG_NAMES.get(tag) or _tag_name(tag)
+            if _rule_rank(name, child) < limit:
+                continue
+            yield name, child
+            stack.append(iter(child))
+            break
+        else:
+            stack.pop()
+
+def _find_parameter(macro, parameter_name: str):
+    for name, tag in _tags(macro, _RANK_MACRO):
+        if name == 'ac:parameter' and tag.get(_AC_NAME) == parameter_name:
+            return tag
+    return None
+
+def _apply_rule(element, name: str, rank: int, preserve: bool) -> Optional[str]:
+    """Replacement string of element (None to drop it); preserve applies to its parent."""
+    preserve = preserve or name in _PRESERVE_WHITESPACE
+    if rank <= 6:
+        header_text = re.sub(r'\\\\+', r'\\\\', _get_text(element, rank, preserve, strip=True))
+        return f"\n\n{'#' * rank} {header_text} {'#' * rank}"
+
+    if rank == _RANK_LIST:
+        list_items_text = []
+        for child in element:
+            if child.tag.__class__ is str and child.tag != _CDATA_TAG and _tag_name(child.tag) == 'li':
+                item_text = _get_text(child, _RANK_LIST, preserve, ' ', strip=True)
+                if item_text:
+                    list_items_text.append(f"  - {item_text}")
+        return "\n" + "\n".join(list_items_text) + "\n" if list_items_text else None
+
+    if rank == _RANK_MACRO:
+        macro_name = element.get(_AC_NAME).lower()
+        rule = _macro_rule(macro_name)
+        if rule == 'remove':
+            return None
+        if rule == 'placeholder':
+            return MACRO_PLACEHOLDERS[macro_name]
+        if rule == 'attachment':
+            name_param = _find_parameter(element, 'name')
+            if name_param is not None:
+                attachment = next((tag for tag_name, tag in _tags(name_param, _RANK_MACRO)
+                                   if tag_name == 'ri:attachment' and tag.get(_RI_FILENAME) is not None), None)
+                if attachment is not None and attachment.get(_RI_FILENAME):
+                    filename = attachment.get(_RI_FILENAME)
+                    if 'pdf' in macro_name:
+                        return f'[ATTACHMENT: {filename} (PDF)]'
+                    return f'[ATTACHMENT: {filename}]'
+            return '[ATTACHMENT: PDF]' if 'pdf' in macro_name else '[ATTACHMENT]'
+        key_param = _find_parameter(element, 'key')
+        if key_param is not None:
+            issue_key = _get_text(key_param, _RANK_MACRO, _preserves_whitespace(key_param)).strip()
+            if issue_key:
+                return f'[JIRA ISSUE: {issue_key}]'
+        return '[JIRA ISSUE]'
+
+    if rank == _RANK_TABLE:
+        rows = [tag for tag_name, tag in _tags(element, _RANK_TABLE) if tag_name == 'tr']
+        if not rows:
+            return "[TABLE DATA (empty)]"
+        row_cells = [[tag for tag_name, tag in _tags(row, _RANK_TABLE) if tag_name in ('td', 'th')] for row in rows]
+        if not row_cells[0]:
+            return "[TABLE DATA (no cells in first row)]"
+        num_cols = len(row_cells[0])
+        cell_texts = [[_get_text(cell, _RANK_TABLE, _preserves_whitespace(cell), ' ', strip=True) for cell in cells[:num_cols]]
+                      for cells in row_cells]
+        has_header = any(child.tag.__class__ is str and child.tag != _CDATA_TAG and _tag_name(child.tag) == 'th'
+                         and _rule_rank('th', child) >= _RANK_TABLE for child in rows[0])
+        return _layout_table(cell_texts, num_cols, has_header)
+
+    return ' ---HR_PLACEHOLDER--- '
+
+def clean_confluence_html_lxml(html_content: str, fallback: bool = True) -> Optional[str]:
+    """
+    clean_confluence_html with one walk over an lxml tree instead of BeautifulSoup passes;
+    the output is the same, several times faster on large pages.
+
+    Bodies that html.parser would read differently from an XML parser (malformed markup,
+    unknown entities, script/style, upper-case tags, ...) and all bodies when lxml is not
+    installed are cleaned by BeautifulSoup, or give None with fallback=False.
+    """
+    if not html_content:
+        return ""
+    text = _lxml_raw_text(html_content)
+    if text is None:
+        return _clean_with_bs4(html_content) if fallback else None
+    return _normalize_text(text)
+
+def _lxml_raw_text(html_content: str) -> Optional[str]:
+    """raw_text by the lxml walk; None when lxml is missing or cannot take the body."""
+    if etree is None:
+        return None
+    try:
+        out = []
+        _collect_strings(_parse_storage_format(html_content), _RANK_NONE, False, out)
+        return ' '.join(out)
+    except (_Unsupported, etree.LxmlError, RecursionError, ValueError):
+        return None
+
 if __name__ == '__main__':
     # Example Usage:
     sample_html_drawio = '<p>Some text</p><ac:structured-macro ac:name="drawio" ac:schema-version="1"><ac:parameter ac:name="diagramName">MyDiagram</ac:parameter></ac:structured-macro><p>More text</p>'
@@ -0,0 +1,256 @@
+"""Everything the pipelines derive from a page body, from a single parse.
+
+The cleaner, the SQL extractor and the link, macro and attachment scans each used to parse the
+body on their own. analyze_page() parses it once with html.parser (the parser all of them use)
+and produces the requested artifacts from that one tree:
+
+* text: clean_confluence_html output
+* markdown: text run through the uploaders' html2text conversion (needs html2text)
+* sql: SQL candidate blocks, as found by utils/sql_extraction.py
+* links: outbound links: {'kind': 'url' | 'page' | 'space', 'target', 'space_key'}
+* macros: macro name -> number of uses
+* attachments: attachments referenced by the body: {'filename', 'page_title'}
+
+The read-only scans run first and text last, because the bs4 cleaner rewrites the tree. With
+the lxml cleaner selected, text comes from its own single-pass parse instead, and bodies over
+html_cleaner.STREAM_MIN_CHARS take it from clean_confluence_html, which streams them, so the
+text matches what the cleaners produce (and cache) for the same body.
+
+PageAnalyzer keeps analyses by body hash, so every stage in a process (and every page sharing a
+template body) reads the artifact it needs without parsing the body again. Given a TextCache
+(utils/text_cache.py) it also keeps them on disk, so other processes and later runs reuse them:
+text and markdown share the entries of the cleaners' modes of the same name, the other
+artifacts are stored as JSON under their own names.
+"""
+import json
+from collections import OrderedDict
+
+from bs4 import BeautifulSoup
+
+from utils import html_cleaner
+from utils.batch_cleaner import html2text, html_to_markdown_text
+from utils.change_ledger import body_hash, body_storage_value, page_body_hash
+from utils.sql_extraction import extract_all_sql_from_page
+
+ARTIFACTS = ('text', 'markdown', 'sql', 'links', 'macros', 'attachments')
+# Bodies whose analyses a PageAnalyzer keeps before dropping the least recently used
+DEFAULT_CACHE_BODIES = 10000
+
+_LINK_TAGS = ['a', 'ri:page', 'ri:blog-post', 'ri:space', 'ri:url']
+# Artifacts stored in a TextCache as they are rather than as JSON
+_TEXT_ARTIFACTS = ('text', 'markdown')
+
+
+def default_artifacts():
+    """All artifacts this environment can produce (markdown needs html2text)."""
+    return tuple(name for name in ARTIFACTS if name != 'markdown' or html2text is not None)
+
+
+def _links(soup):
+    links = []
+    seen = set()
+    for tag in soup.find_all(_LINK_TAGS):
+        if tag.name == 'a':
+            kind, target, space_key = 'url', tag.get('href', '').strip(), ''
+            if target.startswith('#'):
+                continue
+        elif tag.name == 'ri:url':
+            kind, target, space_key = 'url', tag.get('ri:value', '').strip(), ''
+        elif tag.name == 'ri:space':
+            kind, target = 'space', tag.get('ri:space-key', '').strip()
+            space_key = target
+        else:
+            # A page inside ri:attachment names the page holding the attachment, not a link
+            if tag.parent is not None and tag.parent.name == 'ri:attachment':
+                continue
+            kind, target, space_key = 'page', tag.get('ri:content-title', '').strip(), tag.get('ri:space-key', '')
+        if target and (kind, target, space_key) not in seen:
+            seen.add((kind, target, space_key))
+            links.append({'kind': kind, 'target': target, 'space_key': space_key})
+    return links
+
+
+def _macros(soup):
+    macros = {}
+    for macro in soup.find_all(['ac:structured-macro', 'ac:macro']):
+        name = macro.get('ac:name', '').strip().lower()
+        if name:
+            macros[name] = macros.get(name, 0) + 1
+    return macros
+
+
+def _attachments(soup):
+    attachments = []
+    seen = set()
+    for attachment in soup.find_all('ri:attachment'):
+        filename = attachment.get('ri:filename', '').strip()
+        page = attachment.find(['ri:page', 'ri:blog-post'])
+        page_title = page.get('ri:content-title', '').strip() if page else ''
+        if filename and (filename, page_title) not in seen:
+            seen.add((filename, page_title))
+            attachments.append({'filename': filename, 'page_title': page_title})
+    return attachments
+
+
+def _empty(name):
+    if name in ('text', 'markdown'):
+        return ''
+    return {} if name == 'macros' else []
+
+
+def analyze_page(html_content, artifacts=None, scan_plain_text=False, cleaner=None):
+    """
+    Derive the requested artifacts from one parse of a page body.
+
+    Args:
+        html_content: Storage-format body (a string or a {'storage': {'value': ...}} body)
+        artifacts: Names from ARTIFACTS (default: default_artifacts())
+        scan_plain_text: Also look for SQL in the plain text (see extract_all_sql_from_page)
+        cleaner: clean_confluence_html implementation for text, 'bs4' or 'lxml' (default: the
+            process default)
+
+    Returns: dict of artifact name -> artifact
+    """
+    artifacts = default_artifacts() if artifacts is None else tuple(artifacts)
+    unknown = [name for name in artifacts if name not in ARTIFACTS]
+    if unknown:
+        raise ValueError(f"Unknown artifacts {', '.join(unknown)}, expected some of {', '.join(ARTIFACTS)}")
+    if 'markdown' in artifacts and html2text is None:
+        raise ImportError("The markdown artifact needs html2text: pip install html2text")
+
+    html_content = body_storage_value(html_content)
+    if not html_content:
+        return {name: _empty(name) for name in artifacts}
+
+    result = {}
+    wants_text = 'text' in artifacts or 'markdown' in artifacts
+    streamed = len(html_content) > html_cleaner.STREAM_MIN_CHARS
+    bs4_text = wants_text and not streamed and (cleaner or html_cleaner.DEFAULT_CLEANER) != 'lxml'
+    soup = None
+    if bs4_text or any(name in artifacts for name in ('sql', 'links', 'macros', 'attachments')):
+        soup = BeautifulSoup(html_content, 'html.parser')
+
+    if 'sql' in artifacts:
+        result['sql'] = extract_all_sql_from_page(html_content, scan_plain_text=scan_plain_text, soup=soup)
+    if 'links' in artifacts:
+        result['links'] = _links(soup)
+    if 'macros' in artifacts:
+        result['macros'] = _macros(soup)
+    if 'attachments' in artifacts:
+        result['attachments'] = _attachments(soup)
+
+    if wants_text:
+        # Last: the bs4 rules rewrite the tree
+        if streamed:
+            text = html_cleaner.clean_confluence_html(html_content, cleaner)
+        elif bs4_text:
+            text = html_cleaner.clean_soup(soup)
+        else:
+            text = html_cleaner.clean_confluence_html_lxml(html_content)
+        if 'text' in artifacts:
+            result['text'] = text
+        if 'markdown' in artifacts:
+            result['markdown'] = html_to_markdown_text(text)
+    return result
+
+
+class PageAnalyzer:
+    """Analyses of page bodies kept by body hash; the least recently used are dropped first.
+
+    The returned dicts are shared with the cache (and with other pages of the same body), so
+    callers must not modify them. An analysis missing some of the requested artifacts is
+    completed from the text cache, if there is one, or with one more parse.
+    """
+
+    def __init__(self, artifacts=None, max_bodies=DEFAULT_CACHE_BODIES, scan_plain_text=False, cleaner=None,
+                 text_cache=None):
+        """
+        Args:
+            artifacts: Artifacts produced by default (default: default_artifacts())
+            max_bodies: Bodies kept before the least recently used are dropped
+            scan_plain_text, cleaner: As for analyze_page
+            text_cache: TextCache the artifacts are read from and stored in, or None
+        """
+        self.artifacts = default_artifacts() if artifacts is None else tuple(artifacts)
+        self.max_bodies = max_bodies
+        self.scan_plain_text = scan_plain_text
+        self.cleaner = cleaner
+        self.text_cache = text_cache
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.loads = 0
+        self.parses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def analyze(self, body, digest=None, artifacts=None):
+        """Artifacts of body; digest is its body hash, if the caller has it already."""
+        artifacts = self.artifacts if artifacts is None else tuple(artifacts)
+        if digest is None:
+            digest = body_hash(body)
+        analysis = self._cache.get(digest)
+        if analysis is not None:
+            self._cache.move_to_end(digest)
+            missing = [name for name in artifacts if name not in analysis]
+            if not missing:
+                self.hits += 1
+                return analysis
+        else:
+            analysis = {}
+            missing = list(artifacts)
+
+        if self.text_cache is not None:
+            analysis.update(self._load(digest, missing))
+            missing = [name for name in missing if name not in analysis]
+        if missing:
+            computed = analyze_page(body, missing, self.scan_plain_text, self.cleaner)
+            self.parses += 1
+            analysis.update(computed)
+            if self.text_cache is not None:
+                self._store(digest, computed)
+        else:
+            self.loads += 1
+
+        if digest not in self._cache:
+            self._cache[digest] = analysis
+            while len(self._cache) > self.max_bodies:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return analysis
+
+    def _mode(self, name):
+        # SQL found with the plain-text scan is a different artifact
+        return 'sql-plain' if name == 'sql' and self.scan_plain_text else name
+
+    def _load(self, digest, names):
+        """The artifacts of a body hash stored in the text cache."""
+        found = {}
+        for name in names:
+            stored = self.text_cache.get(digest, self._mode(name))
+            if stored is not None:
+                found[name] = stored if name in _TEXT_ARTIFACTS else json.loads(stored)
+        return found
+
+    def _store(self, digest, artifacts):
+        for name, value in artifacts.items():
+            self.text_cache.put(digest, value if name in _TEXT_ARTIFACTS else json.dumps(value), self._mode(name))
+
+    def analyze_page(self, page, artifacts=None):
+        """Artifacts of a page's body, keyed by its stored body_hash when it has one."""
+        return self.analyze(page.get('body'), page_body_hash(page), artifacts)
+
+    def artifact(self, page, name):
+        """One artifact of a page's body."""
+        return self.analyze_page(page, (name,))[name]
+
+    def clear(self):
+        self._cache.clear()
+
+    def summary(self):
+        requests = self.hits + self.loads + self.parses
+        rate = 100.0 * self.hits / requests if requests else 0.0
+        loaded = f"{self.loads:,} read from the text cache, " if self.text_cache is not None else ""
+        return (f"Page analyzer: {requests:,} lookups, {self.hits:,} cache hits ({rate:.1f}%), {loaded}"
+                f"{self.parses:,} parses, {len(self._cache):,} bodies cached, {self.evictions:,} evicted")
@@ -0,0 +1,109 @@
+"""Append-only journal of fetched pages, so a crashed full pickle run can resume mid-space.
+
+Each record is one pickled page dict appended to the journal file. Reading stops at the
+first incomplete record (the tail of a write interrupted by a crash) and the file is
+truncated back to the last complete record before new pages are appended.
+
+The journal doubles as an on-disk spool: full pickle runs keep only page metadata in
+memory and read each body back from the journal when the space pickle is written.
+"""
+import os
+import pickle
+import threading
+
+# fsync the journal after this many appended pages (a flush happens after every page)
+JOURNAL_FSYNC_EVERY = 50
+
+
+class PageJournal:
+    """Page journal for one space; pages are keyed by their 'id'."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._checked = False
+
+    def _records(self):
+        """Yield (offset, page) for every complete record, truncating any torn tail record."""
+        self._checked = True
+        if not os.path.exists(self.path):
+            return
+        good_offset = 0
+        with open(self.path, 'rb') as f:
+            while True:
+                offset = f.tell()
+                try:
+                    page = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    # Torn or corrupt record: keep everything before it
+                    break
+                good_offset = f.tell()
+                if isinstance(page, dict) and page.get('id'):
+                    yield offset, page
+        if good_offset < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+
+    def load(self):
+        """Return {page_id: page} for the latest complete record of every page."""
+        return {page['id']: page for _, page in self._records()}
+
+    def index(self):
+        """Return {page_id: {'offset', 'updated', 'update_count'}} without keeping any bodies in memory."""
+        return {page['id']: {'offset': offset, 'updated': page.get('updated'), 'update_count': page.get('update_count')}
+                for offset, page in self._records()}
+
+    def read(self, offset):
+        """Read back the record at offset (as returned by index())."""
+        with self._lock:
+            if self._reader is None:
+                self._reader = open(self.path, 'rb')
+            self._reader.seek(offset)
+            return pickle.load(self._reader)
+
+    def append(self, page):
+        """Append one page (including its body) and flush it to the OS."""
+        if not self._checked:
+            # Never append behind a torn record left by a crash
+            for _ in self._records():
+                pass
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            pickle.dump(page, self._file)
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= JOURNAL_FSYNC_EVERY:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._unsynced = 0
+
+    def remove(self):
+        """Close and delete the journal once its space has been written out in full."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def same_page_version(journaled, page):
+    """True if a journaled page is the same version as the freshly listed page metadata."""
+    return (journaled.get('update_count') == page.get('update_count')
+            and journaled.get('updated') == page.get('updated'))
@@ -0,0 +1,216 @@
+"""Catalog of the space pickles in a directory, so readers can skip unpickling for metadata.
+
+pickle_catalog.json sits next to the pickles and holds one entry per .pkl file: space key
+and name, page counts, min/avg/max page update time, body size, a content fingerprint,
+and the file's mtime and size. Writers record an entry each time they write a pickle.
+Readers check each entry's mtime and size against the file. A missing or stale entry
+(for example a pickle copied in by hand) is rebuilt from the pickle itself and saved
+back, so the catalog never has to be trusted blindly.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from utils.atomic_io import FileLock, atomic_write_json
+
+CATALOG_FILENAME = 'pickle_catalog.json'
+CATALOG_VERSION = 1
+
+
+def page_timestamp(page):
+    """Unix timestamp of a page's last update, or None if it has none that parses."""
+    when = (page.get('updated') or page.get('lastModified') or (page.get('version') or {}).get('when')
+            or page.get('when'))
+    if not when:
+        return None
+    try:
+        return datetime.fromisoformat(when.replace('Z', '+00:00')).timestamp()
+    except (ValueError, AttributeError):
+        return None
+
+
+class PageStats:
+    """Running page statistics, so a streaming writer can summarize pages it no longer holds."""
+
+    def __init__(self):
+        self.count = 0
+        self.dated = 0
+        self.timestamp_sum = 0.0
+        self.min_updated = None
+        self.max_updated = None
+        self.body_bytes = 0
+        self._fingerprint = hashlib.sha1()
+
+    def add(self, page):
+        self.count += 1
+        ts = page_timestamp(page)
+        if ts is not None:
+            self.dated += 1
+            self.timestamp_sum += ts
+            self.min_updated = ts if self.min_updated is None else min(self.min_updated, ts)
+            self.max_updated = ts if self.max_updated is None else max(self.max_updated, ts)
+        body = page.get('body') or ''
+        if isinstance(body, str):
+            body_bytes = len(body.encode('utf-8'))
+        else:
+            body_bytes = len(body)
+        self.body_bytes += body_bytes
+        version = page.get('update_count', (page.get('version') or {}).get('number'))
+        self._fingerprint.update(f"{page.get('id')}:{version}:{page.get('updated')}:{body_bytes}\n".encode('utf-8'))
+
+    def summary(self):
+        return {
+            'sampled_pages': self.count,
+            'dated_pages': self.dated,
+            'avg_updated': self.timestamp_sum / self.dated if self.dated else 0,
+            'min_updated': self.min_updated,
+            'max_updated': self.max_updated,
+            'body_bytes': self.body_bytes,
+            'fingerprint': self._fingerprint.hexdigest(),
+        }
+
+
+def describe_space(data, filename):
+    """Catalog fields (without file stats) for unpickled content: a space dict or a plain page list."""
+    default_key = os.path.splitext(filename)[0]
+    if isinstance(data, list):
+        # Page lists, as cached by counter_pages_from_pickles.py
+        stats = PageStats()
+        for page in data:
+            if isinstance(page, dict):
+                stats.add(page)
+        return dict(stats.summary(), format='pages', space_key=default_key, name=None, status=None,
+                    total_pages_in_space=None, total_pages=None)
+    if not isinstance(data, dict):
+        return {'format': 'other', 'space_key': default_key, 'name': None, 'status': None}
+    header = {key: value for key, value in data.items() if key != 'sampled_pages'}
+    stats = PageStats()
+    for page in data.get('sampled_pages') or []:
+        stats.add(page)
+    return describe_header(header, stats, filename, has_pages='sampled_pages' in data)
+
+
+def describe_header(header, stats, filename, has_pages=True):
+    """Catalog fields for a space dict given its non-page keys and the PageStats of its pages."""
+    if header.get('status') == 'processing':
+        space_format = 'placeholder'
+    elif 'space_key' in header and has_pages:
+        space_format = 'space'
+    else:
+        space_format = 'other'
+    return dict(stats.summary(), format=space_format,
+                space_key=header.get('space_key', os.path.splitext(filename)[0]),
+                name=header.get('name'),
+                status=header.get('status'),
+                total_pages_in_space=header.get('total_pages_in_space'),
+                # Only set when the pickle itself has a 'total_pages' key (some readers filter on it)
+                total_pages=header.get('total_pages'))
+
+
+def catalog_page_count(entry):
+    """Page count the space loaders filter on: a pickle's 'total_pages' if it has one, else its page count."""
+    if entry.get('total_pages') is not None:
+        return entry['total_pages']
+    return entry.get('sampled_pages', 0)
+
+
+class PickleCatalog:
+    """The catalog of one pickle directory. Call save() to write back refreshed or new entries."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, CATALOG_FILENAME)
+        self._entries = self._read()
+        self._dirty = {}
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                catalog = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if catalog.get('version') != CATALOG_VERSION:
+            return {}
+        return catalog.get('spaces', {})
+
+    def _stat_fields(self, filename):
+        stat = os.stat(os.path.join(self.directory, filename))
+        return {'file': filename, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                'cataloged_at': datetime.now().isoformat()}
+
+    def update(self, filename, fields):
+        """Record catalog fields for a pickle that has just been written."""
+        entry = dict(fields, **self._stat_fields(filename))
+        self._entries[filename] = entry
+        self._dirty[filename] = entry
+        return entry
+
+    def entry(self, filename):
+        """Up-to-date entry for one pickle in the directory, rebuilding it from the pickle if stale."""
+        path = os.path.join(self.directory, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self._entries.get(filename)
+        if entry and entry.get('mtime') == stat.st_mtime and entry.get('size') == stat.st_size:
+            return entry
+        from utils.streaming_pickle import load_space  # streaming_pickle imports this module
+        return self.update(filename, describe_space(load_space(path), filename))
+
+    def entries(self, on_error=None):
+        """Entries for every .pkl in the directory (sorted by file name); unreadable pickles are skipped.
+
+        on_error(filename, exception) is called for each pickle that could not be read.
+        """
+        result = []
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.pkl'):
+                continue
+            try:
+                entry = self.entry(filename)
+            except Exception as e:
+                if on_error is not None:
+                    on_error(filename, e)
+                continue
+            if entry is not None:
+                result.append(entry)
+        return result
+
+    def save(self):
+        """Merge refreshed entries into the catalog file and drop entries whose pickle is gone."""
+        if not self._dirty:
+            return
+        with FileLock(self.path + '.lock'):
+            # Other processes may have recorded spaces since this catalog was read
+            on_disk = self._read()
+            on_disk.update(self._dirty)
+            spaces = {name: entry for name, entry in on_disk.items()
+                      if os.path.exists(os.path.join(self.directory, name))}
+            # Compact JSON: the catalog is rewritten after every pickle and can hold thousands of spaces
+            atomic_write_json(self.path, {'version': CATALOG_VERSION, 'spaces': spaces}, indent=None)
+        self._entries = spaces
+        self._dirty = {}
+
+
+def record_pickle(path, data=None, fields=None):
+    """Catalog one pickle just written to path, from its in-memory data or precomputed fields."""
+    directory, filename = os.path.split(os.path.abspath(path))
+    if fields is None:
+        fields = describe_space(data, filename)
+    catalog = PickleCatalog(directory)
+    catalog.update(filename, fields)
+    catalog.save()
+
+
+def load_catalog_entries(directory, on_error=None):
+    """Fresh catalog entries for every pickle in directory, saving any entries that had to be rebuilt."""
+    catalog = PickleCatalog(directory)
+    entries = catalog.entries(on_error=on_error)
+    try:
+        catalog.save()
+    except (OSError, TimeoutError):
+        # A read-only or busy directory still gets correct entries, just not cached ones
+        pass
+    return entries
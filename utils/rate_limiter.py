@@ -0,0 +1,171 @@
+"""Process-wide adaptive token-bucket rate limiter for Confluence requests.
+
+Every request made through utils.confluence_client acquires a token first. The
+refill rate is learned from server feedback (AIMD style):
+
+- a 429 halves the rate and pauses all threads until Retry-After has elapsed; 429s for
+  requests sent before that decrease (the rest of the same burst) only extend the pause,
+- latency well above the best latency seen so far trims the rate a little,
+- a run of successful, fast responses adds a fixed step to the rate, up to max_rate.
+"""
+import logging
+import threading
+import time
+
+DEFAULT_INITIAL_RATE = 20.0    # requests per second
+DEFAULT_MIN_RATE = 0.5
+DEFAULT_MAX_RATE = 100.0
+THROTTLE_DECREASE = 0.5        # multiply the rate by this on a 429
+LATENCY_DECREASE = 0.9         # multiply the rate by this when latency degrades
+RECOVERY_STEP = 2.0            # add this many requests per second after a clean window
+RECOVERY_WINDOW = 20           # successful responses needed before raising the rate (about one
+                               # second's worth at rates below this)
+LATENCY_DEGRADED_FACTOR = 3.0  # latency this many times the baseline counts as degraded
+LATENCY_EWMA_ALPHA = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """Thread-safe token bucket whose refill rate adapts to 429s, Retry-After and latency."""
+
+    def __init__(self, initial_rate=DEFAULT_INITIAL_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE):
+        self.min_rate = min_rate
+        self.max_rate = max(min_rate, max_rate)
+        self.rate = min(max(initial_rate, min_rate), self.max_rate)
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = float('-inf')
+        self._lock = threading.Lock()
+
+        self._successes_since_change = 0
+        self._latency_ewma = None
+        self._latency_baseline = None
+
+        self.request_count = 0
+        self.throttle_count = 0
+        self.total_wait_seconds = 0.0
+
+    def _capacity(self):
+        # Allow roughly one second's worth of burst, but never less than a single token
+        return max(1.0, self.rate)
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self._capacity(), self._tokens + elapsed * self.rate)
+
+    def acquire(self):
+        """Block until a request may be sent. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait_time = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        self.request_count += 1
+                        self.total_wait_seconds += waited
+                        return waited
+                    wait_time = (1.0 - self._tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def _set_rate(self, new_rate, reason):
+        new_rate = min(max(new_rate, self.min_rate), self.max_rate)
+        if abs(new_rate - self.rate) >= 0.01:
+            logger.info(f"Rate limiter: {self.rate:.2f} -> {new_rate:.2f} req/s ({reason})")
+            self.rate = new_rate
+            self._tokens = min(self._tokens, self._capacity())
+        self._successes_since_change = 0
+
+    def on_throttled(self, retry_after=None, sent_at=None):
+        """
+        Record a 429: halve the rate and pause every caller for retry_after seconds.
+
+        sent_at is the time.monotonic() at which the throttled request was sent. A request sent
+        before the last decrease was already in flight when the server's limit was reached, so
+        its 429 extends the pause but does not lower the rate again.
+        """
+        with self._lock:
+            self.throttle_count += 1
+            now = time.monotonic()
+            if sent_at is None or sent_at >= self._last_decrease:
+                self._set_rate(self.rate * THROTTLE_DECREASE, "429 received")
+                self._last_decrease = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            # Drain the bucket so traffic resumes at the new rate instead of bursting
+            self._tokens = 0.0
+            self._last_refill = max(now, self._paused_until)
+
+    def on_success(self, latency):
+        """Record a completed request and its latency in seconds."""
+        with self._lock:
+            if self._latency_ewma is None:
+                self._latency_ewma = latency
+            else:
+                self._latency_ewma += LATENCY_EWMA_ALPHA * (latency - self._latency_ewma)
+            if self._latency_baseline is None or self._latency_ewma < self._latency_baseline:
+                self._latency_baseline = self._latency_ewma
+
+            self._successes_since_change += 1
+            if self._successes_since_change < max(1, min(RECOVERY_WINDOW, int(self.rate))):
+                return
+            if self._latency_ewma > self._latency_baseline * LATENCY_DEGRADED_FACTOR:
+                self._set_rate(self.rate * LATENCY_DECREASE,
+                               f"latency {self._latency_ewma:.2f}s vs baseline {self._latency_baseline:.2f}s")
+            else:
+                self._set_rate(self.rate + RECOVERY_STEP, "server recovered")
+
+    def on_error(self):
+        """Record a timeout, connection error or gateway error as a congestion signal."""
+        with self._lock:
+            self._set_rate(self.rate * LATENCY_DECREASE, "request error")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'throttle_count': self.throttle_count,
+                'request_count': self.request_count,
+                'total_wait_seconds': self.total_wait_seconds,
+                'latency_ewma': self._latency_ewma,
+            }
+
+    def summary(self):
+        """One-line description of the limiter state for progress output and run logs."""
+        stats = self.stats()
+        latency = f"{stats['latency_ewma']:.2f}s" if stats['latency_ewma'] is not None else "n/a"
+        return (f"rate={stats['rate']:.2f} req/s, throttled={stats['throttle_count']}, "
+                f"requests={stats['request_count']}, waited={stats['total_wait_seconds']:.1f}s, latency={latency}")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide limiter shared by every Confluence client."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveRateLimiter()
+        return _limiter
+
+
+def configure_rate_limiter(initial_rate=None, max_rate=None, min_rate=None):
+    """Adjust the bounds of the process-wide limiter (e.g. from a --max-rate option)."""
+    limiter = get_rate_limiter()
+    with limiter._lock:
+        if min_rate is not None:
+            limiter.min_rate = min_rate
+        if max_rate is not None:
+            limiter.max_rate = max(limiter.min_rate, max_rate)
+        rate = initial_rate if initial_rate is not None else limiter.rate
+        limiter.rate = min(max(rate, limiter.min_rate), limiter.max_rate)
+    return limiter
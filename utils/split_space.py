@@ -0,0 +1,409 @@
+"""Split space format: page metadata and page bodies in separate files.
+
+A space KEY is stored as two files side by side:
+
+  KEY.meta             pickle of the space header (every key of the legacy space dict
+                       except sampled_pages), the page dicts without their bodies and a
+                       body table: offset, length and kind of each page's body
+  KEY.<token>.bodies   the page bodies back to back: UTF-8 text for string bodies, a
+                       pickle for anything else (e.g. {'storage': {'value': ...}} dicts)
+
+Loading the .meta file deserializes no bodies at all, so titles, hierarchy and dates for
+a whole corpus load quickly; SplitSpace.body() reads a single body on demand. Each write
+gets a fresh bodies file named in the .meta, so a reader holding the old .meta keeps
+reading consistent data until it reopens the space.
+
+With use_mmap=True the bodies file is memory-mapped read-only. The OS page cache then
+decides which bodies stay resident, and processes mapping the same file share its pages.
+
+With compression='zstd' (needs the optional zstandard package) each body is compressed on
+its own with a dictionary trained on the first bodies of the space and stored in the .meta,
+so single bodies can still be read at random. Storage-format HTML is repetitive enough that
+the dictionary does most of the work even for small pages. Readers decompress transparently.
+
+Identical bodies within a space (template pages) are written once; their pages share the
+same offset and length in the body table.
+"""
+import hashlib
+import mmap
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+from array import array
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from utils.atomic_io import atomic_pickle_dump
+from utils.streaming_pickle import BodyBuffer, StreamingSpaceWriter, load_space
+
+META_SUFFIX = '.meta'
+BODIES_SUFFIX = '.bodies'
+FORMAT_NAME = 'split-space'
+# 2 added the zstd body kinds; version 1 files are a subset and still read
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+
+BODY_NONE = 0
+BODY_TEXT = 1
+BODY_PICKLE = 2
+BODY_ZSTD_TEXT = 3
+BODY_ZSTD_PICKLE = 4
+# Kind of a compressed body -> kind of the bytes it decompresses to
+_ZSTD_BASE_KIND = {BODY_ZSTD_TEXT: BODY_TEXT, BODY_ZSTD_PICKLE: BODY_PICKLE}
+_ZSTD_KIND = {BODY_TEXT: BODY_ZSTD_TEXT, BODY_PICKLE: BODY_ZSTD_PICKLE}
+
+ZSTD_LEVEL = 3
+# zstd's own default dictionary size
+ZSTD_DICT_SIZE = 112640
+# Bodies are buffered uncompressed until this much sample data is available for training
+ZSTD_DICT_SAMPLE_BYTES = 16 * 1024 * 1024
+
+
+def split_meta_path(directory, space_key):
+    return os.path.join(directory, f"{space_key}{META_SUFFIX}")
+
+
+def find_split_spaces(directory):
+    """Sorted paths of all split space .meta files in directory."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(META_SUFFIX))
+
+
+def encode_body(body):
+    """(kind, bytes) a body is stored as, before compression."""
+    if body is None:
+        return BODY_NONE, b''
+    if isinstance(body, str):
+        return BODY_TEXT, body.encode('utf-8')
+    if isinstance(body, BodyBuffer):
+        return BODY_TEXT, bytes(body.buffer)
+    return BODY_PICKLE, pickle.dumps(body, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("zstd compressed bodies need the zstandard package (pip install zstandard)")
+
+
+def train_body_dictionary(samples, dict_size=ZSTD_DICT_SIZE):
+    """Train a zstd dictionary on encoded body samples; None if there is too little data to train on."""
+    _require_zstandard()
+    samples = [sample for sample in samples if sample]
+    if not samples:
+        return None
+    try:
+        return zstandard.train_dictionary(dict_size, samples)
+    except zstandard.ZstdError:
+        # Too few or too small samples; bodies are then compressed without a dictionary
+        return None
+
+
+def decode_body(kind, data):
+    """Turn the stored bytes of a body back into the original value."""
+    if kind == BODY_TEXT:
+        return bytes(data).decode('utf-8')
+    if kind == BODY_PICKLE:
+        return pickle.loads(data)
+    return None
+
+
+class SplitSpaceWriter:
+    """Write a space in the split format page by page; nothing is visible until commit()."""
+
+    def __init__(self, meta_path, header, source=None, compression=None, dictionary=None,
+                 level=ZSTD_LEVEL, dict_size=ZSTD_DICT_SIZE):
+        if compression not in (None, 'zstd'):
+            raise ValueError(f"Unknown body compression: {compression}")
+        if compression:
+            _require_zstandard()
+        self.meta_path = meta_path
+        # Optional caller data saved in the .meta, e.g. the stat of the pickle it was built from
+        self.source = source
+        self.compression = compression
+        self.level = level
+        self.dict_size = dict_size
+        # A given dictionary (e.g. trained on a sample of the whole corpus) is used as is
+        self.dictionary = dictionary
+        self._compressor = None
+        self._pending = None
+        self._pending_bytes = 0
+        if compression and dictionary is not None:
+            self._compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+        elif compression:
+            self._pending = []
+        self.header = dict(header)
+        self.header.pop('sampled_pages', None)
+        # Bodies are copied out of the pickle's buffers file, so its token means nothing here
+        self.header.pop('body_buffers', None)
+        self.pages = []
+        self.offsets = array('Q')
+        self.lengths = array('Q')
+        self.kinds = bytearray()
+        # (kind, digest of the encoded body) -> index of the first page written with it
+        self._written = {}
+        directory = os.path.dirname(os.path.abspath(meta_path))
+        stem = os.path.basename(meta_path)[:-len(META_SUFFIX)] if meta_path.endswith(META_SUFFIX) else os.path.basename(meta_path)
+        self.bodies_name = f"{stem}.{uuid.uuid4().hex[:12]}{BODIES_SUFFIX}"
+        self._bodies_path = os.path.join(directory, self.bodies_name)
+        fd, self._tmp_path = tempfile.mkstemp(prefix=f".{self.bodies_name}.", suffix='.tmp', dir=directory)
+        self._file = os.fdopen(fd, 'wb')
+        self._offset = 0
+
+    def append(self, page):
+        """Add one page; its body goes to the bodies file, everything else to the metadata table."""
+        kind, data = encode_body(page.get('body'))
+        self.pages.append({key: value for key, value in page.items() if key != 'body'})
+        if self._pending is not None:
+            # Still collecting samples to train the dictionary on
+            self._pending.append((kind, data))
+            self._pending_bytes += len(data)
+            if self._pending_bytes >= ZSTD_DICT_SAMPLE_BYTES:
+                self._start_compressing()
+            return
+        self._write_body(kind, data)
+
+    def _start_compressing(self):
+        pending, self._pending = self._pending, None
+        self.dictionary = train_body_dictionary([data for _, data in pending], self.dict_size)
+        self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+        for kind, data in pending:
+            self._write_body(kind, data)
+
+    def _write_body(self, kind, data):
+        key = (kind, hashlib.blake2b(data, digest_size=16).digest())
+        first = self._written.get(key)
+        if first is not None:
+            self.offsets.append(self.offsets[first])
+            self.lengths.append(self.lengths[first])
+            self.kinds.append(self.kinds[first])
+            return
+        self._written[key] = len(self.offsets)
+        if self._compressor is not None and data:
+            compressed = self._compressor.compress(data)
+            # Bodies too small to gain anything are stored as they are
+            if len(compressed) < len(data):
+                kind, data = _ZSTD_KIND[kind], compressed
+        self._file.write(data)
+        self.offsets.append(self._offset)
+        self.lengths.append(len(data))
+        self.kinds.append(kind)
+        self._offset += len(data)
+
+    def commit(self):
+        """Move the bodies file into place, then atomically replace the .meta that points at it."""
+        if self._pending is not None:
+            self._start_compressing()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self._bodies_path)
+        previous_bodies = None
+        if os.path.exists(self.meta_path):
+            try:
+                with open(self.meta_path, 'rb') as f:
+                    previous_bodies = pickle.load(f).get('bodies_file')
+            except Exception:
+                previous_bodies = None
+        atomic_pickle_dump({
+            'format': FORMAT_NAME,
+            'version': FORMAT_VERSION,
+            'header': self.header,
+            'pages': self.pages,
+            'bodies_file': self.bodies_name,
+            'body_offsets': self.offsets,
+            'body_lengths': self.lengths,
+            'body_kinds': bytes(self.kinds),
+            'source': self.source,
+            'compression': self.compression,
+            'zstd_dict': self.dictionary.as_bytes() if self.dictionary is not None else None,
+        }, self.meta_path, protocol=pickle.HIGHEST_PROTOCOL)
+        if previous_bodies and previous_bodies != self.bodies_name:
+            try:
+                os.remove(os.path.join(os.path.dirname(self._bodies_path), previous_bodies))
+            except OSError:
+                # Still open (or mapped) elsewhere; it is only wasted space
+                pass
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.abort()
+
+
+class SplitSpace:
+    """A split space opened for reading: metadata in memory, bodies read on demand."""
+
+    def __init__(self, meta_path, use_mmap=False):
+        self.meta_path = meta_path
+        self.use_mmap = use_mmap
+        with open(meta_path, 'rb') as f:
+            meta = pickle.load(f)
+        if not isinstance(meta, dict) or meta.get('format') != FORMAT_NAME:
+            raise ValueError(f"{meta_path} is not a split space file")
+        if meta.get('version') not in READABLE_VERSIONS:
+            raise ValueError(f"{meta_path} has unsupported split space version {meta.get('version')}")
+        self.header = meta['header']
+        self.pages = meta['pages']
+        self.bodies_path = os.path.join(os.path.dirname(os.path.abspath(meta_path)), meta['bodies_file'])
+        self._offsets = meta['body_offsets']
+        self._lengths = meta['body_lengths']
+        self._kinds = meta['body_kinds']
+        self.source = meta.get('source')
+        self.compression = meta.get('compression')
+        self._zstd_dict = meta.get('zstd_dict')
+        if self.compression:
+            _require_zstandard()
+        # Decompressors are not thread safe, so each thread gets its own
+        self._local = threading.local()
+        self._index_by_id = None
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()
+
+    @property
+    def space_key(self):
+        return self.header.get('space_key')
+
+    @property
+    def name(self):
+        return self.header.get('name')
+
+    def __len__(self):
+        return len(self.pages)
+
+    def index_of(self, page_id):
+        """Position of a page by id, or None."""
+        if self._index_by_id is None:
+            self._index_by_id = {str(page.get('id')): i for i, page in enumerate(self.pages)}
+        return self._index_by_id.get(str(page_id))
+
+    def _open_map(self):
+        with self._lock:
+            if self._map is None:
+                with open(self.bodies_path, 'rb') as f:
+                    # mmap refuses empty files; a space whose bodies are all empty has nothing to map
+                    size = os.fstat(f.fileno()).st_size
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        return self._map
+
+    def _read(self, offset, length):
+        if self.use_mmap:
+            return (self._map if self._map is not None else self._open_map())[offset:offset + length]
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.bodies_path, 'rb')
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, 'decompressor', None)
+        if decompressor is None:
+            dictionary = zstandard.ZstdCompressionDict(self._zstd_dict) if self._zstd_dict else None
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return decompressor
+
+    def raw_body(self, index):
+        """(kind, bytes) of a page body as stored, without decoding or decompressing it."""
+        return self._kinds[index], self._read(self._offsets[index], self._lengths[index])
+
+    def body_bytes(self, index):
+        """(kind, bytes) of a page body after decompression: BODY_TEXT data is UTF-8."""
+        kind, data = self.raw_body(index)
+        if kind in _ZSTD_BASE_KIND:
+            return _ZSTD_BASE_KIND[kind], self._decompressor().decompress(data)
+        return kind, data
+
+    def body(self, index):
+        """Body of the page at index, read from the bodies file."""
+        if self._kinds[index] == BODY_NONE:
+            return None
+        return decode_body(*self.body_bytes(index))
+
+    def body_by_id(self, page_id):
+        index = self.index_of(page_id)
+        return None if index is None else self.body(index)
+
+    def page(self, index):
+        """The full page dict (metadata plus body), as it was in the legacy pickle."""
+        page = dict(self.pages[index])
+        if self._kinds[index] != BODY_NONE:
+            page['body'] = self.body(index)
+        return page
+
+    def iter_pages(self):
+        """Yield full page dicts one at a time."""
+        for index in range(len(self.pages)):
+            yield self.page(index)
+
+    def to_space_dict(self):
+        """The legacy {space_key, name, sampled_pages, ...} dict with every body loaded."""
+        data = dict(self.header)
+        data['sampled_pages'] = list(self.iter_pages())
+        return data
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if isinstance(self._map, mmap.mmap):
+                self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_split_space(space_data, meta_path, source=None, compression=None, dictionary=None):
+    """Write a legacy space dict in the split format."""
+    with SplitSpaceWriter(meta_path, space_data, source=source, compression=compression,
+                          dictionary=dictionary) as writer:
+        for page in space_data.get('sampled_pages') or []:
+            writer.append(page)
+        writer.commit()
+
+
+def convert_pickle_to_split(pickle_path, meta_path=None, compression=None, dictionary=None):
+    """Convert a legacy space pickle to the split format next to it (or at meta_path)."""
+    if meta_path is None:
+        meta_path = os.path.splitext(pickle_path)[0] + META_SUFFIX
+    space_data = load_space(pickle_path)
+    if not isinstance(space_data, dict) or 'sampled_pages' not in space_data:
+        raise ValueError(f"{pickle_path} is not a space pickle")
+    write_split_space(space_data, meta_path, compression=compression, dictionary=dictionary)
+    return meta_path
+
+
+def convert_split_to_pickle(meta_path, pickle_path=None):
+    """Convert a split space back to a legacy pickle, streaming one page at a time."""
+    if pickle_path is None:
+        pickle_path = meta_path[:-len(META_SUFFIX)] + '.pkl'
+    with SplitSpace(meta_path) as space:
+        header = dict(space.header)
+        # Keep the legacy key order: header keys, sampled_pages, then total_pages_in_space etc.
+        trailer = {key: header.pop(key) for key in list(header) if key not in ('space_key', 'name')}
+        with StreamingSpaceWriter(pickle_path, header) as writer:
+            for page in space.iter_pages():
+                writer.append(page)
+            writer.commit(trailer)
+    return pickle_path
@@ -0,0 +1,730 @@
+"""SQL detection in Confluence page bodies: labeled and unlabeled code and noformat macros,
+pre tags, table cells and (optionally) SQL statements in the plain text.
+
+Used by extract_sql_from_pickles.py and the 'sql' artifact of utils/page_analyzer.py.
+"""
+import re
+
+from bs4 import BeautifulSoup, NavigableString
+
+# SQL-related language identifiers (case-insensitive matching)
+SQL_LANGUAGES = [
+    'sql', 'plsql', 'pl/sql', 'oracle', 'oraclesql', 'oracle-sql',
+    'tsql', 't-sql', 'mssql', 'ms-sql', 'sqlserver', 'sql-server',
+    'mysql', 'postgresql', 'postgres', 'sqlite', 'db2', 'sybase',
+    'transact-sql', 'ansi-sql', 'ddl', 'dml'
+]
+
+# Keywords that strongly indicate SQL content (for detection in unlabeled code blocks)
+SQL_KEYWORDS = [
+    r'\bSELECT\b', r'\bFROM\b', r'\bWHERE\b', r'\bINSERT\b', r'\bUPDATE\b',
+    r'\bDELETE\b', r'\bCREATE\s+TABLE\b', r'\bALTER\s+TABLE\b', r'\bDROP\s+TABLE\b',
+    r'\bCREATE\s+INDEX\b', r'\bCREATE\s+VIEW\b', r'\bCREATE\s+PROCEDURE\b',
+    r'\bCREATE\s+FUNCTION\b', r'\bCREATE\s+TRIGGER\b', r'\bCREATE\s+PACKAGE\b',
+    r'\bBEGIN\b', r'\bEND\b', r'\bDECLARE\b', r'\bEXECUTE\b', r'\bEXEC\b',
+    r'\bGRANT\b', r'\bREVOKE\b', r'\bCOMMIT\b', r'\bROLLBACK\b',
+    r'\bMERGE\s+INTO\b', r'\bTRUNCATE\b', r'\bJOIN\b', r'\bLEFT\s+JOIN\b',
+    r'\bINNER\s+JOIN\b', r'\bOUTER\s+JOIN\b', r'\bUNION\b', r'\bGROUP\s+BY\b',
+    r'\bORDER\s+BY\b', r'\bHAVING\b', r'\bDISTINCT\b', r'\bCOUNT\s*\(',
+    r'\bSUM\s*\(', r'\bAVG\s*\(', r'\bMAX\s*\(', r'\bMIN\s*\(',
+    # Oracle-specific
+    r'\bPLS_INTEGER\b', r'\bVARCHAR2\b', r'\bNUMBER\b', r'\bSYSDATE\b',
+    r'\bNVL\b', r'\bDECODE\b', r'\bROWNUM\b', r'\bROWID\b', r'\bDBMS_',
+    r'\bUTL_', r'\bCURSOR\b', r'\bFETCH\b', r'\bOPEN\b', r'\bCLOSE\b',
+    r'\bLOOP\b', r'\bEXIT\s+WHEN\b', r'\bFOR\s+.*\s+IN\b', r'\bEXCEPTION\b',
+    r'\bRAISE\b', r'\bPRAGMA\b', r'\bBULK\s+COLLECT\b', r'\bFORALL\b',
+]
+
+# Minimum number of SQL keywords to consider something as SQL (for unlabeled blocks)
+# Raised from 2 to 3 to reduce false positives like "Execute light on business"
+MIN_SQL_KEYWORDS = 3
+
+# Patterns that indicate the START of a SQL statement (for plain text extraction)
+# NOTE: BEGIN, LOOP, EXCEPTION etc. are NOT starters - they're continuations within PL/SQL
+SQL_STATEMENT_STARTERS = [
+    r'^\s*SELECT\b',
+    r'^\s*INSERT\b',
+    r'^\s*UPDATE\b',
+    r'^\s*DELETE\b',
+    r'^\s*CREATE\b',
+    r'^\s*ALTER\b',
+    r'^\s*DROP\b',
+    r'^\s*TRUNCATE\b',
+    r'^\s*GRANT\b',
+    r'^\s*REVOKE\b',
+    r'^\s*MERGE\b',
+    r'^\s*DECLARE\b',
+    r'^\s*EXEC(UTE)?\b',
+    r'^\s*WITH\b',  # CTE
+    r'^\s*CALL\b',
+    r'^\s*COMMIT\b',
+    r'^\s*ROLLBACK\b',
+]
+
+# Lines that likely continue a SQL statement
+SQL_CONTINUATION_PATTERNS = [
+    r'^\s*FROM\b',
+    r'^\s*WHERE\b',
+    r'^\s*AND\b',
+    r'^\s*OR\b',
+    r'^\s*JOIN\b',
+    r'^\s*(LEFT|RIGHT|INNER|OUTER|CROSS)\s+JOIN\b',
+    r'^\s*ON\b',
+    r'^\s*GROUP\s+BY\b',
+    r'^\s*ORDER\s+BY\b',
+    r'^\s*HAVING\b',
+    r'^\s*UNION\b',
+    r'^\s*INTERSECT\b',
+    r'^\s*MINUS\b',
+    r'^\s*INTO\b',
+    r'^\s*VALUES\b',
+    r'^\s*SET\b',
+    r'^\s*RETURNING\b',
+    r'^\s*WHEN\b',
+    r'^\s*THEN\b',
+    r'^\s*ELSE\b',
+    r'^\s*END\b',
+    r'^\s*LOOP\b',
+    r'^\s*EXIT\b',
+    r'^\s*FETCH\b',
+    r'^\s*OPEN\b',
+    r'^\s*CLOSE\b',
+    r'^\s*RETURN\b',
+    r'^\s*RAISE\b',
+    r'^\s*EXCEPTION\b',
+    r'^\s*PRAGMA\b',
+    r'^\s*--',  # SQL comment
+    r'^\s*/\*',  # Block comment start
+    r'^\s*\*',   # Block comment continuation
+    r'^\s*\(',   # Subquery or list
+    r'^\s*\)',   # Closing
+    r'.*;\s*$',  # Ends with semicolon
+    r'^\s*,',    # Continuation with comma
+    r'^[^a-zA-Z]*$',  # Lines with only symbols/numbers (likely part of SQL)
+]
+
+
+def is_sql_language(language_str):
+    """Check if a language string indicates SQL."""
+    if not language_str:
+        return False
+    lang_lower = language_str.lower().strip()
+    return any(sql_lang in lang_lower for sql_lang in SQL_LANGUAGES)
+
+
+def looks_like_sql(text):
+    """Heuristically determine if text looks like SQL code."""
+    if not text or len(text.strip()) < 20:
+        return False
+
+    text_upper = text.upper()
+
+    # Quick rejection: if it looks like a shell command, reject it
+    shell_patterns = [
+        r'\bsudo\b',
+        r'\bsu\s+-',
+        r'\bbash\b',
+        r'\b/bin/',
+        r'\b/usr/',
+        r'\bchmod\b',
+        r'\bchown\b',
+        r'\bmkdir\b',
+        r'\bcd\s+/',
+        r'\becho\s+\$',
+        r'\bexport\s+\w+=',
+        r'\bsource\s+',
+        r'\b\.sh\b',
+        r'\bgrep\s+',
+        r'\bawk\s+',
+        r'\bsed\s+',
+        r'\bcat\s+/',
+        r'\brm\s+-',
+        r'\bcp\s+-',
+        r'\bmv\s+',
+        r'\bls\s+-',
+        r'\bcurl\s+',
+        r'\bwget\s+',
+        r'\bssh\s+',
+        r'\bscp\s+',
+    ]
+    if any(re.search(pattern, text, re.IGNORECASE) for pattern in shell_patterns):
+        return False
+
+    # Must have at least one strong SQL statement pattern
+    # These are patterns that are unambiguously SQL
+    strong_patterns = [
+        r'\bSELECT\b.*\bFROM\b',           # SELECT ... FROM
+        r'\bSELECT\b.*\bINTO\b',           # SELECT ... INTO
+        r'\bINSERT\s+INTO\b',              # INSERT INTO
+        r'\bUPDATE\b.*\bSET\b',            # UPDATE ... SET
+        r'\bDELETE\s+FROM\b',              # DELETE FROM
+        r'\bCREATE\s+(OR\s+REPLACE\s+)?(TABLE|VIEW|INDEX|PROCEDURE|FUNCTION|TRIGGER|PACKAGE|TYPE|SEQUENCE|SYNONYM)\b',
+        r'\bALTER\s+(TABLE|VIEW|INDEX|PROCEDURE|FUNCTION|TRIGGER|PACKAGE|SEQUENCE|SESSION)\b',
+        r'\bDROP\s+(TABLE|VIEW|INDEX|PROCEDURE|FUNCTION|TRIGGER|PACKAGE|SEQUENCE)\b',
+        r'\bTRUNCATE\s+TABLE\b',
+        r'\bMERGE\s+INTO\b',
+        r'\bGRANT\s+\w+\s+ON\b',           # GRANT ... ON
+        r'\bREVOKE\s+\w+\s+ON\b',          # REVOKE ... ON
+        r'\bDECLARE\b.*\b(BEGIN|CURSOR|TYPE|VARCHAR|NUMBER|INTEGER|BOOLEAN|EXCEPTION)\b',
+        r'\bBEGIN\b.*\bEND\s*;',           # PL/SQL block (must have END;)
+        r'\bWITH\b.*\bAS\s*\(\s*SELECT\b', # CTE
+        r'\bEXEC(UTE)?\s+(IMMEDIATE|SP_|XP_|DBMS_|UTL_)\b',  # EXECUTE only with specific SQL patterns
+    ]
+
+    has_strong_pattern = any(re.search(pattern, text_upper, re.DOTALL) for pattern in strong_patterns)
+    if has_strong_pattern:
+        return True
+
+    # No fallback - if it doesn't match a strong pattern, it's not SQL
+    # This eliminates false positives from prose that happens to contain SQL keywords
+    return False
+
+
+def is_sql_starter_line(line):
+    """Check if a line starts a SQL statement."""
+    line_upper = line.upper()
+    for pattern in SQL_STATEMENT_STARTERS:
+        if re.match(pattern, line_upper, re.IGNORECASE):
+            return True
+    return False
+
+
+def is_sql_continuation_line(line):
+    """Check if a line is likely part of an ongoing SQL statement."""
+    if not line.strip():
+        return False  # Blank lines might end a statement
+    line_upper = line.upper()
+    for pattern in SQL_CONTINUATION_PATTERNS:
+        if re.match(pattern, line_upper, re.IGNORECASE):
+            return True
+    # Also check if line contains SQL keywords mid-line
+    keyword_count = sum(1 for pattern in SQL_KEYWORDS if re.search(pattern, line_upper))
+    return keyword_count >= 1
+
+
+def looks_like_prose(line):
+    """Check if a line looks like natural language prose rather than code."""
+    line = line.strip()
+    if not line:
+        return False
+
+    line_upper = line.upper()
+
+    # First, check if this line contains SQL keywords - if so, it's not prose
+    sql_words_in_line = [
+        'SELECT', 'FROM', 'WHERE', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'OUTER',
+        'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'ALTER', 'DROP', 'TRUNCATE',
+        'ORDER BY', 'GROUP BY', 'HAVING', 'UNION', 'INTO', 'VALUES', 'SET',
+        'BEGIN', 'END', 'DECLARE', 'EXECUTE', 'EXEC', 'COMMIT', 'ROLLBACK',
+        'GRANT', 'REVOKE', 'CURSOR', 'FETCH', 'EXCEPTION', 'RAISE', 'LOOP',
+        'VARCHAR', 'NUMBER', 'INTEGER', 'SYSDATE', 'NVL', 'DECODE', 'ROWNUM',
+        'PROCEDURE', 'FUNCTION', 'TRIGGER', 'PACKAGE', 'VIEW', 'INDEX',
+        'PRIMARY KEY', 'FOREIGN KEY', 'CONSTRAINT', 'NOT NULL', 'DEFAULT',
+        'AND', 'OR', 'ON', 'AS', 'IN', 'IS', 'NULL', 'LIKE', 'BETWEEN',
+    ]
+
+    # Check for SQL keywords at start of line or as significant part
+    for sql_word in sql_words_in_line:
+        if line_upper.startswith(sql_word + ' ') or line_upper.startswith(sql_word + '\t'):
+            return False
+        if line_upper == sql_word:
+            return False
+
+    # Check if line looks like it's part of SQL (has SQL operators/patterns)
+    if re.search(r'\s+(AND|OR)\s+\w+\s*(=|<|>|!=|<>|LIKE|IN|IS)', line_upper):
+        return False
+    if re.search(r'\bJOIN\b.*\bON\b', line_upper):
+        return False
+    if re.search(r'\b(COUNT|SUM|AVG|MAX|MIN)\s*\(', line_upper):
+        return False
+
+    # Common prose patterns (only match these if no SQL keywords found)
+    prose_patterns = [
+        r'^(This|That|The|Here|There|But|If|What|How|Why|Please|Note|See)\s+\w+\s+\w+',
+        r'.*\s(is|are|was|were|has|have|had|will|would|could|should|can|may|must|shall)\s+(a|an|the|this|that|these|those)\s',
+        r'^[A-Z][a-z]+\s+[a-z]+\s+[a-z]+\s+[a-z]+',  # Sentence-like pattern (4+ words)
+        r'\.\s*$',  # Ends with period (not semicolon)
+        r':\s*$',   # Ends with colon (heading/label)
+        r'^\d+\.\s+[A-Z]',  # Numbered list item starting with capital
+        r'^[-*]\s+[A-Z]',   # Bullet list item starting with capital
+    ]
+
+    for pattern in prose_patterns:
+        if re.search(pattern, line, re.IGNORECASE):
+            # Final check - make sure it's not a SQL comment
+            if not line.strip().startswith('--'):
+                return True
+
+    return False
+
+
+def is_plsql_block_start(line):
+    """Check if this line starts a PL/SQL block (procedure, function, package, trigger)."""
+    line_upper = line.strip().upper()
+    patterns = [
+        r'^CREATE\s+(OR\s+REPLACE\s+)?(PROCEDURE|FUNCTION|PACKAGE|TRIGGER|TYPE)\b',
+        r'^DECLARE\b',
+    ]
+    for pattern in patterns:
+        if re.match(pattern, line_upper):
+            return True
+    return False
+
+
+def is_plsql_block_end(line):
+    """Check if this line ends a PL/SQL block."""
+    line_stripped = line.strip()
+    # PL/SQL blocks typically end with END; followed by / on next line
+    # Or just END; for anonymous blocks
+    return line_stripped == '/' or line_stripped.upper() in ('END;', 'END')
+
+
+def extract_sql_blocks_from_text(text):
+    """
+    Extract SQL blocks from plain text by looking for SQL statement patterns.
+
+    Returns a list of extracted SQL blocks (strings).
+    """
+    if not text:
+        return []
+
+    lines = text.split('\n')
+    sql_blocks = []
+    current_block = []
+    in_sql_block = False
+    in_plsql_block = False  # Track if we're inside a PL/SQL block
+    blank_line_count = 0
+    prev_line_ended_with_comma = False
+    prev_line_ended_with_semicolon = False
+    open_parens = 0
+
+    for i, line in enumerate(lines):
+        line_stripped = line.strip()
+
+        # Track parentheses balance
+        if in_sql_block:
+            open_parens += line_stripped.count('(') - line_stripped.count(')')
+            open_parens = max(0, open_parens)  # Don't go negative
+
+        # Check for PL/SQL block start
+        if is_plsql_block_start(line_stripped):
+            # Start a new PL/SQL block (save previous if valid)
+            if current_block and looks_like_sql('\n'.join(current_block)):
+                sql_blocks.append('\n'.join(current_block))
+            current_block = [line]
+            in_sql_block = True
+            in_plsql_block = True
+            blank_line_count = 0
+            prev_line_ended_with_comma = line_stripped.endswith(',')
+            prev_line_ended_with_semicolon = line_stripped.endswith(';')
+            open_parens = line_stripped.count('(') - line_stripped.count(')')
+
+        # Inside a PL/SQL block - don't start new blocks until END; /
+        elif in_plsql_block:
+            current_block.append(line)
+            blank_line_count = 0 if line_stripped else blank_line_count + 1
+
+            # Check for end of PL/SQL block
+            if is_plsql_block_end(line_stripped):
+                # Look ahead - if next non-blank line is '/', include it
+                if line_stripped.upper() in ('END;', 'END'):
+                    # Check if there's a / coming
+                    for j in range(i + 1, min(i + 3, len(lines))):
+                        next_line = lines[j].strip()
+                        if next_line == '/':
+                            continue  # Will be added in next iteration
+                        elif next_line:
+                            break  # Non-slash content, end here
+                    else:
+                        # No more lines or only blank/slash
+                        pass
+                elif line_stripped == '/':
+                    # This is the end
+                    if current_block and looks_like_sql('\n'.join(current_block)):
+                        sql_blocks.append('\n'.join(current_block))
+                    current_block = []
+                    in_sql_block = False
+                    in_plsql_block = False
+                    open_parens = 0
+
+        elif is_sql_starter_line(line_stripped):
+            # Start a new SQL block (save previous if valid)
+            if current_block and looks_like_sql('\n'.join(current_block)):
+                sql_blocks.append('\n'.join(current_block))
+            current_block = [line]
+            in_sql_block = True
+            blank_line_count = 0
+            prev_line_ended_with_comma = line_stripped.endswith(',')
+            prev_line_ended_with_semicolon = line_stripped.endswith(';')
+            open_parens = line_stripped.count('(') - line_stripped.count(')')
+
+        elif in_sql_block:
+            if not line_stripped:
+                # Blank line - might end the block
+                blank_line_count += 1
+                # End block after semicolon followed by blank line (unless in PL/SQL block)
+                if prev_line_ended_with_semicolon and blank_line_count >= 1 and open_parens <= 0:
+                    # Check if we might be in a PL/SQL block (has BEGIN but no END yet)
+                    block_text = '\n'.join(current_block).upper()
+                    if 'BEGIN' in block_text and 'END' not in block_text:
+                        # Still in PL/SQL block, continue
+                        current_block.append(line)
+                    else:
+                        if current_block and looks_like_sql('\n'.join(current_block)):
+                            sql_blocks.append('\n'.join(current_block))
+                        current_block = []
+                        in_sql_block = False
+                        open_parens = 0
+                elif blank_line_count >= 2 and open_parens <= 0 and not prev_line_ended_with_comma:
+                    # Two blank lines = end of SQL block
+                    if current_block and looks_like_sql('\n'.join(current_block)):
+                        sql_blocks.append('\n'.join(current_block))
+                    current_block = []
+                    in_sql_block = False
+                    open_parens = 0
+                else:
+                    current_block.append(line)
+            elif looks_like_prose(line_stripped):
+                # This looks like natural language - end the SQL block
+                if current_block and looks_like_sql('\n'.join(current_block)):
+                    sql_blocks.append('\n'.join(current_block))
+                current_block = []
+                in_sql_block = False
+                blank_line_count = 0
+                open_parens = 0
+            else:
+                # Check various conditions for continuing the SQL block
+                should_continue = False
+
+                # Explicit SQL patterns
+                if is_sql_continuation_line(line_stripped):
+                    should_continue = True
+                # Ends with semicolon (SQL terminator) - but might continue for PL/SQL
+                elif line_stripped.endswith(';'):
+                    should_continue = True
+                # Ends with comma (list continuation)
+                elif line_stripped.endswith(','):
+                    should_continue = True
+                # Previous line ended with comma - this is likely a list item
+                elif prev_line_ended_with_comma:
+                    should_continue = True
+                # Inside parentheses
+                elif open_parens > 0:
+                    should_continue = True
+                # Contains SQL keywords
+                elif looks_like_sql(line_stripped):
+                    should_continue = True
+                # Indented lines (likely part of SQL structure)
+                elif (line.startswith('    ') or line.startswith('\t')) and len(line_stripped) < 100:
+                    should_continue = True
+                # PL/SQL block terminators
+                elif line_stripped in ('/', 'END;', 'END', 'BEGIN', 'EXCEPTION'):
+                    should_continue = True
+                # Short identifier-like lines (column names, etc.)
+                elif len(line_stripped) < 60 and re.match(r'^[\w\s,\.\(\)\'\"_\-\*:=]+$', line_stripped):
+                    # But not if it looks like prose
+                    if not looks_like_prose(line_stripped):
+                        should_continue = True
+
+                if should_continue:
+                    current_block.append(line)
+                    blank_line_count = 0
+                    prev_line_ended_with_comma = line_stripped.endswith(',')
+                    prev_line_ended_with_semicolon = line_stripped.endswith(';')
+                else:
+                    # Check if this might be a terminator line for PL/SQL
+                    if line_stripped == '/' or line_stripped.upper() == 'END;' or line_stripped.upper() == 'END':
+                        current_block.append(line)
+                        if current_block and looks_like_sql('\n'.join(current_block)):
+                            sql_blocks.append('\n'.join(current_block))
+                        current_block = []
+                        in_sql_block = False
+                        open_parens = 0
+                    else:
+                        # Likely end of SQL block
+                        if current_block and looks_like_sql('\n'.join(current_block)):
+                            sql_blocks.append('\n'.join(current_block))
+                        current_block = []
+                        in_sql_block = False
+                        blank_line_count = 0
+                        open_parens = 0
+
+    # Don't forget the last block
+    if current_block and looks_like_sql('\n'.join(current_block)):
+        sql_blocks.append('\n'.join(current_block))
+
+    return sql_blocks
+
+
+def get_context_before_position(text, position, max_chars=200):
+    """Get text before a position to use as context/description."""
+    if position <= 0:
+        return ''
+
+    # Look backwards for a heading or meaningful context
+    before_text = text[:position]
+    lines = before_text.split('\n')
+
+    # Get last few non-empty lines before the SQL
+    context_lines = []
+    for line in reversed(lines[-5:]):
+        line = line.strip()
+        if line and len(line) < 200:
+            # Skip if it looks like SQL
+            if not is_sql_starter_line(line) and not looks_like_sql(line):
+                context_lines.insert(0, line)
+                if len(' | '.join(context_lines)) > max_chars:
+                    break
+
+    return ' | '.join(context_lines) if context_lines else ''
+
+
+def extract_text_from_element(element):
+    """Extract text content from a BeautifulSoup element, handling CDATA and nested content."""
+    if element is None:
+        return ""
+
+    # Check for CDATA (plain-text-body)
+    if hasattr(element, 'string') and element.string:
+        return str(element.string).strip()
+
+    # Get all text content
+    text = element.get_text(separator='\n', strip=True)
+    return text
+
+
+def extract_sql_from_code_macro(macro):
+    """Extract SQL code and metadata from a Confluence code macro."""
+    result = {
+        'sql_code': '',
+        'language': '',
+        'title': '',
+        'description': ''
+    }
+
+    # Get language parameter
+    lang_param = macro.find('ac:parameter', attrs={'ac:name': 'language'})
+    if lang_param:
+        result['language'] = lang_param.get_text(strip=True)
+
+    # Get title parameter
+    title_param = macro.find('ac:parameter', attrs={'ac:name': 'title'})
+    if title_param:
+        result['title'] = title_param.get_text(strip=True)
+
+    # Get the code body - try plain-text-body first (most common for code macro)
+    plain_text_body = macro.find('ac:plain-text-body')
+    if plain_text_body:
+        result['sql_code'] = extract_text_from_element(plain_text_body)
+    else:
+        # Try rich-text-body
+        rich_text_body = macro.find('ac:rich-text-body')
+        if rich_text_body:
+            result['sql_code'] = extract_text_from_element(rich_text_body)
+
+    return result
+
+
+def extract_sql_from_preformatted(element):
+    """Extract SQL from pre or code tags."""
+    return {
+        'sql_code': element.get_text(separator='\n', strip=True),
+        'language': '',
+        'title': '',
+        'description': ''
+    }
+
+
+def find_nearby_context(element, soup):
+    """Try to find a description or context near the SQL element."""
+    context_parts = []
+
+    # Look at previous siblings for context (headings, paragraphs)
+    for sibling in element.find_previous_siblings()[:3]:
+        if isinstance(sibling, NavigableString):
+            continue
+        if sibling.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p']:
+            text = sibling.get_text(strip=True)
+            if text and len(text) < 200:  # Reasonable context length
+                context_parts.insert(0, text)
+
+    return ' | '.join(context_parts) if context_parts else ''
+
+
+def extract_sql_from_table_cell(cell):
+    """Extract SQL that might be in a table cell."""
+    sql_blocks = []
+
+    # Check for code macros within cell
+    code_macros = cell.find_all(lambda tag: tag.name and tag.has_attr('ac:name') and
+                                 tag.get('ac:name', '').lower() == 'code')
+    for macro in code_macros:
+        extracted = extract_sql_from_code_macro(macro)
+        if extracted['sql_code']:
+            # Check if it's labeled as SQL or looks like SQL
+            if is_sql_language(extracted['language']) or looks_like_sql(extracted['sql_code']):
+                sql_blocks.append(extracted)
+
+    # Check for pre/code tags
+    for pre in cell.find_all(['pre', 'code']):
+        text = pre.get_text(separator='\n', strip=True)
+        if text and looks_like_sql(text):
+            sql_blocks.append({
+                'sql_code': text,
+                'language': 'detected',
+                'title': '',
+                'description': ''
+            })
+
+    # Check raw cell text if no structured code found
+    if not sql_blocks:
+        cell_text = cell.get_text(separator='\n', strip=True)
+        if cell_text and looks_like_sql(cell_text):
+            sql_blocks.append({
+                'sql_code': cell_text,
+                'language': 'detected-from-cell',
+                'title': '',
+                'description': ''
+            })
+
+    return sql_blocks
+
+
+def extract_all_sql_from_page(html_content, page_title='', scan_plain_text=False, soup=None):
+    """
+    Extract all SQL scripts from a page's HTML content.
+
+    Args:
+        html_content: HTML content of the page
+        page_title: Title of the page (for context)
+        scan_plain_text: If True, also scan plain text for SQL patterns (slower)
+        soup: The page already parsed with html.parser, if it was; it is only read
+
+    Returns a list of dicts with keys: sql_code, language, title, description, source
+    """
+    if not html_content:
+        return []
+
+    sql_scripts = []
+    if soup is None:
+        soup = BeautifulSoup(html_content, 'html.parser')
+
+    # 1. Find code macros (ac:structured-macro with ac:name="code")
+    try:
+        code_macros = soup.find_all(lambda tag: tag and hasattr(tag, 'has_attr') and
+                                     tag.has_attr('ac:name') and
+                                     tag.get('ac:name', '').lower() == 'code')
+    except Exception:
+        code_macros = []
+
+    for macro in code_macros:
+        try:
+            extracted = extract_sql_from_code_macro(macro)
+            if extracted['sql_code']:
+                # Check if explicitly labeled as SQL
+                if is_sql_language(extracted['language']):
+                    extracted['source'] = 'code-macro-labeled'
+                    extracted['description'] = find_nearby_context(macro, soup)
+                    sql_scripts.append(extracted)
+                # Or if it looks like SQL even without label
+                elif looks_like_sql(extracted['sql_code']):
+                    extracted['source'] = 'code-macro-detected'
+                    extracted['language'] = extracted['language'] or 'detected'
+                    extracted['description'] = find_nearby_context(macro, soup)
+                    sql_scripts.append(extracted)
+        except Exception:
+            continue
+
+    # 2. Find noformat macros (often used for SQL too)
+    try:
+        noformat_macros = soup.find_all(lambda tag: tag and hasattr(tag, 'has_attr') and
+                                         tag.has_attr('ac:name') and
+                                         tag.get('ac:name', '').lower() == 'noformat')
+    except Exception:
+        noformat_macros = []
+
+    for macro in noformat_macros:
+        try:
+            plain_text = macro.find('ac:plain-text-body')
+            if plain_text:
+                text = extract_text_from_element(plain_text)
+                if text and looks_like_sql(text):
+                    sql_scripts.append({
+                        'sql_code': text,
+                        'language': 'detected',
+                        'title': '',
+                        'description': find_nearby_context(macro, soup),
+                        'source': 'noformat-macro'
+                    })
+        except Exception:
+            continue
+
+    # 3. Find standalone pre tags (outside macros)
+    for pre in soup.find_all('pre'):
+        # Skip if inside a macro we've already processed
+        if pre.find_parent(lambda tag: tag and hasattr(tag, 'has_attr') and
+                          tag.has_attr('ac:name')):
+            continue
+
+        text = pre.get_text(separator='\n', strip=True)
+        if text and looks_like_sql(text):
+            sql_scripts.append({
+                'sql_code': text,
+                'language': 'detected',
+                'title': '',
+                'description': find_nearby_context(pre, soup),
+                'source': 'pre-tag'
+            })
+
+    # 4. Check tables for SQL content (common pattern: tables with script name + SQL)
+    for table in soup.find_all('table'):
+        rows = table.find_all('tr')
+        for row in rows:
+            cells = row.find_all(['td', 'th'])
+
+            # Try to get context from first cell if there are multiple
+            row_context = ''
+            if len(cells) >= 2:
+                first_cell_text = cells[0].get_text(strip=True)
+                if first_cell_text and len(first_cell_text) < 200:
+                    row_context = first_cell_text
+
+            for cell in cells:
+                cell_sql = extract_sql_from_table_cell(cell)
+                for sql_item in cell_sql:
+                    sql_item['source'] = 'table-cell'
+                    if row_context and not sql_item['description']:
+                        sql_item['description'] = row_context
+                    sql_scripts.append(sql_item)
+
+    # 5. Optionally scan plain text for SQL patterns (disabled by default - slow and noisy)
+    if scan_plain_text:
+        full_text = soup.get_text(separator='\n')
+
+        # Track what SQL we've already found (to avoid duplicates)
+        existing_sql_normalized = set()
+        for script in sql_scripts:
+            normalized = re.sub(r'\s+', ' ', script['sql_code'].strip().upper())
+            existing_sql_normalized.add(normalized)
+
+        # Extract SQL blocks from plain text
+        plain_text_sql_blocks = extract_sql_blocks_from_text(full_text)
+
+        for sql_block in plain_text_sql_blocks:
+            normalized = re.sub(r'\s+', ' ', sql_block.strip().upper())
+            if normalized in existing_sql_normalized:
+                continue
+
+            block_pos = full_text.find(sql_block[:50]) if len(sql_block) >= 50 else full_text.find(sql_block)
+            context = get_context_before_position(full_text, block_pos) if block_pos > 0 else ''
+
+            sql_scripts.append({
+                'sql_code': sql_block,
+                'language': 'detected-plain-text',
+                'title': '',
+                'description': context,
+                'source': 'plain-text-scan'
+            })
+            existing_sql_normalized.add(normalized)
+
+    return sql_scripts
@@ -0,0 +1,143 @@
+"""Clean mega-pages (tens of MB of storage format) piece by piece, with bounded memory.
+
+BeautifulSoup holds a tree several times the size of the body, so meeting notes and generated
+pages of many MB used to be truncated before cleaning (MAX_BODY_HTML_BYTES in the search
+indexer). stream_text() instead scans the body's tags once, cuts it into pieces of about
+piece_chars characters at element boundaries, cleans each piece on its own and joins the
+results, so only one piece is ever parsed at a time and the work grows linearly with the body.
+
+Pieces are cut between top-level elements, where every cleaner rule (headings, lists, macros,
+tables) sees whole elements and the text equals clean_confluence_html of the whole body. An
+element too large for one piece (a table of thousands of rows) is cut between its children
+instead, and the next piece starts by reopening the enclosing start tags: its text is all kept,
+but e.g. a continued table has no header row of its own.
+
+A time budget stops the work after the piece that crosses it; StreamResult says how much of
+the body the text covers.
+"""
+import re
+import time
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+from utils import html_cleaner
+
+# Pieces are cut at the first top-level boundary after this many characters
+DEFAULT_PIECE_CHARS = 256 * 1024
+# A piece still open after this many pieces' worth of characters is cut inside its element
+MAX_PIECE_FACTOR = 4
+
+_VOID_ELEMENTS = frozenset(html_cleaner._VOID_ELEMENTS)
+# Comments and CDATA sections are skipped whole; tags are read with their quoted attributes
+_TOKEN_RE = re.compile(
+    r'<!--.*?-->|<!\[CDATA\[.*?\]\]>'
+    r'|<(/?)([A-Za-z][\w:.-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>',
+    re.S)
+
+
+@dataclass
+class StreamResult:
+    text: str
+    processed_chars: int
+    total_chars: int
+    pieces: int
+    elapsed: float
+
+    @property
+    def complete(self) -> bool:
+        return self.processed_chars >= self.total_chars
+
+    @property
+    def coverage(self) -> float:
+        """Share of the body the text was extracted from, 0.0 .. 1.0."""
+        return self.processed_chars / self.total_chars if self.total_chars else 1.0
+
+
+def iter_pieces(html_content: str, piece_chars: int = DEFAULT_PIECE_CHARS) -> Iterator[Tuple[int, str]]:
+    """
+    Cut a body into pieces that can be cleaned one at a time.
+
+    Yields (end, piece): the offset in html_content where the piece ends, and its markup,
+    prefixed with the start tags of the elements it continues.
+    """
+    max_chars = piece_chars * MAX_PIECE_FACTOR
+    open_tags = []  # (name, start tag) of the elements enclosing the scan position
+    start = 0
+    reopen = ''
+    # Depth of the shallowest start tag seen inside an element since the piece reached
+    # piece_chars: an oversized piece is cut before the next start tag that deep, so a table
+    # is cut between rows rather than between the cells of a row
+    shallowest = None
+    for match in _TOKEN_RE.finditer(html_content):
+        closing, name = match.group(1), match.group(2)
+        if name is None:
+            continue
+        name = name.lower()
+        if closing:
+            # Like html.parser: an end tag closes the innermost open element of its name
+            for depth in range(len(open_tags) - 1, -1, -1):
+                if open_tags[depth][0] == name:
+                    del open_tags[depth:]
+                    break
+        elif not (match.group(3).rstrip().endswith('/') or name in _VOID_ELEMENTS):
+            # Cutting before a start tag leaves the next piece something inside the
+            # elements it reopens
+            size = match.start() - start
+            if open_tags and size >= piece_chars:
+                depth = len(open_tags)
+                if shallowest is not None and depth <= shallowest and size >= max_chars:
+                    yield match.start(), reopen + html_content[start:match.start()]
+                    start = match.start()
+                    reopen = ''.join(tag for _, tag in open_tags)
+                    shallowest = None
+                elif shallowest is None or depth < shallowest:
+                    shallowest = depth
+            open_tags.append((name, match.group(0)))
+            continue
+
+        if not open_tags and match.end() - start >= piece_chars:
+            yield match.end(), reopen + html_content[start:match.end()]
+            start = match.end()
+            reopen = ''
+            shallowest = None
+    if start < len(html_content):
+        yield len(html_content), reopen + html_content[start:]
+
+
+def stream_text(html_content: str, time_budget: Optional[float] = None,
+                piece_chars: int = DEFAULT_PIECE_CHARS, cleaner: Optional[str] = None) -> StreamResult:
+    """
+    clean_confluence_html of a body of any size, one piece at a time.
+
+    Args:
+        html_content: Storage-format body
+        time_budget: Seconds after which no further pieces are cleaned (default: no limit);
+            the text then covers the start of the body, see StreamResult.processed_chars
+        piece_chars: Approximate size of the pieces parsed at once
+        cleaner: clean_confluence_html implementation, 'bs4' or 'lxml' (default: the process
+            default)
+
+    Returns: StreamResult with the text and how much of the body it covers
+    """
+    started = time.perf_counter()
+    total = len(html_content or '')
+    texts = []
+    processed = 0
+    pieces = 0
+    if html_content:
+        for end, piece in iter_pieces(html_content, piece_chars):
+            text = html_cleaner.raw_text(piece, cleaner)
+            # An empty piece would add a second separator between its neighbours' strings
+            if text:
+                texts.append(text)
+            processed = end
+            pieces += 1
+            if time_budget is not None and time.perf_counter() - started > time_budget:
+                break
+    return StreamResult(
+        text=html_cleaner._normalize_text(' '.join(texts)),
+        processed_chars=processed,
+        total_chars=total,
+        pieces=pieces,
+        elapsed=time.perf_counter() - started,
+    )
@@ -0,0 +1,333 @@
+"""Write a space pickle page by page, so memory stays flat however large the space is.
+
+The result is an ordinary pickle of the usual space dict (space_key, name, sampled_pages,
+total_pages_in_space) that pickle.load reads exactly as before. It is assembled from
+protocol 3 opcodes: the dict and the page list are opened by hand and every page is
+pickled on its own and appended to the list, so only one page is in memory at a time.
+Protocol 3 addresses its memo with explicit indices, which is what makes concatenating
+independently pickled pages into one stream safe.
+
+Committed pickles are recorded in the directory's pickle catalog (utils/pickle_catalog.py)
+from statistics gathered while the pages were written.
+
+With out_of_band_min_bytes set, bodies at least that large are not pickled in the stream:
+they are written as raw UTF-8 to a buffers file next to the pickle (SPACE.pkl.<token>.buffers)
+and referenced with protocol 5 NEXT_BUFFER opcodes. Such a pickle has to be read with
+load_space(), which memory-maps the buffers file and hands each body back as a BodyBuffer
+that is only decoded to str when something uses it (utils.change_ledger.body_storage_value).
+Each write gets a fresh buffers file named in the pickle's 'body_buffers' key, so a file that
+readers still have mapped is never overwritten; the previous one is removed once the new
+pickle is in place.
+"""
+import io
+import logging
+import mmap
+import os
+import pickle
+import pickletools
+import struct
+import tempfile
+import uuid
+
+from utils.pickle_catalog import PageStats, describe_header, record_pickle
+
+PROTOCOL = 3
+BUFFERS_SUFFIX = '.buffers'
+# Default size (UTF-8 bytes) from which bodies go out of band; smaller ones cost less to copy
+# than the memoryview that would reference them
+OUT_OF_BAND_MIN_BYTES = 8 * 1024
+
+_PROTO = b'\x80\x03'
+_OUT_OF_BAND_PROTO = b'\x80\x05'
+_EMPTY_DICT = b'}'
+_EMPTY_LIST = b']'
+_MARK = b'('
+_APPEND = b'a'
+_SETITEM = b's'
+_SETITEMS = b'u'
+_STOP = b'.'
+_TUPLE1 = b'\x85'
+_REDUCE = b'R'
+_NEXT_BUFFER = b'\x97'
+_READONLY_BUFFER = b'\x98'
+
+# Buffers file: magic, the token in its name (the pickle's 'body_buffers' key), then
+# (little-endian 64-bit length, bytes) per body in the order the pickle references them
+_BUFFERS_MAGIC = b'CVBUF1\n'
+_LENGTH = struct.Struct('<Q')
+# 'body_buffers' is the first header key, so it is found within the start of the pickle
+_HEADER_SCAN_BYTES = 64 * 1024
+
+
+def _push_ops(obj):
+    """Opcodes that push obj onto the unpickler stack: a protocol 3 pickle without PROTO and STOP."""
+    data = pickle.dumps(obj, protocol=PROTOCOL)
+    return memoryview(data)[len(_PROTO):-len(_STOP)]
+
+
+class BodyBuffer:
+    """A page body left as UTF-8 bytes in an out-of-band buffer; decoded each time it is used.
+
+    Pickling one again (e.g. to send it to another process) stores the decoded string.
+    """
+
+    __slots__ = ('buffer',)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def decode(self, encoding='utf-8', errors='replace'):
+        return str(self.buffer, encoding, errors)
+
+    def __str__(self):
+        return self.decode()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __reduce__(self):
+        return str, (bytes(self.buffer), 'utf-8', 'replace')
+
+    def __repr__(self):
+        return f"BodyBuffer({len(self.buffer)} bytes)"
+
+
+# Opcodes that rebuild a BodyBuffer from the next out-of-band buffer
+_BODY_BUFFER_OPS = bytes(_push_ops(BodyBuffer)) + _NEXT_BUFFER + _READONLY_BUFFER + _TUPLE1 + _REDUCE
+
+
+class StreamingSpaceWriter:
+    """Stream {**header, list_key: [pages...], **trailer} to path, replacing it atomically on commit().
+
+    With out_of_band_min_bytes, string bodies of at least that many bytes (and BodyBuffers)
+    go to a new buffers file next to path, whose name the header gets as 'body_buffers'.
+    """
+
+    def __init__(self, path, header, list_key='sampled_pages', catalog=True, out_of_band_min_bytes=None):
+        self.path = path
+        self.count = 0
+        self.stats = PageStats()
+        self._catalog = catalog
+        self._min_bytes = out_of_band_min_bytes
+        self._buffers = None
+        self._buffers_tmp_path = None
+        self._buffers_path = None
+        directory = os.path.dirname(os.path.abspath(path))
+        if out_of_band_min_bytes is not None:
+            token = uuid.uuid4().hex
+            buffers_name = f"{os.path.basename(path)}.{token}{BUFFERS_SUFFIX}"
+            self._buffers_path = os.path.join(directory, buffers_name)
+            header = {'body_buffers': buffers_name, **{key: value for key, value in header.items() if key != 'body_buffers'}}
+            fd, self._buffers_tmp_path = tempfile.mkstemp(prefix=f".{buffers_name}.", suffix='.tmp', dir=directory)
+            self._buffers = os.fdopen(fd, 'wb')
+            self._buffers.write(_BUFFERS_MAGIC + token.encode('ascii') + b'\n')
+        self._header = dict(header)
+        fd, self._tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+        self._file = os.fdopen(fd, 'wb')
+        self._file.write((_PROTO if self._buffers is None else _OUT_OF_BAND_PROTO) + _EMPTY_DICT)
+        self._write_items(header)
+        self._file.write(_push_ops(list_key))
+        self._file.write(_EMPTY_LIST)
+
+    def _write_items(self, items, out_of_band=None):
+        if not items:
+            return
+        self._file.write(_MARK)
+        for key, value in items.items():
+            self._file.write(_push_ops(key))
+            if out_of_band is not None and key == 'body':
+                self._buffers.write(_LENGTH.pack(len(out_of_band)))
+                self._buffers.write(out_of_band)
+                self._file.write(_BODY_BUFFER_OPS)
+            else:
+                self._file.write(_push_ops(value))
+        self._file.write(_SETITEMS)
+
+    def _out_of_band_body(self, page):
+        """Bytes of the page's body if it goes to the buffers file, else None."""
+        if self._buffers is None or not isinstance(page, dict):
+            return None
+        body = page.get('body')
+        if isinstance(body, BodyBuffer):
+            return body.buffer
+        # A str needs at least a quarter as many characters as its UTF-8 length
+        if not isinstance(body, str) or len(body) * 4 < self._min_bytes:
+            return None
+        data = body.encode('utf-8')
+        return data if len(data) >= self._min_bytes else None
+
+    def append(self, page):
+        """Write one page to the end of the list."""
+        body = self._out_of_band_body(page)
+        if body is None:
+            if isinstance(page, dict) and isinstance(page.get('body'), BodyBuffer):
+                page = dict(page, body=page['body'].decode())
+            self._file.write(_push_ops(page))
+        else:
+            self._file.write(_EMPTY_DICT)
+            self._write_items(page, out_of_band=body)
+        self._file.write(_APPEND)
+        self.count += 1
+        self.stats.add(page)
+
+    def commit(self, trailer=None):
+        """Close the list, add the trailer keys and move the finished pickle into place."""
+        self._file.write(_SETITEM)
+        self._write_items(trailer)
+        self._file.write(_STOP)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        if self._buffers is not None:
+            self._buffers.flush()
+            os.fsync(self._buffers.fileno())
+            self._buffers.close()
+            self._buffers = None
+            # The buffers file goes first under a name no other version uses, so the new
+            # pickle is only in place once both are and readers of the old one are unaffected
+            os.replace(self._buffers_tmp_path, self._buffers_path)
+        try:
+            previous_buffers = buffers_path(self.path)
+        except OSError:
+            previous_buffers = None
+        os.replace(self._tmp_path, self.path)
+        if previous_buffers is not None and previous_buffers != self._buffers_path:
+            try:
+                os.remove(previous_buffers)
+            except OSError:
+                # Still mapped by a reader (Windows) or already gone; it is only wasted space
+                pass
+        if self._catalog:
+            header = dict(self._header, **(trailer or {}))
+            try:
+                record_pickle(self.path, fields=describe_header(header, self.stats, os.path.basename(self.path)))
+            except (OSError, TimeoutError) as e:
+                # Readers rebuild a missing catalog entry from the pickle itself
+                logging.getLogger(__name__).warning(f"Could not update pickle catalog for {self.path}: {e}")
+
+    def abort(self):
+        """Discard the partially written pickle; the target path is left untouched."""
+        for attr, tmp_path in (('_file', self._tmp_path), ('_buffers', self._buffers_tmp_path)):
+            handle = getattr(self, attr)
+            if handle is not None:
+                handle.close()
+                setattr(self, attr, None)
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Anything not committed (including on error) is thrown away
+        self.abort()
+
+
+def dump_space(space_data, path, list_key='sampled_pages', catalog=True, out_of_band_min_bytes=None):
+    """Write an in-memory space dict with StreamingSpaceWriter, keeping its key order."""
+    keys = [key for key in space_data if key != 'body_buffers']
+    split = keys.index(list_key) if list_key in space_data else len(keys)
+    header = {key: space_data[key] for key in keys[:split]}
+    trailer = {key: space_data[key] for key in keys[split + 1:]}
+    with StreamingSpaceWriter(path, header, list_key=list_key, catalog=catalog,
+                              out_of_band_min_bytes=out_of_band_min_bytes) as writer:
+        for page in space_data.get(list_key, []):
+            writer.append(page)
+        writer.commit(trailer)
+
+
+def _iter_buffers(view, path):
+    """Yield the out-of-band buffers in view (a buffers file after its header), without copying."""
+    offset = 0
+    while offset < len(view):
+        if offset + _LENGTH.size > len(view):
+            raise pickle.UnpicklingError(f"Truncated buffers file {path}")
+        (length,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        if offset + length > len(view):
+            raise pickle.UnpicklingError(f"Truncated buffers file {path}")
+        yield view[offset:offset + length]
+        offset += length
+
+
+def _buffers_name(head):
+    """The 'body_buffers' value of the pickle starting with head (bytes), or None if it has none."""
+    if bytes(head[:len(_OUT_OF_BAND_PROTO)]) != _OUT_OF_BAND_PROTO:
+        return None
+    is_value = False
+    try:
+        for opcode, arg, _ in pickletools.genops(io.BytesIO(head)):
+            if opcode.name == 'NEXT_BUFFER':
+                break
+            if isinstance(arg, str):
+                if is_value:
+                    return arg
+                is_value = arg == 'body_buffers'
+    except ValueError:
+        # Only the start of the pickle was read
+        pass
+    return None
+
+
+def buffers_path(path, head=None):
+    """
+    Buffers file holding the out-of-band bodies of the pickle at path, or None if it has none.
+
+    head is the content of the pickle (or at least its start), if the caller has read it already.
+    """
+    if head is None:
+        with open(path, 'rb') as f:
+            head = f.read(_HEADER_SCAN_BYTES)
+    name = _buffers_name(memoryview(head)[:_HEADER_SCAN_BYTES])
+    if name is None:
+        return None
+    if not name.endswith(BUFFERS_SUFFIX):
+        # Written before buffers files were named by their token: the name held the token only
+        return path + BUFFERS_SUFFIX
+    return os.path.join(os.path.dirname(path), name)
+
+
+def load_space(path, use_mmap=True):
+    """
+    Load a space pickle, supplying its out-of-band body buffers if it has a buffers file.
+
+    Out-of-band bodies come back as BodyBuffers over a memory map of the buffers file (or over
+    a single read of it with use_mmap=False); nothing is copied or decoded while loading.
+    Pickles without a buffers file load exactly as with pickle.load.
+    """
+    for attempt in range(2):
+        # Only the start of the pickle is read to find its buffers file; the open file keeps the
+        # version that was read even if the pickle is replaced meanwhile
+        f = open(path, 'rb')
+        try:
+            head = f.read(_HEADER_SCAN_BYTES)
+            buffers_file = buffers_path(path, head)
+            if buffers_file is None:
+                f.seek(0)
+                return pickle.load(f)
+            try:
+                buffers = open(buffers_file, 'rb')
+            except FileNotFoundError:
+                if attempt:
+                    raise pickle.UnpicklingError(f"Buffers file {buffers_file} of {path} is missing")
+                # The pickle was rewritten (and its old buffers file removed) after it was opened
+                continue
+            with buffers:
+                if use_mmap and os.fstat(buffers.fileno()).st_size:
+                    view = memoryview(mmap.mmap(buffers.fileno(), 0, access=mmap.ACCESS_READ))
+                else:
+                    view = memoryview(buffers.read())
+            header_end = len(_BUFFERS_MAGIC) + 33
+            if bytes(view[:len(_BUFFERS_MAGIC)]) != _BUFFERS_MAGIC or len(view) < header_end:
+                raise pickle.UnpicklingError(f"{buffers_file} is not a buffers file")
+            token = bytes(view[len(_BUFFERS_MAGIC):header_end - 1]).decode('ascii')
+            expected = _buffers_name(head)
+            if expected != token and not expected.endswith(f".{token}{BUFFERS_SUFFIX}"):
+                raise pickle.UnpicklingError(f"{buffers_file} belongs to a different version of {path}")
+            f.seek(0)
+            return pickle.load(f, buffers=_iter_buffers(view[header_end:], buffers_file))
+        finally:
+            f.close()
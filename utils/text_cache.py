@@ -0,0 +1,233 @@
+"""Cleaned page text kept on disk by body hash, so unchanged bodies are never cleaned twice.
+
+Clustering, indexing and every uploader clean the same bodies on each run. A TextCache is a
+SQLite file mapping (body hash, mode, cleaner version) to the output of
+utils/batch_cleaner.clean_body() for that mode, stored zlib-compressed. A stage that finds
+the text for a body's hash uses it without parsing the body at all.
+
+The cache is capped in size: when it grows past max_bytes, the entries used least recently
+are dropped. Texts from an older html_cleaner.CLEANER_VERSION are never returned, and
+prune_stale() drops them. Hits and misses are counted per instance and added up in the file,
+so warm_text_cache.py --stats reports the hit rate over all runs.
+
+Several processes can share the file; the texts of one body are the same for all of them.
+utils/page_analyzer.py keeps its other artifacts (SQL, links, macros, attachments) in the
+same file, as JSON under modes named after them.
+"""
+import sqlite3
+import threading
+import time
+import zlib
+
+from utils import batch_cleaner, html_cleaner
+from utils.change_ledger import body_hash, body_storage_value
+
+TEXT_CACHE_FILENAME = 'text_cache.sqlite'
+DEFAULT_TEXT_CACHE_MB = 2048
+# Seconds a writer waits for another process holding the cache lock
+TEXT_CACHE_BUSY_TIMEOUT = 60
+# Eviction frees space down to this share of max_bytes, so it does not run on every insert
+EVICT_TO = 0.9
+# zlib level of the stored texts: cheap to write, a quarter of the size on typical pages
+COMPRESS_LEVEL = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cleaned_text (
+    body_hash TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    text BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (body_hash, mode, version)
+);
+CREATE INDEX IF NOT EXISTS cleaned_text_by_use ON cleaned_text (last_used);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+_STAT_NAMES = ('hits', 'misses', 'stores', 'evictions')
+# Keys looked up per query (SQLite limits the number of parameters)
+_LOOKUP_BATCH = 500
+
+
+def _version(mode):
+    # plain mode does not use html_cleaner, but one version for all modes keeps this simple
+    return html_cleaner.CLEANER_VERSION
+
+
+class TextCache:
+    """Cleaned texts by (body hash, mode); safe to share between threads.
+
+    Use as a context manager, or call close(), to record the hit and miss counts in the file.
+    """
+
+    def __init__(self, path, max_mb=DEFAULT_TEXT_CACHE_MB):
+        """
+        Args:
+            path: SQLite file (created if missing)
+            max_mb: Size of the stored texts after which the least recently used are dropped
+        """
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=TEXT_CACHE_BUSY_TIMEOUT, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+        self._size = self._stored_bytes()
+        self.stats = dict.fromkeys(_STAT_NAMES, 0)
+        self._recorded = dict.fromkeys(_STAT_NAMES, 0)
+
+    def _stored_bytes(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cleaned_text").fetchone()[0]
+
+    def get_many(self, digests, mode='text'):
+        """{body_hash: text} of the digests with a cached text; they count as just used."""
+        version = _version(mode)
+        wanted = list(dict.fromkeys(digests))
+        found = {}
+        with self._lock:
+            for start in range(0, len(wanted), _LOOKUP_BATCH):
+                batch = wanted[start:start + _LOOKUP_BATCH]
+                rows = self._db.execute(
+                    f"SELECT body_hash, text FROM cleaned_text WHERE mode = ? AND version = ? "
+                    f"AND body_hash IN ({','.join('?' * len(batch))})", [mode, version] + batch)
+                for digest, text in rows:
+                    found[digest] = zlib.decompress(text).decode('utf-8')
+            if found:
+                now = time.time()
+                with self._db:
+                    self._db.executemany(
+                        "UPDATE cleaned_text SET last_used = ? WHERE body_hash = ? AND mode = ? AND version = ?",
+                        [(now, digest, mode, version) for digest in found])
+        self.stats['hits'] += len(found)
+        self.stats['misses'] += len(wanted) - len(found)
+        return found
+
+    def get(self, digest, mode='text'):
+        """Cached text of one body hash, or None."""
+        return self.get_many([digest], mode).get(digest)
+
+    def put_many(self, items, mode='text'):
+        """Store (body_hash, text) items, then drop the least recently used texts if over the cap."""
+        version = _version(mode)
+        now = time.time()
+        rows = []
+        for digest, text in items:
+            if text is None:
+                continue
+            data = zlib.compress(text.encode('utf-8'), COMPRESS_LEVEL)
+            rows.append((digest, mode, version, data, len(data), now))
+        if not rows:
+            return
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO cleaned_text VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.stats['stores'] += len(rows)
+        self._size += sum(row[4] for row in rows)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def put(self, digest, text, mode='text'):
+        self.put_many([(digest, text)], mode)
+
+    def evict(self):
+        """Drop the least recently used texts until the cache is at EVICT_TO of its cap."""
+        # Other processes may have added texts since this one last looked
+        self._size = self._stored_bytes()
+        excess = self._size - int(self.max_bytes * EVICT_TO)
+        if excess <= 0:
+            return 0
+        victims = []
+        freed = 0
+        with self._lock:
+            cursor = self._db.execute("SELECT body_hash, mode, version, size FROM cleaned_text ORDER BY last_used")
+            for row in cursor:
+                victims.append(row[:3])
+                freed += row[3]
+                if freed >= excess:
+                    break
+            cursor.close()
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM cleaned_text WHERE body_hash = ? AND mode = ? AND version = ?", victims)
+        self._size -= freed
+        self.stats['evictions'] += len(victims)
+        return len(victims)
+
+    def prune_stale(self):
+        """Drop texts cleaned by an older cleaner version; returns how many were dropped."""
+        with self._lock, self._db:
+            dropped = self._db.execute("DELETE FROM cleaned_text WHERE version != ?",
+                                       (html_cleaner.CLEANER_VERSION,)).rowcount
+        self._size = self._stored_bytes()
+        return dropped
+
+    def text(self, body, mode='text', digest=None, cleaner=None):
+        """
+        The cleaned text of one body: from the cache, or cleaned with clean_body() and stored.
+
+        digest is the body's hash, if the caller has it already (page['body_hash']).
+        """
+        body = body_storage_value(body)
+        if not body:
+            return ''
+        if digest is None:
+            digest = body_hash(body)
+        text = self.get(digest, mode)
+        if text is None:
+            text = batch_cleaner.clean_body(body, mode, cleaner)
+            self.put(digest, text, mode)
+        return text
+
+    def counts(self):
+        """Entries and stored bytes per mode of the current cleaner version: {mode: (entries, bytes)}."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT mode, COUNT(*), SUM(size) FROM cleaned_text WHERE version = ? GROUP BY mode",
+                (html_cleaner.CLEANER_VERSION,)).fetchall()
+        return {mode: (entries, size) for mode, entries, size in rows}
+
+    def totals(self):
+        """Hit, miss, store and eviction counts over all runs, including this one's."""
+        self.record_stats()
+        with self._lock:
+            recorded = dict(self._db.execute("SELECT name, value FROM cache_stats").fetchall())
+        return {name: recorded.get(name, 0) for name in _STAT_NAMES}
+
+    def record_stats(self):
+        """Add this instance's counts since the last call to the totals in the file."""
+        deltas = [(name, self.stats[name] - self._recorded[name]) for name in _STAT_NAMES]
+        deltas = [(name, delta) for name, delta in deltas if delta]
+        if not deltas:
+            return
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO cache_stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                deltas)
+        self._recorded = dict(self.stats)
+
+    def summary(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        rate = 100.0 * self.stats['hits'] / lookups if lookups else 0.0
+        return (f"Text cache: {lookups:,} lookups, {self.stats['hits']:,} hits ({rate:.1f}%), "
+                f"{self.stats['stores']:,} stored, {self.stats['evictions']:,} evicted, "
+                f"{self._size / (1024 * 1024):.1f} of {self.max_bytes / (1024 * 1024):.0f} MB used")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cleaned_text").fetchone()[0]
+
+    def close(self):
+        self.record_stats()
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
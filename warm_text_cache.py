@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Fill the cleaned-text cache (utils/text_cache.py) from the space pickles, on all cores.
+
+Every distinct body missing from the cache is cleaned once per mode and stored, so the next
+clustering run, index rebuild or upload reads its text instead of parsing HTML. Bodies that
+are already cached only cost a hash lookup, so running this after each sync cleans just the
+edited pages.
+
+Usage:
+    python warm_text_cache.py temp
+    python warm_text_cache.py temp --mode text --mode markdown --mode plain --workers 8
+    python warm_text_cache.py temp --stats
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from utils.batch_cleaner import CLEAN_MODES, BatchCleaner
+from utils.change_ledger import body_storage_value, page_body_hash
+from utils.corpus_loader import CorpusLoader
+from utils.html_cleaner import HTML_CLEANERS
+from utils.text_cache import DEFAULT_TEXT_CACHE_MB, TEXT_CACHE_FILENAME, TextCache
+
+# Modes used by the stages that read the cache: the search index and open-webui uploads use
+# text, the Qdrant uploaders markdown and explore_clusters.py plain
+DEFAULT_MODES = ('text',)
+
+
+def format_mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def print_stats(cache):
+    counts = cache.counts()
+    totals = cache.totals()
+    print(f"Text cache: {cache.path} ({format_mb(os.path.getsize(cache.path))} on disk, "
+          f"cap {format_mb(cache.max_bytes)})")
+    for mode in CLEAN_MODES:
+        entries, size = counts.get(mode, (0, 0))
+        print(f"  {mode:<9} {entries:>10,} texts  {format_mb(size):>10}")
+    lookups = totals['hits'] + totals['misses']
+    rate = 100.0 * totals['hits'] / lookups if lookups else 0.0
+    print(f"  All runs: {lookups:,} lookups, {totals['hits']:,} hits ({rate:.1f}%), "
+          f"{totals['misses']:,} misses, {totals['stores']:,} stored, {totals['evictions']:,} evicted")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean page bodies ahead of time into the cleaned-text cache')
+    parser.add_argument('directory', nargs='?', default='temp',
+                        help='Directory of space pickles and split spaces (default: temp)')
+    parser.add_argument('--db', help=f'Text cache to fill (default: DIRECTORY/{TEXT_CACHE_FILENAME})')
+    parser.add_argument('--mode', action='append', choices=CLEAN_MODES,
+                        help=f"Output to cache; repeat for several (default: {', '.join(DEFAULT_MODES)})")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes cleaning bodies (default: number of CPU cores)')
+    parser.add_argument('--html-cleaner', choices=HTML_CLEANERS, default='bs4',
+                        help='Text extraction: bs4 (reference) or lxml (same output, several times faster on large pages)')
+    parser.add_argument('--max-mb', type=float, default=DEFAULT_TEXT_CACHE_MB,
+                        help=f'Cache size after which the least recently used texts are dropped (default: {DEFAULT_TEXT_CACHE_MB})')
+    parser.add_argument('--prune', action='store_true',
+                        help='First drop texts cleaned by an older version of the cleaner')
+    parser.add_argument('--stats', action='store_true', help='Only print what the cache holds and its hit rate')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(args.directory, TEXT_CACHE_FILENAME)
+    if not os.path.isdir(os.path.dirname(db_path) or '.'):
+        print(f"ERROR: Directory not found: {os.path.dirname(db_path)}")
+        return 1
+
+    with TextCache(db_path, args.max_mb) as cache:
+        if args.stats:
+            print_stats(cache)
+            return 0
+        if args.prune:
+            print(f"Dropped {cache.prune_stale():,} texts of older cleaner versions")
+
+        modes = args.mode or list(DEFAULT_MODES)
+        try:
+            cleaners = [BatchCleaner(mode, args.workers, cleaner=args.html_cleaner, cache=cache) for mode in modes]
+        except ImportError as e:
+            print(f"ERROR: {e}")
+            return 1
+
+        started = time.time()
+        seen = set()
+        bodies_total = 0
+        loader = CorpusLoader(args.directory, on_error=lambda path, e: print(f"{os.path.basename(path)}: ERROR - {e}"))
+        try:
+            for data in loader.iter_spaces():
+                # Each distinct body once, across all spaces
+                bodies = {}
+                for page in data.get('sampled_pages', []):
+                    digest = page_body_hash(page)
+                    if digest not in seen:
+                        seen.add(digest)
+                        body = body_storage_value(page.get('body'))
+                        if body:
+                            bodies[digest] = body
+                if not bodies:
+                    continue
+                bodies_total += len(bodies)
+                misses = cache.stats['misses']
+                for batch_cleaner in cleaners:
+                    batch_cleaner.clean(list(bodies.values()), list(bodies))
+                print(f"{data.get('space_key', '?')}: {len(bodies):,} bodies, "
+                      f"{cache.stats['misses'] - misses:,} cleaned")
+        finally:
+            for batch_cleaner in cleaners:
+                batch_cleaner.close()
+
+        if loader.stats:
+            print(loader.stats.summary())
+        print("=" * 80)
+        print(f"Distinct bodies: {bodies_total:,} in {time.time() - started:.1f}s, modes: {', '.join(modes)}")
+        print(cache.summary())
+        print_stats(cache)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())